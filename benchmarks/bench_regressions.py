@@ -0,0 +1,233 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Record the results of the benchmark suite and check them for regressions.
+
+This runs //benchmarks:bench_test, records the results along with metadata
+about the machine and the software versions, and compares the results against
+a stored baseline. The exit code is non-zero if any benchmark is slower than
+the baseline by more than a relative threshold.
+
+Record a baseline using a known good version of CompilerGym:
+
+    $ bazel run -c opt //benchmarks:bench_regressions -- \\
+        --baseline=/path/to/baseline.json --update_baseline
+
+Then check a new version against it:
+
+    $ bazel run -c opt //benchmarks:bench_regressions -- \\
+        --baseline=/path/to/baseline.json
+
+Use :code:`--results` to compare an existing results file rather than running
+the suite, and :code:`--filter` to run a subset of the benchmarks. Results are
+only comparable when recorded on the same machine, so a warning is printed if
+the machine of the baseline differs.
+"""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from getpass import getuser
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from absl import app, flags
+
+import compiler_gym
+
+flags.DEFINE_string(
+    "baseline", None, "The path of the baseline results file to compare against."
+)
+flags.DEFINE_string(
+    "results",
+    None,
+    "The path of a results file to compare. If not set, the benchmark suite is "
+    "run and the results are written to --output_dir.",
+)
+flags.DEFINE_string(
+    "output_dir",
+    f"/tmp/compiler_gym_{getuser()}/bench_regressions",
+    "The directory to write the results of the benchmark suite to.",
+)
+flags.DEFINE_string(
+    "filter", None, "A pytest -k expression to select the benchmarks to run."
+)
+flags.DEFINE_float(
+    "threshold",
+    0.1,
+    "The relative slowdown of a benchmark compared to the baseline that is "
+    "considered a regression.",
+)
+flags.DEFINE_enum(
+    "stat",
+    "median",
+    ["min", "median", "mean"],
+    "The statistic of the benchmark timings to compare.",
+)
+flags.DEFINE_boolean(
+    "update_baseline",
+    False,
+    "Write the results to --baseline rather than comparing against it.",
+)
+FLAGS = flags.FLAGS
+
+# The fields of the pytest-benchmark machine info that must match for two
+# results files to be comparable.
+MACHINE_INFO_KEYS = ["node", "machine", "processor", "python_version"]
+
+
+class Comparison(NamedTuple):
+    """The comparison of a benchmark against its baseline."""
+
+    name: str
+    baseline: float
+    result: float
+
+    @property
+    def ratio(self) -> float:
+        return self.result / self.baseline if self.baseline else float("inf")
+
+
+def run_benchmarks(output: Path, keyword: Optional[str] = None) -> None:
+    """Run the benchmark suite and write the results to a file.
+
+    :param output: The path of the results file to write.
+
+    :param keyword: An optional pytest :code:`-k` expression to select the
+        benchmarks to run.
+    """
+    output.parent.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        sys.executable,
+        "-m",
+        "pytest",
+        str(Path(__file__).parent / "bench_test.py"),
+        f"--benchmark-json={output}",
+        "--benchmark-sort=name",
+        "-p",
+        "no:cacheprovider",
+    ]
+    if keyword:
+        cmd += ["-k", keyword]
+    returncode = subprocess.call(cmd)
+    if returncode:
+        raise OSError(f"Benchmark suite failed with returncode {returncode}")
+
+
+def add_metadata(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the CompilerGym metadata to a results dictionary.
+
+    pytest-benchmark records the machine and commit info. This adds the
+    version of CompilerGym, the platform, and the time of the run.
+    """
+    results["compiler_gym_info"] = {
+        "version": compiler_gym.__version__,
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(),
+    }
+    return results
+
+
+def load_stats(results: Dict[str, Any], stat: str) -> Dict[str, float]:
+    """Return a mapping from benchmark name to the chosen statistic."""
+    return {b["fullname"]: b["stats"][stat] for b in results.get("benchmarks", [])}
+
+
+def machine_differences(baseline: Dict[str, Any], results: Dict[str, Any]) -> List[str]:
+    """Return the machine info fields that differ between two results files."""
+    baseline_info = baseline.get("machine_info", {})
+    results_info = results.get("machine_info", {})
+    differences = [
+        key
+        for key in MACHINE_INFO_KEYS
+        if baseline_info.get(key) != results_info.get(key)
+    ]
+    baseline_cpu = baseline_info.get("cpu", {}).get("brand_raw")
+    if baseline_cpu != results_info.get("cpu", {}).get("brand_raw"):
+        differences.append("cpu")
+    return differences
+
+
+def compare(baseline: Dict[str, float], results: Dict[str, float]) -> List[Comparison]:
+    """Compare the benchmarks that are common to both results.
+
+    :param baseline: A mapping from benchmark name to baseline time.
+
+    :param results: A mapping from benchmark name to time.
+
+    :return: A list of comparisons, sorted by decreasing slowdown.
+    """
+    comparisons = [
+        Comparison(name=name, baseline=baseline[name], result=results[name])
+        for name in baseline.keys() & results.keys()
+    ]
+    return sorted(comparisons, key=lambda c: (-c.ratio, c.name))
+
+
+def main(argv):
+    assert len(argv) == 1, f"Unknown arguments: {argv[1:]}"
+    if not FLAGS.baseline:
+        raise app.UsageError("--baseline must be set")
+    baseline_path = Path(FLAGS.baseline)
+
+    if FLAGS.results:
+        results_path = Path(FLAGS.results)
+    else:
+        results_path = (
+            Path(FLAGS.output_dir) / f"{datetime.now():%Y-%m-%dT%H-%M-%S}.json"
+        )
+        run_benchmarks(results_path, FLAGS.filter)
+
+    with open(results_path) as f:
+        results = json.load(f)
+    if "compiler_gym_info" not in results:
+        add_metadata(results)
+        with open(results_path, "w") as f:
+            json.dump(results, f, indent=2)
+    print(f"Results written to {results_path}")
+
+    if FLAGS.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    differences = machine_differences(baseline, results)
+    if differences:
+        print(
+            "WARNING: The baseline was recorded on a different machine "
+            f"({', '.join(differences)} differ). Results may not be comparable.",
+            file=sys.stderr,
+        )
+
+    baseline_stats = load_stats(baseline, FLAGS.stat)
+    results_stats = load_stats(results, FLAGS.stat)
+    comparisons = compare(baseline_stats, results_stats)
+    regressions = [c for c in comparisons if c.ratio > 1 + FLAGS.threshold]
+
+    for c in comparisons:
+        status = "REGRESSION" if c in regressions else "ok"
+        print(
+            f"{status:10s} {c.ratio:6.2f}x  {c.baseline * 1000:10.3f}ms -> "
+            f"{c.result * 1000:10.3f}ms  {c.name}"
+        )
+    for name in sorted(baseline_stats.keys() - results_stats.keys()):
+        print(f"{'missing':10s} {name}")
+    for name in sorted(results_stats.keys() - baseline_stats.keys()):
+        print(f"{'new':10s} {name}")
+
+    print(
+        f"{len(regressions)} of {len(comparisons)} benchmarks regressed by more "
+        f"than {FLAGS.threshold:.0%} ({FLAGS.stat})"
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    app.run(main)
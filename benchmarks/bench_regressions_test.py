@@ -0,0 +1,102 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for //benchmarks:bench_regressions."""
+import json
+from pathlib import Path
+
+from absl import flags
+
+from benchmarks.bench_regressions import compare, load_stats, machine_differences
+from benchmarks.bench_regressions import main as bench_regressions
+from compiler_gym.util.capture_output import capture_output
+from tests.pytest_plugins.common import set_command_line_flags
+from tests.test_main import main
+
+FLAGS = flags.FLAGS
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+
+def make_results(times, node="a"):
+    return {
+        "machine_info": {"node": node},
+        "benchmarks": [
+            {"fullname": name, "stats": {"min": t, "median": t, "mean": t}}
+            for name, t in times.items()
+        ],
+    }
+
+
+def test_compare_sorted_by_slowdown():
+    comparisons = compare({"a": 1, "b": 1, "c": 1}, {"a": 1.5, "b": 0.5, "d": 1})
+    assert [c.name for c in comparisons] == ["a", "b"]
+    assert comparisons[0].ratio == 1.5
+    assert comparisons[1].ratio == 0.5
+
+
+def test_load_stats():
+    assert load_stats(make_results({"a": 1, "b": 2}), "median") == {"a": 1, "b": 2}
+
+
+def test_machine_differences():
+    assert machine_differences(make_results({}), make_results({})) == []
+    assert machine_differences(
+        make_results({}, node="a"), make_results({}, node="b")
+    ) == ["node"]
+
+
+def write_results(path: Path, times) -> Path:
+    with open(path, "w") as f:
+        json.dump(make_results(times), f)
+    return path
+
+
+def test_no_regressions(tmpwd: Path):
+    write_results(tmpwd / "baseline.json", {"a": 1, "b": 1})
+    write_results(tmpwd / "results.json", {"a": 1.05, "b": 0.5})
+    set_command_line_flags(
+        ["argv0", "--baseline=baseline.json", "--results=results.json"]
+    )
+    with capture_output() as out:
+        assert bench_regressions(["argv0"]) == 0
+    assert "0 of 2 benchmarks regressed" in out.stdout
+
+    # Metadata is added to the results file.
+    with open("results.json") as f:
+        assert "compiler_gym_info" in json.load(f)
+
+
+def test_regression(tmpwd: Path):
+    write_results(tmpwd / "baseline.json", {"a": 1, "b": 1, "c": 1})
+    write_results(tmpwd / "results.json", {"a": 1.5, "b": 1, "d": 1})
+    set_command_line_flags(
+        ["argv0", "--baseline=baseline.json", "--results=results.json"]
+    )
+    with capture_output() as out:
+        assert bench_regressions(["argv0"]) == 1
+    assert "REGRESSION" in out.stdout
+    assert "missing    c" in out.stdout
+    assert "new        d" in out.stdout
+    assert "1 of 2 benchmarks regressed" in out.stdout
+
+
+def test_update_baseline(tmpwd: Path):
+    write_results(tmpwd / "results.json", {"a": 1})
+    set_command_line_flags(
+        [
+            "argv0",
+            "--baseline=baselines/baseline.json",
+            "--results=results.json",
+            "--update_baseline",
+        ]
+    )
+    with capture_output():
+        assert bench_regressions(["argv0"]) == 0
+    with open("baselines/baseline.json") as f:
+        assert load_stats(json.load(f), "median") == {"a": 1}
+
+
+if __name__ == "__main__":
+    main()
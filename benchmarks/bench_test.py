@@ -14,8 +14,14 @@ multiple runs using:
 
     $ pytest-benchmark compare --group-by=name --sort=fullname \
         /tmp/compiler_gym_<user>/pytest_benchmark/*/*_bench_test.json
+
+To record results and check them for regressions against a stored baseline, use
+//benchmarks:bench_regressions.
+
+The GCC benchmarks require docker or a system GCC, and are skipped otherwise.
 """
 from getpass import getuser
+from itertools import islice
 
 import gym
 import pytest
@@ -23,9 +29,43 @@ import pytest
 import examples.example_compiler_gym_service as dummy
 from compiler_gym.envs import CompilerEnv, LlvmEnv, llvm
 from compiler_gym.service import CompilerGymServiceConnection
+from tests.pytest_plugins.gcc import with_gcc_support
 from tests.pytest_plugins.llvm import OBSERVATION_SPACE_NAMES, REWARD_SPACE_NAMES
 from tests.test_main import main
 
+# The number of rounds to use for benchmarks that require a fresh environment
+# for every round.
+COLD_ROUNDS = 10
+
+# The GCC observation spaces, excluding those that are derived from the same
+# compiler invocation as another space.
+GCC_OBSERVATION_SPACE_NAMES = [
+    "asm",
+    "asm_size",
+    "choices",
+    "command_line",
+    "instruction_counts",
+    "obj",
+    "obj_size",
+    "rtl",
+    "source",
+]
+
+LOOP_TOOL_OBSERVATION_SPACE_NAMES = ["action_state", "flops", "loop_tree"]
+
+
+def make_loop_tool_env():
+    env = gym.make("loop_tool-v0")
+    env.reset(
+        benchmark=env.datasets.benchmark("benchmark://loop_tool-cpu-v0/1024"),
+        action_space="simple",
+    )
+    return env
+
+
+def make_gcc_env():
+    return gym.make("gcc-v0", benchmark="benchmark://chstone-v0/adpcm")
+
 
 @pytest.fixture(
     params=["llvm-v0", "example-cc-v0", "example-py-v0"],
@@ -85,6 +125,34 @@ def test_reset(benchmark, make_env: CompilerEnv):
         benchmark(env.reset)
 
 
+@pytest.mark.parametrize(
+    "make_env",
+    [
+        lambda: gym.make("llvm-autophase-ic-v0", benchmark="cbench-v1/crc32"),
+        lambda: gym.make("llvm-autophase-ic-v0", benchmark="cbench-v1/jpeg-d"),
+        make_loop_tool_env,
+        pytest.param(make_gcc_env, marks=with_gcc_support),
+    ],
+    ids=["llvm;fast-benchmark", "llvm;slow-benchmark", "loop_tool", "gcc"],
+)
+def test_reset_cold_cache(benchmark, make_env: CompilerEnv):
+    """Benchmark the first reset of a new environment, before the compiler
+    service has cached the benchmark.
+    """
+    envs = []
+
+    def setup():
+        env = make_env()
+        envs.append(env)
+        return (env,), {}
+
+    try:
+        benchmark.pedantic(lambda env: env.reset(), setup=setup, rounds=COLD_ROUNDS)
+    finally:
+        for env in envs:
+            env.close()
+
+
 @pytest.mark.parametrize(
     "args",
     [
@@ -121,6 +189,46 @@ def test_step(benchmark, args):
         benchmark(env.step, action)
 
 
+# A representative action from each class of action: analyses and cheap
+# canonicalization passes, scalar transforms, loop transforms, and
+# interprocedural transforms.
+_args = {
+    f"llvm;{action_class}": action
+    for action_class, action in [
+        ("analysis", "-mem2reg"),
+        ("scalar", "-instcombine"),
+        ("loop", "-loop-unroll"),
+        ("interprocedural", "-inline"),
+    ]
+}
+
+
+@pytest.mark.parametrize("action", _args.values(), ids=_args.keys())
+def test_step_action_class(benchmark, action: str):
+    with gym.make("llvm-v0", benchmark="cbench-v1/qsort") as env:
+        env.reset()
+        action = env.action_space[action]
+
+        # Reset before every round so that each round applies the action to
+        # the same program state.
+        def setup():
+            env.reset()
+            return (action,), {}
+
+        benchmark.pedantic(env.step, setup=setup, rounds=20)
+
+
+@pytest.mark.parametrize(
+    "make_env",
+    [make_loop_tool_env, pytest.param(make_gcc_env, marks=with_gcc_support)],
+    ids=["loop_tool", "gcc"],
+)
+def test_step_other_envs(benchmark, make_env):
+    with make_env() as env:
+        env.reset()
+        benchmark(lambda: env.step(env.action_space.sample()))
+
+
 _args = dict(
     {
         f"llvm;{obs}": (lambda: gym.make("llvm-v0", benchmark="cbench-v1/qsort"), obs)
@@ -141,6 +249,20 @@ def test_observation(benchmark, args):
         benchmark(lambda: env.observation[observation_space])
 
 
+@pytest.mark.parametrize("observation_space", LOOP_TOOL_OBSERVATION_SPACE_NAMES)
+def test_loop_tool_observation(benchmark, observation_space: str):
+    with make_loop_tool_env() as env:
+        benchmark(lambda: env.observation[observation_space])
+
+
+@with_gcc_support
+@pytest.mark.parametrize("observation_space", GCC_OBSERVATION_SPACE_NAMES)
+def test_gcc_observation(benchmark, observation_space: str):
+    with make_gcc_env() as env:
+        env.reset()
+        benchmark(lambda: env.observation[observation_space])
+
+
 _args = dict(
     {
         f"llvm;{reward}": (
@@ -181,6 +303,60 @@ def test_fork(benchmark, make_env):
         benchmark(lambda: env.fork().close())
 
 
+@pytest.mark.parametrize(
+    "benchmark_name",
+    ["cbench-v1/crc32", "cbench-v1/jpeg-d"],
+    ids=["fast-benchmark", "slow-benchmark"],
+)
+def test_validate(benchmark, benchmark_name: str):
+    with gym.make("llvm-v0", benchmark=benchmark_name) as env:
+        env.reset()
+        env.step(env.action_space["-mem2reg"])
+        benchmark(env.validate)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("llvm-v0", "cbench-v1"),
+        ("llvm-v0", "generator://csmith-v0"),
+        ("llvm-v0", "github-v0"),
+        ("loop_tool-v0", "loop_tool-cpu-v0"),
+    ],
+    ids=["llvm;cbench", "llvm;csmith", "llvm;github", "loop_tool"],
+)
+def test_dataset_iteration(benchmark, args):
+    """Benchmark iterating over the first 100 URIs of a dataset."""
+    env_id, dataset_name = args
+    with gym.make(env_id) as env:
+        dataset = env.datasets[dataset_name]
+        benchmark(lambda: list(islice(dataset.benchmark_uris(), 100)))
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("llvm-v0", "benchmark://cbench-v1/crc32"),
+        ("llvm-v0", "generator://csmith-v0/0"),
+        ("loop_tool-v0", "benchmark://loop_tool-cpu-v0/1024"),
+    ],
+    ids=["llvm;cbench", "llvm;csmith", "loop_tool"],
+)
+def test_benchmark_from_dataset(benchmark, args):
+    env_id, uri = args
+    with gym.make(env_id) as env:
+        benchmark(lambda: env.datasets.benchmark(uri))
+
+
+def test_make_benchmark_from_source(benchmark, tmp_path):
+    """Benchmark compiling a C source file to a benchmark."""
+    source = tmp_path / "a.c"
+    source.write_text(
+        "int A(int n) { int s = 0; for (int i = 0; i < n; ++i) s += i; return s; }"
+    )
+    benchmark(lambda: llvm.make_benchmark(source))
+
+
 if __name__ == "__main__":
     main(
         extra_pytest_args=[
@@ -0,0 +1,267 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""A load test for comparing compiler service topologies.
+
+This benchmark measures the throughput and latency of reset() and step() as a
+function of the number of concurrent workers, for three ways of arranging
+environments and compiler services:
+
+    env_per_service: Every worker has its own environment and service.
+
+    shared_service: Every worker has its own environment, and all environments
+        share a single service using the :code:`service_connection` argument.
+
+    service_pool: Every worker has its own environment, and environments are
+        assigned round-robin to a pool of :code:`--num_services` services.
+
+Each topology is run with each of the values of
+:code:`--rpc_service_thread_counts`, which is passed to the compiler service to
+set the size of its RPC thread pool.
+Workers are threads, since environments that share a service cannot be split
+across processes.
+
+The results are written as CSV to :code:`--logfile`. After all runs have
+completed, a summary of the knee point of each configuration is printed. The
+knee point is the smallest number of workers that achieves at least
+:code:`1 - --knee_threshold` of the peak throughput of the configuration.
+Adding more workers past the knee point increases latency without a
+substantial increase in throughput.
+
+Example usage:
+
+    $ bazel run -c opt //benchmarks:service_topology_load_test -- \\
+        --env=llvm-v0 --benchmark=cbench-v1/crc32 --workers=1,2,4,8,16 \\
+        --rpc_service_thread_counts=1,4,16
+"""
+from threading import Thread
+from time import perf_counter
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import gym
+import numpy as np
+from absl import app, flags
+
+from compiler_gym.envs import CompilerEnv
+from compiler_gym.util.flags.benchmark_from_flags import benchmark_from_flags
+from compiler_gym.util.flags.env_from_flags import connection_settings_from_flags
+from compiler_gym.util.timer import Timer
+
+TOPOLOGIES = ["env_per_service", "shared_service", "service_pool"]
+
+flags.DEFINE_list(
+    "topologies",
+    TOPOLOGIES,
+    f"The service topologies to run. One or more of: {', '.join(TOPOLOGIES)}.",
+)
+flags.DEFINE_list(
+    "workers", ["1", "2", "4", "8", "16"], "The numbers of concurrent workers."
+)
+flags.DEFINE_list(
+    "rpc_service_thread_counts",
+    ["1", "4", "16"],
+    "The sizes of the RPC thread pool of the compiler service, which are passed "
+    "to the service using its --rpc_service_threads flag.",
+)
+flags.DEFINE_integer(
+    "num_services", 4, "The number of services in the service_pool topology."
+)
+flags.DEFINE_integer(
+    "num_episodes", 10, "The number of episodes to run in each worker."
+)
+flags.DEFINE_integer("num_steps", 50, "The number of steps in each episode.")
+flags.DEFINE_float(
+    "knee_threshold",
+    0.1,
+    "The fraction of peak throughput below which a worker count is not "
+    "considered to have reached the knee point.",
+)
+flags.DEFINE_string(
+    "logfile",
+    "service_topology_load_test.csv",
+    "The path of the file to write results to.",
+)
+FLAGS = flags.FLAGS
+
+CSV_COLUMNS = [
+    "topology",
+    "rpc_service_threads",
+    "workers",
+    "services",
+    "resets",
+    "steps",
+    "walltime",
+    "steps_per_second",
+    "reset_p50_ms",
+    "reset_p99_ms",
+    "step_p50_ms",
+    "step_p99_ms",
+]
+
+
+class Latencies(NamedTuple):
+    """The latencies of the calls made by a worker, in seconds."""
+
+    reset: List[float]
+    step: List[float]
+
+
+def run_worker(
+    env: CompilerEnv, num_episodes: int, num_steps: int, latencies: Latencies
+) -> None:
+    """The inner loop of a load test worker."""
+    for _ in range(num_episodes):
+        start = perf_counter()
+        env.reset()
+        latencies.reset.append(perf_counter() - start)
+        for _ in range(num_steps):
+            action = env.action_space.sample()
+            start = perf_counter()
+            _, _, done, _ = env.step(action)
+            latencies.step.append(perf_counter() - start)
+            if done:
+                break
+
+
+def make_env(rpc_service_threads: int, service_env: Optional[CompilerEnv] = None):
+    """Create an environment, optionally sharing the service of another."""
+    if service_env:
+        return gym.make(
+            FLAGS.env,
+            benchmark=benchmark_from_flags(),
+            service_connection=service_env.service,
+        )
+    connection_settings = connection_settings_from_flags()
+    connection_settings.script_args = [f"--rpc_service_threads={rpc_service_threads}"]
+    return gym.make(
+        FLAGS.env,
+        benchmark=benchmark_from_flags(),
+        connection_settings=connection_settings,
+    )
+
+
+def run_load_test(topology: str, workers: int, rpc_service_threads: int) -> List[Any]:
+    """Run a single configuration of the load test and return a row of CSV."""
+    # The environments that own the services. These have an active session for
+    # the duration of the run so that the shared services are kept alive.
+    if topology == "env_per_service":
+        service_envs = []
+    elif topology == "shared_service":
+        service_envs = [make_env(rpc_service_threads)]
+    elif topology == "service_pool":
+        service_envs = [
+            make_env(rpc_service_threads)
+            for _ in range(min(FLAGS.num_services, workers))
+        ]
+    else:
+        raise app.UsageError(f"Unknown topology: {topology}")
+
+    for env in service_envs:
+        env.reset()
+
+    envs = [
+        make_env(
+            rpc_service_threads,
+            service_envs[i % len(service_envs)] if service_envs else None,
+        )
+        for i in range(workers)
+    ]
+    latencies = [Latencies(reset=[], step=[]) for _ in range(workers)]
+    threads = [
+        Thread(
+            target=run_worker,
+            args=(env, FLAGS.num_episodes, FLAGS.num_steps, worker_latencies),
+        )
+        for env, worker_latencies in zip(envs, latencies)
+    ]
+    try:
+        with Timer(
+            f"Run {workers} workers with {topology} and "
+            f"{rpc_service_threads} RPC threads"
+        ) as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        for env in envs + service_envs:
+            env.close()
+
+    reset_latencies = np.array([t for w in latencies for t in w.reset])
+    step_latencies = np.array([t for w in latencies for t in w.step])
+    return [
+        topology,
+        rpc_service_threads,
+        workers,
+        len(service_envs) or workers,
+        len(reset_latencies),
+        len(step_latencies),
+        timer.time,
+        len(step_latencies) / timer.time,
+        np.percentile(reset_latencies, 50) * 1000,
+        np.percentile(reset_latencies, 99) * 1000,
+        np.percentile(step_latencies, 50) * 1000,
+        np.percentile(step_latencies, 99) * 1000,
+    ]
+
+
+def knee_point(throughputs: Dict[int, float], threshold: float) -> int:
+    """Return the smallest number of workers that achieves at least
+    :code:`1 - threshold` of the peak throughput.
+
+    :param throughputs: A mapping from number of workers to throughput.
+
+    :param threshold: The fraction of the peak throughput that may be given up.
+
+    :return: A number of workers.
+    """
+    peak = max(throughputs.values())
+    return min(
+        workers
+        for workers, throughput in throughputs.items()
+        if throughput >= (1 - threshold) * peak
+    )
+
+
+def main(argv):
+    assert len(argv) == 1, f"Unknown arguments: {argv[1:]}"
+    if not FLAGS.env:
+        raise app.UsageError("--env must be set")
+
+    workers_list = [int(x) for x in FLAGS.workers]
+    rpc_service_threads_list = [int(x) for x in FLAGS.rpc_service_thread_counts]
+
+    rows = []
+    with open(FLAGS.logfile, "w") as f:
+        print(*CSV_COLUMNS, sep=",", file=f)
+        for topology in FLAGS.topologies:
+            for rpc_service_threads in rpc_service_threads_list:
+                for workers in workers_list:
+                    row = run_load_test(topology, workers, rpc_service_threads)
+                    print(*row, sep=",", file=f, flush=True)
+                    rows.append(dict(zip(CSV_COLUMNS, row)))
+
+    print("Knee points:")
+    for topology in FLAGS.topologies:
+        for rpc_service_threads in rpc_service_threads_list:
+            config = [
+                row
+                for row in rows
+                if row["topology"] == topology
+                and row["rpc_service_threads"] == rpc_service_threads
+            ]
+            knee = knee_point(
+                {row["workers"]: row["steps_per_second"] for row in config},
+                FLAGS.knee_threshold,
+            )
+            knee_row = next(row for row in config if row["workers"] == knee)
+            print(
+                f"  {topology}, {rpc_service_threads} RPC threads: {knee} workers, "
+                f"{knee_row['steps_per_second']:.1f} steps/sec, "
+                f"p99 step latency {knee_row['step_p99_ms']:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    app.run(main)
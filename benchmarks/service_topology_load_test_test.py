@@ -0,0 +1,59 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Smoke test for //benchmarks:service_topology_load_test."""
+import csv
+from pathlib import Path
+
+from absl import flags
+
+from benchmarks.service_topology_load_test import knee_point
+from benchmarks.service_topology_load_test import main as load_test
+from compiler_gym.util.capture_output import capture_output
+from tests.pytest_plugins.common import set_command_line_flags, skip_on_ci
+from tests.test_main import main
+
+FLAGS = flags.FLAGS
+
+pytest_plugins = ["tests.pytest_plugins.llvm", "tests.pytest_plugins.common"]
+
+
+def test_knee_point():
+    assert knee_point({1: 100, 2: 190, 4: 250, 8: 260}, 0.1) == 4
+    assert knee_point({1: 100, 2: 190, 4: 250, 8: 260}, 0) == 8
+    assert knee_point({1: 100, 2: 90}, 0.1) == 1
+
+
+@skip_on_ci
+def test_load_test(env, tmpwd):
+    del env  # Unused.
+    set_command_line_flags(
+        [
+            "argv0",
+            "--env=llvm-v0",
+            "--benchmark=cbench-v1/crc32",
+            "--workers=1,2",
+            "--rpc_service_thread_counts=2",
+            "--num_services=2",
+            "--num_steps=2",
+            "--num_episodes=2",
+        ]
+    )
+    with capture_output() as out:
+        load_test(["argv0"])
+
+    for topology in ["env_per_service", "shared_service", "service_pool"]:
+        assert f"Run 1 workers with {topology} and 2 RPC threads in " in out.stdout
+        assert f"Run 2 workers with {topology} and 2 RPC threads in " in out.stdout
+        assert f"  {topology}, 2 RPC threads: " in out.stdout
+
+    with open(tmpwd / "service_topology_load_test.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 6
+    assert [row["services"] for row in rows] == ["1", "2", "1", "1", "1", "2"]
+    assert Path("service_topology_load_test.csv").is_file()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,8 @@ except ModuleNotFoundError as e:
 
 from compiler_gym.compiler_env_state import (
     CompilerEnvState,
+    CompilerEnvStateColumnarReader,
+    CompilerEnvStateColumnarWriter,
     CompilerEnvStateReader,
     CompilerEnvStateWriter,
 )
@@ -62,6 +64,8 @@ __all__ = [
     "CompilerEnvState",
     "CompilerEnvStateWriter",
     "CompilerEnvStateReader",
+    "CompilerEnvStateColumnarWriter",
+    "CompilerEnvStateColumnarReader",
     "download",
     "get_debug_level",
     "get_logging_level",
@@ -4,8 +4,14 @@
 # LICENSE file in the root directory of this source tree.
 """This module defines a class to represent a compiler environment state."""
 import csv
+import json
+import math
+import os
+import struct
 import sys
-from typing import Iterable, List, Optional, TextIO
+from array import array
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, TextIO, Union
 
 from pydantic import BaseModel, Field, validator
 
@@ -224,6 +230,496 @@ class CompilerEnvStateReader:
         for path in paths:
             if path == "-":
                 yield from iter(CompilerEnvStateReader(sys.stdin))
+            elif is_columnar_state_file(path):
+                with CompilerEnvStateColumnarReader(path) as reader:
+                    yield from iter(reader)
             else:
                 with open(path) as f:
                     yield from iter(CompilerEnvStateReader(f))
+
+
+# The magic bytes at the start of a columnar state file.
+_COLUMNAR_MAGIC = b"CGSTCOL1"
+# The header of each chunk: a tag, the number of rows in the chunk, the number
+# of new benchmark and commandline token dictionary entries that the chunk
+# introduces, and the total number of actions in the chunk.
+_CHUNK_HEADER = struct.Struct("<4sIIII")
+_CHUNK_TAG = b"CHNK"
+_INDEX_VERSION = 1
+# An array typecode for unsigned 32-bit integers.
+_UINT32 = "I" if array("I").itemsize == 4 else "L"
+
+
+def is_columnar_state_file(path: Union[str, Path]) -> bool:
+    """Return whether the given path is a columnar state file, as written by
+    :class:`CompilerEnvStateColumnarWriter`.
+
+    :param path: The path of a file.
+
+    :return: :code:`True` if the file starts with the columnar magic bytes.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_COLUMNAR_MAGIC)) == _COLUMNAR_MAGIC
+    except OSError:
+        return False
+
+
+def columnar_state_index_path(path: Union[str, Path]) -> Path:
+    """Return the path of the sidecar index for a columnar state file.
+
+    :param path: The path of a columnar state file.
+
+    :return: The path of the index.
+    """
+    path = Path(path)
+    return path.parent / f"{path.name}.idx"
+
+
+def _write_array(f: BinaryIO, values: array) -> None:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    f.write(values.tobytes())
+
+
+def _read_array(f: BinaryIO, typecode: str, count: int) -> array:
+    values = array(typecode)
+    size = values.itemsize * count
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated columnar state file")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _write_strings(f: BinaryIO, strings: List[str]) -> None:
+    for string in strings:
+        encoded = string.encode("utf-8")
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+
+
+def _read_strings(f: BinaryIO, count: int) -> List[str]:
+    strings = []
+    for _ in range(count):
+        (size,) = struct.unpack("<I", f.read(4))
+        strings.append(f.read(size).decode("utf-8"))
+    return strings
+
+
+class CompilerEnvStateChunk(NamedTuple):
+    """A chunk of states read from a columnar state file.
+
+    The columns of the chunk are exposed directly so that large logs can be
+    processed without constructing a :class:`CompilerEnvState` per row.
+    """
+
+    benchmarks: List[str]
+    """The benchmark URI of each row."""
+
+    rewards: array
+    """The reward of each row, or :code:`nan` if the row has no reward."""
+
+    walltimes: array
+    """The walltime of each row."""
+
+    actions: List[array]
+    """The packed commandline token indices of each row."""
+
+    tokens: List[str]
+    """The commandline token dictionary used to decode :code:`actions`."""
+
+    def __len__(self) -> int:
+        return len(self.benchmarks)
+
+    def commandline(self, row: int) -> str:
+        """Reconstruct the commandline of a row.
+
+        :param row: The index of a row in the chunk.
+
+        :return: A commandline string.
+        """
+        return " ".join(self.tokens[i] for i in self.actions[row])
+
+    def states(self) -> Iterable[CompilerEnvState]:
+        """Return an iterator over the states in this chunk."""
+        for i in range(len(self)):
+            # The fields were validated when the state was written, so skip
+            # the cost of validation on the read path.
+            yield CompilerEnvState.construct(
+                benchmark=self.benchmarks[i],
+                commandline=self.commandline(i),
+                walltime=self.walltimes[i],
+                reward=None if math.isnan(self.rewards[i]) else self.rewards[i],
+            )
+
+
+class CompilerEnvStateColumnarWriter:
+    """Serialize compiler environment states to a binary columnar file.
+
+    States are buffered and written in chunks. Within a chunk, benchmark URIs
+    are dictionary encoded, rewards and walltimes are stored as float64
+    columns, and each commandline is split into space-separated tokens which
+    are dictionary encoded and stored as a packed array of uint32 indices.
+    For a commandline produced by :meth:`CompilerEnv.commandline()
+    <compiler_gym.envs.CompilerEnv.commandline>`, each token is an action, so
+    a state costs a few bytes per action rather than a copy of every flag.
+
+    The dictionaries are delta encoded: each chunk carries only the entries
+    that it introduces, so a file can be read as a stream. When the writer is
+    closed, a JSON sidecar index is written alongside the file that records
+    the offset of each chunk and the chunks containing each benchmark, which
+    allows :meth:`CompilerEnvStateColumnarReader.read_benchmark` to seek
+    directly to the states for a benchmark.
+
+    Example use:
+
+        >>> with CompilerEnvStateColumnarWriter("results.cgstate") as writer:
+        ...     writer.write_state(env.state)
+    """
+
+    def __init__(self, path: Union[str, Path], chunk_size: int = 4096):
+        """Constructor.
+
+        :param path: The path of the file to write.
+
+        :param chunk_size: The maximum number of states per chunk.
+
+        :raises ValueError: If the chunk size is not positive.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"Chunk size must be positive, received: {chunk_size}")
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.f = open(self.path, "wb")
+        self.f.write(_COLUMNAR_MAGIC)
+
+        self._benchmark_ids: Dict[str, int] = {}
+        self._token_ids: Dict[str, int] = {}
+        self._benchmarks_written = 0
+        self._tokens_written = 0
+        self._chunk_offsets: List[int] = []
+        self._benchmark_chunks: Dict[int, List[int]] = {}
+        self._num_states = 0
+        self._reset_buffer()
+
+    def _reset_buffer(self) -> None:
+        self._buffered_benchmarks = array(_UINT32)
+        self._buffered_rewards = array("d")
+        self._buffered_walltimes = array("d")
+        self._buffered_action_counts = array(_UINT32)
+        self._buffered_actions = array(_UINT32)
+
+    def _intern(self, table: Dict[str, int], value: str) -> int:
+        index = table.get(value)
+        if index is None:
+            index = len(table)
+            table[value] = index
+        return index
+
+    def write_state(self, state: CompilerEnvState, flush: bool = False) -> None:
+        """Write the state to file.
+
+        :param state: A compiler environment state.
+
+        :param flush: Write any buffered states to file immediately.
+        """
+        self._buffered_benchmarks.append(
+            self._intern(self._benchmark_ids, state.benchmark)
+        )
+        self._buffered_rewards.append(
+            math.nan if state.reward is None else state.reward
+        )
+        self._buffered_walltimes.append(state.walltime)
+        tokens = state.commandline.split(" ") if state.commandline else []
+        self._buffered_action_counts.append(len(tokens))
+        self._buffered_actions.extend(
+            self._intern(self._token_ids, token) for token in tokens
+        )
+        if flush or len(self._buffered_benchmarks) >= self.chunk_size:
+            self.flush()
+
+    def write_states(self, states: Iterable[CompilerEnvState]) -> None:
+        """Write a sequence of states to file.
+
+        :param states: An iterable of compiler environment states.
+        """
+        for state in states:
+            self.write_state(state)
+
+    def flush(self) -> None:
+        """Write any buffered states to file as a new chunk."""
+        num_rows = len(self._buffered_benchmarks)
+        if not num_rows:
+            return
+
+        chunk = len(self._chunk_offsets)
+        self._chunk_offsets.append(self.f.tell())
+        for benchmark in set(self._buffered_benchmarks):
+            self._benchmark_chunks.setdefault(benchmark, []).append(chunk)
+
+        # The dictionaries preserve insertion order, so the entries that this
+        # chunk introduces are the tail of each dictionary.
+        new_benchmarks = list(self._benchmark_ids)[self._benchmarks_written :]
+        new_tokens = list(self._token_ids)[self._tokens_written :]
+
+        self.f.write(
+            _CHUNK_HEADER.pack(
+                _CHUNK_TAG,
+                num_rows,
+                len(new_benchmarks),
+                len(new_tokens),
+                len(self._buffered_actions),
+            )
+        )
+        _write_strings(self.f, new_benchmarks)
+        _write_strings(self.f, new_tokens)
+        _write_array(self.f, self._buffered_benchmarks)
+        _write_array(self.f, self._buffered_rewards)
+        _write_array(self.f, self._buffered_walltimes)
+        _write_array(self.f, self._buffered_action_counts)
+        _write_array(self.f, self._buffered_actions)
+        self.f.flush()
+
+        self._benchmarks_written += len(new_benchmarks)
+        self._tokens_written += len(new_tokens)
+        self._num_states += num_rows
+        self._reset_buffer()
+
+    def close(self) -> None:
+        """Write any buffered states and the sidecar index, and close the file."""
+        if self.f.closed:
+            return
+        self.flush()
+        self.f.close()
+
+        benchmarks = list(self._benchmark_ids)
+        index = {
+            "version": _INDEX_VERSION,
+            "num_states": self._num_states,
+            "chunk_offsets": self._chunk_offsets,
+            "benchmarks": benchmarks,
+            "tokens": list(self._token_ids),
+            "benchmark_chunks": {
+                benchmarks[k]: v for k, v in self._benchmark_chunks.items()
+            },
+        }
+        # Write the index atomically so that a reader never sees a partial
+        # index.
+        index_path = columnar_state_index_path(self.path)
+        tmp_path = index_path.parent / f".{index_path.name}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    def __enter__(self):
+        """Support with-statement for the writer."""
+        return self
+
+    def __exit__(self, *args):
+        """Support with-statement for the writer."""
+        self.close()
+
+
+class CompilerEnvStateColumnarReader:
+    """Read states from a binary columnar file written by
+    :class:`CompilerEnvStateColumnarWriter`.
+
+    The file is read one chunk at a time, so memory usage is bounded by the
+    chunk size rather than the size of the file.
+
+    Example usage:
+
+        >>> with CompilerEnvStateColumnarReader("results.cgstate") as reader:
+        ...     for state in reader:
+        ...         print(state)
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Constructor.
+
+        :param path: The path of the file to read.
+
+        :raises ValueError: If the file is not a columnar state file.
+        """
+        self.path = Path(path)
+        self.f = open(self.path, "rb")
+        if self.f.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+            self.f.close()
+            raise ValueError(f"Not a columnar state file: {self.path}")
+        self._index: Optional[Dict] = None
+
+    @property
+    def index(self) -> Dict:
+        """The sidecar index of the file.
+
+        :raises FileNotFoundError: If the file has no index, e.g. because the
+            writer was not closed.
+        """
+        if self._index is None:
+            index_path = columnar_state_index_path(self.path)
+            if not index_path.is_file():
+                raise FileNotFoundError(f"Index not found: {index_path}")
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get("version") != _INDEX_VERSION:
+                raise ValueError(f"Unsupported index version: {index.get('version')}")
+            self._index = index
+        return self._index
+
+    @property
+    def benchmarks(self) -> List[str]:
+        """The list of unique benchmark URIs in the file, from the index."""
+        return list(self.index["benchmark_chunks"])
+
+    def __len__(self) -> int:
+        """The number of states in the file, from the index."""
+        return self.index["num_states"]
+
+    def _read_chunk(
+        self, benchmarks: List[str], tokens: List[str], extend_dictionaries: bool
+    ) -> Optional[CompilerEnvStateChunk]:
+        """Read the chunk at the current file position.
+
+        When streaming, the new dictionary entries of the chunk are appended to
+        :code:`benchmarks` and :code:`tokens`. When seeking directly to a chunk
+        the complete dictionaries from the index are used instead.
+        """
+        header = self.f.read(_CHUNK_HEADER.size)
+        if not header:
+            return None
+        if len(header) != _CHUNK_HEADER.size:
+            raise ValueError("Truncated columnar state file")
+        tag, num_rows, num_benchmarks, num_tokens, num_actions = _CHUNK_HEADER.unpack(
+            header
+        )
+        if tag != _CHUNK_TAG:
+            raise ValueError(f"Invalid chunk tag in columnar state file: {tag}")
+
+        new_benchmarks = _read_strings(self.f, num_benchmarks)
+        new_tokens = _read_strings(self.f, num_tokens)
+        if extend_dictionaries:
+            benchmarks.extend(new_benchmarks)
+            tokens.extend(new_tokens)
+
+        benchmark_ids = _read_array(self.f, _UINT32, num_rows)
+        rewards = _read_array(self.f, "d", num_rows)
+        walltimes = _read_array(self.f, "d", num_rows)
+        action_counts = _read_array(self.f, _UINT32, num_rows)
+        packed_actions = _read_array(self.f, _UINT32, num_actions)
+
+        actions = []
+        start = 0
+        for count in action_counts:
+            actions.append(packed_actions[start : start + count])
+            start += count
+
+        return CompilerEnvStateChunk(
+            benchmarks=[benchmarks[i] for i in benchmark_ids],
+            rewards=rewards,
+            walltimes=walltimes,
+            actions=actions,
+            tokens=tokens,
+        )
+
+    def iter_chunks(self) -> Iterable[CompilerEnvStateChunk]:
+        """Stream the chunks of the file in order.
+
+        This does not require the sidecar index.
+
+        :return: An iterator over chunks.
+        """
+        self.f.seek(len(_COLUMNAR_MAGIC))
+        benchmarks: List[str] = []
+        tokens: List[str] = []
+        while True:
+            chunk = self._read_chunk(benchmarks, tokens, extend_dictionaries=True)
+            if chunk is None:
+                return
+            yield chunk
+
+    def __iter__(self) -> Iterable[CompilerEnvState]:
+        """Read the states from the file."""
+        for chunk in self.iter_chunks():
+            yield from chunk.states()
+
+    def read_benchmark(self, benchmark: str) -> Iterable[CompilerEnvState]:
+        """Read only the states for a single benchmark.
+
+        The sidecar index is used to seek to the chunks that contain the
+        benchmark, skipping the rest of the file.
+
+        :param benchmark: A benchmark URI.
+
+        :return: An iterator over the states for the benchmark, in the order
+            that they were written.
+
+        :raises FileNotFoundError: If the file has no index.
+        """
+        index = self.index
+        for chunk_index in index["benchmark_chunks"].get(benchmark, []):
+            self.f.seek(index["chunk_offsets"][chunk_index])
+            chunk = self._read_chunk(
+                index["benchmarks"], index["tokens"], extend_dictionaries=False
+            )
+            for state in chunk.states():
+                if state.benchmark == benchmark:
+                    yield state
+
+    def __enter__(self):
+        """Support with-statement for the reader."""
+        return self
+
+    def __exit__(self, *args):
+        """Support with-statement for the reader."""
+        self.f.close()
+
+
+def convert_csv_to_columnar(
+    csv_path: Union[str, Path], path: Union[str, Path], chunk_size: int = 4096
+) -> int:
+    """Convert a CSV file of states to a columnar state file.
+
+    :param csv_path: The path of a CSV file, as written by
+        :class:`CompilerEnvStateWriter`.
+
+    :param path: The path of the columnar file to write.
+
+    :param chunk_size: The maximum number of states per chunk.
+
+    :return: The number of states converted.
+    """
+    count = 0
+    with open(csv_path) as f, CompilerEnvStateColumnarWriter(
+        path, chunk_size=chunk_size
+    ) as writer:
+        for state in CompilerEnvStateReader(f):
+            writer.write_state(state)
+            count += 1
+    return count
+
+
+def convert_columnar_to_csv(
+    path: Union[str, Path], csv_path: Union[str, Path], header: bool = True
+) -> int:
+    """Convert a columnar state file to a CSV file of states.
+
+    :param path: The path of a columnar state file, as written by
+        :class:`CompilerEnvStateColumnarWriter`.
+
+    :param csv_path: The path of the CSV file to write.
+
+    :param header: Whether to include a header row.
+
+    :return: The number of states converted.
+    """
+    count = 0
+    with CompilerEnvStateColumnarReader(path) as reader, open(csv_path, "w") as f:
+        writer = CompilerEnvStateWriter(f, header=header)
+        for state in reader:
+            writer.write_state(state)
+            count += 1
+    return count
@@ -0,0 +1,226 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""This module defines helpers for generating benchmarks ahead of time."""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from compiler_gym.datasets.benchmark import Benchmark
+
+# A module-level lock that guards the creation of the prefetchers of
+# PrefetchingDatasetMixin. We don't use per-dataset locks as locks cannot be
+# pickled.
+_PREFETCHER_LOCK = Lock()
+
+
+class BenchmarkPrefetcher:
+    """Generates random benchmarks from seeds using a pool of background
+    threads.
+
+    This is for datasets that generate benchmarks on demand from a numeric
+    seed, where generation is slow enough to dominate the cost of
+    :meth:`env.reset() <compiler_gym.envs.CompilerEnv.reset>`. The prefetcher
+    keeps a bounded queue of benchmarks that are being generated in the
+    background. Every call to :meth:`random_benchmark()` takes the oldest
+    benchmark from the queue and schedules the generation of a new one.
+
+    The seeds of the queued benchmarks are drawn from a random number generator
+    that is owned by the prefetcher, so prefetching does not consume values from
+    any other random state. The sequence of benchmarks is determined by the
+    initial state of this generator.
+
+    Generation is performed by threads as the work is done by subprocesses.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[int], Benchmark],
+        max_seed: int,
+        random_state: Optional[np.random.Generator] = None,
+        queue_size: int = 16,
+        num_workers: int = 4,
+    ):
+        """Constructor.
+
+        :param generate: A callback that generates a benchmark from a seed.
+
+        :param max_seed: The exclusive upper bound of the seeds to generate.
+
+        :param random_state: The random number generator that the seeds of
+            benchmarks are drawn from. The prefetcher takes ownership of this
+            generator. If not provided, a generator is created with an
+            unpredictable seed.
+
+        :param queue_size: The maximum number of benchmarks to generate ahead
+            of time.
+
+        :param num_workers: The number of background threads to use for
+            generation.
+
+        :raises ValueError: If :code:`queue_size` or :code:`num_workers` is
+            not positive.
+        """
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be positive, received: {queue_size}")
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be positive, received: {num_workers}")
+        self.generate = generate
+        self.max_seed = max_seed
+        self.queue_size = queue_size
+        self._random_state = random_state or np.random.default_rng()
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="BenchmarkPrefetcher"
+        )
+        self._queue: Deque[Tuple[int, Future]] = deque()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def _fill(self) -> None:
+        """Top up the queue. Must hold the lock."""
+        while len(self._queue) < self.queue_size:
+            seed = int(self._random_state.integers(self.max_seed))
+            self._queue.append((seed, self._executor.submit(self.generate, seed)))
+
+    def random_benchmark(self) -> Benchmark:
+        """Return the oldest benchmark in the queue.
+
+        :return: A benchmark.
+
+        :raises: Any error raised by the generate callback for this benchmark.
+        """
+        with self._lock:
+            self._fill()
+            _, future = self._queue.popleft()
+            self._fill()
+        return future.result()
+
+    def prefetched_benchmark(self, seed: int) -> Optional[Benchmark]:
+        """Take a benchmark from the queue by seed.
+
+        :param seed: The seed of the benchmark.
+
+        :return: The benchmark if it is in the queue, else :code:`None`.
+
+        :raises: Any error raised by the generate callback for this benchmark.
+        """
+        with self._lock:
+            for i, (queued_seed, future) in enumerate(self._queue):
+                if queued_seed == seed:
+                    del self._queue[i]
+                    break
+            else:
+                return None
+        return future.result()
+
+    def close(self) -> None:
+        """Cancel the generation of queued benchmarks and stop the workers."""
+        with self._lock:
+            for _, future in self._queue:
+                future.cancel()
+            self._queue.clear()
+        self._executor.shutdown(wait=False)
+
+
+class PrefetchingDatasetMixin:
+    """A mixin for datasets that generate benchmarks from numeric seeds, adding
+    a :meth:`prefetch()` method that generates random benchmarks in the
+    background using a :class:`BenchmarkPrefetcher`.
+
+    The mixin must precede :class:`Dataset <compiler_gym.datasets.Dataset>` in
+    the base classes. Classes that use it set the :code:`max_seed` attribute,
+    implement :code:`_benchmark_from_seed(seed)` to generate a benchmark, and
+    call :meth:`_random_prefetched_benchmark()` and
+    :meth:`_prefetched_benchmark()` from their implementations of
+    :code:`_random_benchmark()` and :code:`benchmark_from_seed()`.
+    """
+
+    # The exclusive upper bound of the seeds of the dataset.
+    max_seed: int
+    # The arguments of the last call to prefetch(). The prefetcher is created
+    # from these on the first call to random_benchmark().
+    _prefetch_options: Optional[Dict[str, int]] = None
+    _prefetcher: Optional[BenchmarkPrefetcher] = None
+
+    def __getstate__(self):
+        # The prefetcher owns a thread pool and a lock, which cannot be pickled.
+        # It is recreated on the next call to random_benchmark().
+        state = self.__dict__.copy()
+        state["_prefetcher"] = None
+        return state
+
+    def prefetch(self, queue_size: int = 16, num_workers: int = 4) -> None:
+        """Generate random benchmarks in the background.
+
+        Once called, :meth:`random_benchmark()
+        <compiler_gym.datasets.Dataset.random_benchmark>` returns benchmarks from
+        a queue that is filled by a pool of background workers. See
+        :class:`BenchmarkPrefetcher
+        <compiler_gym.datasets.benchmark_prefetcher.BenchmarkPrefetcher>`.
+
+        The workers are started by the next call to :meth:`random_benchmark()
+        <compiler_gym.datasets.Dataset.random_benchmark>`. The seeds of
+        prefetched benchmarks are drawn from a separate random number generator
+        that is seeded by a single draw from the :code:`random_state` of that
+        call, so a given random state produces a reproducible sequence of
+        benchmarks, though not the same sequence as without prefetching.
+
+        :param queue_size: The number of benchmarks to generate ahead of time.
+            If zero, prefetching is stopped.
+
+        :param num_workers: The number of background workers.
+        """
+        with _PREFETCHER_LOCK:
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+                self._prefetcher = None
+            self._prefetch_options = None
+            if queue_size:
+                self.install()
+                self._prefetch_options = {
+                    "queue_size": queue_size,
+                    "num_workers": num_workers,
+                }
+
+    def _random_prefetched_benchmark(
+        self, random_state: np.random.Generator
+    ) -> Optional[Benchmark]:
+        """Return the next benchmark from the prefetcher, creating the
+        prefetcher if required.
+
+        The prefetcher draws seeds from its own random number generator, which
+        is seeded by a single draw from :code:`random_state` when the
+        prefetcher is created.
+
+        :return: A benchmark, or :code:`None` if prefetching is not enabled.
+        """
+        with _PREFETCHER_LOCK:
+            if not self._prefetch_options:
+                return None
+            if self._prefetcher is None:
+                self._prefetcher = BenchmarkPrefetcher(
+                    self._benchmark_from_seed,
+                    max_seed=self.max_seed,
+                    random_state=np.random.default_rng(
+                        random_state.integers(self.max_seed)
+                    ),
+                    **self._prefetch_options,
+                )
+            prefetcher = self._prefetcher
+        return prefetcher.random_benchmark()
+
+    def _prefetched_benchmark(self, seed: int) -> Optional[Benchmark]:
+        """Take the benchmark for a seed from the prefetcher.
+
+        :return: The benchmark if it has been prefetched, else :code:`None`.
+        """
+        prefetcher = self._prefetcher
+        if prefetcher is None:
+            return None
+        return prefetcher.prefetched_benchmark(seed)
@@ -0,0 +1,134 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""This module defines a persistent, memory-mapped index of benchmark URIs."""
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from compiler_gym.util.filesystem import atomic_file_write
+
+# The magic bytes at the start of an index file.
+_MAGIC = b"CGURIDX1"
+# The file header: magic bytes and the number of URIs.
+_HEADER = struct.Struct("<8sQ")
+
+
+class BenchmarkUriIndex:
+    """A read-only list of benchmark URIs that is backed by a memory-mapped
+    file.
+
+    The index file stores a table of :code:`N + 1` byte offsets followed by the
+    UTF-8 encoded URIs, one per line. This gives constant-time :code:`len()` and
+    random access by ordinal without reading the URIs into memory. Since the
+    file is memory-mapped, the pages are shared by every process that opens the
+    same index.
+
+    Create an index using :meth:`BenchmarkUriIndex.write()
+    <compiler_gym.datasets.benchmark_uri_index.BenchmarkUriIndex.write>`:
+
+        >>> BenchmarkUriIndex.write(path, dataset.benchmark_uris())
+        >>> index = BenchmarkUriIndex(path)
+        >>> len(index)
+        1000
+        >>> index[0]
+        'benchmark://ds-v0/a'
+    """
+
+    def __init__(self, path: Path):
+        """Constructor.
+
+        :param path: The path of an index file.
+
+        :raises FileNotFoundError: If the file does not exist.
+
+        :raises ValueError: If the file is not a valid index.
+        """
+        self.path = Path(path)
+        self._open()
+
+    def _open(self) -> None:
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"Invalid benchmark URI index: {self.path}")
+        magic, self._size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Invalid benchmark URI index: {self.path}")
+        self._offsets = memoryview(self._mmap)[
+            _HEADER.size : _HEADER.size + 8 * (self._size + 1)
+        ].cast("Q")
+        self._data_start = _HEADER.size + 8 * (self._size + 1)
+
+    @classmethod
+    def write(cls, path: Path, uris: Iterable[str]) -> int:
+        """Write an index file atomically.
+
+        The URIs are stored in the order that they are provided, so that
+        iteration order is consistent with the order of the dataset that
+        produced them.
+
+        :param path: The path of the index file to write.
+
+        :param uris: An iterable of benchmark URIs.
+
+        :return: The number of URIs written.
+        """
+        encoded = [f"{uri}\n".encode("utf-8") for uri in uris]
+        offsets = array("Q", [0])
+        for uri in encoded:
+            offsets.append(offsets[-1] + len(uri))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_file_write(path, fileobj=True) as f:
+            f.write(_HEADER.pack(_MAGIC, len(encoded)))
+            f.write(offsets.tobytes())
+            f.writelines(encoded)
+        return len(encoded)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(f"Benchmark URI index out of range: {i}")
+        start, end = self._offset(i), self._offset(i + 1) - 1
+        return self._mmap[self._data_start + start : self._data_start + end].decode(
+            "utf-8"
+        )
+
+    def _offset(self, i: int) -> int:
+        offset = self._offsets[i]
+        if sys.byteorder != "little":
+            offset = int.from_bytes(offset.to_bytes(8, "big"), "little")
+        return offset
+
+    def __iter__(self) -> Iterator[str]:
+        # Scan for line endings rather than using the mmap file position so
+        # that concurrent iterators over the same index are independent.
+        start = self._data_start
+        for _ in range(self._size):
+            end = self._mmap.find(b"\n", start)
+            yield self._mmap[start:end].decode("utf-8")
+            start = end + 1
+
+    def close(self) -> None:
+        """Release the memory map."""
+        self._offsets.release()
+        self._mmap.close()
+
+    def __getstate__(self):
+        # Memory maps cannot be pickled, so re-open the index on unpickle.
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
@@ -4,10 +4,11 @@
 # LICENSE file in the root directory of this source tree.
 import os
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
 import numpy as np
 
+from compiler_gym.datasets.benchmark_uri_index import BenchmarkUriIndex
 from compiler_gym.datasets.dataset import Benchmark, Dataset
 from compiler_gym.util.decorators import memoized_property
 
@@ -46,6 +47,7 @@ class FilesDataset(Dataset):
         dataset_root: Path,
         benchmark_file_suffix: str = "",
         memoize_uris: bool = True,
+        benchmark_uri_index: bool = False,
         **dataset_args,
     ):
         """Constructor.
@@ -61,6 +63,14 @@ class FilesDataset(Dataset):
             <compiler_gym.datasets.Dataset.benchmark_uris>` at the expense of
             increased memory overhead as the file list must be kept in memory.
 
+        :param benchmark_uri_index: Whether to persist the list of URIs
+            contained in the dataset to an on-disk index in the site data
+            directory. The index is built once and then provides constant-time
+            :code:`len()` and random benchmark selection, and memory-mapped
+            iteration that is shared by all processes. Only enable this if the
+            contents of :code:`dataset_root` do not change after the index is
+            built.
+
         :param dataset_args: See :meth:`Dataset.__init__()
             <compiler_gym.datasets.Dataset.__init__>`.
         """
@@ -68,20 +78,75 @@ class FilesDataset(Dataset):
         self.dataset_root = dataset_root
         self.benchmark_file_suffix = benchmark_file_suffix
         self.memoize_uris = memoize_uris
+        self.benchmark_uri_index = benchmark_uri_index
         self._memoized_uris = None
+        self._benchmark_uri_index = None
 
     @memoized_property
     def size(self) -> int:  # pylint: disable=invalid-overriden-method
+        if self._uri_index is not None:
+            return len(self._uri_index)
         self.install()
         return sum(
             sum(1 for f in files if f.endswith(self.benchmark_file_suffix))
             for (_, _, files) in os.walk(self.dataset_root)
         )
 
+    @property
+    def _benchmark_uri_index_path(self) -> Path:
+        """The path of the on-disk benchmark URI index."""
+        return self.site_data_path / "benchmark_uris.idx"
+
+    def _benchmark_uris_for_index(self) -> Iterable[str]:
+        """Return the URIs to write to the on-disk index.
+
+        This must not call :meth:`install()
+        <compiler_gym.datasets.Dataset.install>`, as it is called from within
+        the install routine of subclasses.
+        """
+        return self._walk_benchmark_uris()
+
+    def _write_benchmark_uri_index(self) -> None:
+        """Write the on-disk benchmark URI index, replacing any existing index."""
+        if self._benchmark_uri_index is not None:
+            self._benchmark_uri_index.close()
+            self._benchmark_uri_index = None
+        BenchmarkUriIndex.write(
+            self._benchmark_uri_index_path, self._benchmark_uris_for_index()
+        )
+
+    def _build_benchmark_uri_index(self) -> None:
+        """Build the on-disk benchmark URI index when it is first required."""
+        self.install()
+        self._write_benchmark_uri_index()
+
+    @property
+    def _uri_index(self) -> Optional[BenchmarkUriIndex]:
+        """Return the on-disk benchmark URI index, building it if required, or
+        :code:`None` if the index is not enabled.
+        """
+        if not self.benchmark_uri_index:
+            return None
+        if self._benchmark_uri_index is None:
+            if not self._benchmark_uri_index_path.is_file():
+                # The index is written atomically, so concurrent builders at
+                # worst perform redundant work.
+                self._build_benchmark_uri_index()
+            self._benchmark_uri_index = BenchmarkUriIndex(
+                self._benchmark_uri_index_path
+            )
+        return self._benchmark_uri_index
+
     @property
     def _benchmark_uris_iter(self) -> Iterable[str]:
         """Return an iterator over benchmark URIs that is consistent across runs."""
         self.install()
+        yield from self._walk_benchmark_uris()
+
+    def _walk_benchmark_uris(self) -> Iterable[str]:
+        """Walk the dataset root to enumerate the benchmark URIs. Does not
+        install the dataset.
+        """
         for root, dirs, files in os.walk(self.dataset_root):
             # Sort the subdirectories so that os.walk() order is stable between
             # runs.
@@ -103,7 +168,9 @@ class FilesDataset(Dataset):
         return list(self._benchmark_uris_iter)
 
     def benchmark_uris(self) -> Iterable[str]:
-        if self._memoized_uris:
+        if self._uri_index is not None:
+            yield from self._uri_index
+        elif self._memoized_uris:
             yield from self._memoized_uris
         elif self.memoize_uris:
             self._memoized_uris = self._benchmark_uris
@@ -121,4 +188,7 @@ class FilesDataset(Dataset):
         return self.benchmark_class.from_file(uri, abspath)
 
     def _random_benchmark(self, random_state: np.random.Generator) -> Benchmark:
+        if self._uri_index is not None:
+            index = self._uri_index
+            return self.benchmark(index[int(random_state.integers(len(index)))])
         return self.benchmark(random_state.choice(list(self.benchmark_uris())))
@@ -7,15 +7,17 @@ import gzip
 import io
 import logging
 import shutil
+import subprocess
 import tarfile
-from threading import Lock
-from typing import Iterable, List, Optional
+from pathlib import Path
+from threading import Lock, Thread
+from typing import BinaryIO, Iterable, List, Optional
 
 from fasteners import InterProcessLock
 
 from compiler_gym.datasets.files_dataset import FilesDataset
 from compiler_gym.util.decorators import memoized_property
-from compiler_gym.util.download import download
+from compiler_gym.util.download import download, open_download
 from compiler_gym.util.filesystem import atomic_file_write
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,99 @@ logger = logging.getLogger(__name__)
 _TAR_INSTALL_LOCK = Lock()
 _TAR_MANIFEST_INSTALL_LOCK = Lock()
 
+# Multi-threaded decompressors that are used in place of the Python standard
+# library decompressors when available, in order of preference.
+_PARALLEL_DECOMPRESSORS = {
+    "bz2": ["lbzip2", "pbzip2"],
+    "gz": ["pigz"],
+}
+
+# The number of seconds to wait for the thread that feeds a decompressor to
+# exit once the decompressor has ended.
+_FEEDER_JOIN_TIMEOUT_SECONDS = 60
+
+
+def _parallel_decompressor(compression: str) -> Optional[List[str]]:
+    """Return the command of a multi-threaded decompressor for the given
+    compression type, or :code:`None` if one is not available.
+    """
+    for name in _PARALLEL_DECOMPRESSORS.get(compression, []):
+        path = shutil.which(name)
+        if path:
+            return [path, "-d", "-c"]
+    return None
+
+
+def extract_tar_stream(
+    f: BinaryIO, compression: str, outdir: Path, parallel: bool = True
+) -> None:
+    """Extract a compressed tar archive from a non-seekable stream.
+
+    The archive is decompressed and extracted as it is read, so the archive is
+    never held in memory.
+
+    :param f: A readable stream of compressed tar archive data. If extraction
+        fails, the stream is closed.
+
+    :param compression: The archive compression type. One of {"bz2", "gz"}.
+
+    :param outdir: The directory to extract to.
+
+    :param parallel: If :code:`True` and a multi-threaded decompressor for the
+        compression type is installed (:code:`lbzip2` or :code:`pbzip2` for
+        bz2, :code:`pigz` for gz), decompress in a subprocess using that
+        decompressor.
+    """
+    cmd = _parallel_decompressor(compression) if parallel else None
+    if not cmd:
+        with tarfile.open(fileobj=f, mode=f"r|{compression}") as arc:
+            arc.extractall(str(outdir))
+        return
+
+    logger.debug("Decompressing with %s", cmd[0])
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feeder_error: List[Exception] = []
+
+    def feed_decompressor():
+        try:
+            shutil.copyfileobj(f, process.stdin)
+        except Exception as e:  # pylint: disable=broad-except
+            feeder_error.append(e)
+        finally:
+            process.stdin.close()
+
+    feeder = Thread(target=feed_decompressor, daemon=True)
+    feeder.start()
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as arc:
+            arc.extractall(str(outdir))
+        # Drain any trailing padding so that the decompressor can exit.
+        while process.stdout.read(1024 * 1024):
+            pass
+    except Exception as e:
+        # An error reading the input is the root cause of any extraction error.
+        # Errors that occur after the decompressor is killed, such as a broken
+        # pipe, are caused by the kill and are ignored.
+        input_error = feeder_error[0] if feeder_error else None
+        process.kill()
+        # The feeder may be blocked reading the input, so close the input to
+        # interrupt the read. The underlying raw stream is closed as closing a
+        # buffered stream waits for the read to complete.
+        getattr(f, "raw", f).close()
+        if input_error:
+            raise input_error from e
+        raise
+    finally:
+        feeder.join(timeout=_FEEDER_JOIN_TIMEOUT_SECONDS)
+        if feeder.is_alive():
+            logger.warning("Timed out waiting for the input of %s to close", cmd[0])
+        process.stdout.close()
+        returncode = process.wait()
+    if feeder_error:
+        raise feeder_error[0]
+    if returncode:
+        raise OSError(f"{cmd[0]} failed with returncode {returncode}")
+
 
 class TarDataset(FilesDataset):
     """A dataset comprising a files tree stored in a tar archive.
@@ -41,6 +136,7 @@ class TarDataset(FilesDataset):
         tar_sha256: Optional[str] = None,
         tar_compression: str = "bz2",
         strip_prefix: str = "",
+        benchmark_uri_index: bool = True,
         **dataset_args,
     ):
         """Constructor.
@@ -55,11 +151,17 @@ class TarDataset(FilesDataset):
         :param strip_prefix: An optional path prefix to strip. Only files that
             match this path prefix will be used as benchmarks.
 
+        :param benchmark_uri_index: Whether to write an on-disk index of the
+            benchmark URIs once the archive has been unpacked. See
+            :meth:`FilesDataset.__init__()
+            <compiler_gym.datasets.FilesDataset.__init__>`.
+
         :param dataset_args: See :meth:`FilesDataset.__init__()
             <compiler_gym.datasets.FilesDataset.__init__>`.
         """
         super().__init__(
             dataset_root=None,  # Set below once site_data_path is resolved.
+            benchmark_uri_index=benchmark_uri_index,
             **dataset_args,
         )
         self.dataset_root = self.site_data_path / "contents" / strip_prefix
@@ -91,17 +193,28 @@ class TarDataset(FilesDataset):
 
             # Remove any partially-completed prior extraction.
             shutil.rmtree(self.site_data_path / "contents", ignore_errors=True)
+            if self._benchmark_uri_index_path.is_file():
+                self._benchmark_uri_index_path.unlink()
 
             logger.warning(
                 "Installing the %s dataset. This may take a few moments ...", self.name
             )
 
-            tar_data = io.BytesIO(download(self.tar_urls, self.tar_sha256))
+            # Stream the archive through the decompressor and into extraction
+            # as it is downloaded. The checksum is validated on exiting the
+            # context, before the install is marked as complete.
             logger.info("Unpacking %s dataset to %s", self.name, self.site_data_path)
-            with tarfile.open(
-                fileobj=tar_data, mode=f"r:{self.tar_compression}"
-            ) as arc:
-                arc.extractall(str(self.site_data_path / "contents"))
+            with open_download(self.tar_urls, self.tar_sha256) as tar_data:
+                extract_tar_stream(
+                    tar_data,
+                    self.tar_compression,
+                    self.site_data_path / "contents",
+                )
+
+            # Index the extracted benchmarks before marking the install as
+            # complete so that an installed dataset always has an index.
+            if self.benchmark_uri_index:
+                self._write_benchmark_uri_index()
 
             # We're done. The last thing we do is create the marker file to
             # signal to any other install() invocations that the dataset is
@@ -157,6 +270,18 @@ class TarDatasetWithManifest(TarDataset):
 
         self._manifest_lockfile = self.site_data_path / ".manifest_lock"
 
+    @property
+    def _benchmark_uri_index_path(self) -> Path:
+        return self.site_data_path / f"benchmark_uris-{self.manifest_sha256}.idx"
+
+    def _benchmark_uris_for_index(self) -> Iterable[str]:
+        # Build the index from the manifest so that it does not require the
+        # archive to be downloaded and unpacked.
+        return self._benchmark_uris
+
+    def _build_benchmark_uri_index(self) -> None:
+        self._write_benchmark_uri_index()
+
     def _read_manifest(self, manifest_data: str) -> List[str]:
         """Read the manifest data into a list of URIs. Does not validate the
         manifest contents.
@@ -217,7 +342,12 @@ class TarDatasetWithManifest(TarDataset):
 
     @memoized_property
     def size(self) -> int:
+        if self._uri_index is not None:
+            return len(self._uri_index)
         return len(self._benchmark_uris)
 
     def benchmark_uris(self) -> Iterable[str]:
-        yield from iter(self._benchmark_uris)
+        if self._uri_index is not None:
+            yield from self._uri_index
+        else:
+            yield from iter(self._benchmark_uris)
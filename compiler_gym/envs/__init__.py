@@ -2,6 +2,7 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+from compiler_gym.envs.async_compiler_env import AsyncCompilerEnv
 from compiler_gym.envs.compiler_env import CompilerEnv
 from compiler_gym.envs.gcc import GccEnv
 from compiler_gym.envs.llvm.llvm_env import LlvmEnv
@@ -9,6 +10,7 @@ from compiler_gym.envs.loop_tool.loop_tool_env import LoopToolEnv
 from compiler_gym.util.registration import COMPILER_GYM_ENVS
 
 __all__ = [
+    "AsyncCompilerEnv",
     "COMPILER_GYM_ENVS",
     "CompilerEnv",
     "GccEnv",
@@ -0,0 +1,505 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""This module defines an asyncio interface to compiler service sessions."""
+import asyncio
+import logging
+from collections.abc import Iterable as IterableType
+from copy import deepcopy
+from functools import partial
+from time import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from compiler_gym.datasets import Benchmark
+from compiler_gym.envs.compiler_env import CompilerEnv, _step_request_actions
+from compiler_gym.service import (
+    ServiceError,
+    ServiceOSError,
+    ServiceTransportError,
+    SessionNotFound,
+)
+from compiler_gym.service.benchmark_upload import (
+    add_benchmark_request,
+    benchmark_reference,
+)
+from compiler_gym.service.connection import AsyncConnection
+from compiler_gym.service.proto import AddBenchmarkRequest
+from compiler_gym.service.proto import Benchmark as BenchmarkProto
+from compiler_gym.service.proto import (
+    EndSessionRequest,
+    ForkSessionReply,
+    ForkSessionRequest,
+    StartSessionRequest,
+    StepReply,
+    StepRequest,
+)
+from compiler_gym.spaces import Reward
+from compiler_gym.util.gym_type_hints import (
+    ActionType,
+    ObservationType,
+    RewardType,
+    StepType,
+)
+from compiler_gym.views import ObservationSpaceSpec, ObservationView
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCompilerEnv:
+    """An asyncio interface to a compiler service session.
+
+    An :class:`AsyncCompilerEnv` runs an episode on the service of an existing
+    :class:`CompilerEnv <compiler_gym.envs.CompilerEnv>`, using an
+    :class:`AsyncConnection <compiler_gym.service.connection.AsyncConnection>`
+    to make RPC calls without blocking. Many async environments can share a
+    single connection, so one process can drive hundreds of concurrent episodes
+    from a single thread:
+
+        >>> env = gym.make("llvm-v0", observation_space="Autophase")
+        >>> connection = AsyncConnection(env.service.connection.url)
+        >>> async def run_episode():
+        ...     async_env = AsyncCompilerEnv(env, connection)
+        ...     observation = await async_env.reset()
+        ...     observation, reward, done, info = await async_env.step(0)
+        ...     await async_env.close()
+        >>> await asyncio.gather(*[run_episode() for _ in range(100)])
+
+    The action space, observation spaces, reward spaces, and benchmark are
+    taken from the environment passed to the constructor. The environment owns
+    the service, so it must not be closed until the async environments are
+    done.
+
+    Reward spaces that request additional observations from their
+    :code:`observation_view`, such as the initial cost of a benchmark, compute
+    them using the blocking connection of the environment. These calls, and
+    resolving benchmark URIs that may generate or compile a benchmark, are run
+    in the default executor of the event loop so that they do not stall other
+    coroutines.
+    """
+
+    def __init__(self, env: CompilerEnv, connection: AsyncConnection):
+        """Constructor.
+
+        :param env: The environment that provides the service and the spaces.
+
+        :param connection: The connection to use for RPC calls.
+        """
+        self.env = env
+        self.connection = connection
+        self.actions: List[ActionType] = []
+        self.episode_reward: Optional[float] = None
+        self.episode_start_time: float = time()
+        self._session_id: Optional[int] = None
+        self._benchmark_in_use: Benchmark = env.benchmark
+        self._action_space_index = (
+            [a.name for a in env.action_spaces].index(env.action_space_name)
+            if env.action_space_name
+            else 0
+        )
+        self.observation_space_spec: Optional[
+            ObservationSpaceSpec
+        ] = env.observation_space_spec
+        # Rewards are stateful, so each async environment has its own copy.
+        self.reward_spaces: Dict[str, Reward] = deepcopy(env.reward.spaces)
+        self.reward_space: Optional[Reward] = (
+            self.reward_spaces[env.reward_space.id] if env.reward_space else None
+        )
+
+    @property
+    def observation_spaces(self) -> Dict[str, ObservationSpaceSpec]:
+        """The observation spaces of the environment."""
+        return self.env.observation.spaces
+
+    @property
+    def benchmark(self) -> Benchmark:
+        """The benchmark of the current episode."""
+        return self._benchmark_in_use
+
+    @property
+    def in_episode(self) -> bool:
+        """Whether the environment is in an episode."""
+        return self._session_id is not None
+
+    def _observation_view(self) -> ObservationView:
+        """Return an observation view of this session that is used to compute
+        observations on behalf of reward spaces.
+        """
+        view = ObservationView(
+            raw_step=self._blocking_raw_step,
+            spaces=self.env.service.observation_spaces,
+        )
+        view.spaces = self.observation_spaces
+        return view
+
+    async def _run_in_executor(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call in the default executor of the event loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
+
+    def _blocking_raw_step(
+        self,
+        actions: List[ActionType],
+        observations: List[ObservationSpaceSpec],
+        rewards: List[Reward],
+    ) -> StepType:
+        del rewards  # unused
+        reply: StepReply = self.env.service(
+            self.env.service.stub.Step,
+            self._step_request(actions, observations),
+        )
+        return (
+            [
+                space.translate(value)
+                for space, value in zip(observations, reply.observation)
+            ],
+            [],
+            reply.end_of_session,
+            {},
+        )
+
+    def _step_request(
+        self, actions: List[ActionType], observations: List[ObservationSpaceSpec]
+    ) -> StepRequest:
+        return StepRequest(
+            session_id=self._session_id,
+            **_step_request_actions(self.env.service, actions),
+            observation_space=[space.index for space in observations],
+        )
+
+    async def _end_session(self) -> None:
+        try:
+            await self.connection(
+                self.connection.stub.EndSession,
+                EndSessionRequest(session_id=self._session_id),
+            )
+        except (ServiceError, ServiceTransportError, TimeoutError) as e:
+            logger.warning(
+                "Failed to stop session %d with %s: %s",
+                self._session_id,
+                type(e).__name__,
+                e,
+            )
+        self._session_id = None
+
+    async def reset(
+        self, benchmark: Optional[Union[str, Benchmark]] = None
+    ) -> Optional[ObservationType]:
+        """Reset the environment state.
+
+        :param benchmark: The benchmark to use. If not provided, the benchmark
+            of the previous episode is used.
+
+        :return: The initial observation, if an observation space is set.
+        """
+        if self.in_episode:
+            await self._end_session()
+
+        if isinstance(benchmark, str):
+            benchmark = await self._run_in_executor(
+                self.env.datasets.benchmark, benchmark
+            )
+        if benchmark:
+            self._benchmark_in_use = benchmark
+
+        # As with CompilerEnv.reset(), send only the benchmark URI unless
+        # configured otherwise.
+        request = StartSessionRequest(
+            benchmark=(
+                (
+                    benchmark_reference(self._benchmark_in_use.proto)
+                    or self._benchmark_in_use.proto
+                )
+                if self.connection.opts.always_send_benchmark_on_reset
+                else BenchmarkProto(uri=self._benchmark_in_use.uri)
+            ),
+            action_space=self._action_space_index,
+            observation_space=(
+                [self.observation_space_spec.index]
+                if self.observation_space_spec
+                else None
+            ),
+        )
+        try:
+            reply = await self.connection(self.connection.stub.StartSession, request)
+        except FileNotFoundError:
+            # The benchmark was not found, so try adding it and then repeating
+            # the request. As with CompilerEnv.reset(), a reference to the
+            # program contents is sent before uploading them.
+            proto = self._benchmark_in_use.proto
+            reference = benchmark_reference(proto)
+            added = False
+            if reference and not self.connection.opts.always_send_benchmark_on_reset:
+                try:
+                    await self.connection(
+                        self.connection.stub.AddBenchmark,
+                        AddBenchmarkRequest(benchmark=[reference]),
+                    )
+                    added = True
+                except FileNotFoundError:
+                    pass
+            if not added:
+                await self.connection(
+                    *add_benchmark_request(self.connection.stub, proto)
+                )
+            reply = await self.connection(self.connection.stub.StartSession, request)
+
+        self._session_id = reply.session_id
+        self.episode_start_time = time()
+        self.actions = []
+
+        await self._run_in_executor(self._reset_reward_spaces)
+        if self.reward_space:
+            self.episode_reward = 0.0
+
+        if self.observation_space_spec:
+            if len(reply.observation) != 1:
+                raise OSError(
+                    "Expected one observation from service, "
+                    f"received {len(reply.observation)}"
+                )
+            return self.observation_space_spec.translate(reply.observation[0])
+
+    async def raw_step(
+        self,
+        actions: Iterable[ActionType],
+        observations: Iterable[ObservationSpaceSpec],
+        rewards: Iterable[Reward],
+    ) -> StepType:
+        """Take a step.
+
+        This has the same semantics as :meth:`CompilerEnv.raw_step()
+        <compiler_gym.envs.CompilerEnv.raw_step>`.
+        """
+        if not self.in_episode:
+            raise SessionNotFound("Must call reset() before step()")
+
+        actions = list(actions)
+        user_observation_spaces: List[ObservationSpaceSpec] = list(observations)
+        reward_spaces: List[Reward] = list(rewards)
+
+        reward_observation_spaces: List[ObservationSpaceSpec] = []
+        for reward_space in reward_spaces:
+            reward_observation_spaces += [
+                self.observation_spaces[obs] for obs in reward_space.observation_spaces
+            ]
+
+        observations_to_compute: List[ObservationSpaceSpec] = list(
+            set(user_observation_spaces).union(set(reward_observation_spaces))
+        )
+        observation_space_index_map: Dict[ObservationSpaceSpec, int] = {
+            observation_space: i
+            for i, observation_space in enumerate(observations_to_compute)
+        }
+
+        self.actions += actions
+
+        try:
+            try:
+                reply: StepReply = await self.connection(
+                    self.connection.stub.Step,
+                    self._step_request(actions, observations_to_compute),
+                )
+            except FileNotFoundError as e:
+                if str(e).startswith("Session not found"):
+                    raise SessionNotFound(str(e))
+                raise
+        except (
+            ServiceError,
+            ServiceTransportError,
+            ServiceOSError,
+            TimeoutError,
+            SessionNotFound,
+        ) as e:
+            # Gracefully handle "expected" error types by ending the episode.
+            info = {
+                "error_type": type(e).__name__,
+                "error_details": str(e),
+            }
+            await self.close()
+            default_observations = [
+                observation_space.default_value
+                for observation_space in user_observation_spaces
+            ]
+            default_rewards = [
+                float(reward_space.reward_on_error(self.episode_reward))
+                for reward_space in reward_spaces
+            ]
+            return default_observations, default_rewards, True, info
+
+        if len(reply.observation) != len(observations_to_compute):
+            raise ServiceError(
+                f"Requested {len(observations_to_compute)} observations "
+                f"but received {len(reply.observation)}"
+            )
+        computed_observations = [
+            observation_space.translate(value)
+            for observation_space, value in zip(
+                observations_to_compute, reply.observation
+            )
+        ]
+
+        observations: List[ObservationType] = [
+            computed_observations[observation_space_index_map[observation_space]]
+            for observation_space in user_observation_spaces
+        ]
+
+        rewards: List[RewardType] = []
+        if reward_spaces:
+            rewards = await self._run_in_executor(
+                self._update_reward_spaces,
+                actions,
+                reward_spaces,
+                [
+                    [
+                        computed_observations[
+                            observation_space_index_map[
+                                self.observation_spaces[observation_space]
+                            ]
+                        ]
+                        for observation_space in reward_space.observation_spaces
+                    ]
+                    for reward_space in reward_spaces
+                ],
+            )
+
+        info = {
+            "action_had_no_effect": reply.action_had_no_effect,
+            "new_action_space": reply.HasField("new_action_space"),
+        }
+
+        return observations, rewards, reply.end_of_session, info
+
+    def _reset_reward_spaces(self) -> None:
+        """Reset the reward spaces. This may block to compute observations."""
+        observation_view = self._observation_view()
+        for reward_space in self.reward_spaces.values():
+            reward_space.reset(
+                benchmark=self._benchmark_in_use, observation_view=observation_view
+            )
+
+    def _update_reward_spaces(
+        self,
+        actions: List[ActionType],
+        reward_spaces: List[Reward],
+        reward_observations: List[List[ObservationType]],
+    ) -> List[RewardType]:
+        """Compute the rewards of a step. This may block to compute
+        observations.
+        """
+        observation_view = self._observation_view()
+        return [
+            float(reward_space.update(actions, observations, observation_view))
+            for reward_space, observations in zip(reward_spaces, reward_observations)
+        ]
+
+    async def step(
+        self,
+        action: Union[ActionType, Iterable[ActionType]],
+        observations: Optional[Iterable[Union[str, ObservationSpaceSpec]]] = None,
+        rewards: Optional[Iterable[Union[str, Reward]]] = None,
+    ) -> StepType:
+        """Take a step.
+
+        This has the same semantics as :meth:`CompilerEnv.step()
+        <compiler_gym.envs.CompilerEnv.step>`.
+        """
+        actions = action if isinstance(action, IterableType) else [action]
+
+        if observations:
+            observation_spaces: List[ObservationSpaceSpec] = [
+                obs
+                if isinstance(obs, ObservationSpaceSpec)
+                else self.observation_spaces[obs]
+                for obs in observations
+            ]
+        elif self.observation_space_spec:
+            observation_spaces = [self.observation_space_spec]
+        else:
+            observation_spaces = []
+
+        if rewards:
+            reward_spaces: List[Reward] = [
+                rew if isinstance(rew, Reward) else self.reward_spaces[rew]
+                for rew in rewards
+            ]
+        elif self.reward_space:
+            reward_spaces = [self.reward_space]
+        else:
+            reward_spaces = []
+
+        observation_values, reward_values, done, info = await self.raw_step(
+            actions, observation_spaces, reward_spaces
+        )
+
+        if observations is None and self.observation_space_spec:
+            observation_values = observation_values[0]
+        elif not observation_spaces:
+            observation_values = None
+
+        if rewards is None and self.reward_space:
+            reward_values = reward_values[0]
+            self.episode_reward += reward_values
+        elif not reward_spaces:
+            reward_values = None
+
+        return observation_values, reward_values, done, info
+
+    async def observation(
+        self, observation_space: Union[str, ObservationSpaceSpec]
+    ) -> ObservationType:
+        """Compute an observation of the current state.
+
+        :param observation_space: The observation space to compute.
+
+        :return: An observation.
+
+        :raises ServiceError: If the service fails to compute the observation.
+        """
+        if not isinstance(observation_space, ObservationSpaceSpec):
+            observation_space = self.observation_spaces[observation_space]
+        observations, _, done, info = await self.raw_step([], [observation_space], [])
+        if done:
+            msg = f"Failed to compute observation '{observation_space.id}'"
+            if info.get("error_details"):
+                msg += f": {info['error_details']}"
+            raise ServiceError(msg)
+        return observations[0]
+
+    async def fork(self) -> "AsyncCompilerEnv":
+        """Fork a new environment with exactly the same state.
+
+        The new environment shares the connection of this environment.
+
+        :return: A new environment instance.
+
+        :raises SessionNotFound: If :meth:`reset()` has not been called.
+        """
+        if not self.in_episode:
+            raise SessionNotFound("Must call reset() before fork()")
+
+        reply: ForkSessionReply = await self.connection(
+            self.connection.stub.ForkSession,
+            ForkSessionRequest(session_id=self._session_id),
+        )
+        new_env = type(self)(self.env, self.connection)
+        new_env._session_id = reply.session_id  # pylint: disable=protected-access
+        new_env._benchmark_in_use = self._benchmark_in_use
+        new_env._action_space_index = self._action_space_index
+        new_env.reward_spaces = deepcopy(self.reward_spaces)
+        new_env.observation_space_spec = self.observation_space_spec
+        if self.reward_space:
+            new_env.reward_space = new_env.reward_spaces[self.reward_space.id]
+        new_env.episode_reward = self.episode_reward
+        new_env.episode_start_time = self.episode_start_time
+        new_env.actions = self.actions.copy()
+        return new_env
+
+    async def close(self) -> None:
+        """End the current episode, if any.
+
+        This does not close the connection, which may be shared with other
+        environments.
+        """
+        if self.in_episode:
+            await self._end_session()
@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 """This module defines the OpenAI gym interface for compilers."""
+import json
 import logging
 import numbers
 import warnings
@@ -11,7 +12,17 @@ from copy import deepcopy
 from math import isclose
 from pathlib import Path
 from time import time
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import gym
 import numpy as np
@@ -28,12 +39,18 @@ from compiler_gym.service import (
     ServiceTransportError,
     SessionNotFound,
 )
+from compiler_gym.service.benchmark_upload import (
+    add_benchmark_request,
+    benchmark_reference,
+)
 from compiler_gym.service.proto import Action, AddBenchmarkRequest
 from compiler_gym.service.proto import Benchmark as BenchmarkProto
 from compiler_gym.service.proto import (
     Choice,
     EndSessionReply,
     EndSessionRequest,
+    ExpandSessionReply,
+    ExpandSessionRequest,
     ForkSessionReply,
     ForkSessionRequest,
     GetVersionReply,
@@ -44,8 +61,10 @@ from compiler_gym.service.proto import (
     StartSessionRequest,
     StepReply,
     StepRequest,
+    StepTimings,
     proto_to_action_space,
 )
+from compiler_gym.service.step_stream import StepReplyStream
 from compiler_gym.spaces import DefaultRewardFromObservation, NamedDiscrete, Reward
 from compiler_gym.util.gym_type_hints import (
     ActionType,
@@ -67,6 +86,25 @@ logger = logging.getLogger(__name__)
 _logger = logger
 
 
+def _step_request_actions(
+    service: CompilerGymServiceConnection, actions: List[ActionType]
+) -> Dict[str, Any]:
+    """Return the StepRequest fields that encode a list of actions.
+
+    Actions are indices into a named discrete space, so services that support it
+    are sent the compact packed encoding rather than an Action message per
+    action. Older services silently ignore packed actions, so they are sent
+    Action messages.
+    """
+    if service.supports_packed_action:
+        return {"packed_action": actions}
+    return {
+        "action": [
+            Action(choice=[Choice(named_discrete_value_index=a)]) for a in actions
+        ]
+    }
+
+
 def _wrapped_step(
     service: CompilerGymServiceConnection, request: StepRequest
 ) -> StepReply:
@@ -79,6 +117,18 @@ def _wrapped_step(
         raise
 
 
+def _wrapped_step_stream(
+    service: CompilerGymServiceConnection, request: StepRequest
+) -> StepReplyStream:
+    """Call the StepStream() RPC endpoint."""
+    try:
+        return StepReplyStream(service(service.stub.StepStream, request))
+    except FileNotFoundError as e:
+        if str(e).startswith("Session not found"):
+            raise SessionNotFound(str(e))
+        raise
+
+
 class CompilerEnv(gym.Env):
     """An OpenAI gym environment for compiler optimizations.
 
@@ -316,6 +366,15 @@ class CompilerEnv(gym.Env):
         self._make_action: Optional[Callable[[Any], Action]] = None
         self.observation_space: Optional[Space] = None
 
+        # If set, the service reports the time spent on each part of a step,
+        # which is returned in the "step_timings" entry of the info dict.
+        self.record_step_timings: bool = False
+
+        # If set, steps that compute observations use the StepStream() RPC,
+        # which sends observation values in chunks. This permits observations
+        # that are larger than the maximum message size.
+        self.stream_observations: bool = False
+
         # Mutable state initialized in reset().
         self.reward_range: Tuple[float, float] = (-np.inf, np.inf)
         self.episode_reward: Optional[float] = None
@@ -647,6 +706,8 @@ class CompilerEnv(gym.Env):
         new_env.episode_reward = self.episode_reward
         new_env.episode_start_time = self.episode_start_time
         new_env.actions = self.actions.copy()
+        new_env.record_step_timings = self.record_step_timings
+        new_env.stream_observations = self.stream_observations
 
         return new_env
 
@@ -765,6 +826,30 @@ class CompilerEnv(gym.Env):
             except (ServiceError, ServiceTransportError, TimeoutError) as e:
                 return e, None
 
+        def _add_benchmark() -> Optional[Exception]:
+            """Add the benchmark in use to the service. A reference to the
+            program contents is sent first, as the service may already have the
+            same contents under a different URI, and the contents are uploaded
+            only if it does not.
+            """
+            proto = self._benchmark_in_use.proto
+            reference = benchmark_reference(proto)
+            # When always_send_benchmark_on_reset is enabled, the reference was
+            # already sent with the StartSession request.
+            if reference and not self.service.opts.always_send_benchmark_on_reset:
+                try:
+                    error, _ = _call_with_error(
+                        self.service.stub.AddBenchmark,
+                        AddBenchmarkRequest(benchmark=[reference]),
+                    )
+                    return error
+                except FileNotFoundError:
+                    pass
+            error, _ = _call_with_error(
+                *add_benchmark_request(self.service.stub, proto)
+            )
+            return error
+
         if not self._next_benchmark:
             raise TypeError(
                 "No benchmark set. Set a benchmark using "
@@ -801,17 +886,23 @@ class CompilerEnv(gym.Env):
             self.benchmark = benchmark
         self._benchmark_in_use = self._next_benchmark
 
-        # When always_send_benchmark_on_reset option is enabled, the entire
-        # benchmark program is sent with every StartEpisode request. Otherwise
-        # only the URI of the benchmark is sent. In cases where benchmarks are
-        # reused between calls to reset(), sending the URI is more efficient as
-        # the service can cache the benchmark. In cases where reset() is always
-        # called with a different benchmark, this causes unnecessary roundtrips
-        # as every StartEpisodeRequest receives a FileNotFound response.
+        # When always_send_benchmark_on_reset option is enabled, the benchmark
+        # is sent with every StartEpisode request, with the program contents
+        # replaced by their SHA-256 digest. Otherwise only the URI of the
+        # benchmark is sent. In cases where benchmarks are reused between calls
+        # to reset(), sending the URI is more efficient as the service can
+        # cache the benchmark. In cases where reset() is always called with a
+        # different benchmark, this causes unnecessary roundtrips as every
+        # StartEpisodeRequest receives a FileNotFound response.
         if self.service.opts.always_send_benchmark_on_reset:
-            self._benchmark_in_use_proto = self._benchmark_in_use.proto
+            self._benchmark_in_use_proto = (
+                benchmark_reference(self._benchmark_in_use.proto)
+                or self._benchmark_in_use.proto
+            )
         else:
-            self._benchmark_in_use_proto.uri = self._benchmark_in_use.uri
+            self._benchmark_in_use_proto = BenchmarkProto(
+                uri=self._benchmark_in_use.uri
+            )
 
         start_session_request = StartSessionRequest(
             benchmark=self._benchmark_in_use_proto,
@@ -834,10 +925,7 @@ class CompilerEnv(gym.Env):
         except FileNotFoundError:
             # The benchmark was not found, so try adding it and then repeating
             # the request.
-            error, _ = _call_with_error(
-                self.service.stub.AddBenchmark,
-                AddBenchmarkRequest(benchmark=[self._benchmark_in_use.proto]),
-            )
+            error = _add_benchmark()
             if error:
                 return _retry(error)
             error, reply = _call_with_error(
@@ -928,15 +1016,21 @@ class CompilerEnv(gym.Env):
         # Send the request to the backend service.
         request = StepRequest(
             session_id=self._session_id,
-            action=[
-                Action(choice=[Choice(named_discrete_value_index=a)]) for a in actions
-            ],
+            **_step_request_actions(self.service, actions),
             observation_space=[
                 observation_space.index for observation_space in observations_to_compute
             ],
+            record_timings=self.record_step_timings,
         )
+        step_start = time()
         try:
-            reply = _wrapped_step(self.service, request)
+            if self.stream_observations and observations_to_compute:
+                stream = _wrapped_step_stream(self.service, request)
+                reply = stream.reply
+                observation_values = stream.observations()
+            else:
+                reply = _wrapped_step(self.service, request)
+                observation_values = reply.observation
         except (
             ServiceError,
             ServiceTransportError,
@@ -987,7 +1081,7 @@ class CompilerEnv(gym.Env):
         computed_observations = [
             observation_space.translate(value)
             for observation_space, value in zip(
-                observations_to_compute, reply.observation
+                observations_to_compute, observation_values
             )
         ]
 
@@ -1018,9 +1112,97 @@ class CompilerEnv(gym.Env):
             "action_had_no_effect": reply.action_had_no_effect,
             "new_action_space": reply.HasField("new_action_space"),
         }
+        if self.record_step_timings:
+            info["step_timings"] = self._step_timings(
+                reply.timings, observations_to_compute, step_start
+            )
 
         return observations, rewards, reply.end_of_session, info
 
+    @staticmethod
+    def _step_timings(
+        timings: StepTimings,
+        observation_spaces: List[ObservationSpaceSpec],
+        step_start: float,
+    ) -> Dict[str, Any]:
+        """Convert the step timings reported by the service to seconds.
+
+        The service does not measure the time taken to serialize its reply, so
+        the difference between the wall time of the call and the total time
+        reported by the service is returned as :code:`rpc_overhead`. This
+        includes the serialization, transport, and deserialization of the
+        request and reply.
+        """
+        wall_time = time() - step_start
+        total = timings.total_micros / 1e6
+        return {
+            "actions": [t / 1e6 for t in timings.action_micros],
+            "end_of_step": timings.end_of_step_micros / 1e6,
+            "observations": {
+                space.id: t / 1e6
+                for space, t in zip(observation_spaces, timings.observation_micros)
+            },
+            "total": total,
+            "rpc_overhead": max(wall_time - total, 0),
+        }
+
+    def step_timing_histograms(self) -> Dict[str, Any]:
+        """Return histograms of the time spent by the compiler service on each
+        part of the steps of the current session.
+
+        The histograms are aggregated by the service for every step, regardless
+        of whether :code:`record_step_timings` is set. Each histogram is a
+        dictionary with keys :code:`count`, :code:`sum_micros`, and
+        :code:`buckets`, where bucket :code:`i` counts the durations in the
+        range :code:`[2^i, 2^(i+1))` microseconds.
+
+        Example usage:
+
+            >>> env.reset()
+            >>> env.step(env.action_space.sample())
+            >>> env.step_timing_histograms()["total"]["count"]
+            1
+
+        :return: A dictionary with keys :code:`total`, :code:`end_of_step`,
+            :code:`actions` (keyed by action index), and :code:`observations`
+            (keyed by observation space name).
+
+        :raises SessionNotFound: If called before :meth:`reset()
+            <compiler_gym.envs.CompilerEnv.reset>`.
+        """
+        return json.loads(self.send_param("service.get_step_timing_histograms", ""))
+
+    def open_observation(
+        self, observation_space: Union[str, ObservationSpaceSpec]
+    ) -> BinaryIO:
+        """Compute an observation and open its value as a binary file.
+
+        The value is received from the service in chunks using the StepStream()
+        RPC, and the file reads the chunks as they arrive. This permits
+        processing very large string and binary observations, such as the IR
+        of a large program, without holding the value in memory at once:
+
+            >>> with io.TextIOWrapper(env.open_observation("Ir")) as f:
+            ...     for line in f:
+            ...         pass
+
+        :param observation_space: The name or specification of an observation
+            space.
+
+        :return: A binary file object.
+
+        :raises SessionNotFound: If called before :meth:`reset()
+            <compiler_gym.envs.CompilerEnv.reset>`.
+        """
+        if not self.in_episode:
+            raise SessionNotFound("Must call reset() before open_observation()")
+        if isinstance(observation_space, str):
+            observation_space = self.observation.spaces[observation_space]
+        request = StepRequest(
+            session_id=self._session_id, observation_space=[observation_space.index]
+        )
+        return _wrapped_step_stream(self.service, request).open(0)
+
     def step(
         self,
         action: Union[ActionType, Iterable[ActionType]],
@@ -1053,6 +1235,38 @@ class CompilerEnv(gym.Env):
         # Coerce actions into a list.
         actions = action if isinstance(action, IterableType) else [action]
 
+        observation_spaces, reward_spaces = self._coerce_spaces(observations, rewards)
+
+        # Perform the underlying environment step.
+        observation_values, reward_values, done, info = self.raw_step(
+            actions, observation_spaces, reward_spaces
+        )
+
+        # Translate observations lists back to the appropriate types.
+        if observations is None and self.observation_space_spec:
+            observation_values = observation_values[0]
+        elif not observation_spaces:
+            observation_values = None
+
+        # Translate reward lists back to the appropriate types.
+        if rewards is None and self.reward_space:
+            reward_values = reward_values[0]
+            # Update the cumulative episode reward
+            self.episode_reward += reward_values
+        elif not reward_spaces:
+            reward_values = None
+
+        return observation_values, reward_values, done, info
+
+    def _coerce_spaces(
+        self,
+        observations: Optional[Iterable[Union[str, ObservationSpaceSpec]]],
+        rewards: Optional[Iterable[Union[str, Reward]]],
+    ) -> Tuple[List[ObservationSpaceSpec], List[Reward]]:
+        """Resolve the observation and reward spaces for a call to
+        :meth:`step() <compiler_gym.envs.CompilerEnv.step>`, using the default
+        spaces if none are provided.
+        """
         # Coerce observation spaces into a list of ObservationSpaceSpec instances.
         if observations:
             observation_spaces: List[ObservationSpaceSpec] = [
@@ -1079,26 +1293,134 @@ class CompilerEnv(gym.Env):
         else:
             reward_spaces: List[Reward] = []
 
-        # Perform the underlying environment step.
-        observation_values, reward_values, done, info = self.raw_step(
-            actions, observation_spaces, reward_spaces
+        return observation_spaces, reward_spaces
+
+    def expand(
+        self,
+        actions: Iterable[ActionType],
+        observations: Optional[Iterable[Union[str, ObservationSpaceSpec]]] = None,
+        rewards: Optional[Iterable[Union[str, Reward]]] = None,
+    ) -> List[StepType]:
+        """Compute the result of taking each of a list of actions from the
+        current state, without changing the state of the environment.
+
+        This is equivalent to calling :meth:`fork()
+        <compiler_gym.envs.CompilerEnv.fork>` and :meth:`step()
+        <compiler_gym.envs.CompilerEnv.step>` for every action, but the
+        candidate states are created and the actions are applied in parallel by
+        the compiler service using a single round trip, and no environments are
+        created on the client. This is useful for greedy and exhaustive search:
+
+            >>> successors = env.expand(range(env.action_space.n))
+            >>> best_action = max(
+            ...     range(env.action_space.n), key=lambda a: successors[a][1]
+            ... )
+            >>> env.step(best_action)
+
+        To distinguish successors that reach the same program state, request an
+        observation that hashes the program, such as :code:`IrSha1` for LLVM.
+
+        If the compiler service does not support expansion, this falls back to
+        forking the environment for each action.
+
+        :param actions: A list of candidate actions.
+
+        :param observations: A list of observation spaces to compute for each
+            candidate, with the same semantics as :meth:`step()
+            <compiler_gym.envs.CompilerEnv.step>`.
+
+        :param rewards: A list of reward spaces to compute for each candidate,
+            with the same semantics as :meth:`step()
+            <compiler_gym.envs.CompilerEnv.step>`. The rewards are computed
+            relative to the current state.
+
+        :return: A list of :code:`(observation, reward, done, info)` tuples,
+            one per action.
+
+        :raises SessionNotFound: If :meth:`reset()
+            <compiler_gym.envs.CompilerEnv.reset>` has not been called.
+        """
+        if not self.in_episode:
+            raise SessionNotFound("Must call reset() before expand()")
+
+        actions = list(actions)
+        observation_spaces, reward_spaces = self._coerce_spaces(observations, rewards)
+
+        reward_observation_spaces: List[ObservationSpaceSpec] = []
+        for reward_space in reward_spaces:
+            reward_observation_spaces += [
+                self.observation.spaces[obs] for obs in reward_space.observation_spaces
+            ]
+        observations_to_compute: List[ObservationSpaceSpec] = list(
+            set(observation_spaces).union(set(reward_observation_spaces))
         )
 
-        # Translate observations lists back to the appropriate types.
-        if observations is None and self.observation_space_spec:
-            observation_values = observation_values[0]
-        elif not observation_spaces:
-            observation_values = None
+        request = ExpandSessionRequest(
+            session_id=self._session_id,
+            packed_action=actions,
+            observation_space=[space.index for space in observations_to_compute],
+        )
+        try:
+            reply: ExpandSessionReply = self.service(
+                self.service.stub.ExpandSession, request
+            )
+        except NotImplementedError:
+            return self._expand_by_forking(actions, observations, rewards)
 
-        # Translate reward lists back to the appropriate types.
-        if rewards is None and self.reward_space:
-            reward_values = reward_values[0]
-            # Update the cumulative episode reward
-            self.episode_reward += reward_values
-        elif not reward_spaces:
-            reward_values = None
+        results: List[StepType] = []
+        for action, candidate in zip(actions, reply.candidate):
+            computed = {
+                space.id: space.translate(value)
+                for space, value in zip(observations_to_compute, candidate.observation)
+            }
+            observation_values = [computed[space.id] for space in observation_spaces]
+            # Copy the reward spaces so that the incremental reward state of
+            # this environment is not modified.
+            reward_values = [
+                float(
+                    deepcopy(reward_space).update(
+                        [action],
+                        [computed[obs] for obs in reward_space.observation_spaces],
+                        self.observation,
+                    )
+                )
+                for reward_space in reward_spaces
+            ]
 
-        return observation_values, reward_values, done, info
+            # Translate to the same types as step().
+            if observations is None and self.observation_space_spec:
+                observation_values = observation_values[0]
+            elif not observation_spaces:
+                observation_values = None
+            if rewards is None and self.reward_space:
+                reward_values = reward_values[0]
+            elif not reward_spaces:
+                reward_values = None
+
+            info = {
+                "action_had_no_effect": candidate.action_had_no_effect,
+                "new_action_space": False,
+            }
+            results.append(
+                (observation_values, reward_values, candidate.end_of_session, info)
+            )
+        return results
+
+    def _expand_by_forking(
+        self,
+        actions: List[ActionType],
+        observations: Optional[Iterable[Union[str, ObservationSpaceSpec]]],
+        rewards: Optional[Iterable[Union[str, Reward]]],
+    ) -> List[StepType]:
+        """Fallback implementation of :meth:`expand()
+        <compiler_gym.envs.CompilerEnv.expand>` for services that do not
+        support the ExpandSession() operator.
+        """
+        results: List[StepType] = []
+        for action in actions:
+            with self.fork() as fkd:
+                results.append(fkd.step(action, observations, rewards))
+        return results
 
     def render(
         self,
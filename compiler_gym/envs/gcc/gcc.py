@@ -16,6 +16,7 @@ values in a cache directory.
 
 Running this file will print the gcc spec to stdout.
 """
+import atexit
 import logging
 import math
 import os
@@ -24,13 +25,15 @@ import re
 import subprocess
 from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, NamedTuple, Optional, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 import docker
+from requests.exceptions import ReadTimeout
 
+from compiler_gym.envs.gcc.worker_pool import Volumes, Worker, WorkerError, WorkerPool
 from compiler_gym.service import EnvironmentNotSupported, ServiceError, ServiceInitError
 from compiler_gym.util.filesystem import atomic_file_write
-from compiler_gym.util.runfiles_path import site_data_path
+from compiler_gym.util.runfiles_path import site_data_path, transient_cache_path
 
 logger = logging.getLogger(__name__)
 
@@ -233,6 +236,22 @@ def get_docker_client():
         ) from e
 
 
+@lru_cache(maxsize=8)
+def _get_docker_api_client(timeout: Optional[float]) -> docker.APIClient:
+    """Fetch a low-level docker client whose requests wait for the given number
+    of seconds, or indefinitely if :code:`None`.
+    """
+    try:
+        return docker.from_env(timeout=timeout).api
+    except docker.errors.DockerException as e:
+        raise WorkerError(f"Failed to initialize docker client: {e}") from e
+
+
+# The number of seconds to wait for a command in a worker to complete beyond
+# its timeout, to allow for the overhead of the docker API.
+_DOCKER_EXEC_TIMEOUT_SLACK = 60
+
+
 # We only need to run this function once per image.
 @lru_cache(maxsize=64)
 def pull_docker_image(image: str) -> str:
@@ -250,23 +269,89 @@ def pull_docker_image(image: str) -> str:
         raise ServiceInitError(f"Failed to fetch docker image '{image}': {e}")
 
 
-def join_docker_container(container, timeout_seconds: int) -> str:
-    """Block until the container terminates, returning its output."""
-    try:
-        status = container.wait(timeout=timeout_seconds)
-    except docker.exceptions.ReadTimeout as e:
-        # Catch and re-raise the timeout.
-        raise TimeoutError(f"GCC timed out after {timeout_seconds:,d} seconds") from e
+class DockerWorker(Worker):
+    """A long-lived docker container that runs commands using :code:`exec`."""
+
+    def __init__(self, image: str, volumes: Volumes):
+        """Start a container.
+
+        :param image: The name of the docker image.
+
+        :param volumes: A dictionary of volume bindings for docker.
+
+        :raises WorkerError: If the container cannot be started.
+        """
+        try:
+            self.container = get_docker_client().containers.run(
+                image,
+                ["sleep", "infinity"],
+                detach=True,
+                auto_remove=True,
+                volumes=volumes,
+            )
+        except docker.errors.DockerException as e:
+            raise WorkerError(f"Failed to start docker container: {e}") from e
+
+    def exec(
+        self, cmd: List[str], workdir: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str]:
+        # Container.exec_run() is bound by the default timeout of the docker
+        # client, so use a client with a timeout that matches the command.
+        api = _get_docker_api_client(timeout)
+        try:
+            exec_id = api.exec_create(self.container.id, cmd, workdir=workdir)["Id"]
+            stdout, _ = api.exec_start(exec_id, demux=True)
+            returncode = api.exec_inspect(exec_id)["ExitCode"]
+        except ReadTimeout as e:
+            raise TimeoutError(f"Timed out waiting for command: {cmd}") from e
+        except docker.errors.DockerException as e:
+            raise WorkerError(f"Failed to execute command in container: {e}") from e
+        return returncode, (stdout or b"").decode()
+
+    def healthy(self) -> bool:
+        try:
+            self.container.reload()
+            return self.container.status == "running"
+        except docker.errors.DockerException:
+            return False
 
-    if status["StatusCode"]:
-        logs = ""
+    def close(self) -> None:
         try:
-            logs = container.logs(stdout=True, stderr=False).decode()
-        except (UnicodeDecodeError, docker.errors.NotFound):
+            # The container is removed automatically once stopped.
+            self.container.kill()
+        except docker.errors.DockerException:
             pass
-        raise ServiceError(f"GCC failed with returncode {status['StatusCode']}: {logs}")
 
-    return container.logs(stdout=True, stderr=False).decode()
+
+def _docker_mount_root(cwd: Path) -> Path:
+    """Return the directory to mount in a docker worker to run a command in the
+    given working directory.
+
+    The working directories of services are within the transient cache, so the
+    root of the transient cache is mounted for them. This gives every working
+    directory the same volume mounts, so the worker pool runs their commands in
+    a shared container rather than starting a container for each one.
+    """
+    root = transient_cache_path(".").resolve()
+    try:
+        cwd.relative_to(root)
+        return root
+    except ValueError:
+        return cwd
+
+
+@lru_cache(maxsize=64)
+def get_docker_worker_pool(image: str) -> WorkerPool:
+    """Fetch the pool of docker workers for an image.
+
+    The pool is shared by all :class:`Gcc` instances in the process that use
+    the image, and its containers are stopped when the process exits.
+
+    :param image: The name of the docker image.
+    """
+    pool = WorkerPool(lambda volumes: DockerWorker(image, volumes))
+    atexit.register(pool.close)
+    return pool
 
 
 class Gcc:
@@ -324,28 +409,36 @@ class Gcc:
         cwd: Path,
         volumes: Optional[Dict[str, Dict[str, str]]] = None,
     ):
-        cwd = cwd.absolute().as_posix()
+        cwd = cwd.resolve()
+        mount = _docker_mount_root(cwd).as_posix()
 
         cmd_line = ["gcc"] + list(map(str, args))
 
         if timeout:
             cmd_line = ["timeout", str(timeout)] + cmd_line
 
-        volumes_ = {cwd: {"bind": cwd, "mode": "rw"}}
+        volumes_ = {mount: {"bind": mount, "mode": "rw"}}
         volumes_.update(volumes or {})
 
-        client = get_docker_client()
-        container = client.containers.create(
-            self.image,
-            cmd_line,
-            working_dir=cwd,
-            volumes=volumes_,
-        )
-        container.start()
+        # Run the command in a long-lived container for these volumes, rather
+        # than paying to create and remove a container for each call. The
+        # working directory is set per command.
         try:
-            return join_docker_container(container, timeout_seconds=timeout)
-        finally:
-            container.remove()
+            returncode, stdout = get_docker_worker_pool(self.image).run(
+                cmd_line,
+                workdir=cwd.as_posix(),
+                volumes=volumes_,
+                timeout=timeout + _DOCKER_EXEC_TIMEOUT_SLACK if timeout else None,
+            )
+        except WorkerError as e:
+            raise ServiceError(f"Failed to run GCC in docker: {e}") from e
+
+        # The timeout command exits with returncode 124 on timeout.
+        if timeout and returncode == 124:
+            raise TimeoutError(f"GCC timed out after {timeout:,d} seconds")
+        if returncode:
+            raise ServiceError(f"GCC failed with returncode {returncode}: {stdout}")
+        return stdout
 
     def _subprocess_run(self, args, timeout, cwd, volumes):
         del volumes  # Unused
@@ -38,6 +38,7 @@ class GccEnv(CompilerEnv):
         datasets_site_path: Optional[Path] = None,
         connection_settings: Optional[ConnectionOpts] = None,
         timeout: Optional[int] = None,
+        single_invocation: bool = False,
         **kwargs,
     ):
         """Create an environment.
@@ -56,6 +57,11 @@ class GccEnv(CompilerEnv):
 
         :param timeout: The timeout to use when compiling.
 
+        :param single_invocation: If :code:`True`, the object code, assembly,
+            and RTL observations are produced by a single invocation of GCC
+            once more than one of them has been requested, rather than by one
+            invocation per observation.
+
         :raises EnvironmentNotSupported: If the runtime requirements for the GCC
             environment have not been met.
 
@@ -85,6 +91,7 @@ class GccEnv(CompilerEnv):
             connection_settings=connection_settings,
         )
         self._timeout = timeout
+        self._single_invocation = single_invocation
 
     def reset(
         self,
@@ -92,11 +99,13 @@ class GccEnv(CompilerEnv):
         action_space: Optional[str] = None,
         retry_count: int = 0,
     ) -> Optional[ObservationType]:
-        """Reset the environment. This additionally sets the timeout to the
-        correct value."""
+        """Reset the environment. This additionally sets the timeout and the
+        single invocation mode to the correct values."""
         observation = super().reset(benchmark, action_space, retry_count)
         if self._timeout:
             self.send_param("timeout", str(self._timeout))
+        if self._single_invocation:
+            self.send_param("single_invocation", "1")
         return observation
 
     def commandline(self) -> str:
@@ -117,6 +126,19 @@ class GccEnv(CompilerEnv):
         self._timeout = value
         self.send_param("timeout", str(value) if value else "")
 
+    @property
+    def single_invocation(self) -> bool:
+        """Whether the object code, assembly, and RTL are produced by a single
+        invocation of GCC.
+        """
+        return self._single_invocation
+
+    @single_invocation.setter
+    def single_invocation(self, value: bool):
+        """Tell the service whether to use a single invocation of GCC."""
+        self._single_invocation = value
+        self.send_param("single_invocation", "1" if value else "0")
+
     @memoized_property
     def gcc_spec(self) -> GccSpec:
         """A :class:`GccSpec <compiler_gym.envs.gcc.gcc.GccSpec>` description of
@@ -230,6 +230,12 @@ def make_gcc_compilation_session(gcc_bin: str):
             # Initially the choices and the spec, etc are empty. They will be
             # initialised lazily
             self._choices = None
+            # Whether to produce all requested artifacts in a single gcc run
+            self._single_invocation = False
+            # The artifacts that have been requested by observations in this
+            # session. In single invocation mode, all of these are produced
+            # whenever any of them are needed.
+            self._requested_artifacts = set()
 
         @property
         def num_actions(self) -> int:
@@ -388,6 +394,20 @@ def make_gcc_compilation_session(gcc_bin: str):
             ]
             return cmd_line
 
+        @property
+        def save_temps_asm_path(self) -> Path:
+            """Get the path of the assembly that is kept by -save-temps=obj"""
+            return self.obj_path.with_suffix(".s")
+
+        def single_invocation_command_line(self, rtl: bool) -> List[str]:
+            """Get the command line to create the object file and the assembly,
+            and optionally the rtl, in a single gcc invocation. The assembly is
+            kept by -save-temps=obj alongside the object file."""
+            cmd_line = self.obj_command_line() + ["-save-temps=obj"]
+            if rtl:
+                cmd_line.append(f"-fdump-rtl-dfinish={self.rtl_path}")
+            return cmd_line
+
         def prepare_files(self):
             """Copy the source to the working directory."""
             if not self._source:
@@ -400,9 +420,53 @@ def make_gcc_compilation_session(gcc_bin: str):
                 with open(self.src_path, "w") as f:
                     print(self._source, file=f)
 
+        def _read_obj(self):
+            with open(self.obj_path, "rb") as f:
+                # Set the internal variables
+                self._obj = f.read()
+                self._obj_size = os.path.getsize(self.obj_path)
+                self._obj_hash = hashlib.md5(self._obj).hexdigest()
+
+        def _read_asm(self, asm_path: Path):
+            with open(asm_path, "rb") as f:
+                # Set the internal variables
+                asm_bytes = f.read()
+                self._asm = asm_bytes.decode()
+                self._asm_size = os.path.getsize(asm_path)
+                self._asm_hash = hashlib.md5(asm_bytes).hexdigest()
+
+        def _read_rtl(self):
+            with open(self.rtl_path, "rb") as f:
+                # Set the internal variables
+                rtl_bytes = f.read()
+                self._rtl = rtl_bytes.decode()
+
+        def _compile_requested_artifacts(self, artifact: str) -> bool:
+            """Record that an artifact was requested and, if in single
+            invocation mode and more than one artifact has been requested,
+            produce all of the requested artifacts in a single gcc run.
+
+            Returns whether the artifacts were produced."""
+            self._requested_artifacts.add(artifact)
+            if not self._single_invocation or len(self._requested_artifacts) < 2:
+                return False
+
+            self.prepare_files()
+            rtl = "rtl" in self._requested_artifacts
+            cmd_line = self.single_invocation_command_line(rtl=rtl)
+            logger.debug("Compiling: %s", " ".join(map(str, cmd_line)))
+            gcc(*cmd_line, cwd=self.working_dir, timeout=self._timeout)
+            self._read_obj()
+            self._read_asm(self.save_temps_asm_path)
+            if rtl:
+                self._read_rtl()
+            return True
+
         def compile(self) -> Optional[str]:
             """Compile the benchmark"""
             if not self._obj:
+                if self._compile_requested_artifacts("obj"):
+                    return
                 self.prepare_files()
                 logger.debug(
                     "Compiling: %s", " ".join(map(str, self.obj_command_line()))
@@ -412,15 +476,13 @@ def make_gcc_compilation_session(gcc_bin: str):
                     cwd=self.working_dir,
                     timeout=self._timeout,
                 )
-                with open(self.obj_path, "rb") as f:
-                    # Set the internal variables
-                    self._obj = f.read()
-                    self._obj_size = os.path.getsize(self.obj_path)
-                    self._obj_hash = hashlib.md5(self._obj).hexdigest()
+                self._read_obj()
 
         def assemble(self) -> Optional[str]:
             """Assemble the benchmark"""
             if not self._asm:
+                if self._compile_requested_artifacts("asm"):
+                    return
                 self.prepare_files()
                 logger.debug(
                     "Assembling: %s", " ".join(map(str, self.asm_command_line()))
@@ -430,16 +492,13 @@ def make_gcc_compilation_session(gcc_bin: str):
                     cwd=self.working_dir,
                     timeout=self._timeout,
                 )
-                with open(self.asm_path, "rb") as f:
-                    # Set the internal variables
-                    asm_bytes = f.read()
-                    self._asm = asm_bytes.decode()
-                    self._asm_size = os.path.getsize(self.asm_path)
-                    self._asm_hash = hashlib.md5(asm_bytes).hexdigest()
+                self._read_asm(self.asm_path)
 
         def dump_rtl(self) -> Optional[str]:
             """Dump the RTL (and assemble the benchmark)"""
             if not self._rtl:
+                if self._compile_requested_artifacts("rtl"):
+                    return
                 self.prepare_files()
                 logger.debug(
                     "Dumping RTL: %s", " ".join(map(str, self.rtl_command_line()))
@@ -449,16 +508,8 @@ def make_gcc_compilation_session(gcc_bin: str):
                     cwd=self.working_dir,
                     timeout=self._timeout,
                 )
-                with open(self.asm_path, "rb") as f:
-                    # Set the internal variables
-                    asm_bytes = f.read()
-                    self._asm = asm_bytes.decode()
-                    self._asm_size = os.path.getsize(self.asm_path)
-                    self._asm_hash = hashlib.md5(asm_bytes).hexdigest()
-                with open(self.rtl_path, "rb") as f:
-                    # Set the internal variables
-                    rtl_bytes = f.read()
-                    self._rtl = rtl_bytes.decode()
+                self._read_asm(self.asm_path)
+                self._read_rtl()
 
         def reset_cached(self):
             """Reset the cached values"""
@@ -546,6 +597,9 @@ def make_gcc_compilation_session(gcc_bin: str):
             elif key == "timeout":
                 self._timeout = None if value == "" else int(value)
                 return ""
+            elif key == "single_invocation":
+                self._single_invocation = value == "1"
+                return ""
             return None
 
     return GccCompilationSession
@@ -0,0 +1,231 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""A pool of long-lived workers for running compiler commands.
+
+Creating a container for every compiler invocation adds hundreds of
+milliseconds to each call. Instead, a worker is started once for each set of
+volume mounts and commands are executed inside it. The pool is independent of
+docker so that it can be tested using local workers.
+"""
+import logging
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A mapping from host paths to bind options, in the format used by docker.
+Volumes = Dict[str, Dict[str, str]]
+
+
+class WorkerError(OSError):
+    """Error raised when a worker fails to execute a command, as opposed to the
+    command itself failing.
+    """
+
+
+class Worker:
+    """The interface for a long-lived worker that executes commands."""
+
+    def exec(
+        self, cmd: List[str], workdir: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str]:
+        """Execute a command in the worker.
+
+        :param cmd: The command to execute.
+
+        :param workdir: The working directory for the command.
+
+        :param timeout: The number of seconds to wait for the command to
+            complete. If :code:`None`, wait indefinitely.
+
+        :return: A tuple of the returncode and stdout of the command.
+
+        :raises WorkerError: If the worker fails to execute the command.
+
+        :raises TimeoutError: If the command does not complete within the
+            timeout.
+        """
+        raise NotImplementedError("abstract class")
+
+    def healthy(self) -> bool:
+        """Return whether the worker is able to execute commands."""
+        raise NotImplementedError("abstract class")
+
+    def close(self) -> None:
+        """Stop the worker."""
+        raise NotImplementedError("abstract class")
+
+
+def _volumes_key(volumes: Volumes) -> Tuple:
+    return tuple(
+        sorted((host, tuple(sorted(bind.items()))) for host, bind in volumes.items())
+    )
+
+
+class _PoolEntry:
+    def __init__(self, worker: Worker):
+        self.worker = worker
+        self.users = 0
+        self.last_health_check = time()
+
+
+class WorkerPool:
+    """A pool of workers, one for each distinct set of volume mounts.
+
+    Workers are created on demand and reused for subsequent commands with the
+    same volume mounts. When the number of workers exceeds
+    :code:`max_workers`, the least recently used idle worker is stopped.
+    Workers are health checked periodically and restarted if they fail, and a
+    command that fails because of a worker error is retried once on a new
+    worker. A worker whose command times out is stopped, as the command may
+    still be running in it.
+    """
+
+    def __init__(
+        self,
+        make_worker: Callable[[Volumes], Worker],
+        max_workers: int = 8,
+        health_check_interval: float = 30,
+    ):
+        """Constructor.
+
+        :param make_worker: A callback that starts a worker with the given
+            volume mounts.
+
+        :param max_workers: The maximum number of idle workers to keep.
+
+        :param health_check_interval: The number of seconds between health
+            checks of a worker.
+        """
+        self.make_worker = make_worker
+        self.max_workers = max_workers
+        self.health_check_interval = health_check_interval
+        self._workers: "OrderedDict[Tuple, _PoolEntry]" = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._workers)
+
+    def _acquire(self, volumes: Volumes) -> _PoolEntry:
+        key = _volumes_key(volumes)
+        with self._lock:
+            entry = self._workers.get(key)
+            if entry is not None:
+                self._workers.move_to_end(key)
+                entry.users += 1
+        if entry is not None:
+            if time() - entry.last_health_check < self.health_check_interval:
+                return entry
+            entry.last_health_check = time()
+            if entry.worker.healthy():
+                return entry
+            logger.warning("Restarting unhealthy worker")
+            self._release(entry)
+            self._discard(key, entry)
+
+        # Start the worker outside of the lock as it may be slow. Concurrent
+        # callers may start redundant workers, in which case the surplus worker
+        # is stopped.
+        worker = self.make_worker(volumes)
+        with self._lock:
+            entry = self._workers.get(key)
+            if entry is None:
+                entry = _PoolEntry(worker)
+                self._workers[key] = entry
+                worker = None
+            entry.users += 1
+            evicted = self._evict()
+        if worker:
+            worker.close()
+        for stale in evicted:
+            stale.worker.close()
+        return entry
+
+    def _release(self, entry: _PoolEntry) -> None:
+        with self._lock:
+            entry.users -= 1
+
+    def _evict(self) -> List[_PoolEntry]:
+        """Remove the least recently used idle workers. Must hold the lock."""
+        evicted = []
+        for key in list(self._workers):
+            if len(self._workers) <= self.max_workers:
+                break
+            if not self._workers[key].users:
+                evicted.append(self._workers.pop(key))
+        return evicted
+
+    def _discard(self, key: Tuple, entry: _PoolEntry) -> None:
+        with self._lock:
+            if self._workers.get(key) is entry:
+                del self._workers[key]
+        entry.worker.close()
+
+    def run(
+        self,
+        cmd: List[str],
+        workdir: str,
+        volumes: Volumes,
+        timeout: Optional[float] = None,
+    ) -> Tuple[int, str]:
+        """Run a command on a worker.
+
+        :param cmd: The command to execute.
+
+        :param workdir: The working directory for the command.
+
+        :param volumes: The volumes that the worker must mount.
+
+        :param timeout: The number of seconds to wait for the command to
+            complete. If :code:`None`, wait indefinitely.
+
+        :return: A tuple of the returncode and stdout of the command.
+
+        :raises WorkerError: If the command cannot be executed after
+            restarting the worker.
+
+        :raises TimeoutError: If the command does not complete within the
+            timeout.
+        """
+        key = _volumes_key(volumes)
+        entry = self._acquire(volumes)
+        try:
+            return self._exec(key, entry, cmd, workdir, timeout)
+        except WorkerError as e:
+            logger.warning("Restarting worker after error: %s", e)
+        finally:
+            self._release(entry)
+
+        self._discard(key, entry)
+        entry = self._acquire(volumes)
+        try:
+            return self._exec(key, entry, cmd, workdir, timeout)
+        finally:
+            self._release(entry)
+
+    def _exec(
+        self,
+        key: Tuple,
+        entry: _PoolEntry,
+        cmd: List[str],
+        workdir: str,
+        timeout: Optional[float],
+    ) -> Tuple[int, str]:
+        try:
+            return entry.worker.exec(cmd, workdir, timeout=timeout)
+        except TimeoutError:
+            # The command may still be running, so the worker cannot be reused.
+            self._discard(key, entry)
+            raise
+
+    def close(self) -> None:
+        """Stop all workers."""
+        with self._lock:
+            entries = list(self._workers.values())
+            self._workers.clear()
+        for entry in entries:
+            entry.worker.close()
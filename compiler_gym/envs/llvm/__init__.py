@@ -5,6 +5,7 @@
 """Register the LLVM environments."""
 from itertools import product
 
+from compiler_gym.envs.llvm.compile_cache import BitcodeCache
 from compiler_gym.envs.llvm.compute_observation import compute_observation
 from compiler_gym.envs.llvm.llvm_benchmark import (
     ClangInvocation,
@@ -17,6 +18,7 @@ from compiler_gym.util.registration import register
 from compiler_gym.util.runfiles_path import runfiles_path
 
 __all__ = [
+    "BitcodeCache",
     "ClangInvocation",
     "compute_observation",
     "get_system_includes",
@@ -0,0 +1,263 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""This module defines a content-addressed cache of compiled LLVM bitcodes."""
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from compiler_gym.third_party import llvm
+from compiler_gym.util.filesystem import atomic_file_write
+from compiler_gym.util.runfiles_path import cache_path
+
+logger = logging.getLogger(__name__)
+
+# The maximum number of include sets recorded for a single compilation key.
+_MAX_MANIFEST_ENTRIES = 16
+
+# Compiler options that take a path that is joined to the option name, e.g.
+# "-Iinclude".
+_JOINED_PATH_OPTIONS = ("-idirafter", "-include", "-iquote", "-isystem", "-I")
+
+
+def file_sha256(path: Path) -> str:
+    """Return the hex sha256 checksum of the contents of a file."""
+    checksum = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _absolute_path_arg(arg: str) -> str:
+    """Return an argument with a relative path to an existing file or
+    directory resolved to an absolute path, so that the argument refers to the
+    same file regardless of the working directory.
+    """
+    for option in ("",) + _JOINED_PATH_OPTIONS:
+        if not arg.startswith(option) or len(arg) == len(option):
+            continue
+        path = Path(arg[len(option) :])
+        if not path.is_absolute() and path.exists():
+            return f"{option}{path.absolute()}"
+    return arg
+
+
+def read_dependency_file(path: Path) -> List[Path]:
+    """Read the list of dependencies from a Makefile-style dependency file, as
+    produced by :code:`clang -MD -MF <path>`.
+
+    :param path: The path of the dependency file.
+
+    :return: A list of paths that the target depends on.
+    """
+    with open(path) as f:
+        contents = f.read().replace("\\\n", " ")
+    # Strip the target name, up to the first colon that is followed by
+    # whitespace.
+    _, _, dependencies = contents.partition(": ")
+    return [
+        Path(dependency.replace("\\ ", " "))
+        for dependency in re.split(r"(?<!\\)\s+", dependencies.strip())
+        if dependency
+    ]
+
+
+class BitcodeCache:
+    """A content-addressed, size-bounded on-disk cache of compiled bitcodes.
+
+    The cache works in the same manner as the "direct mode" of `ccache
+    <https://ccache.dev/>`_. A compilation is identified by a key that is
+    computed from the version of LLVM, the compiler arguments, and the contents
+    of any input files. Since the set of header files that a compilation job
+    includes is not known until the job has been run, each key maps to a
+    manifest of previously observed include sets and their checksums. A cache
+    hit requires that every file in one of the recorded include sets is
+    unchanged.
+
+    The cache is safe for concurrent use by multiple processes. All files are
+    written atomically, and concurrent writers at worst perform redundant work.
+    When the total size of the cached bitcodes exceeds :code:`max_size_in_bytes`,
+    the least recently used bitcodes are evicted.
+
+    Example usage:
+
+        >>> cache = BitcodeCache()
+        >>> benchmark = make_benchmark("my_app.c", cache=cache)
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        max_size_in_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """Constructor.
+
+        :param path: The directory to store the cache in. If not provided,
+            :code:`$cache_path/llvm-v0/bitcode-cache` is used. See
+            :func:`compiler_gym.cache_path`.
+
+        :param max_size_in_bytes: The maximum total size of cached bitcodes.
+        """
+        self.path = Path(path or cache_path("llvm-v0/bitcode-cache"))
+        self.max_size_in_bytes = max_size_in_bytes
+        self.hits = 0
+        self.misses = 0
+        (self.path / "manifests").mkdir(parents=True, exist_ok=True)
+        (self.path / "objects").mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(tool: str, args: Iterable[str], inputs: Iterable[Path]) -> str:
+        """Compute the key for a compilation job.
+
+        :param tool: The name of the tool being invoked.
+
+        :param args: The arguments to the tool, excluding the output path.
+            Arguments that are relative paths of existing files or directories
+            are resolved to absolute paths, so the key does not depend on the
+            working directory.
+
+        :param inputs: A list of input files whose contents should be hashed.
+
+        :return: A hex checksum string.
+        """
+        checksum = hashlib.sha256()
+        # The checksum of the LLVM binaries archive identifies the LLVM version.
+        checksum.update(llvm._LLVM_SHA256.encode("utf-8"))
+        checksum.update(tool.encode("utf-8"))
+        for arg in args:
+            checksum.update(b"\0")
+            checksum.update(_absolute_path_arg(str(arg)).encode("utf-8"))
+        for path in inputs:
+            checksum.update(b"\0")
+            checksum.update(file_sha256(path).encode("utf-8"))
+        return checksum.hexdigest()
+
+    def _manifest_path(self, key: str) -> Path:
+        return self.path / "manifests" / f"{key}.json"
+
+    def _object_path(self, object_key: str) -> Path:
+        return self.path / "objects" / f"{object_key}.bc"
+
+    def _read_manifest(self, key: str) -> List[Dict]:
+        try:
+            with open(self._manifest_path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    @staticmethod
+    def _includes_unchanged(includes: Dict[str, str]) -> bool:
+        for path, checksum in includes.items():
+            try:
+                if file_sha256(Path(path)) != checksum:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Look up a cached bitcode.
+
+        :param key: A key returned by :meth:`make_key()`.
+
+        :return: The contents of the bitcode, or :code:`None` on cache miss.
+        """
+        for entry in self._read_manifest(key):
+            if not self._includes_unchanged(entry["includes"]):
+                continue
+            path = self._object_path(entry["object"])
+            try:
+                with open(path, "rb") as f:
+                    bitcode = f.read()
+            except FileNotFoundError:
+                # The object was evicted.
+                continue
+            # Update the modification time to record the use for LRU eviction.
+            os.utime(path)
+            self.hits += 1
+            return bitcode
+        self.misses += 1
+        return None
+
+    def put(
+        self, key: str, bitcode: bytes, includes: Optional[Iterable[Path]] = None
+    ) -> None:
+        """Add a bitcode to the cache.
+
+        :param key: A key returned by :meth:`make_key()`.
+
+        :param bitcode: The contents of the bitcode.
+
+        :param includes: The list of files that were read by the compilation
+            job, in addition to the inputs used to compute the key.
+        """
+        include_checksums = {
+            str(Path(path).absolute()): file_sha256(path) for path in includes or []
+        }
+        object_key = hashlib.sha256(
+            (key + json.dumps(include_checksums, sort_keys=True)).encode("utf-8")
+        ).hexdigest()
+
+        with atomic_file_write(self._object_path(object_key), fileobj=True) as f:
+            f.write(bitcode)
+
+        manifest = [
+            entry for entry in self._read_manifest(key) if entry["object"] != object_key
+        ]
+        manifest.append({"includes": include_checksums, "object": object_key})
+        with atomic_file_write(self._manifest_path(key), fileobj=True, mode="w") as f:
+            json.dump(manifest[-_MAX_MANIFEST_ENTRIES:], f)
+
+        self.evict()
+
+    @property
+    def size_in_bytes(self) -> int:
+        """The total size of the cached bitcodes."""
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.path / "objects")
+            if entry.name.endswith(".bc")
+        )
+
+    def evict(self) -> None:
+        """Evict the least recently used bitcodes until the size of the cache
+        is within the limit.
+        """
+        entries = []
+        for entry in os.scandir(self.path / "objects"):
+            if not entry.name.endswith(".bc"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(e[1] for e in entries)
+        if size <= self.max_size_in_bytes:
+            return
+
+        # Evict down to a low water mark so that eviction is not run on every
+        # subsequent insertion.
+        target_size = int(self.max_size_in_bytes * 0.9)
+        for _, entry_size, path in sorted(entries):
+            if size <= target_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # Evicted concurrently.
+            size -= entry_size
+        logger.debug("Evicted bitcode cache to %d bytes", size)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        for subdir in ["manifests", "objects"]:
+            for entry in os.scandir(self.path / subdir):
+                os.unlink(entry.path)
@@ -4,14 +4,13 @@
 # LICENSE file in the root directory of this source tree.
 import subprocess
 import sys
-from concurrent.futures import as_completed
 from pathlib import Path
 from typing import Optional
 
 from compiler_gym.datasets import Benchmark, TarDatasetWithManifest
 from compiler_gym.datasets.benchmark import BenchmarkWithSource
+from compiler_gym.envs.llvm.datasets.parallel_compile import compile_all
 from compiler_gym.envs.llvm.llvm_benchmark import ClangInvocation
-from compiler_gym.util import thread_pool
 from compiler_gym.util.filesystem import atomic_file_write
 
 
@@ -114,18 +113,13 @@ class AnghaBenchDataset(TarDatasetWithManifest):
             uri, bitcode_abspath, "function.c", c_file_abspath
         )
 
-    def compile_all(self):
-        n = self.size
-        executor = thread_pool.get_thread_pool_executor()
-        # Since the dataset is lazily compiled, simply iterating over the full
-        # set of URIs will compile everything. Do this in parallel.
-        futures = (
-            executor.submit(self.benchmark, uri) for uri in self.benchmark_uris()
-        )
-        for i, future in enumerate(as_completed(futures), start=1):
-            future.result()
-            print(
-                f"\r\033[KCompiled {i} of {n} programs ({i/n:.1%} complete)",
-                flush=True,
-                end="",
-            )
+    def compile_all(
+        self, num_workers: Optional[int] = None, retry_failures: bool = False
+    ) -> int:
+        """Compile every benchmark in the dataset using a pool of processes.
+
+        See :func:`compiler_gym.envs.llvm.datasets.parallel_compile.compile_all`.
+
+        :return: The number of benchmarks that failed to compile.
+        """
+        return compile_all(self, num_workers=num_workers, retry_failures=retry_failures)
@@ -5,15 +5,17 @@
 import logging
 import subprocess
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Iterable, List, Optional, Tuple
 
 import numpy as np
 
 from compiler_gym.datasets import Benchmark, BenchmarkSource, Dataset
 from compiler_gym.datasets.benchmark import BenchmarkInitError, BenchmarkWithSource
+from compiler_gym.datasets.benchmark_prefetcher import PrefetchingDatasetMixin
 from compiler_gym.envs.llvm.llvm_benchmark import ClangInvocation
 from compiler_gym.service.proto import BenchmarkDynamicConfig, Command
 from compiler_gym.util.decorators import memoized_property
+from compiler_gym.util.filesystem import atomic_file_write
 from compiler_gym.util.runfiles_path import runfiles_path
 from compiler_gym.util.shell_format import plural
 from compiler_gym.util.truncate import truncate
@@ -68,7 +70,7 @@ class CsmithBenchmark(BenchmarkWithSource):
         return self._src.decode("utf-8")
 
 
-class CsmithDataset(Dataset):
+class CsmithDataset(PrefetchingDatasetMixin, Dataset):
     """A dataset which uses Csmith to generate programs.
 
     Csmith is a tool that can generate random conformant C99 programs. It is
@@ -88,14 +90,28 @@ class CsmithDataset(Dataset):
     environment and that :meth:`env.reset()
     <compiler_gym.envs.CompilerEnv.reset>` will raise :class:`BenchmarkInitError
     <compiler_gym.datasets.BenchmarkInitError>`.
+
+    Generating a benchmark runs Csmith and clang, which can dominate the cost of
+    :meth:`env.reset() <compiler_gym.envs.CompilerEnv.reset>`. Use
+    :meth:`prefetch() <compiler_gym.envs.llvm.datasets.CsmithDataset.prefetch>`
+    to generate random benchmarks in the background, and set :code:`cache_dir`
+    to store generated benchmarks on disk so that they are not regenerated:
+
+        >>> dataset = env.datasets["generator://csmith-v0"]
+        >>> dataset.cache_dir = Path("~/.cache/csmith").expanduser()
+        >>> dataset.prefetch(queue_size=32, num_workers=8)
+        >>> env.reset(benchmark=dataset.random_benchmark())
     """
 
+    max_seed = UINT_MAX
+
     def __init__(
         self,
         site_data_base: Path,
         sort_order: int = 0,
         csmith_bin: Optional[Path] = None,
         csmith_includes: Optional[Path] = None,
+        cache_dir: Optional[Path] = None,
     ):
         """Constructor.
 
@@ -111,6 +127,9 @@ class CsmithDataset(Dataset):
         :param csmith_includes: The path of the Csmith includes directory. If
             not provided, the includes of the Csmith shipped with CompilerGym is
             used.
+
+        :param cache_dir: An optional directory to store generated benchmarks
+            in, keyed by seed.
         """
         super().__init__(
             name="generator://csmith-v0",
@@ -126,6 +145,7 @@ class CsmithDataset(Dataset):
         )
         self.csmith_bin_path = csmith_bin or _CSMITH_BIN
         self.csmith_includes_path = csmith_includes or _CSMITH_INCLUDES
+        self.cache_dir = cache_dir
         # The command that is used to compile an LLVM-IR bitcode file from a
         # Csmith input. Reads from stdin, writes to stdout.
         self.clang_compile_command: List[str] = ClangInvocation.from_c_file(
@@ -153,6 +173,9 @@ class CsmithDataset(Dataset):
         return self.benchmark_from_seed(int(uri.split("/")[-1]))
 
     def _random_benchmark(self, random_state: np.random.Generator) -> Benchmark:
+        benchmark = self._random_prefetched_benchmark(random_state)
+        if benchmark is not None:
+            return benchmark
         seed = random_state.integers(UINT_MAX)
         return self.benchmark_from_seed(seed)
 
@@ -170,6 +193,27 @@ class CsmithDataset(Dataset):
         :raises BenchmarkInitError: If the C program generated by Csmith cannot
             be lowered to LLVM-IR.
         """
+        benchmark = self._prefetched_benchmark(seed)
+        if benchmark is not None:
+            return benchmark
+        return self._benchmark_from_seed(seed, max_retries, retry_count)
+
+    def _cache_paths(self, seed: int) -> Tuple[Path, Path]:
+        cache_dir = Path(self.cache_dir)
+        return cache_dir / f"{seed}.bc", cache_dir / f"{seed}.c"
+
+    def _benchmark_from_seed(
+        self, seed: int, max_retries: int = 3, retry_count: int = 0
+    ) -> CsmithBenchmark:
+        if self.cache_dir:
+            bitcode_path, src_path = self._cache_paths(seed)
+            if bitcode_path.is_file():
+                return self.benchmark_class.create(
+                    f"{self.name}/{seed}",
+                    bitcode_path.read_bytes(),
+                    src_path.read_bytes(),
+                )
+
         if retry_count >= max_retries:
             raise OSError(
                 f"Csmith failed after {retry_count} {plural(retry_count, 'attempt', 'attempts')} "
@@ -199,7 +243,7 @@ class CsmithDataset(Dataset):
                 # Failed to interpret the stderr output, generate a generic
                 # error message.
                 logger.warning("Csmith failed with seed %d", seed)
-            return self.benchmark_from_seed(
+            return self._benchmark_from_seed(
                 seed, max_retries=max_retries, retry_count=retry_count + 1
             )
 
@@ -220,4 +264,12 @@ class CsmithDataset(Dataset):
                 f"Command: {compile_cmd}\n"
             )
 
+        if self.cache_dir:
+            # Write the source first, as the bitcode marks a complete entry.
+            bitcode_path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_file_write(src_path, fileobj=True) as f:
+                f.write(src)
+            with atomic_file_write(bitcode_path, fileobj=True) as f:
+                f.write(stdout)
+
         return self.benchmark_class.create(f"{self.name}/{seed}", stdout, src)
@@ -4,19 +4,21 @@
 # LICENSE file in the root directory of this source tree.
 import subprocess
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Optional
 
 import numpy as np
 
 from compiler_gym.datasets import Benchmark, Dataset
 from compiler_gym.datasets.benchmark import BenchmarkInitError
+from compiler_gym.datasets.benchmark_prefetcher import PrefetchingDatasetMixin
 from compiler_gym.third_party import llvm
+from compiler_gym.util.filesystem import atomic_file_write
 
 # The maximum value for the --seed argument to llvm-stress.
 UINT_MAX = (2 ** 32) - 1
 
 
-class LlvmStressDataset(Dataset):
+class LlvmStressDataset(PrefetchingDatasetMixin, Dataset):
     """A dataset which uses llvm-stress to generate programs.
 
     `llvm-stress <https://llvm.org/docs/CommandGuide/llvm-stress.html>`_ is a
@@ -32,9 +34,21 @@ class LlvmStressDataset(Dataset):
     environment and that :meth:`env.reset()
     <compiler_gym.envs.CompilerEnv.reset>` will raise
     :class:`BenchmarkInitError <compiler_gym.datasets.BenchmarkInitError>`.
+
+    Use :meth:`prefetch()
+    <compiler_gym.envs.llvm.datasets.LlvmStressDataset.prefetch>` to generate
+    random benchmarks in the background, and set :code:`cache_dir` to store
+    generated benchmarks on disk so that they are not regenerated.
     """
 
-    def __init__(self, site_data_base: Path, sort_order: int = 0):
+    max_seed = UINT_MAX
+
+    def __init__(
+        self,
+        site_data_base: Path,
+        sort_order: int = 0,
+        cache_dir: Optional[Path] = None,
+    ):
         super().__init__(
             name="generator://llvm-stress-v0",
             description="Randomly generated LLVM-IR",
@@ -45,6 +59,7 @@ class LlvmStressDataset(Dataset):
             site_data_base=site_data_base,
             sort_order=sort_order,
         )
+        self.cache_dir = cache_dir
 
     @property
     def size(self) -> int:
@@ -59,6 +74,9 @@ class LlvmStressDataset(Dataset):
         return self.benchmark_from_seed(int(uri.split("/")[-1]))
 
     def _random_benchmark(self, random_state: np.random.Generator) -> Benchmark:
+        benchmark = self._random_prefetched_benchmark(random_state)
+        if benchmark is not None:
+            return benchmark
         seed = random_state.integers(UINT_MAX)
         return self.benchmark_from_seed(seed)
 
@@ -69,6 +87,18 @@ class LlvmStressDataset(Dataset):
 
         :return: A benchmark instance.
         """
+        benchmark = self._prefetched_benchmark(seed)
+        if benchmark is not None:
+            return benchmark
+        return self._benchmark_from_seed(seed)
+
+    def _benchmark_from_seed(self, seed: int) -> Benchmark:
+        uri = f"{self.name}/{seed}"
+        if self.cache_dir:
+            bitcode_path = Path(self.cache_dir) / f"{seed}.bc"
+            if bitcode_path.is_file():
+                return Benchmark.from_file_contents(uri, bitcode_path.read_bytes())
+
         self.install()
 
         # Run llvm-stress with the given seed and pipe the output to llvm-as to
@@ -90,4 +120,9 @@ class LlvmStressDataset(Dataset):
         if llvm_stress.returncode or llvm_as.returncode:
             raise BenchmarkInitError("Failed to generate benchmark")
 
-        return Benchmark.from_file_contents(f"{self.name}/{seed}", stdout)
+        if self.cache_dir:
+            bitcode_path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_file_write(bitcode_path, fileobj=True) as f:
+                f.write(stdout)
+
+        return Benchmark.from_file_contents(uri, stdout)
@@ -0,0 +1,98 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Bulk compilation of datasets whose benchmarks are compiled on demand."""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from typing import Optional, Tuple
+
+from compiler_gym.datasets import Dataset
+
+logger = logging.getLogger(__name__)
+
+# The name of the file in the dataset's site data directory that records the
+# URIs of the benchmarks that failed to compile.
+FAILURES_FILE_NAME = "compile_all_failures.txt"
+
+# The dataset of a worker process, set by _init_worker().
+_worker_dataset: Optional[Dataset] = None
+
+
+def _init_worker(dataset: Dataset) -> None:
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _compile(uri: str) -> Tuple[str, Optional[str]]:
+    """Compile a benchmark and return its URI and an error message on failure."""
+    try:
+        _worker_dataset.benchmark(uri)
+        return uri, None
+    except Exception as e:  # pylint: disable=broad-except
+        return uri, f"{type(e).__name__}: {e}"
+
+
+def compile_all(
+    dataset: Dataset,
+    num_workers: Optional[int] = None,
+    chunksize: int = 32,
+    retry_failures: bool = False,
+) -> int:
+    """Compile every benchmark in a dataset that is compiled on demand.
+
+    The benchmarks are compiled by a pool of processes, with each process
+    calling :meth:`dataset.benchmark(uri)
+    <compiler_gym.datasets.Dataset.benchmark>` for batches of
+    :code:`chunksize` URIs. Bitcodes are written atomically and benchmarks that
+    have already been compiled are skipped, so an interrupted run can be
+    resumed by calling this function again. The URIs of benchmarks that fail to
+    compile are recorded in the dataset's site data directory and skipped on
+    subsequent runs unless :code:`retry_failures` is set.
+
+    :param dataset: The dataset to compile. The dataset must be picklable, as a
+        copy is sent to each worker process.
+
+    :param num_workers: The number of worker processes. Defaults to the number
+        of cores on the machine.
+
+    :param chunksize: The number of URIs to send to a worker process at a time.
+
+    :param retry_failures: Whether to retry the benchmarks that failed to
+        compile on a previous run.
+
+    :return: The number of benchmarks that failed to compile.
+    """
+    dataset.install()
+    failures_path = dataset.site_data_path / FAILURES_FILE_NAME
+    failures_path.parent.mkdir(parents=True, exist_ok=True)
+    failed = set()
+    if failures_path.is_file() and not retry_failures:
+        with open(failures_path) as f:
+            failed = {line.rstrip("\n") for line in f if line.strip()}
+    elif failures_path.is_file():
+        failures_path.unlink()
+
+    uris = [uri for uri in dataset.benchmark_uris() if uri not in failed]
+    n = len(uris)
+    if failed:
+        logger.info("Skipping %d benchmarks that previously failed", len(failed))
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers or cpu_count(),
+        initializer=_init_worker,
+        initargs=(dataset,),
+    ) as executor, open(failures_path, "a") as failures:
+        results = executor.map(_compile, uris, chunksize=chunksize)
+        for i, (uri, error) in enumerate(results, start=1):
+            if error:
+                logger.warning("Failed to compile %s: %s", uri, error)
+                print(uri, file=failures, flush=True)
+                failed.add(uri)
+            print(
+                f"\r\033[KCompiled {i} of {n} programs ({i/n:.1%} complete)",
+                flush=True,
+                end="",
+            )
+    return len(failed)
@@ -2,23 +2,69 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+import hashlib
 import logging
+import re
 import subprocess
 import sys
-from concurrent.futures import as_completed
 from pathlib import Path
+from threading import Lock
 from typing import Optional
 
+from fasteners import InterProcessLock
+
 from compiler_gym.datasets import Benchmark, BenchmarkInitError, TarDatasetWithManifest
 from compiler_gym.datasets.benchmark import BenchmarkWithSource
+from compiler_gym.envs.llvm.datasets.parallel_compile import compile_all
 from compiler_gym.envs.llvm.llvm_benchmark import ClangInvocation
-from compiler_gym.util import thread_pool
+from compiler_gym.third_party import llvm
 from compiler_gym.util.download import download
 from compiler_gym.util.filesystem import atomic_file_write
 from compiler_gym.util.truncate import truncate
 
 logger = logging.getLogger(__name__)
 
+# The flags used to compile POJ-104 sources, and the precompiled header of the
+# prelude that is prepended to them.
+_COPT = [
+    "-ferror-limit=1",  # Stop on first error.
+    "-w",  # No warnings.
+    # Some of the programs use the gets() function that was deprecated in C++11
+    # and removed in C++14.
+    "-std=c++11",
+]
+
+_PRELUDE_PCH_LOCK = Lock()
+
+# Matches the diagnostics that clang emits when it rejects a precompiled
+# header, such as when a system header has been modified since the header was
+# built.
+_PCH_ERROR_RE = re.compile(r"precompiled header|PCH file|AST file")
+
+
+class _PrecompiledHeaderError(BenchmarkInitError):
+    """Raised when the compiler rejects the precompiled header of the prelude."""
+
+
+def _poj104_prelude() -> str:
+    """Return the code that is prepended to every POJ-104 source."""
+    # Pull in the standard library.
+    if sys.platform == "linux":
+        header = "#include <bits/stdc++.h>\n" "using namespace std;\n"
+    else:
+        # Download a bits/stdc++ implementation for macOS.
+        header = download(
+            "https://raw.githubusercontent.com/tekfyl/bits-stdc-.h-for-mac/e1193f4470514d82ea19c3cc1357116fadaa2a4e/stdc%2B%2B.h",
+            sha256="b4d9b031d56d89a2b58b5ed80fa9943aa92420d6aed0835747c9a5584469afeb",
+        ).decode("utf-8")
+
+    # These defines provide values for commonly undefined symbols. Defining
+    # these macros increases the number of POJ-104 programs that compile
+    # from 49,302 to 49,821 (+519) on linux.
+    defines = "#define LEN 128\n" "#define MAX_LENGTH 1024\n" "#define MAX 1024\n"
+
+    return header + defines
+
 
 class POJ104Dataset(TarDatasetWithManifest):
     """The POJ-104 dataset contains 52000 C++ programs implementing 104
@@ -68,6 +114,8 @@ class POJ104Dataset(TarDatasetWithManifest):
             site_data_base=site_data_base,
             sort_order=sort_order,
         )
+        self._prelude_pch: Optional[Path] = None
+        self._prelude_pch_resolved = False
 
     def benchmark(self, uri: Optional[str] = None) -> Benchmark:
         self.install()
@@ -89,48 +137,140 @@ class POJ104Dataset(TarDatasetWithManifest):
 
             # Load the C++ source into memory and pre-process it.
             with open(cc_file_path) as f:
-                src = self.preprocess_poj104_source(f.read())
-
-            # Compile the C++ source into a bitcode file.
-            with atomic_file_write(bitcode_path) as tmp_bitcode_path:
-                compile_cmd = ClangInvocation.from_c_file(
-                    "-",
-                    copt=[
-                        "-xc++",
-                        "-ferror-limit=1",  # Stop on first error.
-                        "-w",  # No warnings.
-                        # Some of the programs use the gets() function that was
-                        # deprecated in C++11 and removed in C++14.
-                        "-std=c++11",
-                    ],
-                ).command(outpath=tmp_bitcode_path)
-                logger.debug("Exec %s", compile_cmd)
-                clang = subprocess.Popen(
-                    compile_cmd,
-                    stdin=subprocess.PIPE,
+                src = self.preprocess_poj104_source(f.read(), prelude=False)
+
+            pch = self.prelude_pch()
+            try:
+                self._compile(src, bitcode_path, pch)
+            except _PrecompiledHeaderError:
+                # A precompiled header is invalidated by changes to the system
+                # headers, so retry without it before reporting an error.
+                self._compile(src, bitcode_path, None)
+
+        return BenchmarkWithSource.create(uri, bitcode_path, "source.cc", cc_file_path)
+
+    @staticmethod
+    def _compile(src: str, bitcode_path: Path, pch: Optional[Path]) -> None:
+        """Compile a pre-processed C++ source into a bitcode file."""
+        copt = ["-xc++"] + _COPT
+        if pch:
+            copt += ["-include-pch", str(pch)]
+        else:
+            src = _poj104_prelude() + src
+
+        with atomic_file_write(bitcode_path) as tmp_bitcode_path:
+            compile_cmd = ClangInvocation.from_c_file("-", copt=copt).command(
+                outpath=tmp_bitcode_path
+            )
+            logger.debug("Exec %s", compile_cmd)
+            clang = subprocess.Popen(
+                compile_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            _, stderr = clang.communicate(src.encode("utf-8"), timeout=300)
+
+        if clang.returncode:
+            compile_cmd = " ".join(compile_cmd)
+            stderr = stderr.decode("utf-8")
+            error = truncate(stderr, max_lines=20, max_line_len=100)
+            error_type = (
+                _PrecompiledHeaderError
+                if pch and _PCH_ERROR_RE.search(stderr)
+                else BenchmarkInitError
+            )
+            raise error_type(
+                f"Compilation job failed!\n"
+                f"Command: {compile_cmd}\n"
+                f"Error: {error}"
+            )
+        if not bitcode_path.is_file():
+            raise BenchmarkInitError(
+                f"Compilation job failed to produce output file!\nCommand: {compile_cmd}"
+            )
+
+    def prelude_pch(self) -> Optional[Path]:
+        """Return the path of a precompiled header of the prelude that is
+        prepended to every POJ-104 source, building it if required.
+
+        The prelude includes the entire C++ standard library, so precompiling
+        it saves clang from parsing the standard library for every benchmark.
+        The precompiled header is built once for each clang version and set of
+        compiler flags, and is stored in the site data directory.
+
+        :return: The path of the precompiled header, or :code:`None` if it
+            could not be built.
+        """
+        with _PRELUDE_PCH_LOCK:
+            if not self._prelude_pch_resolved:
+                self._prelude_pch = self._build_prelude_pch()
+                self._prelude_pch_resolved = True
+            return self._prelude_pch
+
+    def _build_prelude_pch(self) -> Optional[Path]:
+        prelude = _poj104_prelude()
+        copt = ["-xc++-header"] + _COPT
+        try:
+            clang_version = subprocess.check_output(
+                [str(llvm.clang_path()), "--version"], timeout=60
+            ).decode("utf-8")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("Failed to determine clang version: %s", e)
+            return None
+        placeholder_cmd = ClangInvocation.from_c_file(
+            "-", copt=copt
+        ).precompiled_header_command(Path("-"))
+        key = hashlib.sha256(
+            "\n".join([clang_version, " ".join(placeholder_cmd), prelude]).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+
+        pch_dir = self.site_data_path / "pch"
+        header_path = pch_dir / f"prelude-{key}.h"
+        pch_path = pch_dir / f"prelude-{key}.h.pch"
+        if pch_path.is_file():
+            return pch_path
+
+        pch_dir.mkdir(parents=True, exist_ok=True)
+        # Clang checks the modification time of the header when loading the
+        # precompiled header, so the header must not be rewritten once the
+        # precompiled header has been built.
+        with InterProcessLock(pch_dir / ".lock"):
+            if pch_path.is_file():
+                return pch_path
+            header_path.write_text(prelude)
+            with atomic_file_write(pch_path) as tmp_pch_path:
+                cmd = ClangInvocation.from_c_file(
+                    header_path, copt=copt
+                ).precompiled_header_command(tmp_pch_path)
+                logger.debug("Exec %s", cmd)
+                clang = subprocess.run(
+                    cmd,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
+                    timeout=600,
                 )
-                _, stderr = clang.communicate(src.encode("utf-8"), timeout=300)
-
-            if clang.returncode:
-                compile_cmd = " ".join(compile_cmd)
-                error = truncate(stderr.decode("utf-8"), max_lines=20, max_line_len=100)
-                raise BenchmarkInitError(
-                    f"Compilation job failed!\n"
-                    f"Command: {compile_cmd}\n"
-                    f"Error: {error}"
-                )
-            if not bitcode_path.is_file():
-                raise BenchmarkInitError(
-                    f"Compilation job failed to produce output file!\nCommand: {compile_cmd}"
+            if clang.returncode or not pch_path.is_file():
+                error = truncate(
+                    clang.stderr.decode("utf-8"), max_lines=20, max_line_len=100
                 )
-
-        return BenchmarkWithSource.create(uri, bitcode_path, "source.cc", cc_file_path)
+                logger.warning("Failed to build precompiled header: %s", error)
+                return None
+        return pch_path
 
     @staticmethod
-    def preprocess_poj104_source(src: str) -> str:
-        """Pre-process a POJ-104 C++ source file for compilation."""
+    def preprocess_poj104_source(src: str, prelude: bool = True) -> str:
+        """Pre-process a POJ-104 C++ source file for compilation.
+
+        :param src: The C++ source.
+
+        :param prelude: Whether to prepend the standard library headers and
+            defines that the programs depend on. If :code:`False`, the prelude
+            must be provided separately, such as by using
+            :meth:`prelude_pch()`.
+        """
         # Clean up declaration of main function. Many are missing a return type
         # declaration, or use an incorrect void return type.
         src = src.replace("void main", "int main")
@@ -138,38 +278,20 @@ class POJ104Dataset(TarDatasetWithManifest):
         if src.startswith("main"):
             src = f"int {src}"
 
-        # Pull in the standard library.
-        if sys.platform == "linux":
-            header = "#include <bits/stdc++.h>\n" "using namespace std;\n"
-        else:
-            # Download a bits/stdc++ implementation for macOS.
-            header = download(
-                "https://raw.githubusercontent.com/tekfyl/bits-stdc-.h-for-mac/e1193f4470514d82ea19c3cc1357116fadaa2a4e/stdc%2B%2B.h",
-                sha256="b4d9b031d56d89a2b58b5ed80fa9943aa92420d6aed0835747c9a5584469afeb",
-            ).decode("utf-8")
+        if prelude:
+            src = _poj104_prelude() + src
+        return src
 
-        # These defines provide values for commonly undefined symbols. Defining
-        # these macros increases the number of POJ-104 programs that compile
-        # from 49,302 to 49,821 (+519) on linux.
-        defines = "#define LEN 128\n" "#define MAX_LENGTH 1024\n" "#define MAX 1024\n"
+    def compile_all(
+        self, num_workers: Optional[int] = None, retry_failures: bool = False
+    ) -> int:
+        """Compile every benchmark in the dataset using a pool of processes.
 
-        return header + defines + src
+        See :func:`compiler_gym.envs.llvm.datasets.parallel_compile.compile_all`.
 
-    def compile_all(self):
-        n = self.size
-        executor = thread_pool.get_thread_pool_executor()
-        # Since the dataset is lazily compiled, simply iterating over the full
-        # set of URIs will compile everything. Do this in parallel.
-        futures = (
-            executor.submit(self.benchmark, uri) for uri in self.benchmark_uris()
-        )
-        for i, future in enumerate(as_completed(futures), start=1):
-            future.result()
-            print(
-                f"\r\033[KCompiled {i} of {n} programs ({i/n:.2%} complete)",
-                flush=True,
-                end="",
-            )
+        :return: The number of benchmarks that failed to compile.
+        """
+        return compile_all(self, num_workers=num_workers, retry_failures=retry_failures)
 
 
 class POJ104LegacyDataset(TarDatasetWithManifest):
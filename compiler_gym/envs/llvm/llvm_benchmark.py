@@ -14,6 +14,7 @@ from pathlib import Path
 from typing import Iterable, List, Optional, Union
 
 from compiler_gym.datasets import Benchmark, BenchmarkInitError
+from compiler_gym.envs.llvm.compile_cache import BitcodeCache, read_dependency_file
 from compiler_gym.third_party import llvm
 from compiler_gym.util.commands import communicate, run_command
 from compiler_gym.util.runfiles_path import transient_cache_path
@@ -127,17 +128,29 @@ class ClangInvocation:
         self.system_includes = system_includes
         self.timeout = timeout
 
-    def command(self, outpath: Path) -> List[str]:
+    def _base_command(self) -> List[str]:
         cmd = [str(llvm.clang_path())]
         if self.system_includes:
             for directory in get_system_includes():
                 cmd += ["-isystem", str(directory)]
 
         cmd += [str(s) for s in self.args]
-        cmd += ["-c", "-emit-llvm", "-o", str(outpath)]
-
         return cmd
 
+    def command(self, outpath: Path) -> List[str]:
+        return self._base_command() + ["-c", "-emit-llvm", "-o", str(outpath)]
+
+    def precompiled_header_command(self, outpath: Path) -> List[str]:
+        """Return the command to compile a header into a precompiled header.
+
+        The input must be compiled as a header, e.g. using
+        :code:`-xc++-header`. Translation units that use the precompiled header
+        with :code:`-include-pch` must be compiled with the same flags.
+
+        :param outpath: The path of the precompiled header to write.
+        """
+        return self._base_command() + ["-o", str(outpath)]
+
     @classmethod
     def from_c_file(
         cls,
@@ -175,11 +188,58 @@ class ClangInvocation:
         )
 
 
+def _run_clang_job(
+    job: ClangInvocation, outpath: Path, cache: Optional[BitcodeCache]
+) -> None:
+    """Run a clang job, using the cache if provided."""
+    if cache is None:
+        run_command(job.command(outpath), job.timeout)
+        return
+
+    # Every argument that names a file is an input whose contents are hashed.
+    # The command is computed with a placeholder output path so that it is the
+    # same across runs.
+    inputs = [Path(arg) for arg in job.args if Path(arg).is_file()]
+    key = cache.make_key("clang", job.command(Path("-")), inputs)
+    bitcode = cache.get(key)
+    if bitcode is not None:
+        outpath.write_bytes(bitcode)
+        return
+
+    depfile = outpath.parent / f"{outpath.name}.d"
+    run_command(job.command(outpath) + ["-MD", "-MF", str(depfile)], job.timeout)
+    # Without a dependency file we cannot determine which headers the job
+    # included, so the result cannot be safely cached.
+    if outpath.is_file() and depfile.is_file():
+        cache.put(key, outpath.read_bytes(), includes=read_dependency_file(depfile))
+
+
+def _run_llvm_as_job(
+    ll_path: Path, outpath: Path, timeout: int, cache: Optional[BitcodeCache]
+) -> None:
+    """Run an llvm-as job, using the cache if provided."""
+    command = [str(llvm.llvm_as_path()), str(ll_path)]
+    if cache is None:
+        run_command(command + ["-o", str(outpath)], timeout)
+        return
+
+    key = cache.make_key("llvm-as", command, [ll_path])
+    bitcode = cache.get(key)
+    if bitcode is not None:
+        outpath.write_bytes(bitcode)
+        return
+
+    run_command(command + ["-o", str(outpath)], timeout)
+    if outpath.is_file():
+        cache.put(key, outpath.read_bytes())
+
+
 def make_benchmark(
     inputs: Union[str, Path, ClangInvocation, List[Union[str, Path, ClangInvocation]]],
     copt: Optional[List[str]] = None,
     system_includes: bool = True,
     timeout: int = 600,
+    cache: Optional[BitcodeCache] = None,
 ) -> Benchmark:
     """Create a benchmark for use by LLVM environments.
 
@@ -233,6 +293,13 @@ def make_benchmark(
 
         >>> benchmark = make_benchmark('module.ll')
 
+    To reuse the results of earlier compilation jobs, pass a :class:`BitcodeCache
+    <compiler_gym.envs.llvm.BitcodeCache>`. Cached results are shared by all
+    processes that use the same cache directory:
+
+        >>> cache = BitcodeCache()
+        >>> benchmark = make_benchmark('my_app.c', cache=cache)
+
     .. note::
 
         LLVM bitcode compatibility is
@@ -253,6 +320,10 @@ def make_benchmark(
     :param timeout: The maximum number of seconds to allow clang to run before
         terminating.
 
+    :param cache: An optional cache of compiled bitcodes. If provided, the
+        results of clang, llvm-as, and llvm-link jobs are looked up in the cache
+        before running them, and added to the cache after.
+
     :return: A :code:`Benchmark` instance.
 
     :raises FileNotFoundError: If any input sources are not found.
@@ -334,11 +405,11 @@ def make_benchmark(
 
             # Fire off the clang and llvm-as jobs.
             futures = [
-                executor.submit(run_command, job.command(out), job.timeout)
+                executor.submit(_run_clang_job, job, out, cache)
                 for job, out in zip(clang_jobs, clang_outs)
             ] + [
-                executor.submit(run_command, command, timeout)
-                for command in llvm_as_commands
+                executor.submit(_run_llvm_as_job, ll_path, out, timeout, cache)
+                for ll_path, out in zip(ll_paths, llvm_as_outs)
             ]
 
             # Block until finished.
@@ -363,17 +434,27 @@ def make_benchmark(
                 bitcode = f.read()
         else:
             # Link all of the bitcodes into a single module.
+            link_inputs = bitcodes + clang_outs
             llvm_link_cmd = [str(llvm.llvm_link_path()), "-o", "-"] + [
-                str(path) for path in bitcodes + clang_outs
+                str(path) for path in link_inputs
             ]
-            llvm_link = subprocess.Popen(
-                llvm_link_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            bitcode, stderr = communicate(llvm_link, timeout=timeout)
-            if llvm_link.returncode:
-                raise BenchmarkInitError(
-                    f"Failed to link LLVM bitcodes with error: {stderr.decode('utf-8')}"
+            # The paths of the link inputs are excluded from the key as they
+            # include the name of the temporary working directory.
+            bitcode, link_key = None, None
+            if cache is not None:
+                link_key = cache.make_key("llvm-link", llvm_link_cmd[:3], link_inputs)
+                bitcode = cache.get(link_key)
+            if bitcode is None:
+                llvm_link = subprocess.Popen(
+                    llvm_link_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
                 )
+                bitcode, stderr = communicate(llvm_link, timeout=timeout)
+                if llvm_link.returncode:
+                    raise BenchmarkInitError(
+                        f"Failed to link LLVM bitcodes with error: {stderr.decode('utf-8')}"
+                    )
+                if cache is not None:
+                    cache.put(link_key, bitcode)
 
     timestamp = datetime.now().strftime("%Y%m%HT%H%M%S")
     uri = f"benchmark://user/{timestamp}-{random.randrange(16**4):04x}"
@@ -3,13 +3,16 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 """Extensions to the CompilerEnv environment for LLVM."""
+import json
+import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Iterable, List, Optional, Union, cast
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union, cast
 
 import numpy as np
 
+from compiler_gym.compiler_env_state import CompilerEnvState
 from compiler_gym.datasets import Benchmark, BenchmarkInitError, Dataset
 from compiler_gym.envs.compiler_env import CompilerEnv
 from compiler_gym.envs.llvm.datasets import get_llvm_datasets
@@ -19,6 +22,8 @@ from compiler_gym.envs.llvm.llvm_rewards import (
     CostFunctionReward,
     NormalizedReward,
 )
+from compiler_gym.service import ServiceError
+from compiler_gym.service.proto import EndSessionRequest
 from compiler_gym.spaces import Box, Commandline
 from compiler_gym.spaces import Dict as DictSpace
 from compiler_gym.spaces import Scalar, Sequence
@@ -26,9 +31,26 @@ from compiler_gym.third_party.autophase import AUTOPHASE_FEATURE_NAMES
 from compiler_gym.third_party.inst2vec import Inst2vecEncoder
 from compiler_gym.third_party.llvm import download_llvm_files
 from compiler_gym.third_party.llvm.instcount import INST_COUNT_FEATURE_NAMES
+from compiler_gym.util.array_dict_view import ArrayDictView
+
+logger = logging.getLogger(__name__)
 
 _INST2VEC_ENCODER = Inst2vecEncoder()
 
+# Tables that map the keys of the dictionary observations to the indices of the
+# features in the observations that they are derived from. These are shared by
+# every observation so that a dictionary observation can be constructed as a
+# view of the feature array without copying it.
+_INST_COUNT_DICT_INDEX: Dict[str, int] = {
+    f"{name}Count": i for i, name in enumerate(INST_COUNT_FEATURE_NAMES)
+}
+_INST_COUNT_NORM_DICT_INDEX: Dict[str, int] = {
+    f"{name}Density": i for i, name in enumerate(INST_COUNT_FEATURE_NAMES[1:])
+}
+_AUTOPHASE_DICT_INDEX: Dict[str, int] = {
+    name: i for i, name in enumerate(AUTOPHASE_FEATURE_NAMES)
+}
+
 
 _LLVM_DATASETS: Optional[List[Dataset]] = None
 
@@ -192,17 +214,14 @@ class LlvmEnv(CompilerEnv):
                     "base_id": "InstCount",
                     "space": DictSpace(
                         {
-                            f"{name}Count": Scalar(
-                                name=f"{name}Count", min=0, max=None, dtype=int
-                            )
-                            for name in INST_COUNT_FEATURE_NAMES
+                            name: Scalar(name=name, min=0, max=None, dtype=int)
+                            for name in _INST_COUNT_DICT_INDEX
                         },
                         name="InstCountDict",
                     ),
-                    "translate": lambda base_observation: {
-                        f"{name}Count": val
-                        for name, val in zip(INST_COUNT_FEATURE_NAMES, base_observation)
-                    },
+                    "translate": lambda base_observation: ArrayDictView(
+                        _INST_COUNT_DICT_INDEX, base_observation
+                    ),
                 },
                 {
                     "id": "InstCountNorm",
@@ -223,19 +242,14 @@ class LlvmEnv(CompilerEnv):
                     "base_id": "InstCountNorm",
                     "space": DictSpace(
                         {
-                            f"{name}Density": Scalar(
-                                name=f"{name}Density", min=0, max=None, dtype=int
-                            )
-                            for name in INST_COUNT_FEATURE_NAMES[1:]
+                            name: Scalar(name=name, min=0, max=None, dtype=int)
+                            for name in _INST_COUNT_NORM_DICT_INDEX
                         },
                         name="InstCountNormDict",
                     ),
-                    "translate": lambda base_observation: {
-                        f"{name}Density": val
-                        for name, val in zip(
-                            INST_COUNT_FEATURE_NAMES[1:], base_observation
-                        )
-                    },
+                    "translate": lambda base_observation: ArrayDictView(
+                        _INST_COUNT_NORM_DICT_INDEX, base_observation
+                    ),
                 },
                 {
                     "id": "AutophaseDict",
@@ -243,14 +257,13 @@ class LlvmEnv(CompilerEnv):
                     "space": DictSpace(
                         {
                             name: Scalar(name=name, min=0, max=None, dtype=int)
-                            for name in AUTOPHASE_FEATURE_NAMES
+                            for name in _AUTOPHASE_DICT_INDEX
                         },
                         name="AutophaseDict",
                     ),
-                    "translate": lambda base_observation: {
-                        name: val
-                        for name, val in zip(AUTOPHASE_FEATURE_NAMES, base_observation)
-                    },
+                    "translate": lambda base_observation: ArrayDictView(
+                        _AUTOPHASE_DICT_INDEX, base_observation
+                    ),
                 },
             ],
         )
@@ -259,6 +272,11 @@ class LlvmEnv(CompilerEnv):
         # to reset.
         self._runtimes_per_observation_count: Optional[int] = None
         self._runtimes_warmup_per_observation_count: Optional[int] = None
+        self._shared_memory_observation_threshold: int = 0
+        self._packed_observation_spaces: FrozenSet[str] = frozenset()
+        self._state_transition_cache: bool = False
+        self._module_verification_policy: str = "EveryStep"
+        self._module_verification_interval: int = 10
 
         cpu_info_spaces = [
             Sequence(name="name", size_range=(0, None), dtype=str),
@@ -280,6 +298,7 @@ class LlvmEnv(CompilerEnv):
         )
 
     def reset(self, *args, **kwargs):
+        self._verify_module_at_end_of_episode()
         try:
             observation = super().reset(*args, **kwargs)
         except ValueError as e:
@@ -303,6 +322,17 @@ class LlvmEnv(CompilerEnv):
             self.runtime_observation_count = self._runtimes_per_observation_count
         if self._runtimes_warmup_per_observation_count is not None:
             self.runtime_warmup_runs_count = self._runtimes_warmup_per_observation_count
+        if self._shared_memory_observation_threshold:
+            self.shared_memory_observation_threshold = (
+                self._shared_memory_observation_threshold
+            )
+        if self._packed_observation_spaces:
+            self.packed_observation_spaces = self._packed_observation_spaces
+        if self._state_transition_cache:
+            self.state_transition_cache = self._state_transition_cache
+        if self._module_verification_policy != "EveryStep":
+            self.module_verification_interval = self._module_verification_interval
+            self.module_verification_policy = self._module_verification_policy
 
         return observation
 
@@ -460,12 +490,15 @@ class LlvmEnv(CompilerEnv):
     def write_ir(self, path: Union[Path, str]) -> Path:
         """Write the current program state to a file.
 
+        The IR is streamed from the service to the file in chunks, so this
+        works for programs whose IR is too large to fit in a single message.
+
         :param path: The path of the file to write.
         :return: The input :code:`path` argument.
         """
         path = Path(path).expanduser()
-        with open(path, "w") as f:
-            f.write(self.ir)
+        with self.open_observation("Ir") as ir, open(path, "wb") as f:
+            shutil.copyfileobj(ir, f)
         return path
 
     def write_bitcode(self, path: Union[Path, str]) -> Path:
@@ -564,10 +597,294 @@ class LlvmEnv(CompilerEnv):
         # send_param() will raise an error if the valid is invalid.
         self._runtimes_warmup_per_observation_count = n
 
+    @property
+    def shared_memory_observation_threshold(self) -> int:
+        """The minimum size in bytes of an :code:`Ir` or :code:`Bitcode`
+        observation that is transferred from the compiler service through a
+        shared memory file rather than the RPC reply.
+
+        Large observations are expensive to serialize and copy between the
+        compiler service and the frontend. When this threshold is set, the
+        service writes observations at or above this size to a file in its
+        working directory, which uses the in-memory filesystem :code:`/dev/shm`
+        when available. The frontend maps the file into memory and removes it.
+        :code:`Ir` observations are returned as strings as usual.
+        :code:`Bitcode` observations are returned as a read-only
+        :code:`memoryview` of the mapped file rather than :code:`bytes`. Use
+        :code:`np.frombuffer()` to view it as an array without copying.
+
+        Shared memory transfer requires that the frontend and compiler service
+        share a filesystem, so it cannot be used with remote services.
+
+        Example usage:
+
+            >>> env = compiler_gym.make("llvm-v0")
+            >>> env.reset()
+            >>> env.shared_memory_observation_threshold = 1024 * 1024
+            >>> bitcode = env.observation["Bitcode"]
+
+        :getter: Returns the threshold in bytes. A value of zero means that
+            shared memory transfer is disabled.
+
+        :setter: Set the threshold in bytes. Set to zero to disable shared
+            memory transfer.
+
+        :type: int
+        """
+        return self._shared_memory_observation_threshold
+
+    @shared_memory_observation_threshold.setter
+    def shared_memory_observation_threshold(self, n: int) -> None:
+        if self.in_episode:
+            self.send_param("llvm.set_shared_memory_observation_threshold", str(n))
+        # NOTE(cummins): Keep this after the send_param() call because
+        # send_param() will raise an error if the valid is invalid.
+        self._shared_memory_observation_threshold = n
+
+    @property
+    def packed_observation_spaces(self) -> FrozenSet[str]:
+        """The names of the numeric observation spaces that are transferred
+        from the compiler service as packed byte buffers.
+
+        By default, numeric vector observations such as :code:`Autophase`,
+        :code:`InstCount`, and :code:`Runtime` are transferred as repeated
+        protocol buffer fields, which must be converted to arrays element by
+        element. Packed observations are instead decoded using a single
+        :code:`np.frombuffer()`. The returned arrays are read-only. Use
+        :code:`array.copy()` to obtain a writable array.
+
+        Example usage:
+
+            >>> env = compiler_gym.make("llvm-v0")
+            >>> env.reset()
+            >>> env.packed_observation_spaces = {"Autophase", "InstCount"}
+            >>> env.observation["Autophase"]
+            array([...])
+
+        :getter: Returns the set of observation space names.
+
+        :setter: Set the observation spaces to pack. Set to an empty set to
+            disable packing.
+
+        :type: FrozenSet[str]
+        """
+        return self._packed_observation_spaces
+
+    @packed_observation_spaces.setter
+    def packed_observation_spaces(self, spaces: Iterable[str]) -> None:
+        spaces = frozenset(spaces)
+        if self.in_episode:
+            self.send_param(
+                "llvm.set_packed_observation_spaces", ",".join(sorted(spaces))
+            )
+        # NOTE(cummins): Keep this after the send_param() call because
+        # send_param() will raise an error if the valid is invalid.
+        self._packed_observation_spaces = spaces
+
+    @property
+    def state_transition_cache(self) -> bool:
+        """Whether to share the results of pass actions between sessions.
+
+        When enabled, the compiler service records the result of every pass
+        action that is applied to a module in a cache that is shared by all of
+        the sessions of the service, keyed by a hash of the module and the
+        action. A session that applies the same action to an identical module
+        loads the result from the cache rather than running the pass. This
+        benefits search algorithms that repeatedly evaluate action sequences
+        with common prefixes.
+
+        The cache is bounded in size, with entries evicted randomly once full.
+        The bound is set using the
+        :code:`llvm.set_state_transition_cache_max_size_in_bytes` parameter of
+        :meth:`send_param() <compiler_gym.envs.CompilerEnv.send_param>`. Like
+        the cache itself, the bound is global to the service, so setting it from
+        one environment changes it for every session of the service.
+        Because results are shared, a pass that is not deterministic produces
+        the first result that was cached for a module.
+
+        Example usage:
+
+            >>> env = compiler_gym.make("llvm-v0")
+            >>> env.reset()
+            >>> env.state_transition_cache = True
+            >>> env.step(env.action_space.sample())
+            >>> env.state_transition_cache_stats
+            {'hits': 0, 'misses': 1, ...}
+
+        :getter: Returns whether the cache is enabled.
+
+        :setter: Enable or disable the cache for this environment.
+
+        :type: bool
+        """
+        return self._state_transition_cache
+
+    @state_transition_cache.setter
+    def state_transition_cache(self, enabled: bool) -> None:
+        if self.in_episode:
+            self.send_param("llvm.set_state_transition_cache", "1" if enabled else "0")
+        self._state_transition_cache = enabled
+
+    @property
+    def state_transition_cache_stats(self) -> Dict[str, int]:
+        """The hit rate counters and size of the compiler service's state
+        transition cache. See :attr:`state_transition_cache`.
+
+        :return: A dictionary with keys :code:`hits`, :code:`misses`,
+            :code:`size`, :code:`size_in_bytes`, and :code:`max_size_in_bytes`.
+        """
+        return json.loads(self.send_param("llvm.get_state_transition_cache_stats", ""))
+
+    @property
+    def module_verification_policy(self) -> str:
+        """The policy that determines when the compiler service verifies the
+        module after actions that modify it.
+
+        By default the module is verified at the end of every step that
+        modifies it, which for large modules is a significant part of the
+        time spent in a step. The other policies defer verification:
+
+        * :code:`"EveryStep"`: Verify after every step that modifies the
+          module. This is the default.
+        * :code:`"EveryNSteps"`: Verify after every
+          :attr:`module_verification_interval` steps that modify the module,
+          and before computing an observation that compiles or runs it.
+        * :code:`"BeforeExecution"`: Verify only before computing an
+          observation that compiles or runs the module, such as
+          :code:`Runtime` or :code:`ObjectTextSizeBytes`.
+        * :code:`"OnDemand"`: Verify only when :meth:`verify_module()` is
+          called, and at the end of an episode.
+
+        Under every deferred policy, the module is also verified at the end of
+        an episode, i.e. on :meth:`reset()` and :meth:`close()`, where a
+        failure is logged as a warning, and by :meth:`apply()` and
+        :meth:`validate()`, where a failure is an error.
+
+        Under a deferred policy, the service records the module each time it
+        is verified. If verification fails, the actions since then are
+        replayed on the recorded module to report the first action after which
+        the module fails verification.
+
+        Example usage:
+
+            >>> env = compiler_gym.make("llvm-v0")
+            >>> env.reset()
+            >>> env.module_verification_policy = "OnDemand"
+            >>> env.step(env.action_space.sample())
+            >>> env.verify_module()
+
+        :getter: Returns the name of the policy.
+
+        :setter: Set the policy. Any actions that have not been verified under
+            the previous policy are verified first.
+
+        :type: str
+        """
+        return self._module_verification_policy
+
+    @module_verification_policy.setter
+    def module_verification_policy(self, policy: str) -> None:
+        if self.in_episode:
+            self.send_param("llvm.set_module_verification_policy", policy)
+        self._module_verification_policy = policy
+
+    @property
+    def module_verification_interval(self) -> int:
+        """The number of steps that modify the module between verifications
+        under the :code:`"EveryNSteps"` :attr:`module_verification_policy`.
+
+        :getter: Returns the number of steps.
+
+        :setter: Set the number of steps. Must be >= 1.
+
+        :type: int
+        """
+        return self._module_verification_interval
+
+    @module_verification_interval.setter
+    def module_verification_interval(self, n: int) -> None:
+        if self.in_episode:
+            self.send_param("llvm.set_module_verification_interval", str(n))
+        self._module_verification_interval = n
+
+    def verify_module(self) -> None:
+        """Verify any actions that have not yet been verified under the
+        current :attr:`module_verification_policy`.
+
+        :raises ServiceError: If the module fails verification. The error
+            message names the first action after which verification fails.
+        """
+        self.send_param("llvm.verify_module", "")
+
+    def _verify_module_at_end_of_episode(self) -> None:
+        """Verify the outstanding actions of an episode that is ending under a
+        deferred verification policy.
+
+        The compiler service cannot tell when an episode ends, so this is how
+        the actions of an episode are verified under a deferred policy.
+
+        :raises ValueError: If the module fails verification. The session is
+            ended, so the failed episode is not resumed.
+        """
+        # This may be called from close() on a partially constructed
+        # environment.
+        policy = getattr(self, "_module_verification_policy", "EveryStep")
+        if policy == "EveryStep" or not self.in_episode:
+            return
+        try:
+            self.verify_module()
+        except ServiceError as e:
+            try:
+                self.service(
+                    self.service.stub.EndSession,
+                    EndSessionRequest(session_id=self._session_id),
+                )
+            except Exception as end_session_error:  # pylint: disable=broad-except
+                logger.warning(
+                    "Failed to end session %d: %s", self._session_id, end_session_error
+                )
+            self._session_id = None
+            raise ValueError(
+                f"Module verification failed at end of episode: {e}"
+            ) from e
+
+    def apply(self, state: CompilerEnvState) -> None:
+        super().apply(state)
+        # Replaying a state is the end of its episode, so verify any actions
+        # that a deferred verification policy has not. This is the replay that
+        # validate() performs, so a verification failure is reported as an
+        # action replay failure just as it is under the "EveryStep" policy.
+        if self.module_verification_policy != "EveryStep":
+            try:
+                self.verify_module()
+            except ServiceError as e:
+                raise ValueError(f"Module verification failed: {e}") from e
+
+    def close(self):
+        try:
+            self._verify_module_at_end_of_episode()
+        finally:
+            super().close()
+
     def fork(self):
         fkd = super().fork()
         if self.runtime_observation_count is not None:
             fkd.runtime_observation_count = self.runtime_observation_count
         if self.runtime_warmup_runs_count is not None:
             fkd.runtime_warmup_runs_count = self.runtime_warmup_runs_count
+        if self.shared_memory_observation_threshold:
+            fkd.shared_memory_observation_threshold = (
+                self.shared_memory_observation_threshold
+            )
+        if self.packed_observation_spaces:
+            fkd.packed_observation_spaces = self.packed_observation_spaces
+        if self.state_transition_cache:
+            fkd.state_transition_cache = self.state_transition_cache
+        # The forked session inherits the verification policy and any
+        # unverified actions from this session, so only the frontend copies
+        # need updating.
+        #
+        # pylint: disable=protected-access
+        fkd._module_verification_policy = self._module_verification_policy
+        fkd._module_verification_interval = self._module_verification_interval
         return fkd
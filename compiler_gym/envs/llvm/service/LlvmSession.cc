@@ -8,12 +8,17 @@
 #include <fmt/format.h>
 #include <glog/logging.h>
 
+#include <algorithm>
 #include <boost/process.hpp>
+#include <cctype>
 #include <chrono>
 #include <future>
 #include <iomanip>
 #include <optional>
+#include <sstream>
+#include <stdexcept>
 #include <string>
+#include <vector>
 
 #include "boost/filesystem.hpp"
 #include "compiler_gym/envs/llvm/service/ActionSpace.h"
@@ -22,10 +27,12 @@
 #include "compiler_gym/envs/llvm/service/Cost.h"
 #include "compiler_gym/envs/llvm/service/Observation.h"
 #include "compiler_gym/envs/llvm/service/ObservationSpaces.h"
+#include "compiler_gym/envs/llvm/service/StateTransitionCache.h"
 #include "compiler_gym/envs/llvm/service/passes/ActionHeaders.h"
 #include "compiler_gym/envs/llvm/service/passes/ActionSwitch.h"
 #include "compiler_gym/third_party/autophase/InstCount.h"
 #include "compiler_gym/third_party/llvm/InstCount.h"
+#include "compiler_gym/util/Bisect.h"
 #include "compiler_gym/util/EnumUtil.h"
 #include "compiler_gym/util/GrpcStatusMacros.h"
 #include "compiler_gym/util/RunfilesPath.h"
@@ -62,6 +69,38 @@ llvm::TargetLibraryInfoImpl getTargetLibraryInfo(llvm::Module& module) {
   return llvm::TargetLibraryInfoImpl(triple);
 }
 
+// Whether computing an observation compiles or executes the module.
+bool observationCompilesModule(LlvmObservationSpace observationSpace) {
+  switch (observationSpace) {
+    case LlvmObservationSpace::OBJECT_TEXT_SIZE_BYTES:
+#ifdef COMPILER_GYM_EXPERIMENTAL_TEXT_SIZE_COST
+    case LlvmObservationSpace::TEXT_SIZE_BYTES:
+#endif
+    case LlvmObservationSpace::IS_BUILDABLE:
+    case LlvmObservationSpace::IS_RUNNABLE:
+    case LlvmObservationSpace::RUNTIME:
+    case LlvmObservationSpace::BUILDTIME:
+      return true;
+    default:
+      return false;
+  }
+}
+
+// Parse a non-negative size in bytes from a session parameter value.
+Status parseSizeInBytes(const std::string& key, const std::string& value, size_t* sizeInBytes) {
+  const bool isNumeric =
+      !value.empty() &&
+      std::all_of(value.begin(), value.end(), [](unsigned char c) { return std::isdigit(c); });
+  if (isNumeric) {
+    try {
+      *sizeInBytes = std::stoull(value);
+      return Status::OK;
+    } catch (const std::out_of_range&) {
+    }
+  }
+  return Status(StatusCode::INVALID_ARGUMENT, fmt::format("Invalid value for {}: {}", key, value));
+}
+
 }  // anonymous namespace
 
 std::string LlvmSession::getCompilerVersion() const {
@@ -78,10 +117,22 @@ std::vector<ObservationSpace> LlvmSession::getObservationSpaces() const {
 
 LlvmSession::LlvmSession(const boost::filesystem::path& workingDirectory)
     : CompilationSession(workingDirectory),
-      observationSpaceNames_(util::createPascalCaseToEnumLookupTable<LlvmObservationSpace>()) {
+      observationSpaceNames_(util::createPascalCaseToEnumLookupTable<LlvmObservationSpace>()),
+      sharedMemoryObservationThreshold_(0),
+      useStateTransitionCache_(false),
+      moduleVerificationPolicy_(ModuleVerificationPolicy::EVERY_STEP),
+      moduleVerificationInterval_(10),
+      unverifiedStepCount_(0) {
   cpuinfo_initialize();
 }
 
+LlvmSession::~LlvmSession() {
+  for (const auto& path : sharedMemoryObservationFiles_) {
+    boost::system::error_code ec;
+    fs::remove(path, ec);
+  }
+}
+
 Status LlvmSession::init(const ActionSpace& actionSpace, const BenchmarkProto& benchmark) {
   BenchmarkFactory& benchmarkFactory = BenchmarkFactory::getSingleton(workingDirectory());
 
@@ -101,12 +152,26 @@ Status LlvmSession::init(const ActionSpace& actionSpace, const BenchmarkProto& b
 Status LlvmSession::init(CompilationSession* other) {
   // TODO: Static cast?
   auto llvmOther = static_cast<LlvmSession*>(other);
-  return init(llvmOther->actionSpace(), llvmOther->benchmark().clone(workingDirectory()));
+  RETURN_IF_ERROR(
+      init(llvmOther->actionSpace(), llvmOther->benchmark().clone(workingDirectory())));
+
+  // Inherit the unverified actions so that a verification failure in the fork
+  // is attributed to the action that caused it. The verification snapshot is
+  // shared rather than copied, as forks such as the candidates of
+  // ExpandSession() are often short-lived.
+  moduleVerificationPolicy_ = llvmOther->moduleVerificationPolicy_;
+  moduleVerificationInterval_ = llvmOther->moduleVerificationInterval_;
+  unverifiedStepCount_ = llvmOther->unverifiedStepCount_;
+  verifiedBitcode_ = llvmOther->verifiedBitcode_;
+  verifiedActions_ = llvmOther->verifiedActions_;
+  unverifiedActions_ = llvmOther->unverifiedActions_;
+  return Status::OK;
 }
 
 Status LlvmSession::init(const LlvmActionSpace& actionSpace, std::unique_ptr<Benchmark> benchmark) {
   benchmark_ = std::move(benchmark);
   actionSpace_ = actionSpace;
+  moduleHash_.reset();
 
   tlii_ = getTargetLibraryInfo(benchmark_->module());
 
@@ -129,6 +194,9 @@ Status LlvmSession::applyAction(const Action& action, bool& endOfEpisode,
       }
       RETURN_IF_ERROR(util::intToEnum(action.choice(0).named_discrete_value_index(), &actionEnum));
       RETURN_IF_ERROR(applyPassAction(actionEnum, actionHadNoEffect));
+      if (!actionHadNoEffect && moduleVerificationPolicy_ != ModuleVerificationPolicy::EVERY_STEP) {
+        unverifiedActions_.push_back(actionEnum);
+      }
   }
 
   return Status::OK;
@@ -136,10 +204,23 @@ Status LlvmSession::applyAction(const Action& action, bool& endOfEpisode,
 
 Status LlvmSession::endOfStep(bool actionHadNoEffect, bool& endOfEpisode,
                               std::optional<ActionSpace>& newActionSpace) {
+  // Actions never end an episode, so under a deferred policy any outstanding
+  // actions are verified only when the client requests it. See
+  // ModuleVerificationPolicy.
   if (actionHadNoEffect) {
     return Status::OK;
-  } else {
-    return benchmark().verify_module();
+  }
+
+  switch (moduleVerificationPolicy_) {
+    case ModuleVerificationPolicy::EVERY_STEP:
+      return benchmark().verify_module();
+    case ModuleVerificationPolicy::EVERY_N_STEPS:
+      if (++unverifiedStepCount_ >= moduleVerificationInterval_) {
+        return verifyModule();
+      }
+      return Status::OK;
+    default:
+      return Status::OK;
   }
 }
 
@@ -155,7 +236,42 @@ Status LlvmSession::computeObservation(const ObservationSpace& observationSpace,
   }
   const LlvmObservationSpace observationSpaceEnum = it->second;
 
-  return setObservation(observationSpaceEnum, workingDirectory(), benchmark(), observation);
+  // Under a deferred verification policy, make sure that an invalid module is
+  // never passed to the code generator.
+  if ((moduleVerificationPolicy_ == ModuleVerificationPolicy::EVERY_N_STEPS ||
+       moduleVerificationPolicy_ == ModuleVerificationPolicy::BEFORE_EXECUTION) &&
+      observationCompilesModule(observationSpaceEnum)) {
+    RETURN_IF_ERROR(verifyModule());
+  }
+
+  RETURN_IF_ERROR(
+      setObservation(observationSpaceEnum, workingDirectory(), benchmark(), observation));
+
+  // Large module serializations can be transferred through a file in the
+  // working directory rather than the RPC reply.
+  if (sharedMemoryObservationThreshold_ &&
+      (observationSpaceEnum == LlvmObservationSpace::IR ||
+       observationSpaceEnum == LlvmObservationSpace::BITCODE)) {
+    RETURN_IF_ERROR(moveObservationToSharedMemory(
+        workingDirectory(), sharedMemoryObservationThreshold_, observation));
+    if (observation.value_case() == Observation::kSharedMemoryPath) {
+      // The client removes a file once it has read it. Forget the files that
+      // have been removed and track the new file so that it is removed when
+      // the session ends if the client never reads it.
+      sharedMemoryObservationFiles_.erase(
+          std::remove_if(sharedMemoryObservationFiles_.begin(),
+                         sharedMemoryObservationFiles_.end(),
+                         [](const fs::path& path) { return !fs::exists(path); }),
+          sharedMemoryObservationFiles_.end());
+      sharedMemoryObservationFiles_.push_back(observation.shared_memory_path());
+    }
+  }
+
+  if (packedObservationSpaces_.count(observationSpace.name())) {
+    packObservation(observation);
+  }
+
+  return Status::OK;
 }
 
 Status LlvmSession::handleSessionParameter(const std::string& key, const std::string& value,
@@ -194,7 +310,84 @@ Status LlvmSession::handleSessionParameter(const std::string& key, const std::st
     reply = value;
   } else if (key == "llvm.get_buildtimes_per_observation_count") {
     reply = fmt::format("{}", benchmark().getBuildtimesPerObservationCount());
+  } else if (key == "llvm.set_shared_memory_observation_threshold") {
+    const int64_t ivalue = std::stoll(value);
+    if (ivalue < 0) {
+      return Status(
+          StatusCode::INVALID_ARGUMENT,
+          fmt::format("shared_memory_observation_threshold must be >= 0. Received: {}", ivalue));
+    }
+    sharedMemoryObservationThreshold_ = ivalue;
+    reply = value;
+  } else if (key == "llvm.get_shared_memory_observation_threshold") {
+    reply = fmt::format("{}", sharedMemoryObservationThreshold_);
+  } else if (key == "llvm.set_packed_observation_spaces") {
+    // A comma-separated list of observation space names.
+    std::unordered_set<std::string> names;
+    std::stringstream ss(value);
+    std::string name;
+    while (std::getline(ss, name, ',')) {
+      if (name.empty()) {
+        continue;
+      }
+      if (!observationSpaceNames_.count(name)) {
+        return Status(StatusCode::INVALID_ARGUMENT,
+                      fmt::format("Could not interpret observation space name: {}", name));
+      }
+      names.insert(name);
+    }
+    packedObservationSpaces_ = std::move(names);
+    reply = value;
+  } else if (key == "llvm.get_packed_observation_spaces") {
+    std::vector<std::string> names(packedObservationSpaces_.begin(),
+                                   packedObservationSpaces_.end());
+    std::sort(names.begin(), names.end());
+    reply = fmt::format("{}", fmt::join(names, ","));
+  } else if (key == "llvm.set_state_transition_cache") {
+    if (value != "0" && value != "1") {
+      return Status(StatusCode::INVALID_ARGUMENT,
+                    fmt::format("Invalid value for llvm.set_state_transition_cache: {}", value));
+    }
+    useStateTransitionCache_ = value == "1";
+    reply = value;
+  } else if (key == "llvm.get_state_transition_cache") {
+    reply = useStateTransitionCache_ ? "1" : "0";
+  } else if (key == "llvm.set_state_transition_cache_max_size_in_bytes") {
+    // The state transition cache is shared by every session of the service, so
+    // this sets the maximum size for all sessions, not just this one.
+    size_t maxSizeInBytes;
+    RETURN_IF_ERROR(parseSizeInBytes(key, value, &maxSizeInBytes));
+    StateTransitionCache::getSingleton().setMaxSizeInBytes(maxSizeInBytes);
+    reply = value;
+  } else if (key == "llvm.get_state_transition_cache_stats") {
+    reply = StateTransitionCache::getSingleton().stats();
+  } else if (key == "llvm.set_module_verification_policy") {
+    ModuleVerificationPolicy policy;
+    RETURN_IF_ERROR(util::pascalCaseToEnum(value, &policy));
+    // Verify any actions that are outstanding under the previous policy.
+    RETURN_IF_ERROR(verifyModule());
+    moduleVerificationPolicy_ = policy;
+    snapshotVerifiedModule();
+    reply = value;
+  } else if (key == "llvm.get_module_verification_policy") {
+    reply = util::enumNameToPascalCase(moduleVerificationPolicy_);
+  } else if (key == "llvm.set_module_verification_interval") {
+    const int ivalue = std::stoi(value);
+    if (ivalue < 1) {
+      return Status(
+          StatusCode::INVALID_ARGUMENT,
+          fmt::format("module_verification_interval must be >= 1. Received: {}", ivalue));
+    }
+    moduleVerificationInterval_ = ivalue;
+    reply = value;
+  } else if (key == "llvm.get_module_verification_interval") {
+    reply = fmt::format("{}", moduleVerificationInterval_);
+  } else if (key == "llvm.verify_module") {
+    RETURN_IF_ERROR(verifyModule());
+    reply = "1";
   } else if (key == "llvm.apply_baseline_optimizations") {
+    RETURN_IF_ERROR(verifyModule());
+    moduleHash_.reset();
     if (value == "-Oz") {
       bool changed = benchmark().applyBaselineOptimizations(/*optLevel=*/2, /*sizeLevel=*/2);
       reply = changed ? "1" : "0";
@@ -205,11 +398,66 @@ Status LlvmSession::handleSessionParameter(const std::string& key, const std::st
       return Status(StatusCode::INVALID_ARGUMENT,
                     fmt::format("Invalid value for llvm.apply_baseline_optimizations: {}", value));
     }
+    snapshotVerifiedModule();
   }
   return Status::OK;
 }
 
 Status LlvmSession::applyPassAction(LlvmAction action, bool& actionHadNoEffect) {
+  if (useStateTransitionCache_) {
+    return applyCachedPassAction(action, actionHadNoEffect);
+  }
+  RETURN_IF_ERROR(runPassAction(action, actionHadNoEffect));
+  if (!actionHadNoEffect) {
+    moduleHash_.reset();
+  }
+  return Status::OK;
+}
+
+Status LlvmSession::applyCachedPassAction(LlvmAction action, bool& actionHadNoEffect) {
+  StateTransitionCache& cache = StateTransitionCache::getSingleton();
+  if (!moduleHash_.has_value()) {
+    moduleHash_ = StateTransitionCache::hashModule(benchmark().module());
+  }
+  const BenchmarkHash hash = *moduleHash_;
+
+  std::optional<StateTransition> transition = cache.get(hash, static_cast<int>(action));
+  if (transition.has_value()) {
+    actionHadNoEffect = transition->actionHadNoEffect;
+    if (!actionHadNoEffect) {
+      Status status;
+      auto module = makeModule(benchmark().context(), *transition->bitcode, benchmark().name(),
+                               &status);
+      RETURN_IF_ERROR(status);
+      benchmark().replaceModule(std::move(module));
+      moduleHash_ = transition->hash;
+    }
+    return Status::OK;
+  }
+
+  RETURN_IF_ERROR(runPassAction(action, actionHadNoEffect));
+  // The module may have been replaced by an action that does not report its
+  // effect, in which case the result is not cached.
+  if (!moduleHash_.has_value()) {
+    return Status::OK;
+  }
+
+  StateTransition result;
+  result.actionHadNoEffect = actionHadNoEffect;
+  if (actionHadNoEffect) {
+    result.hash = hash;
+  } else {
+    auto bitcode = std::make_shared<Bitcode>();
+    result.hash = StateTransitionCache::serializeModule(benchmark().module(), bitcode.get());
+    result.bitcode = std::move(bitcode);
+  }
+  moduleHash_ = result.hash;
+  cache.add(hash, static_cast<int>(action), std::move(result));
+
+  return Status::OK;
+}
+
+Status LlvmSession::runPassAction(LlvmAction action, bool& actionHadNoEffect) {
 #ifdef EXPERIMENTAL_UNSTABLE_GVN_SINK_PASS
   // NOTE(https://github.com/facebookresearch/CompilerGym/issues/46): The
   // -gvn-sink pass has been found to have nondeterministic behavior so has
@@ -234,6 +482,92 @@ Status LlvmSession::applyPassAction(LlvmAction action, bool& actionHadNoEffect)
   return Status::OK;
 }
 
+Status LlvmSession::verifyModule() {
+  if (unverifiedActions_.empty()) {
+    return Status::OK;
+  }
+
+  const Status status = benchmark().verify_module();
+  if (status.ok()) {
+    markModuleVerified();
+    return status;
+  }
+
+  const size_t i = findFirstUnverifiableAction();
+  return Status(StatusCode::DATA_LOSS,
+                fmt::format("Failed to verify module after action {} ({} of {} actions since the "
+                            "module was last verified). {}",
+                            util::enumNameToCommandlineFlag(unverifiedActions_[i]), i + 1,
+                            unverifiedActions_.size(), status.error_message()));
+}
+
+void LlvmSession::markModuleVerified() {
+  verifiedActions_.insert(verifiedActions_.end(), unverifiedActions_.begin(),
+                          unverifiedActions_.end());
+  unverifiedActions_.clear();
+  unverifiedStepCount_ = 0;
+}
+
+void LlvmSession::snapshotVerifiedModule() {
+  verifiedActions_.clear();
+  unverifiedActions_.clear();
+  unverifiedStepCount_ = 0;
+  if (moduleVerificationPolicy_ == ModuleVerificationPolicy::EVERY_STEP) {
+    verifiedBitcode_.reset();
+  } else {
+    auto bitcode = std::make_shared<Bitcode>();
+    llvm::raw_svector_ostream ostream(*bitcode);
+    llvm::WriteBitcodeToFile(benchmark().module(), ostream);
+    verifiedBitcode_ = std::move(bitcode);
+  }
+}
+
+size_t LlvmSession::findFirstUnverifiableAction() {
+  DCHECK(!unverifiedActions_.empty()) << "No unverified actions";
+  if (!verifiedBitcode_) {
+    return unverifiedActions_.size() - 1;
+  }
+
+  // Swap in copies of the verified module to replay actions on, restoring the
+  // current module once done.
+  std::unique_ptr<Benchmark> current = std::move(benchmark_);
+  const std::optional<BenchmarkHash> moduleHash = moduleHash_;
+
+  // Rebuild the module as it was when it was last verified by replaying the
+  // verified actions on the snapshot. The replayed module is only verified, so
+  // it does not need the dynamic config of the benchmark.
+  benchmark_ = std::make_unique<Benchmark>(current->name(), *verifiedBitcode_,
+                                           BenchmarkDynamicConfig(), workingDirectory(),
+                                           current->baselineCosts());
+  for (const auto action : verifiedActions_) {
+    bool actionHadNoEffect;
+    if (!runPassAction(action, actionHadNoEffect).ok()) {
+      benchmark_ = std::move(current);
+      moduleHash_ = moduleHash;
+      return unverifiedActions_.size() - 1;
+    }
+  }
+  const std::unique_ptr<Benchmark> verified = std::move(benchmark_);
+
+  // The module is known to fail verification after the last action, so find
+  // the shortest prefix of the actions that fails.
+  const size_t index =
+      util::findFirstFailingPrefix(unverifiedActions_.size(), [&](size_t last) {
+        benchmark_ = verified->clone(workingDirectory());
+        for (size_t i = 0; i <= last; ++i) {
+          bool actionHadNoEffect;
+          if (!runPassAction(unverifiedActions_[i], actionHadNoEffect).ok()) {
+            return true;
+          }
+        }
+        return !benchmark().verify_module().ok();
+      });
+
+  benchmark_ = std::move(current);
+  moduleHash_ = moduleHash;
+  return index;
+}
+
 bool LlvmSession::runPass(llvm::Pass* pass) {
   llvm::legacy::PassManager passManager;
   setupPassManager(&passManager, pass);
@@ -313,6 +647,7 @@ Status LlvmSession::runOptWithArgs(const std::vector<std::string>& optArgs) {
   auto module = makeModule(benchmark().context(), bitcode, benchmark().name(), &status);
   RETURN_IF_ERROR(status);
   benchmark().replaceModule(std::move(module));
+  moduleHash_.reset();
 
   return Status::OK;
 }
@@ -11,6 +11,8 @@
 #include <memory>
 #include <optional>
 #include <unordered_map>
+#include <unordered_set>
+#include <vector>
 
 #include "compiler_gym/envs/llvm/service/ActionSpace.h"
 #include "compiler_gym/envs/llvm/service/Benchmark.h"
@@ -29,6 +31,37 @@
 
 namespace compiler_gym::llvm_service {
 
+/**
+ * The policy that determines when a session verifies its module after actions
+ * that modify it.
+ *
+ * No LLVM action ends an episode, so the service cannot tell when an episode
+ * ends. Under a policy other than EVERY_STEP, actions that have not been
+ * verified when an episode ends are verified only if the client requests it
+ * using the "llvm.verify_module" session parameter. The LlvmEnv frontend does
+ * this on reset(), close(), and when replaying a state for validation.
+ */
+enum class ModuleVerificationPolicy {
+  /** Verify the module at the end of every step that modifies it. */
+  EVERY_STEP,
+  /**
+   * Verify the module after every N steps that modify it, where N is set using
+   * the "llvm.set_module_verification_interval" session parameter, and before
+   * computing an observation that compiles or executes the module.
+   */
+  EVERY_N_STEPS,
+  /**
+   * Verify the module only before computing an observation that compiles or
+   * executes it.
+   */
+  BEFORE_EXECUTION,
+  /**
+   * Verify the module only when requested using the "llvm.verify_module"
+   * session parameter.
+   */
+  ON_DEMAND,
+};
+
 /**
  * An interactive LLVM compilation session.
  *
@@ -40,6 +73,11 @@ class LlvmSession final : public CompilationSession {
  public:
   LlvmSession(const boost::filesystem::path& workingDirectory);
 
+  /**
+   * Removes any shared memory observation files that the client did not read.
+   */
+  ~LlvmSession();
+
   std::string getCompilerVersion() const final override;
 
   std::vector<ActionSpace> getActionSpaces() const final override;
@@ -93,6 +131,27 @@ class LlvmSession final : public CompilationSession {
    */
   [[nodiscard]] grpc::Status applyPassAction(LlvmAction action, bool& actionHadNoEffect);
 
+  /**
+   * Run the requested action, or load its result from the state transition
+   * cache if another session has already applied it to the same module.
+   *
+   * @param action An action to apply.
+   * @param actionHadNoEffect Set to true if LLVM reported that any passes that
+   *    were run made no modifications to the module.
+   * @return `OK` on success.
+   */
+  [[nodiscard]] grpc::Status applyCachedPassAction(LlvmAction action, bool& actionHadNoEffect);
+
+  /**
+   * Run the requested action.
+   *
+   * @param action An action to apply.
+   * @param actionHadNoEffect Set to true if LLVM reported that any passes that
+   *    were run made no modifications to the module.
+   * @return `OK` on success.
+   */
+  [[nodiscard]] grpc::Status runPassAction(LlvmAction action, bool& actionHadNoEffect);
+
   /**
    * Run the given pass, possibly modifying the underlying LLVM module.
    *
@@ -107,6 +166,39 @@ class LlvmSession final : public CompilationSession {
    */
   bool runPass(llvm::FunctionPass* pass);
 
+  /**
+   * Verify the module if it has been modified by actions since it was last
+   * verified.
+   *
+   * If verification fails, the actions are replayed on the verification
+   * snapshot to find the first action after which verification fails.
+   *
+   * @return `OK` on success, else `DATA_LOSS` if verification fails.
+   */
+  [[nodiscard]] grpc::Status verifyModule();
+
+  /**
+   * Record the current module as verified. This does not copy the module.
+   */
+  void markModuleVerified();
+
+  /**
+   * Take a verification snapshot of the current module, which must be
+   * verified. A snapshot is only taken under a policy other than EVERY_STEP.
+   * This is done when the module is changed other than by an action, as the
+   * actions applied since the snapshot can no longer be replayed on it.
+   */
+  void snapshotVerifiedModule();
+
+  /**
+   * Find the first of the unverified actions after which the module fails
+   * verification, by bisecting the action sequence replayed on the
+   * verification snapshot.
+   *
+   * @return An index into the unverified actions.
+   */
+  size_t findFirstUnverifiableAction();
+
   /**
    * Run the commandline `opt` tool on the current LLVM module with the given
    * arguments, replacing the environment state with the generated output.
@@ -132,6 +224,42 @@ class LlvmSession final : public CompilationSession {
   LlvmActionSpace actionSpace_;
   std::unique_ptr<Benchmark> benchmark_;
   llvm::TargetLibraryInfoImpl tlii_;
+  // The minimum size of an Ir or Bitcode observation that is transferred
+  // through a shared memory file rather than the RPC reply. Set using the
+  // "llvm.set_shared_memory_observation_threshold" session parameter. A value
+  // of zero disables shared memory transfer.
+  int64_t sharedMemoryObservationThreshold_;
+  // The shared memory observation files that have been written by this session
+  // and not yet removed by the client.
+  std::vector<boost::filesystem::path> sharedMemoryObservationFiles_;
+  // The names of the observation spaces whose numeric list values are packed
+  // into a byte buffer. Set using the "llvm.set_packed_observation_spaces"
+  // session parameter.
+  std::unordered_set<std::string> packedObservationSpaces_;
+  // Whether to use the service-wide StateTransitionCache for pass actions. Set
+  // using the "llvm.set_state_transition_cache" session parameter.
+  bool useStateTransitionCache_;
+  // The StateTransitionCache hash of the current module, if known. This is
+  // reset whenever the module is modified other than by a cached action.
+  std::optional<BenchmarkHash> moduleHash_;
+  // The policy that determines when the module is verified. Set using the
+  // "llvm.set_module_verification_policy" session parameter.
+  ModuleVerificationPolicy moduleVerificationPolicy_;
+  // The number of modifying steps between verifications under the
+  // EVERY_N_STEPS policy.
+  int moduleVerificationInterval_;
+  // The number of steps that have modified the module since it was verified.
+  int unverifiedStepCount_;
+  // Under a policy other than EVERY_STEP, the serialized bitcode of a verified
+  // copy of the module taken when the policy was set or the module was last
+  // changed other than by an action, the actions that have modified it since
+  // and have been verified, and the actions that have modified it since the
+  // last verification. These are used to attribute a verification failure to
+  // an action by replaying the actions, so that a successful verification does
+  // not copy the module. The bitcode is immutable, so forked sessions share it.
+  std::shared_ptr<const Bitcode> verifiedBitcode_;
+  std::vector<LlvmAction> verifiedActions_;
+  std::vector<LlvmAction> unverifiedActions_;
 };
 
 }  // namespace compiler_gym::llvm_service
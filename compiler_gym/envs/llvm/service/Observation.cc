@@ -5,8 +5,10 @@
 #include "compiler_gym/envs/llvm/service/Observation.h"
 
 #include <cpuinfo.h>
+#include <fmt/format.h>
 #include <glog/logging.h>
 
+#include <fstream>
 #include <iomanip>
 #include <sstream>
 #include <string>
@@ -223,4 +225,72 @@ Status setObservation(LlvmObservationSpace space, const fs::path& workingDirecto
   return Status::OK;
 }
 
+Status moveObservationToSharedMemory(const fs::path& workingDirectory, int64_t minimumSizeInBytes,
+                                     Observation& reply) {
+  const std::string* value;
+  switch (reply.value_case()) {
+    case Observation::kStringValue:
+      value = &reply.string_value();
+      break;
+    case Observation::kBinaryValue:
+      value = &reply.binary_value();
+      break;
+    default:
+      return Status::OK;
+  }
+
+  if (static_cast<int64_t>(value->size()) < minimumSizeInBytes) {
+    return Status::OK;
+  }
+
+  // Generate an output path with 32 bits of randomness.
+  const auto outpath = fs::unique_path(workingDirectory / "observation-%%%%%%%%.bin");
+  std::ofstream outfile(outpath.string(), std::ios::binary);
+  outfile.write(value->data(), value->size());
+  outfile.close();
+  if (outfile.fail()) {
+    return Status(StatusCode::INTERNAL,
+                  fmt::format("Failed to write observation file: {}", outpath.string()));
+  }
+
+  reply.set_shared_memory_path(outpath.string());
+  return Status::OK;
+}
+
+namespace {
+
+template <typename T>
+void setPackedArray(const google::protobuf::RepeatedField<T>& values, const char* dtype,
+                    PackedArray* packed) {
+  static_assert(sizeof(T) == 8, "Packed arrays use 8 byte elements");
+  // Copy the elements before modifying the reply as setting a member of a
+  // oneof clears the other members.
+  std::string data(reinterpret_cast<const char*>(values.data()), values.size() * sizeof(T));
+  packed->set_dtype(dtype);
+  packed->set_data(std::move(data));
+}
+
+}  // anonymous namespace
+
+void packObservation(Observation& reply) {
+  // The packed element data is in host byte order, which is little endian on
+  // all supported platforms.
+  switch (reply.value_case()) {
+    case Observation::kInt64List: {
+      PackedArray packed;
+      setPackedArray(reply.int64_list().value(), "<i8", &packed);
+      *reply.mutable_packed_array() = std::move(packed);
+      break;
+    }
+    case Observation::kDoubleList: {
+      PackedArray packed;
+      setPackedArray(reply.double_list().value(), "<f8", &packed);
+      *reply.mutable_packed_array() = std::move(packed);
+      break;
+    }
+    default:
+      break;
+  }
+}
+
 }  // namespace compiler_gym::llvm_service
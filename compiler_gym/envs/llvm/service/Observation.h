@@ -26,4 +26,33 @@ grpc::Status setObservation(LlvmObservationSpace space,
                             const boost::filesystem::path& workingDirectory, Benchmark& benchmark,
                             Observation& reply);
 
+/**
+ * Move the value of a large string or binary observation into a file.
+ *
+ * If the observation is a string or binary value of at least
+ * `minimumSizeInBytes` bytes, the value is written to a new file in the working
+ * directory and replaced with the path of that file. When possible the working
+ * directory is on an in-memory filesystem, so this avoids serializing large
+ * observations into the RPC reply. The client is responsible for removing the
+ * file, though LlvmSession removes any files that remain when it is destroyed.
+ *
+ * @param workingDirectory The directory to write the file to.
+ * @param minimumSizeInBytes The minimum size of observation to move.
+ * @param reply The observation to move.
+ * @return `OK` on success.
+ */
+grpc::Status moveObservationToSharedMemory(const boost::filesystem::path& workingDirectory,
+                                           int64_t minimumSizeInBytes, Observation& reply);
+
+/**
+ * Pack the value of a numeric list observation into a byte buffer.
+ *
+ * If the observation is an int64 or double list, the value is replaced with a
+ * PackedArray of the same elements. This allows the client to decode the
+ * observation with a single copy. Other observations are left unchanged.
+ *
+ * @param reply The observation to pack.
+ */
+void packObservation(Observation& reply);
+
 }  // namespace compiler_gym::llvm_service
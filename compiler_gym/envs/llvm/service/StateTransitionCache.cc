@@ -0,0 +1,120 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#include "compiler_gym/envs/llvm/service/StateTransitionCache.h"
+
+#include <glog/logging.h>
+
+#include "llvm/Bitcode/BitcodeWriter.h"
+#include "nlohmann/json.hpp"
+
+using nlohmann::json;
+
+namespace compiler_gym::llvm_service {
+
+namespace {
+
+std::string makeKey(const BenchmarkHash& hash, int action) {
+  std::string key(reinterpret_cast<const char*>(hash.data()), sizeof(hash));
+  key.append(reinterpret_cast<const char*>(&action), sizeof(action));
+  return key;
+}
+
+// The number of bytes that a transition adds to the cache.
+size_t sizeInBytes(const std::string& key, const StateTransition& transition) {
+  return key.size() + (transition.bitcode ? transition.bitcode->size() : 0);
+}
+
+}  // anonymous namespace
+
+StateTransitionCache::StateTransitionCache()
+    : rand_(std::random_device()()),
+      maxSizeInBytes_(kMaxStateTransitionCacheSizeInBytes),
+      sizeInBytes_(0),
+      hits_(0),
+      misses_(0) {}
+
+BenchmarkHash StateTransitionCache::hashModule(const llvm::Module& module) {
+  Bitcode bitcode;
+  return serializeModule(module, &bitcode);
+}
+
+BenchmarkHash StateTransitionCache::serializeModule(const llvm::Module& module, Bitcode* bitcode) {
+  BenchmarkHash hash;
+  llvm::BitcodeWriter writer(*bitcode);
+  writer.writeModule(module, /*ShouldPreserveUseListOrder=*/true,
+                     /*Index=*/nullptr, /*GenerateHash=*/true, &hash);
+  writer.writeSymtab();
+  writer.writeStrtab();
+  return hash;
+}
+
+std::optional<StateTransition> StateTransitionCache::get(const BenchmarkHash& hash, int action) {
+  const std::lock_guard<std::mutex> lock(mutex_);
+  auto it = transitions_.find(makeKey(hash, action));
+  if (it == transitions_.end()) {
+    ++misses_;
+    return std::nullopt;
+  }
+  ++hits_;
+  return it->second;
+}
+
+void StateTransitionCache::add(const BenchmarkHash& hash, int action,
+                               StateTransition&& transition) {
+  const std::lock_guard<std::mutex> lock(mutex_);
+  const std::string key = makeKey(hash, action);
+  const size_t size = sizeInBytes(key, transition);
+
+  // Remove any existing value to keep the cache size consistent.
+  auto it = transitions_.find(key);
+  if (it != transitions_.end()) {
+    sizeInBytes_ -= sizeInBytes(it->first, it->second);
+    transitions_.erase(it);
+  }
+
+  if (sizeInBytes_ + size > maxSizeInBytes_) {
+    evictToCapacity(maxSizeInBytes_ / 2);
+  }
+
+  transitions_.insert({key, std::move(transition)});
+  sizeInBytes_ += size;
+}
+
+void StateTransitionCache::setMaxSizeInBytes(size_t maxSizeInBytes) {
+  const std::lock_guard<std::mutex> lock(mutex_);
+  maxSizeInBytes_ = maxSizeInBytes;
+  evictToCapacity(maxSizeInBytes);
+}
+
+std::string StateTransitionCache::stats() {
+  const std::lock_guard<std::mutex> lock(mutex_);
+  json stats;
+  stats["hits"] = hits_;
+  stats["misses"] = misses_;
+  stats["size"] = transitions_.size();
+  stats["size_in_bytes"] = sizeInBytes_;
+  stats["max_size_in_bytes"] = maxSizeInBytes_;
+  return stats.dump();
+}
+
+void StateTransitionCache::evictToCapacity(size_t targetSizeInBytes) {
+  int evicted = 0;
+  while (transitions_.size() && sizeInBytes_ > targetSizeInBytes) {
+    // Select a transition randomly.
+    std::uniform_int_distribution<size_t> distribution(0, transitions_.size() - 1);
+    auto it = std::next(std::begin(transitions_), distribution(rand_));
+
+    ++evicted;
+    sizeInBytes_ -= sizeInBytes(it->first, it->second);
+    transitions_.erase(it);
+  }
+
+  if (evicted) {
+    VLOG(2) << "Evicted " << evicted << " state transitions from cache. State transition "
+            << "cache size now " << sizeInBytes_ << " bytes, " << transitions_.size() << " items";
+  }
+}
+
+}  // namespace compiler_gym::llvm_service
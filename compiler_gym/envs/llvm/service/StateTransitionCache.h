@@ -0,0 +1,134 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#pragma once
+
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <random>
+#include <string>
+#include <unordered_map>
+
+#include "compiler_gym/envs/llvm/service/Benchmark.h"
+#include "llvm/IR/Module.h"
+
+namespace compiler_gym::llvm_service {
+
+/**
+ * The default maximum combined size of the bitcodes in the state transition
+ * cache.
+ */
+constexpr size_t kMaxStateTransitionCacheSizeInBytes = 512 * 1024 * 1024;
+
+/**
+ * The result of applying an action to a module.
+ */
+struct StateTransition {
+  /** Whether the action made no modifications to the module. */
+  bool actionHadNoEffect;
+  /** The hash of the resulting module. */
+  BenchmarkHash hash;
+  /**
+   * The bitcode of the resulting module, or `nullptr` if the action had no
+   * effect. The bitcode is immutable so that it can be shared by the cache and
+   * the sessions that read it without copying.
+   */
+  std::shared_ptr<const Bitcode> bitcode;
+};
+
+/**
+ * A service-wide cache of state transitions.
+ *
+ * This object maps a module hash and an action to the result of applying that
+ * action to the module, so that a session can skip running a pass that another
+ * session has already run on the same module. Once the combined size of the
+ * cached bitcodes reaches a predetermined size, transitions are evicted
+ * randomly until the size is reduced to 50%.
+ *
+ * This class is thread safe.
+ */
+class StateTransitionCache {
+ public:
+  /**
+   * Return the global state transition cache singleton.
+   */
+  static StateTransitionCache& getSingleton() {
+    static StateTransitionCache instance;
+    return instance;
+  }
+
+  /**
+   * Compute the hash of a module.
+   *
+   * Modules are hashed using this function, rather than
+   * `Benchmark::module_hash()`, as the use-list order is preserved when
+   * serializing cached modules.
+   *
+   * @param module An LLVM module.
+   * @return The hash of the module.
+   */
+  static BenchmarkHash hashModule(const llvm::Module& module);
+
+  /**
+   * Serialize a module to bitcode and compute its hash.
+   *
+   * @param module An LLVM module.
+   * @param bitcode The bitcode to write.
+   * @return The hash of the module.
+   */
+  static BenchmarkHash serializeModule(const llvm::Module& module, Bitcode* bitcode);
+
+  /**
+   * Lookup a state transition.
+   *
+   * @param hash The hash of the module that the action is applied to.
+   * @param action The numeric value of the action.
+   * @return A copy of the state transition, or `std::nullopt` if not cached.
+   *    Only the pointer to the bitcode is copied, not the bitcode itself.
+   */
+  std::optional<StateTransition> get(const BenchmarkHash& hash, int action);
+
+  /**
+   * Add a state transition to the cache.
+   *
+   * @param hash The hash of the module that the action was applied to.
+   * @param action The numeric value of the action.
+   * @param transition The result of applying the action.
+   */
+  void add(const BenchmarkHash& hash, int action, StateTransition&& transition);
+
+  /**
+   * Set a new maximum size of the cache, evicting transitions if required.
+   *
+   * @param maxSizeInBytes A number of bytes.
+   */
+  void setMaxSizeInBytes(size_t maxSizeInBytes);
+
+  /**
+   * Get a JSON string of the cache size and hit rate counters.
+   */
+  std::string stats();
+
+ private:
+  StateTransitionCache();
+
+  StateTransitionCache(const StateTransitionCache&) = delete;
+  StateTransitionCache& operator=(const StateTransitionCache&) = delete;
+
+  // Evict transitions randomly to reduce the size to the given target. Must
+  // hold the lock.
+  void evictToCapacity(size_t targetSizeInBytes);
+
+  std::mutex mutex_;
+  // Transitions keyed by the concatenation of the module hash and the action.
+  std::unordered_map<std::string, StateTransition> transitions_;
+  std::mt19937_64 rand_;
+  size_t maxSizeInBytes_;
+  size_t sizeInBytes_;
+  int64_t hits_;
+  int64_t misses_;
+};
+
+}  // namespace compiler_gym::llvm_service
@@ -5,9 +5,12 @@
 """Define the loop_tool environment."""
 import logging
 import time
+from collections import OrderedDict
 from functools import reduce
 from pathlib import Path
-from typing import Optional, Tuple
+from statistics import median
+from threading import Lock
+from typing import Callable, List, Optional, Tuple
 
 import loop_tool_py as lt
 import numpy as np
@@ -30,6 +33,65 @@ from compiler_gym.service.proto import (
 
 logger = logging.getLogger(__name__)
 
+# The maximum number of compiled kernels to keep. Kernels are shared by all
+# sessions in a service.
+MAX_CACHED_KERNELS = 256
+
+# A cache of compiled kernels, keyed by (size, order, thread, backend).
+_kernel_cache: "OrderedDict[Tuple, Callable]" = OrderedDict()
+_kernel_cache_lock = Lock()
+
+
+def _time_batch(kernel: Callable, args: List, iters: int) -> float:
+    """Return the wall time of :code:`iters` invocations of a kernel."""
+    t = time.perf_counter()
+    for _ in range(iters - 1):
+        kernel(args, False)
+    # The final invocation synchronizes.
+    kernel(args)
+    return time.perf_counter() - t
+
+
+def measure_flops(
+    kernel: Callable,
+    args: List,
+    size: int,
+    batch_time: float = 0.01,
+    window: int = 3,
+    rel_tolerance: float = 0.05,
+    max_time: float = 1,
+) -> float:
+    """Measure the throughput of a kernel in GFLOPs.
+
+    Rather than timing a fixed number of iterations, the number of iterations
+    per batch is calibrated so that a batch takes at least :code:`batch_time`
+    seconds, which also serves to warm up the kernel. Batches are then timed
+    until the last :code:`window` measurements are within
+    :code:`rel_tolerance` of their median, or until :code:`max_time` seconds
+    have elapsed.
+    """
+    iters = 1
+    while True:
+        elapsed = _time_batch(kernel, args, iters)
+        if elapsed >= batch_time:
+            break
+        # Grow geometrically, aiming slightly past the target batch time.
+        iters = max(iters * 2, int(iters * 1.2 * batch_time / max(elapsed, 1e-9)))
+
+    samples = []
+    end = time.perf_counter() + max_time
+    while True:
+        elapsed = _time_batch(kernel, args, iters)
+        samples.append(size * iters / elapsed / 1e9)
+        recent = samples[-window:]
+        m = median(recent)
+        if len(recent) == window and max(recent) - min(recent) <= rel_tolerance * m:
+            break
+        if time.perf_counter() >= end:
+            logger.debug("FLOPs measurement did not stabilize: %s", recent)
+            break
+    return m
+
 
 class LoopToolCompilationSession(CompilationSession):
     """Represents an instance of an interactive loop_tool session."""
@@ -130,6 +192,7 @@ class LoopToolCompilationSession(CompilationSession):
         self.thread = [1, 0, 0]
         self.cursor = 0
         self.mode = "size"
+        self.tensors = None
         logger.info("Started a compilation session for %s", benchmark.uri)
 
     def resize(self, increment):
@@ -267,28 +330,46 @@ class LoopToolCompilationSession(CompilationSession):
             t = loop_tree.children(t)[0]
         return loop_tree, parallel
 
-    def flops(self):
+    def kernel(self) -> Callable:
+        """Return the compiled kernel for the current loop nest.
+
+        Lowering and JIT compilation are expensive, so compiled kernels are
+        cached by schedule and backend and shared across sessions.
+        """
+        key = (
+            self.size,
+            tuple(self.order),
+            tuple(bool(t) for t in self.thread),
+            self.backend,
+        )
+        with _kernel_cache_lock:
+            c = _kernel_cache.get(key)
+            if c is not None:
+                _kernel_cache.move_to_end(key)
+                return c
+
         loop_tree, parallel = self.lower()
         if self.backend == "cuda":
             c = lt.cuda(loop_tree, parallel)
         else:
             c = lt.cpu(loop_tree)
-        A = lt.Tensor(self.size)
-        B = lt.Tensor(self.size)
-        C = lt.Tensor(self.size)
-        A.set(self.Ap)
-        B.set(self.Bp)
-        iters = 1000
-        warmup = 50
-        for i in range(warmup):
-            c([A, B, C])
-        t = time.time()
-        for i in range(iters - 1):
-            c([A, B, C], False)
-        c([A, B, C])
-        t_ = time.time()
-        flops = self.size * iters / (t_ - t) / 1e9
-        return flops
+
+        with _kernel_cache_lock:
+            _kernel_cache[key] = c
+            while len(_kernel_cache) > MAX_CACHED_KERNELS:
+                _kernel_cache.popitem(last=False)
+        return c
+
+    def flops(self):
+        c = self.kernel()
+        if self.tensors is None:
+            A = lt.Tensor(self.size)
+            B = lt.Tensor(self.size)
+            C = lt.Tensor(self.size)
+            A.set(self.Ap)
+            B.set(self.Bp)
+            self.tensors = [A, B, C]
+        return measure_flops(c, self.tensors, self.size)
 
     def get_observation(self, observation_space: ObservationSpace) -> Observation:
         if observation_space.name == "action_state":
@@ -28,12 +28,18 @@ Users who wish to create a submission for this leaderboard may use
 automatically evaluate their agent on the test set.
 """
 import logging
+import math
+import multiprocessing
 import os
+import queue
+import sys
+import traceback
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from itertools import islice
 from pathlib import Path
-from threading import Thread
-from time import sleep
-from typing import Callable, List
+from threading import Lock, Thread, local
+from typing import Callable, List, Optional, Set, Union
 
 import gym
 import humanize
@@ -47,8 +53,8 @@ from compiler_gym.compiler_env_state import (
     CompilerEnvStateWriter,
 )
 from compiler_gym.envs import LlvmEnv
-from compiler_gym.util.statistics import arithmetic_mean, geometric_mean
 from compiler_gym.util.timer import Timer, humanize_duration_hms
+from compiler_gym.validation_result import ValidationResult
 
 flags.DEFINE_string(
     "leaderboard_results",
@@ -78,6 +84,21 @@ flags.DEFINE_boolean(
     "If true, read the --leaderboard_results file first and run only the "
     "evaluations not already in the results file.",
 )
+flags.DEFINE_integer(
+    "workers",
+    1,
+    "The number of benchmarks to evaluate in parallel. If > 1, each worker is "
+    "a separate process with its own environment that, on platforms that "
+    "support it, is pinned to its own CPU core, so that walltimes are not "
+    "inflated by contention.",
+)
+flags.DEFINE_boolean(
+    "validate_during_evaluation",
+    False,
+    "If true, validate results as they are produced, in parallel with the "
+    "evaluation, rather than once all evaluations have completed. Validation "
+    "runs on the CPU cores that are not used by --workers.",
+)
 FLAGS = flags.FLAGS
 
 # A policy is a function that accepts as input an LLVM environment, and
@@ -85,57 +106,173 @@ FLAGS = flags.FLAGS
 Policy = Callable[[LlvmEnv], None]
 
 
-class _EvalPolicyWorker(Thread):
-    """Worker thread to evaluate a policy."""
-
-    def __init__(
-        self,
-        env: LlvmEnv,
-        benchmarks: List[str],
-        policy: Policy,
-        init_states: List[CompilerEnvState],
-    ):
-        super().__init__()
-        self.env = env
-        self.benchmarks = benchmarks
-        self.policy = policy
-        self.states: List[CompilerEnvState] = init_states
-        self.alive = True
-
-    def run(self):
-        # Determine if we need to print a header.
-        header = (
-            not Path(FLAGS.leaderboard_results).is_file()
-            or os.stat(FLAGS.leaderboard_results).st_size == 0
-        )
-        with CompilerEnvStateWriter(
-            open(FLAGS.leaderboard_results, "a"), header=header
-        ) as writer:
-            for benchmark in self.benchmarks:
-                self.env.reset(benchmark=benchmark)
-                with Timer() as timer:
-                    self.policy(self.env)
-
-                # Sanity check that the policy didn't change the expected
-                # experimental setup.
-                assert self.env.in_episode, "Environment is no longer in an episode"
-                assert self.env.benchmark and (
-                    self.env.benchmark == benchmark
-                ), "Policy changed environment benchmark"
-                assert self.env.reward_space, "Policy unset environment reward space"
-                assert (
-                    self.env.reward_space.id == "IrInstructionCountOz"
-                ), "Policy changed environment reward space"
-
-                # Override walltime in the generated state.
-                state = self.env.state.copy()
-                state.walltime = timer.time
+def _eval_benchmark(env: LlvmEnv, benchmark: str, policy: Policy) -> CompilerEnvState:
+    """Run a policy on a benchmark and return the final state."""
+    env.reset(benchmark=benchmark)
+    with Timer() as timer:
+        policy(env)
+
+    # Sanity check that the policy didn't change the expected experimental
+    # setup.
+    assert env.in_episode, "Environment is no longer in an episode"
+    assert env.benchmark and (
+        env.benchmark == benchmark
+    ), "Policy changed environment benchmark"
+    assert env.reward_space, "Policy unset environment reward space"
+    assert (
+        env.reward_space.id == "IrInstructionCountOz"
+    ), "Policy changed environment reward space"
+
+    # Override walltime in the generated state.
+    state = env.state.copy()
+    state.walltime = timer.time
+    return state
+
+
+class _WorkerError:
+    """An error raised by a worker, put in the results queue in place of a
+    state. The traceback is sent as a string as the exception may not be
+    picklable.
+    """
 
-                writer.write_state(state, flush=True)
-                self.states.append(state)
+    def __init__(self, benchmark: Optional[str], traceback: str):
+        self.benchmark = benchmark
+        self.traceback = traceback
 
-                if not self.alive:
-                    return
+    def __str__(self) -> str:
+        if self.benchmark:
+            return f"Policy evaluation failed on {self.benchmark}:\n{self.traceback}"
+        return f"Policy evaluation failed:\n{self.traceback}"
+
+
+def _eval_policy_worker(
+    policy: Policy, benchmarks, results, core: Optional[int] = None
+) -> None:
+    """Evaluate a policy on benchmarks from a queue until a :code:`None`
+    sentinel is received, putting the final states in a results queue.
+
+    This is run either in a thread or in a separate process. If a core is
+    given, the worker and the compiler service that it starts are pinned to
+    it. If the policy raises an error, a :class:`_WorkerError` is put in the
+    results queue and the worker stops.
+    """
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    benchmark = None
+    try:
+        with gym.make("llvm-ic-v0") as env:
+            for benchmark in iter(benchmarks.get, None):
+                results.put(_eval_benchmark(env, benchmark, policy))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        # Send the error to the main process rather than dying silently.
+        results.put(_WorkerError(benchmark, traceback.format_exc()))
+
+
+def _stop_workers(workers, benchmarks) -> None:
+    """Stop the workers from starting new benchmarks and wait for them to
+    end. Worker processes are terminated.
+    """
+    try:
+        while True:
+            benchmarks.get_nowait()
+    except queue.Empty:
+        pass
+    for worker in workers:
+        if isinstance(worker, Thread):
+            benchmarks.put(None)
+            worker.join()
+        else:
+            worker.terminate()
+
+
+class _ResultStats:
+    """Aggregate statistics of results that are updated incrementally."""
+
+    def __init__(self):
+        self.count = 0
+        self.walltime_sum = 0.0
+        self.log_reward_sum = 0.0
+        self.has_nonpositive_reward = False
+
+    def add(self, state: CompilerEnvState) -> None:
+        self.count += 1
+        self.walltime_sum += state.walltime
+        if state.reward is not None and state.reward > 0:
+            self.log_reward_sum += math.log(state.reward)
+        else:
+            self.has_nonpositive_reward = True
+
+    @property
+    def mean_walltime(self) -> float:
+        return self.walltime_sum / self.count if self.count else 0
+
+    @property
+    def geomean_reward(self) -> float:
+        # Consistent with util.statistics.geometric_mean(), the geometric mean
+        # is zero if any reward is not positive.
+        if not self.count or self.has_nonpositive_reward:
+            return 0
+        return math.exp(self.log_reward_sum / self.count)
+
+
+class _Validator:
+    """Validate states in background threads while the evaluation runs.
+
+    Each thread reuses a single environment for all of the states that it
+    validates, rather than starting a new compiler service per state. If a set
+    of cores is given, the threads and the compiler services that they start
+    are pinned to those cores so that they do not contend with the evaluation
+    workers.
+    """
+
+    def __init__(self, max_workers: int, cores: Optional[Set[int]] = None):
+        self.cores = cores
+        self._local = local()
+        self._envs: List[LlvmEnv] = []
+        self._envs_lock = Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, initializer=self._init_thread
+        )
+
+    def _init_thread(self) -> None:
+        # On Linux the affinity of the calling thread is set, and is inherited
+        # by the compiler service that the thread starts.
+        if self.cores:
+            os.sched_setaffinity(0, self.cores)
+
+    def _validate(self, state: CompilerEnvState) -> ValidationResult:
+        env = getattr(self._local, "env", None)
+        if env is None:
+            env = gym.make("llvm-ic-v0")
+            self._local.env = env
+            with self._envs_lock:
+                self._envs.append(env)
+        return env.validate(state)
+
+    def submit(self, state: CompilerEnvState) -> Future:
+        return self._executor.submit(self._validate, state)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        for env in self._envs:
+            env.close()
+
+
+def _print_validation_results(futures: List[Future]) -> None:
+    """Wait for the results of overlapping validation and print a summary,
+    exiting with an error if any state failed validation.
+    """
+    error_count = 0
+    for future in futures:
+        result = future.result()
+        if not result.okay():
+            error_count += 1
+            print(f"{result.state.benchmark}: {result}", file=sys.stderr)
+    print(f"Validated {len(futures) - error_count} of {len(futures)} results")
+    if error_count:
+        sys.exit(1)
 
 
 def eval_llvm_instcount_policy(policy: Policy) -> None:
@@ -209,6 +346,16 @@ def eval_llvm_instcount_policy(policy: Policy) -> None:
 
         $ python my_policy.py --n=5 --leaderboard_results=my_policy_results.csv
 
+    Benchmarks can be evaluated in parallel using :code:`--workers`. Each worker
+    is a separate process with its own environment, pinned to its own CPU core
+    on Linux, so the policy must be picklable. Use
+    :code:`--validate_during_evaluation` to validate results as they are
+    produced rather than once at the end:
+
+    .. code-block::
+
+        $ python my_policy.py --workers=8 --validate_during_evaluation
+
     You can use :code:`--helpfull` flag to list all of the flags that are
     defined:
 
@@ -224,44 +371,124 @@ def eval_llvm_instcount_policy(policy: Policy) -> None:
     def main(argv):
         assert len(argv) == 1, f"Unknown args: {argv[:1]}"
         assert FLAGS.n > 0, "n must be > 0"
+        assert FLAGS.workers > 0, "workers must be > 0"
 
+        # Stream verbose CompilerGym logs to file.
+        logger = logging.getLogger("compiler_gym")
+        logger.setLevel(logging.DEBUG)
+        log_handler = logging.FileHandler(FLAGS.leaderboard_logfile)
+        logger.addHandler(log_handler)
+        logger.propagate = False
+
+        print(f"Writing results to {FLAGS.leaderboard_results}")
+        print(f"Writing logs to {FLAGS.leaderboard_logfile}")
+
+        # Build the list of benchmarks to evaluate.
         with gym.make("llvm-ic-v0") as env:
+            uris = env.datasets[FLAGS.test_dataset].benchmark_uris()
+            if FLAGS.max_benchmarks:
+                uris = islice(uris, FLAGS.max_benchmarks)
+            uris = list(uris)
+
+        # Repeat the searches for the requested number of iterations.
+        benchmarks = [uri for _ in range(FLAGS.n) for uri in uris]
+        total_count = len(benchmarks)
+
+        # If we are resuming from a previous job, read the states that have
+        # already been proccessed and remove those benchmarks from the list
+        # of benchmarks to evaluate.
+        stats = _ResultStats()
+        resumed_states: List[CompilerEnvState] = []
+        if FLAGS.resume and Path(FLAGS.leaderboard_results).is_file():
+            done = Counter()
+            with CompilerEnvStateReader(open(FLAGS.leaderboard_results)) as reader:
+                for state in reader:
+                    done[state.benchmark] += 1
+                    stats.add(state)
+                    resumed_states.append(state)
+            remaining = []
+            for benchmark in benchmarks:
+                if done[benchmark] > 0:
+                    done[benchmark] -= 1
+                else:
+                    remaining.append(benchmark)
+            benchmarks = remaining
+
+        # Run the benchmark loop in background so that we can asynchronously
+        # log progress. A single worker runs in a thread. Multiple workers run
+        # in separate processes, each pinned to its own core where supported.
+        # CPU affinity is not supported on macOS.
+        cores = (
+            sorted(os.sched_getaffinity(0))
+            if hasattr(os, "sched_setaffinity")
+            else list(range(os.cpu_count() or 1))
+        )
+        validator_cores: Optional[Set[int]] = None
+        if FLAGS.workers == 1:
+            benchmark_queue, result_queue = queue.Queue(), queue.Queue()
+            workers = [
+                Thread(
+                    target=_eval_policy_worker,
+                    args=(policy, benchmark_queue, result_queue),
+                )
+            ]
+            validator_count = max(len(cores) - 1, 1)
+        else:
+            mp = multiprocessing.get_context("spawn")
+            benchmark_queue, result_queue = mp.Queue(), mp.Queue()
+            if hasattr(os, "sched_setaffinity"):
+                worker_cores = [cores[i % len(cores)] for i in range(FLAGS.workers)]
+                # Validate on the cores that are not used by workers. If every
+                # core has a worker then validation must share them.
+                validator_cores = set(cores) - set(worker_cores) or None
+                validator_count = len(validator_cores or [None])
+            else:
+                worker_cores = [None] * FLAGS.workers
+                validator_count = max(len(cores) - FLAGS.workers, 1)
+            workers = [
+                mp.Process(
+                    target=_eval_policy_worker,
+                    args=(policy, benchmark_queue, result_queue, core),
+                )
+                for core in worker_cores
+            ]
+        for benchmark in benchmarks:
+            benchmark_queue.put(benchmark)
+        for _ in workers:
+            benchmark_queue.put(None)
+
+        # Validate the results in the background as they are produced.
+        validate_during_evaluation = FLAGS.validate and FLAGS.validate_during_evaluation
+        validator: Optional[_Validator] = None
+        validations: List[Future] = []
+        if validate_during_evaluation:
+            validator = _Validator(validator_count, validator_cores)
+            validations = [validator.submit(state) for state in resumed_states]
 
-            # Stream verbose CompilerGym logs to file.
-            logger = logging.getLogger("compiler_gym")
-            logger.setLevel(logging.DEBUG)
-            log_handler = logging.FileHandler(FLAGS.leaderboard_logfile)
-            logger.addHandler(log_handler)
-            logger.propagate = False
+        # Determine if we need to print a header.
+        header = (
+            not Path(FLAGS.leaderboard_results).is_file()
+            or os.stat(FLAGS.leaderboard_results).st_size == 0
+        )
+        with CompilerEnvStateWriter(
+            open(FLAGS.leaderboard_results, "a"), header=header
+        ) as writer:
 
-            print(f"Writing results to {FLAGS.leaderboard_results}")
-            print(f"Writing logs to {FLAGS.leaderboard_logfile}")
+            worker_error: Optional[_WorkerError] = None
+            interrupted = False
 
-            # Build the list of benchmarks to evaluate.
-            benchmarks = env.datasets[FLAGS.test_dataset].benchmark_uris()
-            if FLAGS.max_benchmarks:
-                benchmarks = islice(benchmarks, FLAGS.max_benchmarks)
-            benchmarks = list(benchmarks)
-
-            # Repeat the searches for the requested number of iterations.
-            benchmarks *= FLAGS.n
-            total_count = len(benchmarks)
-
-            # If we are resuming from a previous job, read the states that have
-            # already been proccessed and remove those benchmarks from the list
-            # of benchmarks to evaluate.
-            init_states = []
-            if FLAGS.resume and Path(FLAGS.leaderboard_results).is_file():
-                with CompilerEnvStateReader(open(FLAGS.leaderboard_results)) as reader:
-                    for state in reader:
-                        init_states.append(state)
-                        if state.benchmark in benchmarks:
-                            benchmarks.remove(state.benchmark)
-
-            # Run the benchmark loop in background so that we can asynchronously
-            # log progress.
-            worker = _EvalPolicyWorker(env, benchmarks, policy, init_states)
-            worker.start()
+            def record(state: Union[CompilerEnvState, _WorkerError]) -> None:
+                nonlocal worker_error
+                if isinstance(state, _WorkerError):
+                    worker_error = worker_error or state
+                    return
+                writer.write_state(state, flush=True)
+                stats.add(state)
+                if validator:
+                    validations.append(validator.submit(state))
+
+            for worker in workers:
+                worker.start()
             timer = Timer().reset()
             try:
                 print(
@@ -270,37 +497,76 @@ def eval_llvm_instcount_policy(policy: Policy) -> None:
                     f"{FLAGS.test_dataset} benchmarks ==="
                     "\n\n"  # Blank lines will be filled below
                 )
-                while worker.is_alive():
-                    done_count = len(worker.states)
+                while worker_error is None and any(
+                    worker.is_alive() for worker in workers
+                ):
+                    try:
+                        record(result_queue.get(timeout=1))
+                    except queue.Empty:
+                        pass
+                    done_count = stats.count
                     remaining_count = total_count - done_count
                     time = timer.time
-                    gmean_reward = geometric_mean([s.reward for s in worker.states])
-                    mean_walltime = (
-                        arithmetic_mean([s.walltime for s in worker.states]) or time
-                    )
+                    mean_walltime = stats.mean_walltime or time
+                    eta = time + mean_walltime * remaining_count / len(workers)
                     print(
                         "\r\033[2A"
                         "\033[K"
                         f"Runtime: {humanize_duration_hms(time)}. "
-                        f"Estimated completion: {humanize_duration_hms(time + mean_walltime * remaining_count)}. "
+                        f"Estimated completion: {humanize_duration_hms(eta)}. "
                         f"Completed: {humanize.intcomma(done_count)} / {humanize.intcomma(total_count)} "
                         f"({done_count / total_count:.1%})."
                         "\n\033[K"
                         f"Current mean walltime: {mean_walltime:.3f}s / benchmark."
                         "\n\033[K"
-                        f"Current geomean reward: {gmean_reward:.4f}.",
+                        f"Current geomean reward: {stats.geomean_reward:.4f}.",
                         flush=True,
                         end="",
                     )
-                    sleep(1)
             except KeyboardInterrupt:
                 print("\nkeyboard interrupt", flush=True)
-                worker.alive = False
-                # User interrupt, don't validate.
-                FLAGS.validate = False
-
-        if FLAGS.validate:
+                _stop_workers(workers, benchmark_queue)
+                interrupted = True
+
+            # A process that is killed, e.g. by the OOM killer, exits without
+            # reporting an error.
+            for worker in workers:
+                if not interrupted and getattr(worker, "exitcode", None):
+                    worker_error = worker_error or _WorkerError(
+                        None, f"Worker exited with code {worker.exitcode}"
+                    )
+            # Fail the run if any worker failed.
+            if worker_error:
+                _stop_workers(workers, benchmark_queue)
+
+            # Record the results that arrived after the last poll.
+            while True:
+                try:
+                    record(result_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        # Don't validate if the user interrupted the run or a worker failed.
+        if interrupted or worker_error:
+            FLAGS.validate = False
+
+        if validator:
+            try:
+                if FLAGS.validate:
+                    print()
+                    _print_validation_results(validations)
+                else:
+                    # Interrupted, so drop the validations that have not started.
+                    for future in validations:
+                        future.cancel()
+            finally:
+                validator.close()
+        elif FLAGS.validate:
             FLAGS.env = "llvm-ic-v0"
             validate(["argv0", FLAGS.leaderboard_results])
 
+        if worker_error:
+            print(f"\n{worker_error}", file=sys.stderr, flush=True)
+            sys.exit(1)
+
     app.run(main)
@@ -0,0 +1,214 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Evaluate a population of action sequences with shared-prefix reuse.
+
+Black-box search algorithms such as genetic algorithms evaluate populations of
+candidate action sequences that share long common prefixes. Evaluating each
+candidate by calling :code:`env.reset()` followed by :code:`env.step(actions)`
+executes the shared prefixes once per candidate.
+:class:`PopulationEvaluator` instead arranges the population into a prefix
+trie and walks it, executing the actions of every edge of the trie exactly once
+and using :meth:`env.fork() <compiler_gym.envs.CompilerEnv.fork>` to branch the
+compiler service session wherever two candidates diverge.
+
+Optionally, results are memoized using a hash of the program state at the root
+of the trie and at each branch point, so that candidates reaching a known
+program state by a different prefix, and candidates from earlier generations,
+are not re-evaluated. The memo is an arbitrary mutable mapping, so a
+:code:`multiprocessing.Manager().dict()` can be used to share results across
+worker processes.
+"""
+from typing import Dict, Iterable, List, MutableMapping, Optional, Sequence, Tuple
+
+from compiler_gym.envs import CompilerEnv
+from compiler_gym.util.gym_type_hints import ActionType
+
+# A memo key is a program state hash and a sequence of actions applied to it.
+MemoKey = Tuple[str, Tuple[ActionType, ...]]
+
+
+class _TrieNode:
+    __slots__ = ["children", "indices"]
+
+    def __init__(self):
+        self.children: Dict[ActionType, "_TrieNode"] = {}
+        # The indices of the candidates that end at this node.
+        self.indices: List[int] = []
+
+
+def _build_trie(candidates: Iterable[Tuple[int, Sequence[ActionType]]]) -> _TrieNode:
+    root = _TrieNode()
+    for index, actions in candidates:
+        node = root
+        for action in actions:
+            node = node.children.setdefault(action, _TrieNode())
+        node.indices.append(index)
+    return root
+
+
+def _edges(node: _TrieNode) -> List[Tuple[List[ActionType], _TrieNode]]:
+    """Return the outgoing edges of a node, merging chains of nodes that have
+    only a single child and no candidates ending at them, so that each edge
+    can be applied using a single call to step().
+    """
+    edges = []
+    for action, child in node.children.items():
+        actions = [action]
+        while len(child.children) == 1 and not child.indices:
+            ((action, child),) = child.children.items()
+            actions.append(action)
+        edges.append((actions, child))
+    return edges
+
+
+def _suffixes(node: _TrieNode) -> List[Tuple[int, Tuple[ActionType, ...]]]:
+    """Return the index and remaining actions of every candidate in a subtree."""
+    suffixes = []
+    stack = [(node, ())]
+    while stack:
+        node, suffix = stack.pop()
+        suffixes += [(index, suffix) for index in node.indices]
+        stack += [
+            (child, suffix + (action,)) for action, child in node.children.items()
+        ]
+    return suffixes
+
+
+class PopulationEvaluator:
+    """Compute the cumulative rewards of a population of action sequences.
+
+    Example usage:
+
+        >>> env = compiler_gym.make("llvm-v0", reward_space="IrInstructionCountOz")
+        >>> env.reset(benchmark="cbench-v1/crc32")
+        >>> evaluator = PopulationEvaluator(env, state_hash="IrSha1", memo={})
+        >>> evaluator.evaluate([[1, 2, 3], [1, 2, 4], [1, 5]])
+        [0.0, 0.011, 0.0]
+
+    The candidates are evaluated starting from the current state of the
+    environment, which is not modified. The number of forked environments that
+    are alive at any one time is bounded by the size of the population.
+
+    :ivar steps: The total number of actions executed.
+
+    :ivar cache_hits: The total number of candidates that were resolved using
+        the memo.
+    """
+
+    def __init__(
+        self,
+        env: CompilerEnv,
+        state_hash: Optional[str] = None,
+        memo: Optional[MutableMapping[MemoKey, float]] = None,
+    ):
+        """Constructor.
+
+        :param env: The environment to evaluate candidates in. A reward space
+            must be set.
+
+        :param state_hash: The name of an observation space that computes a
+            hash of the program state, such as :code:`IrSha1` for LLVM. Required
+            for memoization.
+
+        :param memo: A mapping from program state hashes and action sequences
+            to cumulative rewards. If provided, results are looked up in and
+            added to this mapping. Only use a memo with deterministic rewards.
+
+        :raises ValueError: If a memo is provided without a state hash.
+        """
+        if memo is not None and not state_hash:
+            raise ValueError("A state_hash observation is required for memoization")
+        self.env = env
+        self.state_hash = state_hash
+        self.memo = memo
+        self.steps = 0
+        self.cache_hits = 0
+
+    def evaluate(self, population: Iterable[Sequence[ActionType]]) -> List[float]:
+        """Compute the cumulative reward of each candidate in a population.
+
+        :param population: A list of action sequences.
+
+        :return: A list of cumulative rewards, one per candidate. If an action
+            sequence ends the episode early, the cumulative reward at that
+            point is returned.
+
+        :raises ValueError: If the environment does not have a reward space.
+        """
+        if not self.env.reward_space:
+            raise ValueError("Cannot evaluate population without a reward space")
+
+        population = [tuple(actions) for actions in population]
+        rewards: List[Optional[float]] = [None] * len(population)
+        # Memo entries to add once the rewards have been computed, as tuples of
+        # memo key, candidate index, and the cumulative reward at the key state.
+        new_memo_entries: List[Tuple[MemoKey, int, float]] = []
+
+        root = _build_trie(enumerate(population))
+        # Every forked environment, so that they can be closed on error.
+        forks = [self.env.fork()]
+        stack = [(root, forks[0], 0.0)]
+        try:
+            while stack:
+                node, env, reward = stack.pop()
+                for index in node.indices:
+                    rewards[index] = reward
+
+                if self.memo is not None and (node is root or len(node.children) > 1):
+                    node = self._lookup(node, env, reward, rewards, new_memo_entries)
+
+                edges = _edges(node)
+                if not edges:
+                    env.close()
+                    continue
+
+                # Fork the environment for all but the last edge before
+                # stepping, which reuses this environment.
+                envs = [env.fork() for _ in edges[:-1]]
+                forks += envs
+                envs.append(env)
+                for (actions, child), child_env in zip(edges, envs):
+                    _, step_reward, done, _ = child_env.step(actions)
+                    self.steps += len(actions)
+                    child_reward = reward + (step_reward or 0)
+                    if done:
+                        for index, _ in _suffixes(child):
+                            rewards[index] = child_reward
+                        child_env.close()
+                    else:
+                        stack.append((child, child_env, child_reward))
+        finally:
+            for env in forks:
+                env.close()
+
+        for key, index, reward in new_memo_entries:
+            self.memo[key] = rewards[index] - reward
+        return rewards
+
+    def _lookup(
+        self,
+        node: _TrieNode,
+        env: CompilerEnv,
+        reward: float,
+        rewards: List[Optional[float]],
+        new_memo_entries: List[Tuple[MemoKey, int, float]],
+    ) -> _TrieNode:
+        """Resolve the candidates in a subtree using the memo and return a new
+        subtree of the candidates that must still be evaluated.
+        """
+        state = env.observation[self.state_hash]
+        misses = []
+        for index, suffix in _suffixes(node):
+            if not suffix:
+                continue
+            key = (state, suffix)
+            cached = self.memo.get(key)
+            if cached is None:
+                misses.append((index, suffix))
+                new_memo_entries.append((key, index, reward))
+            else:
+                rewards[index] = reward + cached
+                self.cache_hits += 1
+        return _build_trie(misses)
@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 from compiler_gym.service.compilation_session import CompilationSession
 from compiler_gym.service.connection import (
+    AsyncConnection,
     CompilerGymServiceConnection,
     ConnectionOpts,
     EnvironmentNotSupported,
@@ -16,6 +17,7 @@ from compiler_gym.service.connection import (
 )
 
 __all__ = [
+    "AsyncConnection",
     "CompilerGymServiceConnection",
     "CompilationSession",
     "ConnectionOpts",
@@ -0,0 +1,114 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Helpers for sending benchmarks to a compiler service.
+
+A client sends a benchmark to a service in two steps. First, it sends a
+reference to the program contents by SHA-256 digest, using
+:func:`benchmark_reference`. The service resolves the reference if it has
+already received the same contents, possibly under a different URI. Only if it
+has not does the client upload the contents, using the request returned by
+:func:`add_benchmark_request`.
+"""
+import hashlib
+from typing import Iterator, Optional, Tuple, Union
+
+from compiler_gym.service.connection import StubMethod
+from compiler_gym.service.proto import (
+    AddBenchmarkChunk,
+    AddBenchmarkRequest,
+    Benchmark,
+    CompilerGymServiceStub,
+    File,
+)
+
+# Benchmarks that are larger than this are uploaded as a stream of chunks
+# using the AddBenchmarkStream() RPC.
+STREAM_THRESHOLD_IN_BYTES = 64 * 1024 * 1024
+
+# The size of the chunks of a streamed benchmark upload.
+CHUNK_SIZE_IN_BYTES = 4 * 1024 * 1024
+
+
+def content_sha256(benchmark: Benchmark) -> Optional[str]:
+    """Compute the SHA-256 digest of the program contents of a benchmark.
+
+    :param benchmark: A benchmark.
+
+    :return: A hex-encoded digest, or :code:`None` if the benchmark program
+        does not have contents.
+    """
+    program = benchmark.program
+    if program.WhichOneof("data") != "contents":
+        return None
+    return program.sha256 or hashlib.sha256(program.contents).hexdigest()
+
+
+def benchmark_reference(benchmark: Benchmark) -> Optional[Benchmark]:
+    """Return a copy of a benchmark in which the program contents are replaced
+    by their SHA-256 digest.
+
+    :param benchmark: A benchmark.
+
+    :return: A benchmark, or :code:`None` if the benchmark program does not
+        have contents.
+    """
+    sha256 = content_sha256(benchmark)
+    if sha256 is None:
+        return None
+    reference = Benchmark(uri=benchmark.uri, program=File(sha256=sha256))
+    if benchmark.HasField("dynamic_config"):
+        reference.dynamic_config.CopyFrom(benchmark.dynamic_config)
+    return reference
+
+
+class AddBenchmarkChunks:
+    """An iterable over the chunks of an AddBenchmarkStream() request.
+
+    The chunks are generated lazily, and can be iterated over multiple times so
+    that a failed request can be retried.
+    """
+
+    def __init__(self, benchmark: Benchmark, chunk_size: int = CHUNK_SIZE_IN_BYTES):
+        self.benchmark = benchmark
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[AddBenchmarkChunk]:
+        header = Benchmark(
+            uri=self.benchmark.uri,
+            program=File(sha256=content_sha256(self.benchmark)),
+        )
+        if self.benchmark.HasField("dynamic_config"):
+            header.dynamic_config.CopyFrom(self.benchmark.dynamic_config)
+
+        contents = self.benchmark.program.contents
+        yield AddBenchmarkChunk(benchmark=header, contents=contents[: self.chunk_size])
+        for start in range(self.chunk_size, len(contents), self.chunk_size):
+            yield AddBenchmarkChunk(contents=contents[start : start + self.chunk_size])
+
+
+def add_benchmark_request(
+    stub: CompilerGymServiceStub, benchmark: Benchmark
+) -> Tuple[StubMethod, Union[AddBenchmarkRequest, AddBenchmarkChunks]]:
+    """Return the RPC method and request to upload a benchmark.
+
+    The SHA-256 digest of the program contents is sent along with the contents
+    so that the service can deduplicate them. Benchmarks larger than
+    :code:`STREAM_THRESHOLD_IN_BYTES` are streamed in chunks.
+
+    :param stub: The service stub.
+
+    :param benchmark: The benchmark to upload.
+
+    :return: A tuple of the stub method and the request to call it with.
+    """
+    sha256 = content_sha256(benchmark)
+    if sha256 is None:
+        return stub.AddBenchmark, AddBenchmarkRequest(benchmark=[benchmark])
+    if benchmark.ByteSize() > STREAM_THRESHOLD_IN_BYTES:
+        return stub.AddBenchmarkStream, AddBenchmarkChunks(benchmark)
+    hashed = Benchmark()
+    hashed.CopyFrom(benchmark)
+    hashed.program.sha256 = sha256
+    return stub.AddBenchmark, AddBenchmarkRequest(benchmark=[hashed])
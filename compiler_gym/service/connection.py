@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 """This module contains the logic for connecting to services."""
+import asyncio
 import logging
 import os
 import random
@@ -13,7 +14,7 @@ from datetime import datetime
 from pathlib import Path
 from signal import Signals
 from time import sleep, time
-from typing import Dict, Iterable, List, Optional, TypeVar, Union
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar, Union
 
 import grpc
 from pydantic import BaseModel
@@ -85,9 +86,11 @@ class ConnectionOpts(BaseModel):
     """The maximum number of seconds to wait for an RPC connection to establish."""
 
     always_send_benchmark_on_reset: bool = False
-    """Send the full benchmark program data to the compiler service on ever call
-    to :meth:`env.reset() <compiler_gym.envs.CompilerEnv.reset>`. This is more
-    efficient in cases where the majority of calls to
+    """Send the benchmark to the compiler service on every call to
+    :meth:`env.reset() <compiler_gym.envs.CompilerEnv.reset>`, with the program
+    data replaced by its SHA-256 digest. The program data is uploaded only if
+    the service does not already have it. This is more efficient in cases where
+    the majority of calls to
     :meth:`env.reset() <compiler_gym.envs.CompilerEnv.reset>` uses a different
     benchmark. In case of benchmark re-use, leave this :code:`False`.
     """
@@ -157,6 +160,77 @@ else:
     StubMethod = Callable[[Request], Reply]
 
 
+def _translate_rpc_error(
+    e: grpc.RpcError, request: Request, timeout: float
+) -> Optional[Exception]:
+    """Translate an RPC error into the exception that should be raised, or
+    :code:`None` if the call should be retried.
+    """
+    # pylint: disable=no-member
+    if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
+        return ValueError(e.details())
+    elif e.code() == grpc.StatusCode.UNIMPLEMENTED:
+        return NotImplementedError(e.details())
+    elif e.code() == grpc.StatusCode.NOT_FOUND:
+        return FileNotFoundError(e.details())
+    elif e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+        return ServiceOSError(e.details())
+    elif e.code() == grpc.StatusCode.FAILED_PRECONDITION:
+        return TypeError(str(e.details()))
+    elif e.code() == grpc.StatusCode.UNAVAILABLE:
+        return None
+    elif (
+        e.code() == grpc.StatusCode.INTERNAL
+        and e.details() == "Exception serializing request!"
+    ):
+        return TypeError(f"{e.details()} Request type: {type(request).__name__}")
+    elif e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+        return TimeoutError(f"{e.details()} ({timeout:.1f} seconds)")
+    elif e.code() == grpc.StatusCode.DATA_LOSS:
+        return ServiceError(e.details())
+    elif e.code() == grpc.StatusCode.UNKNOWN:
+        # By default, GRPC provides no context if an exception is raised in an
+        # RPC handler as this could lead to an information leak. Unfortunately
+        # for us this makes debugging a little more difficult, so be verbose
+        # about the possible causes of this error.
+        return ServiceError(
+            "Service returned an unknown error. Possibly an "
+            "unhandled exception in a C++ RPC handler, see "
+            "<https://github.com/grpc/grpc/issues/13706>."
+        )
+    else:
+        return ServiceError(
+            f"RPC call returned status code {e.code()} and error `{e.details()}`"
+        )
+
+
+def _stream_reply(
+    first: Optional[Reply], rest: Iterator[Reply], request: Request, timeout: float
+) -> Iterator[Reply]:
+    """Yield the messages of a server-streaming reply, translating RPC errors
+    that occur part way through the stream.
+    """
+    if first is None:
+        return
+    yield first
+    try:
+        yield from rest
+    except grpc.RpcError as e:
+        # A partially received stream cannot be retried.
+        error = _translate_rpc_error(e, request, timeout)
+        raise (error or ServiceTransportError(e.details())) from None
+
+
+def _log_retry(url: str, e: grpc.RpcError, remaining: int) -> None:
+    logger.warning(
+        "%s %s (%d %s remaining)",
+        url,
+        e.details(),
+        remaining,
+        plural(remaining, "attempt", "attempts"),
+    )
+
+
 class Connection:
     """Base class for service connections."""
 
@@ -192,7 +266,13 @@ class Connection:
         attempt = 0
         while True:
             try:
-                return stub_method(request, timeout=timeout)
+                reply = stub_method(request, timeout=timeout)
+                if isinstance(reply, grpc.Call):
+                    # A server-streaming call. Receive the first message here
+                    # so that errors in making the call are handled below.
+                    first = next(reply, None)
+                    return _stream_reply(first, reply, request, timeout)
+                return reply
             except ValueError as e:
                 if str(e) == "Cannot invoke RPC on closed channel!":
                     raise ServiceIsClosed(
@@ -200,66 +280,23 @@ class Connection:
                     ) from None
                 raise e
             except grpc.RpcError as e:
-                # We raise "from None" to discard the gRPC stack trace, with the
-                # remaining stack trace correctly pointing to the CompilerGym
-                # calling code.
-                if e.code() == grpc.StatusCode.INVALID_ARGUMENT:
-                    raise ValueError(e.details()) from None
-                elif e.code() == grpc.StatusCode.UNIMPLEMENTED:
-                    raise NotImplementedError(e.details()) from None
-                elif e.code() == grpc.StatusCode.NOT_FOUND:
-                    raise FileNotFoundError(e.details()) from None
-                elif e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
-                    raise ServiceOSError(e.details()) from None
-                elif e.code() == grpc.StatusCode.FAILED_PRECONDITION:
-                    raise TypeError(str(e.details())) from None
-                elif e.code() == grpc.StatusCode.UNAVAILABLE:
-                    # For "unavailable" errors we retry with exponential
-                    # backoff. This is because this error can be caused by an
-                    # overloaded service, a flaky connection, etc.
-                    attempt += 1
-                    if attempt > max_retries:
-                        raise ServiceTransportError(
-                            f"{self.url} {e.details()} ({max_retries} retries)"
-                        ) from None
-                    remaining = max_retries - attempt
-                    logger.warning(
-                        "%s %s (%d %s remaining)",
-                        self.url,
-                        e.details(),
-                        remaining,
-                        plural(remaining, "attempt", "attempts"),
-                    )
-                    sleep(retry_wait_seconds)
-                    retry_wait_seconds *= retry_wait_backoff_exponent
-                elif (
-                    e.code() == grpc.StatusCode.INTERNAL
-                    and e.details() == "Exception serializing request!"
-                ):
-                    raise TypeError(
-                        f"{e.details()} Request type: {type(request).__name__}"
-                    ) from None
-                elif e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
-                    raise TimeoutError(
-                        f"{e.details()} ({timeout:.1f} seconds)"
-                    ) from None
-                elif e.code() == grpc.StatusCode.DATA_LOSS:
-                    raise ServiceError(e.details()) from None
-                elif e.code() == grpc.StatusCode.UNKNOWN:
-                    # By default, GRPC provides no context if an exception is
-                    # raised in an RPC handler as this could lead to an
-                    # information leak. Unfortunately for us this makes
-                    # debugging a little more difficult, so be verbose about the
-                    # possible causes of this error.
-                    raise ServiceError(
-                        "Service returned an unknown error. Possibly an "
-                        "unhandled exception in a C++ RPC handler, see "
-                        "<https://github.com/grpc/grpc/issues/13706>."
-                    ) from None
-                else:
-                    raise ServiceError(
-                        f"RPC call returned status code {e.code()} and error `{e.details()}`"
+                error = _translate_rpc_error(e, request, timeout)
+                if error:
+                    # We raise "from None" to discard the gRPC stack trace, with
+                    # the remaining stack trace correctly pointing to the
+                    # CompilerGym calling code.
+                    raise error from None
+                # For "unavailable" errors we retry with exponential backoff.
+                # This is because this error can be caused by an overloaded
+                # service, a flaky connection, etc.
+                attempt += 1
+                if attempt > max_retries:
+                    raise ServiceTransportError(
+                        f"{self.url} {e.details()} ({max_retries} retries)"
                     ) from None
+                _log_retry(self.url, e, max_retries - attempt)
+                sleep(retry_wait_seconds)
+                retry_wait_seconds *= retry_wait_backoff_exponent
 
     def loglines(self) -> Iterable[str]:
         """Fetch any available log lines from the service backend.
@@ -625,6 +662,11 @@ class CompilerGymServiceConnection:
         self.observation_spaces: List[ObservationSpace] = list(
             self.connection.spaces.observation_space_list
         )
+        # Services that predate packed actions ignore the packed_action field
+        # of StepRequest, so they must be sent Action messages.
+        self.supports_packed_action: bool = (
+            self.connection.spaces.supports_packed_action
+        )
 
     def _establish_connection(self) -> None:
         """Create and establish a connection."""
@@ -749,7 +791,9 @@ class CompilerGymServiceConnection:
             reply = connection(connection.stub.GetSpaces, request)
 
         In the above example, the `GetSpaces` RPC method is invoked on a
-        connection, yielding a `GetSpacesReply` message.
+        connection, yielding a `GetSpacesReply` message. For RPC methods that
+        respond with a stream of messages, such as `StepStream`, an iterator
+        over the messages is returned.
 
         :param stub_method: An RPC method attribute on `CompilerGymServiceStub`.
         :param request: A request message.
@@ -782,7 +826,7 @@ class CompilerGymServiceConnection:
         :raises ServiceIsClosed: If the connection to the service is closed.
         :raises ServiceError: If the service raised an error not covered by
             any of the above conditions.
-        :return: A reply message.
+        :return: A reply message, or an iterator over reply messages.
         """
         if self.closed:
             self._establish_connection()
@@ -796,3 +840,100 @@ class CompilerGymServiceConnection:
                 retry_wait_backoff_exponent or self.opts.retry_wait_backoff_exponent
             ),
         )
+
+
+class AsyncConnection:
+    """An asyncio connection to a compiler gym service.
+
+    This provides the same RPC call interface as
+    :class:`CompilerGymServiceConnection`, using a :code:`grpc.aio` channel so
+    that many concurrent calls can be made from a single thread. The connection
+    does not manage the lifecycle of the service. Use it to connect to a
+    service that has been started by a :class:`CompilerGymServiceConnection`,
+    or to an unmanaged service.
+
+    The channel is created on first use and is bound to the event loop that is
+    running at that time. A single connection may be shared by any number of
+    coroutines running on that event loop.
+
+    Example usage:
+
+    .. code-block:: python
+
+        connection = AsyncConnection("localhost:8080")
+        reply = await connection(connection.stub.GetSpaces, GetSpacesRequest())
+        await connection.close()
+    """
+
+    def __init__(self, url: str, opts: ConnectionOpts = None):
+        """Constructor.
+
+        :param url: The URL of the service, e.g. :code:`"localhost:8080"`.
+        :param opts: The connection options.
+        """
+        self.url = url
+        self.opts = opts or ConnectionOpts()
+        self._channel = None
+        self._stub = None
+
+    @property
+    def stub(self) -> CompilerGymServiceStub:
+        """A :code:`CompilerGymServiceStub` bound to the asyncio channel."""
+        if self._stub is None:
+            self._channel = grpc.aio.insecure_channel(
+                self.url, options=GRPC_CHANNEL_OPTIONS
+            )
+            self._stub = CompilerGymServiceStub(self._channel)
+        return self._stub
+
+    @property
+    def closed(self) -> bool:
+        """Whether the connection is closed."""
+        return self._channel is None
+
+    async def close(self):
+        if self._channel is not None:
+            await self._channel.close()
+        self._channel = None
+        self._stub = None
+
+    async def __call__(
+        self,
+        stub_method: StubMethod,
+        request: Request,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        retry_wait_seconds: Optional[float] = None,
+        retry_wait_backoff_exponent: Optional[float] = None,
+    ) -> Reply:
+        """Invoke an RPC method on the service and await its response.
+
+        The arguments, retry behavior, and exceptions raised are the same as
+        for :meth:`CompilerGymServiceConnection.__call__()`.
+        """
+        timeout = timeout or self.opts.rpc_call_max_seconds
+        max_retries = max_retries or self.opts.rpc_max_retries
+        retry_wait_seconds = retry_wait_seconds or self.opts.retry_wait_seconds
+        retry_wait_backoff_exponent = (
+            retry_wait_backoff_exponent or self.opts.retry_wait_backoff_exponent
+        )
+        attempt = 0
+        while True:
+            try:
+                return await stub_method(request, timeout=timeout)
+            except grpc.aio.UsageError as e:
+                raise ServiceIsClosed(
+                    f"RPC communication failed with message: {e}"
+                ) from None
+            except grpc.RpcError as e:
+                error = _translate_rpc_error(e, request, timeout)
+                if error:
+                    raise error from None
+                attempt += 1
+                if attempt > max_retries:
+                    raise ServiceTransportError(
+                        f"{self.url} {e.details()} ({max_retries} retries)"
+                    ) from None
+                _log_retry(self.url, e, max_retries - attempt)
+                await asyncio.sleep(retry_wait_seconds)
+                retry_wait_seconds *= retry_wait_backoff_exponent
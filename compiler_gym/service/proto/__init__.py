@@ -5,6 +5,7 @@
 from compiler_gym.service.proto.compiler_gym_service_pb2 import (
     Action,
     ActionSpace,
+    AddBenchmarkChunk,
     AddBenchmarkReply,
     AddBenchmarkRequest,
     Benchmark,
@@ -15,6 +16,9 @@ from compiler_gym.service.proto.compiler_gym_service_pb2 import (
     DoubleList,
     EndSessionReply,
     EndSessionRequest,
+    ExpandSessionCandidate,
+    ExpandSessionReply,
+    ExpandSessionRequest,
     File,
     ForkSessionReply,
     ForkSessionRequest,
@@ -26,6 +30,7 @@ from compiler_gym.service.proto.compiler_gym_service_pb2 import (
     NamedDiscreteSpace,
     Observation,
     ObservationSpace,
+    PackedArray,
     ScalarLimit,
     ScalarRange,
     ScalarRangeList,
@@ -35,7 +40,9 @@ from compiler_gym.service.proto.compiler_gym_service_pb2 import (
     StartSessionReply,
     StartSessionRequest,
     StepReply,
+    StepReplyChunk,
     StepRequest,
+    StepTimings,
 )
 from compiler_gym.service.proto.compiler_gym_service_pb2_grpc import (
     CompilerGymServiceServicer,
@@ -47,6 +54,7 @@ __all__ = [
     "proto_to_action_space",
     "Action",
     "ActionSpace",
+    "AddBenchmarkChunk",
     "AddBenchmarkReply",
     "AddBenchmarkRequest",
     "Benchmark",
@@ -61,6 +69,9 @@ __all__ = [
     "DoubleList",
     "EndSessionReply",
     "EndSessionRequest",
+    "ExpandSessionCandidate",
+    "ExpandSessionReply",
+    "ExpandSessionRequest",
     "File",
     "ForkSessionReply",
     "ForkSessionRequest",
@@ -72,6 +83,7 @@ __all__ = [
     "NamedDiscreteSpace",
     "Observation",
     "ObservationSpace",
+    "PackedArray",
     "ScalarLimit",
     "ScalarRange",
     "ScalarRangeList",
@@ -85,5 +97,7 @@ __all__ = [
     "StartSessionReply",
     "StartSessionRequest",
     "StepReply",
+    "StepReplyChunk",
     "StepRequest",
+    "StepTimings",
 ]
@@ -16,27 +16,94 @@ BenchmarkCache::BenchmarkCache(size_t maxSizeInBytes, std::optional<std::mt19937
       maxSizeInBytes_(maxSizeInBytes),
       sizeInBytes_(0){};
 
-const Benchmark* BenchmarkCache::get(const std::string& uri) const {
+namespace {
+
+// Whether a program refers to contents by SHA-256 digest, without the contents.
+bool isContentsReference(const File& program) {
+  return !program.sha256().empty() && program.data_case() == File::DATA_NOT_SET;
+}
+
+}  // anonymous namespace
+
+std::shared_ptr<const Benchmark> BenchmarkCache::get(const std::string& uri) const {
   auto it = benchmarks_.find(uri);
   if (it == benchmarks_.end()) {
     return nullptr;
   }
 
-  return &it->second;
+  const Benchmark& entry = *it->second;
+  if (!isContentsReference(entry.program())) {
+    return it->second;
+  }
+
+  // Construct a benchmark that borrows the shared program rather than copying
+  // its contents. The deleter releases the borrowed program before deleting
+  // the benchmark, and keeps the program alive until then.
+  std::shared_ptr<File> program = contents_.at(entry.program().sha256()).program;
+  auto benchmark = std::make_unique<Benchmark>();
+  benchmark->set_uri(entry.uri());
+  if (entry.has_dynamic_config()) {
+    *benchmark->mutable_dynamic_config() = entry.dynamic_config();
+  }
+  benchmark->unsafe_arena_set_allocated_program(program.get());
+  return std::shared_ptr<const Benchmark>(benchmark.release(), [program](const Benchmark* ptr) {
+    auto benchmark = const_cast<Benchmark*>(ptr);
+    benchmark->unsafe_arena_release_program();
+    delete benchmark;
+  });
+}
+
+bool BenchmarkCache::hasContents(const std::string& sha256) const {
+  return contents_.find(sha256) != contents_.end();
 }
 
 void BenchmarkCache::add(const Benchmark&& benchmark) {
-  const size_t benchmarkSize = benchmark.ByteSizeLong();
+  const File& program = benchmark.program();
+  const bool isHashed = !program.sha256().empty() && (program.data_case() == File::kContents ||
+                                                      program.data_case() == File::DATA_NOT_SET);
+
+  // Acquire a reference to the program contents before removing any existing
+  // value, which may hold the only other reference.
+  size_t contentsSize = 0;
+  if (isHashed) {
+    auto contents = contents_.find(program.sha256());
+    if (contents == contents_.end()) {
+      if (isContentsReference(program)) {
+        LOG(WARNING) << "Not caching benchmark " << benchmark.uri()
+                     << " as its program contents are not in the cache: " << program.sha256();
+        return;
+      }
+      auto shared = std::make_shared<File>();
+      shared->set_sha256(program.sha256());
+      shared->set_contents(program.contents());
+      contents = contents_.insert({program.sha256(), {std::move(shared), 0}}).first;
+      contentsSize = contents->second.program->contents().size();
+      sizeInBytes_ += contentsSize;
+    }
+    ++contents->second.refCount;
+  }
+
+  // Strip the program contents from hashed benchmarks.
+  Benchmark entry;
+  if (isHashed) {
+    entry.set_uri(benchmark.uri());
+    entry.mutable_program()->set_sha256(program.sha256());
+    if (benchmark.has_dynamic_config()) {
+      *entry.mutable_dynamic_config() = benchmark.dynamic_config();
+    }
+  } else {
+    entry = std::move(benchmark);
+  }
+  const size_t entrySize = entry.ByteSizeLong();
+  const size_t benchmarkSize = entrySize + contentsSize;
 
   // Remove any existing value to keep the cache size consistent.
-  const auto it = benchmarks_.find(benchmark.uri());
+  const auto it = benchmarks_.find(entry.uri());
   if (it != benchmarks_.end()) {
-    const size_t replacedSize = it->second.ByteSizeLong();
-    benchmarks_.erase(it);
-    sizeInBytes_ -= replacedSize;
+    erase(it);
   }
 
-  if (sizeInBytes() + benchmarkSize > maxSizeInBytes()) {
+  if (sizeInBytes() + entrySize > maxSizeInBytes()) {
     if (benchmarkSize > maxSizeInBytes()) {
       LOG(WARNING) << "Adding new benchmark with size " << benchmarkSize
                    << " bytes exceeds total target cache size of " << maxSizeInBytes() << " bytes";
@@ -48,13 +115,26 @@ void BenchmarkCache::add(const Benchmark&& benchmark) {
     evictToCapacity();
   }
 
-  benchmarks_.insert({benchmark.uri(), std::move(benchmark)});
-  sizeInBytes_ += benchmarkSize;
+  const std::string uri = entry.uri();
+  benchmarks_.insert({uri, std::make_shared<const Benchmark>(std::move(entry))});
+  sizeInBytes_ += entrySize;
 
-  VLOG(3) << "Cached benchmark " << benchmark.uri() << " (" << benchmarkSize
+  VLOG(3) << "Cached benchmark " << uri << " (" << benchmarkSize
           << " bytes). Cache size = " << sizeInBytes() << " bytes, " << size() << " items";
 }
 
+void BenchmarkCache::erase(BenchmarkMap::const_iterator it) {
+  sizeInBytes_ -= it->second->ByteSizeLong();
+  if (isContentsReference(it->second->program())) {
+    auto contents = contents_.find(it->second->program().sha256());
+    if (!--contents->second.refCount) {
+      sizeInBytes_ -= contents->second.program->contents().size();
+      contents_.erase(contents);
+    }
+  }
+  benchmarks_.erase(it);
+}
+
 void BenchmarkCache::evictToCapacity(std::optional<size_t> targetSize) {
   int evicted = 0;
   targetSize = targetSize.has_value() ? targetSize : maxSizeInBytes() / 2;
@@ -67,8 +147,7 @@ void BenchmarkCache::evictToCapacity(std::optional<size_t> targetSize) {
 
     // Evict the benchmark from the pool of loaded benchmarks.
     ++evicted;
-    sizeInBytes_ -= iterator->second.ByteSizeLong();
-    benchmarks_.erase(iterator);
+    erase(iterator);
   }
 
   if (evicted) {
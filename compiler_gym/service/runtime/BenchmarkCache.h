@@ -10,6 +10,8 @@
 #include <mutex>
 #include <optional>
 #include <random>
+#include <string>
+#include <unordered_map>
 
 #include "boost/filesystem.hpp"
 #include "compiler_gym/service/proto/compiler_gym_service.pb.h"
@@ -24,6 +26,11 @@ constexpr size_t kEvictionSizeInBytes = 256 * 1024 * 1024;
  * This object caches Benchmark messages by URI. Once the cache reaches a
  * predetermined size, benchmarks are evicted randomly until the capacity is
  * reduced to 50%.
+ *
+ * Program contents that are added with a SHA-256 digest are stored once per
+ * digest and shared by every benchmark that has the same contents. A benchmark
+ * may be added with only the digest of its program contents, in which case the
+ * contents must already be in the cache.
  */
 class BenchmarkCache {
  public:
@@ -39,21 +46,37 @@ class BenchmarkCache {
                  std::optional<std::mt19937_64> rand = std::nullopt);
 
   /**
-   * Lookup a benchmark. The pointer set by this method is valid only until the
-   * next call to add().
+   * Lookup a benchmark.
+   *
+   * The program contents are not copied. A benchmark whose contents are
+   * shared with other benchmarks refers to the shared contents. The returned
+   * benchmark remains valid after it is evicted from the cache.
    *
    * @param uri The URI of the benchmark.
-   * @return A Benchmark pointer.
+   * @return The benchmark with its program contents, or `nullptr` if the
+   *    benchmark is not in the cache.
    */
-  const Benchmark* get(const std::string& uri) const;
+  std::shared_ptr<const Benchmark> get(const std::string& uri) const;
 
   /**
    * Move-insert the given benchmark to the cache.
    *
+   * If the benchmark program has a SHA-256 digest but no contents, it refers
+   * to contents that are already in the cache. A benchmark that refers to
+   * unknown contents is not added.
+   *
    * @param benchmark A benchmark to insert.
    */
   void add(const Benchmark&& benchmark);
 
+  /**
+   * Check whether program contents with the given digest are in the cache.
+   *
+   * @param sha256 The hex-encoded SHA-256 digest of the program contents.
+   * @return True if the contents are in the cache.
+   */
+  bool hasContents(const std::string& sha256) const;
+
   /**
    * Get the number of elements in the cache.
    *
@@ -62,7 +85,8 @@ class BenchmarkCache {
   inline size_t size() const { return benchmarks_.size(); };
 
   /**
-   * Get the size of the cache in bytes.
+   * Get the size of the cache in bytes. Program contents that are shared by
+   * multiple benchmarks are counted once.
    *
    * @return A nonnegative integer.
    */
@@ -93,7 +117,21 @@ class BenchmarkCache {
   void evictToCapacity(std::optional<size_t> targetSizeInBytes = std::nullopt);
 
  private:
-  std::unordered_map<std::string, const Benchmark> benchmarks_;
+  // Program contents that are shared by one or more benchmarks.
+  struct Contents {
+    std::shared_ptr<File> program;
+    size_t refCount;
+  };
+
+  using BenchmarkMap = std::unordered_map<std::string, std::shared_ptr<const Benchmark>>;
+
+  // Remove a benchmark from the cache, releasing its program contents.
+  void erase(BenchmarkMap::const_iterator it);
+
+  // Benchmarks keyed by URI. The program contents of benchmarks that have a
+  // SHA-256 digest are removed and stored in contents_.
+  BenchmarkMap benchmarks_;
+  std::unordered_map<std::string, Contents> contents_;
 
   std::mt19937_64 rand_;
   size_t maxSizeInBytes_;
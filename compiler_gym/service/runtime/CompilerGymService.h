@@ -9,14 +9,21 @@
 #include <memory>
 #include <mutex>
 
+#include "boost/asio/thread_pool.hpp"
 #include "boost/filesystem.hpp"
 #include "compiler_gym/service/CompilationSession.h"
 #include "compiler_gym/service/proto/compiler_gym_service.grpc.pb.h"
 #include "compiler_gym/service/proto/compiler_gym_service.pb.h"
 #include "compiler_gym/service/runtime/BenchmarkCache.h"
+#include "compiler_gym/service/runtime/StepTimingHistograms.h"
 
 namespace compiler_gym::runtime {
 
+/**
+ * The maximum size of the observation data in a single StepStream() chunk.
+ */
+constexpr size_t kStepStreamChunkSizeInBytes = 4 * 1024 * 1024;
+
 /**
  * A default implementation of the CompilerGymService.
  *
@@ -54,9 +61,27 @@ class CompilerGymService final : public compiler_gym::CompilerGymService::Servic
   grpc::Status Step(grpc::ServerContext* context, const StepRequest* request,
                     StepReply* reply) final override;
 
+  // NOTE: StepStream() has the same thread safety requirements as Step(). The
+  // reply is computed in full before the first chunk is written.
+  grpc::Status StepStream(grpc::ServerContext* context, const StepRequest* request,
+                          grpc::ServerWriter<StepReplyChunk>* writer) final override;
+
+  // NOTE: ExpandSession() has the same thread safety requirements as Step().
+  // The candidates are forked from the session serially, and then the
+  // candidate actions are applied in parallel on a thread pool that is shared
+  // by all ExpandSession() calls.
+  grpc::Status ExpandSession(grpc::ServerContext* context, const ExpandSessionRequest* request,
+                             ExpandSessionReply* reply) final override;
+
   grpc::Status AddBenchmark(grpc::ServerContext* context, const AddBenchmarkRequest* request,
                             AddBenchmarkReply* reply) final override;
 
+  // NOTE: AddBenchmarkStream() receives the whole stream before acquiring the
+  // sessions lock to add the benchmark to the cache.
+  grpc::Status AddBenchmarkStream(grpc::ServerContext* context,
+                                  grpc::ServerReader<AddBenchmarkChunk>* reader,
+                                  AddBenchmarkReply* reply) final override;
+
   grpc::Status SendSessionParameter(grpc::ServerContext* context,
                                     const SendSessionParameterRequest* request,
                                     SendSessionParameterReply* reply) final override;
@@ -79,11 +104,18 @@ class CompilerGymService final : public compiler_gym::CompilerGymService::Servic
 
   inline const boost::filesystem::path& workingDirectory() const { return workingDirectory_; }
 
+  // Apply a candidate action of ExpandSession() to a forked session.
+  [[nodiscard]] grpc::Status expandCandidate(
+      CompilationSession* candidate, int actionIndex,
+      const std::vector<const ObservationSpace*>& observationSpaces,
+      ExpandSessionCandidate& reply);
+
   // Add the given session and return its ID.
   uint64_t addSession(std::unique_ptr<CompilationSession> session);
 
   // Handle a built-in session parameter.
-  [[nodiscard]] grpc::Status handleBuiltinSessionParameter(const std::string& key,
+  [[nodiscard]] grpc::Status handleBuiltinSessionParameter(uint64_t sessionId,
+                                                           const std::string& key,
                                                            const std::string& value,
                                                            std::optional<std::string>& reply);
 
@@ -95,9 +127,16 @@ class CompilerGymService final : public compiler_gym::CompilerGymService::Servic
   std::unordered_map<uint64_t, std::unique_ptr<CompilationSession>> sessions_;
   std::unique_ptr<BenchmarkCache> benchmarks_;
 
+  // Aggregate timings of the steps of each session. Guarded by sessionsMutex_.
+  std::unordered_map<uint64_t, StepTimingHistograms> stepTimings_;
+
   // Mutex used to ensure thread safety of creation and destruction of sessions.
   std::mutex sessionsMutex_;
   uint64_t nextSessionId_;
+
+  // The workers that apply the candidate actions of ExpandSession(). The pool
+  // is shared by all requests so that the number of threads is bounded.
+  boost::asio::thread_pool expandSessionPool_;
 };
 
 }  // namespace compiler_gym::runtime
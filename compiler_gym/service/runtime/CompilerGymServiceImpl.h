@@ -10,6 +10,13 @@
 
 #include <fmt/format.h>
 
+#include <algorithm>
+#include <chrono>
+#include <future>
+#include <memory>
+#include <thread>
+
+#include "boost/asio/post.hpp"
 #include "compiler_gym/util/GrpcStatusMacros.h"
 #include "compiler_gym/util/Version.h"
 
@@ -22,7 +29,8 @@ CompilerGymService<CompilationSessionType>::CompilerGymService(
       actionSpaces_(CompilationSessionType(workingDirectory).getActionSpaces()),
       observationSpaces_(CompilationSessionType(workingDirectory).getObservationSpaces()),
       benchmarks_(benchmarks ? std::move(benchmarks) : std::make_unique<BenchmarkCache>()),
-      nextSessionId_(0) {}
+      nextSessionId_(0),
+      expandSessionPool_(std::max(1u, std::thread::hardware_concurrency())) {}
 
 template <typename CompilationSessionType>
 grpc::Status CompilerGymService<CompilationSessionType>::GetVersion(
@@ -45,6 +53,7 @@ grpc::Status CompilerGymService<CompilationSessionType>::GetSpaces(grpc::ServerC
   for (const auto& observationSpace : observationSpaces_) {
     *reply->add_observation_space_list() = observationSpace;
   }
+  reply->set_supports_packed_action(true);
   return grpc::Status::OK;
 }
 
@@ -60,13 +69,19 @@ grpc::Status CompilerGymService<CompilationSessionType>::StartSession(
   VLOG(1) << "StartSession(id=" << nextSessionId_ << ", benchmark=" << request->benchmark().uri()
           << "), " << (sessionCount() + 1) << " active sessions";
 
-  // If a benchmark definition was provided, add it.
+  // If a benchmark definition was provided, add it. The program may refer to
+  // contents that were previously sent by SHA-256 digest.
   if (request->benchmark().has_program()) {
+    const File& program = request->benchmark().program();
+    if (program.data_case() == File::DATA_NOT_SET && !program.sha256().empty() &&
+        !benchmarks().hasContents(program.sha256())) {
+      return grpc::Status(grpc::StatusCode::NOT_FOUND, "Benchmark contents not found");
+    }
     benchmarks().add(std::move(request->benchmark()));
   }
 
   // Lookup the requested benchmark.
-  const Benchmark* benchmark = benchmarks().get(request->benchmark().uri());
+  const std::shared_ptr<const Benchmark> benchmark = benchmarks().get(request->benchmark().uri());
   if (!benchmark) {
     return grpc::Status(grpc::StatusCode::NOT_FOUND, "Benchmark not found");
   }
@@ -128,6 +143,7 @@ grpc::Status CompilerGymService<CompilationSessionType>::EndSession(
     const CompilationSession* environment;
     RETURN_IF_ERROR(session(request->session_id(), &environment));
     sessions_.erase(request->session_id());
+    stepTimings_.erase(request->session_id());
   }
 
   reply->set_remaining_sessions(sessionCount());
@@ -143,42 +159,205 @@ grpc::Status CompilerGymService<CompilationSessionType>::Step(grpc::ServerContex
 
   VLOG(2) << "Session " << request->session_id() << " Step()";
 
+  using clock = std::chrono::steady_clock;
+  const auto micros = [](clock::time_point start) -> int64_t {
+    return std::chrono::duration_cast<std::chrono::microseconds>(clock::now() - start).count();
+  };
+  const auto stepStart = clock::now();
+  StepTimings timings;
+
   bool endOfEpisode = false;
   std::optional<ActionSpace> newActionSpace;
   bool actionsHadNoEffect = true;
 
-  // Apply the actions.
-  for (int i = 0; i < request->action_size(); ++i) {
+  const auto applyAction = [&](const Action& action) -> Status {
     bool actionHadNoEffect = false;
     std::optional<ActionSpace> newActionSpaceFromAction;
-    RETURN_IF_ERROR(environment->applyAction(request->action(i), endOfEpisode,
-                                             newActionSpaceFromAction, actionHadNoEffect));
+    const auto actionStart = clock::now();
+    RETURN_IF_ERROR(environment->applyAction(action, endOfEpisode, newActionSpaceFromAction,
+                                             actionHadNoEffect));
+    timings.add_action_micros(micros(actionStart));
     actionsHadNoEffect &= actionHadNoEffect;
     if (newActionSpaceFromAction.has_value()) {
       newActionSpace = *newActionSpaceFromAction;
     }
-    if (endOfEpisode) {
-      break;
+    return Status::OK;
+  };
+
+  // Apply the actions.
+  for (int i = 0; i < request->action_size() && !endOfEpisode; ++i) {
+    RETURN_IF_ERROR(applyAction(request->action(i)));
+  }
+
+  // Apply the packed actions. A single Action message is reused for every
+  // action rather than constructing one per action.
+  if (request->packed_action_size() && !endOfEpisode) {
+    Action action;
+    Choice* choice = action.add_choice();
+    for (int i = 0; i < request->packed_action_size() && !endOfEpisode; ++i) {
+      choice->set_named_discrete_value_index(request->packed_action(i));
+      RETURN_IF_ERROR(applyAction(action));
     }
   }
 
   // Compute the requested observations.
+  std::vector<std::string> observationSpaceNames;
   for (int i = 0; i < request->observation_space_size(); ++i) {
     const ObservationSpace* observationSpace;
     RETURN_IF_ERROR(
         observation_space(environment, request->observation_space(i), &observationSpace));
     DCHECK(observationSpace) << "No observation space set";
+    const auto observationStart = clock::now();
     RETURN_IF_ERROR(environment->computeObservation(*observationSpace, *reply->add_observation()));
+    timings.add_observation_micros(micros(observationStart));
+    observationSpaceNames.push_back(observationSpace->name());
   }
 
   // Call the end-of-step callback.
+  const auto endOfStepStart = clock::now();
   RETURN_IF_ERROR(environment->endOfStep(actionsHadNoEffect, endOfEpisode, newActionSpace));
+  timings.set_end_of_step_micros(micros(endOfStepStart));
 
   reply->set_action_had_no_effect(actionsHadNoEffect);
   if (newActionSpace.has_value()) {
     *reply->mutable_new_action_space() = *newActionSpace;
   }
   reply->set_end_of_session(endOfEpisode);
+
+  timings.set_total_micros(micros(stepStart));
+  {
+    // The timings of every session are stored in a single map, so the sessions
+    // lock is required to guard against concurrent steps of other sessions.
+    const std::lock_guard<std::mutex> lock(sessionsMutex_);
+    stepTimings_[request->session_id()].add(*request, observationSpaceNames, timings);
+  }
+  if (request->record_timings()) {
+    *reply->mutable_timings() = std::move(timings);
+  }
+  return Status::OK;
+}
+
+template <typename CompilationSessionType>
+grpc::Status CompilerGymService<CompilationSessionType>::StepStream(
+    grpc::ServerContext* context, const StepRequest* request,
+    grpc::ServerWriter<StepReplyChunk>* writer) {
+  VLOG(2) << "Session " << request->session_id() << " StepStream()";
+
+  StepReplyChunk header;
+  RETURN_IF_ERROR(Step(context, request, header.mutable_reply()));
+
+  // Move the values that are to be streamed out of the reply, leaving the
+  // value fields set but empty so that the client can determine their types.
+  std::vector<std::string> values(header.reply().observation_size());
+  for (int i = 0; i < header.reply().observation_size(); ++i) {
+    Observation* observation = header.mutable_reply()->mutable_observation(i);
+    switch (observation->value_case()) {
+      case Observation::ValueCase::kStringValue:
+        values[i].swap(*observation->mutable_string_value());
+        break;
+      case Observation::ValueCase::kBinaryValue:
+        values[i].swap(*observation->mutable_binary_value());
+        break;
+      case Observation::ValueCase::kPackedArray:
+        values[i].swap(*observation->mutable_packed_array()->mutable_data());
+        break;
+      default:
+        break;
+    }
+    header.add_observation_size_in_bytes(values[i].size());
+  }
+
+  if (!writer->Write(header)) {
+    return grpc::Status(grpc::StatusCode::CANCELLED, "Failed to write StepStream() reply");
+  }
+  StepReplyChunk chunk;
+  for (int i = 0; i < static_cast<int>(values.size()); ++i) {
+    for (size_t offset = 0; offset < values[i].size(); offset += kStepStreamChunkSizeInBytes) {
+      chunk.set_observation_index(i);
+      chunk.set_data(values[i].substr(offset, kStepStreamChunkSizeInBytes));
+      if (!writer->Write(chunk)) {
+        return grpc::Status(grpc::StatusCode::CANCELLED, "Failed to write StepStream() reply");
+      }
+    }
+  }
+
+  return Status::OK;
+}
+
+template <typename CompilationSessionType>
+grpc::Status CompilerGymService<CompilationSessionType>::ExpandSession(
+    grpc::ServerContext* context, const ExpandSessionRequest* request, ExpandSessionReply* reply) {
+  CompilationSession* environment;
+  RETURN_IF_ERROR(session(request->session_id(), &environment));
+
+  VLOG(2) << "Session " << request->session_id() << " ExpandSession("
+          << request->packed_action_size() << " candidates)";
+
+  std::vector<const ObservationSpace*> observationSpaces(request->observation_space_size());
+  for (int i = 0; i < request->observation_space_size(); ++i) {
+    RETURN_IF_ERROR(
+        observation_space(environment, request->observation_space(i), &observationSpaces[i]));
+  }
+
+  // Fork a copy of the session for every candidate. This reads the state of
+  // the session, so is done serially.
+  const int numCandidates = request->packed_action_size();
+  std::vector<std::unique_ptr<CompilationSession>> candidates;
+  candidates.reserve(numCandidates);
+  for (int i = 0; i < numCandidates; ++i) {
+    auto candidate = std::make_unique<CompilationSessionType>(workingDirectory());
+    RETURN_IF_ERROR(candidate->init(environment));
+    candidates.push_back(std::move(candidate));
+    reply->add_candidate();
+  }
+
+  // Apply the candidate actions and compute the observations in parallel.
+  std::vector<std::future<Status>> results;
+  results.reserve(numCandidates);
+  for (int i = 0; i < numCandidates; ++i) {
+    auto task = std::make_shared<std::packaged_task<Status()>>([&, i]() {
+      return expandCandidate(candidates[i].get(), request->packed_action(i), observationSpaces,
+                             *reply->mutable_candidate(i));
+    });
+    results.push_back(task->get_future());
+    boost::asio::post(expandSessionPool_, [task]() { (*task)(); });
+  }
+
+  // Wait for every candidate before returning, as the tasks reference the
+  // state of this call.
+  std::vector<Status> statuses;
+  statuses.reserve(numCandidates);
+  for (auto& result : results) {
+    statuses.push_back(result.get());
+  }
+  for (const auto& status : statuses) {
+    RETURN_IF_ERROR(status);
+  }
+  return Status::OK;
+}
+
+template <typename CompilationSessionType>
+grpc::Status CompilerGymService<CompilationSessionType>::expandCandidate(
+    CompilationSession* candidate, int actionIndex,
+    const std::vector<const ObservationSpace*>& observationSpaces,
+    ExpandSessionCandidate& reply) {
+  Action action;
+  action.add_choice()->set_named_discrete_value_index(actionIndex);
+
+  bool endOfEpisode = false;
+  bool actionHadNoEffect = false;
+  std::optional<ActionSpace> newActionSpace;
+  RETURN_IF_ERROR(
+      candidate->applyAction(action, endOfEpisode, newActionSpace, actionHadNoEffect));
+
+  for (const auto* observationSpace : observationSpaces) {
+    RETURN_IF_ERROR(candidate->computeObservation(*observationSpace, *reply.add_observation()));
+  }
+
+  RETURN_IF_ERROR(candidate->endOfStep(actionHadNoEffect, endOfEpisode, newActionSpace));
+
+  reply.set_end_of_session(endOfEpisode);
+  reply.set_action_had_no_effect(actionHadNoEffect);
   return Status::OK;
 }
 
@@ -191,12 +370,46 @@ grpc::Status CompilerGymService<CompilationSessionType>::AddBenchmark(
 
   VLOG(2) << "AddBenchmark()";
   for (int i = 0; i < request->benchmark_size(); ++i) {
+    const File& program = request->benchmark(i).program();
+    if (program.data_case() == File::DATA_NOT_SET && !program.sha256().empty() &&
+        !benchmarks().hasContents(program.sha256())) {
+      return grpc::Status(grpc::StatusCode::NOT_FOUND,
+                          fmt::format("Benchmark contents not found: {}", program.sha256()));
+    }
     benchmarks().add(std::move(request->benchmark(i)));
   }
 
   return grpc::Status::OK;
 }
 
+template <typename CompilationSessionType>
+grpc::Status CompilerGymService<CompilationSessionType>::AddBenchmarkStream(
+    grpc::ServerContext* context, grpc::ServerReader<AddBenchmarkChunk>* reader,
+    AddBenchmarkReply* reply) {
+  Benchmark benchmark;
+  std::string contents;
+  AddBenchmarkChunk chunk;
+  for (int i = 0; reader->Read(&chunk); ++i) {
+    if (!i) {
+      benchmark = std::move(*chunk.mutable_benchmark());
+    }
+    contents.append(chunk.contents());
+  }
+  if (benchmark.uri().empty()) {
+    return grpc::Status(grpc::StatusCode::INVALID_ARGUMENT,
+                        "No benchmark URI set for AddBenchmarkStream()");
+  }
+  VLOG(2) << "AddBenchmarkStream(" << benchmark.uri() << ", " << contents.size() << " bytes)";
+  benchmark.mutable_program()->set_contents(std::move(contents));
+
+  // We need to grab the sessions lock here to ensure thread safe access to the
+  // benchmarks cache.
+  const std::lock_guard<std::mutex> lock(sessionsMutex_);
+  benchmarks().add(std::move(benchmark));
+
+  return grpc::Status::OK;
+}
+
 template <typename CompilationSessionType>
 grpc::Status CompilerGymService<CompilationSessionType>::SendSessionParameter(
     grpc::ServerContext* context, const SendSessionParameterRequest* request,
@@ -215,7 +428,8 @@ grpc::Status CompilerGymService<CompilationSessionType>::SendSessionParameter(
 
     // Use the builtin parameter handlers if not handled by a session.
     if (!message.has_value()) {
-      RETURN_IF_ERROR(handleBuiltinSessionParameter(param.key(), param.value(), message));
+      RETURN_IF_ERROR(handleBuiltinSessionParameter(request->session_id(), param.key(),
+                                                    param.value(), message));
     }
 
     if (message.has_value()) {
@@ -231,7 +445,8 @@ grpc::Status CompilerGymService<CompilationSessionType>::SendSessionParameter(
 
 template <typename CompilationSessionType>
 grpc::Status CompilerGymService<CompilationSessionType>::handleBuiltinSessionParameter(
-    const std::string& key, const std::string& value, std::optional<std::string>& reply) {
+    uint64_t sessionId, const std::string& key, const std::string& value,
+    std::optional<std::string>& reply) {
   if (key == "service.benchmark_cache.set_max_size_in_bytes") {
     benchmarks().setMaxSizeInBytes(std::stoi(value));
     reply = value;
@@ -239,6 +454,9 @@ grpc::Status CompilerGymService<CompilationSessionType>::handleBuiltinSessionPar
     reply = fmt::format("{}", benchmarks().maxSizeInBytes());
   } else if (key == "service.benchmark_cache.get_size_in_bytes") {
     reply = fmt::format("{}", benchmarks().sizeInBytes());
+  } else if (key == "service.get_step_timing_histograms") {
+    const std::lock_guard<std::mutex> lock(sessionsMutex_);
+    reply = stepTimings_[sessionId].toJson();
   }
 
   return grpc::Status::OK;
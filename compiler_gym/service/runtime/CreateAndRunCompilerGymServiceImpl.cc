@@ -10,6 +10,8 @@ DEFINE_string(
 DEFINE_string(port, "0",
               "The port to listen on. If 0, an unused port will be selected. The selected port is "
               "written to <working_dir>/port.txt.");
+DEFINE_int32(rpc_service_threads, 0,
+             "The maximum number of server worker threads. If 0, the gRPC default is used.");
 
 namespace compiler_gym::runtime {
 
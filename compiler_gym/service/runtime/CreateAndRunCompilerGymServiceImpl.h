@@ -10,6 +10,7 @@
 #include <gflags/gflags.h>
 #include <glog/logging.h>
 #include <grpcpp/grpcpp.h>
+#include <grpcpp/resource_quota.h>
 #include <unistd.h>
 
 #include <csignal>
@@ -22,6 +23,7 @@
 #include "compiler_gym/service/proto/compiler_gym_service.pb.h"
 #include "compiler_gym/service/runtime/CompilerGymService.h"
 
+DECLARE_int32(rpc_service_threads);
 DECLARE_string(port);
 DECLARE_string(working_dir);
 
@@ -89,6 +91,13 @@ template <typename CompilationSessionType>
 
   builder.SetMaxMessageSize(kMaxMessageSizeInBytes);
 
+  // Limit the number of threads used to handle RPC calls.
+  if (FLAGS_rpc_service_threads > 0) {
+    grpc::ResourceQuota quota;
+    quota.SetMaxThreads(FLAGS_rpc_service_threads);
+    builder.SetResourceQuota(quota);
+  }
+
   // Start a channel on the port.
   int port;
   std::string serverAddress = "0.0.0.0:" + (FLAGS_port.empty() ? "0" : FLAGS_port);
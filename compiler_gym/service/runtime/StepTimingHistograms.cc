@@ -0,0 +1,73 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#include "compiler_gym/service/runtime/StepTimingHistograms.h"
+
+#include <fmt/format.h>
+
+namespace compiler_gym::runtime {
+
+void DurationHistogram::add(int64_t micros) {
+  size_t bucket = 0;
+  for (int64_t n = micros; n > 1; n >>= 1) {
+    ++bucket;
+  }
+  if (buckets_.size() <= bucket) {
+    buckets_.resize(bucket + 1, 0);
+  }
+  ++buckets_[bucket];
+  ++count_;
+  sumMicros_ += micros;
+}
+
+std::string DurationHistogram::toJson() const {
+  return fmt::format("{{\"count\": {}, \"sum_micros\": {}, \"buckets\": [{}]}}", count_,
+                     sumMicros_, fmt::join(buckets_, ", "));
+}
+
+void StepTimingHistograms::add(const StepRequest& request,
+                               const std::vector<std::string>& observationSpaces,
+                               const StepTimings& timings) {
+  total_.add(timings.total_micros());
+  endOfStep_.add(timings.end_of_step_micros());
+
+  // Actions are applied in order: first the action messages, then the packed
+  // actions. Fewer actions may have been applied than requested if the episode
+  // ended.
+  for (int i = 0; i < timings.action_micros_size(); ++i) {
+    int index;
+    if (i < request.action_size()) {
+      const auto& action = request.action(i);
+      index = action.choice_size() ? action.choice(0).named_discrete_value_index() : -1;
+    } else {
+      index = request.packed_action(i - request.action_size());
+    }
+    actions_[index].add(timings.action_micros(i));
+  }
+
+  for (int i = 0; i < timings.observation_micros_size(); ++i) {
+    observations_[observationSpaces[i]].add(timings.observation_micros(i));
+  }
+}
+
+namespace {
+
+template <typename Key>
+std::string mapToJson(const std::map<Key, DurationHistogram>& histograms) {
+  std::vector<std::string> items;
+  for (const auto& [key, histogram] : histograms) {
+    items.push_back(fmt::format("\"{}\": {}", key, histogram.toJson()));
+  }
+  return fmt::format("{{{}}}", fmt::join(items, ", "));
+}
+
+}  // anonymous namespace
+
+std::string StepTimingHistograms::toJson() const {
+  return fmt::format(
+      "{{\"total\": {}, \"end_of_step\": {}, \"actions\": {}, \"observations\": {}}}",
+      total_.toJson(), endOfStep_.toJson(), mapToJson(actions_), mapToJson(observations_));
+}
+
+}  // namespace compiler_gym::runtime
@@ -0,0 +1,73 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#pragma once
+
+#include <cstdint>
+#include <map>
+#include <string>
+#include <vector>
+
+#include "compiler_gym/service/proto/compiler_gym_service.pb.h"
+
+namespace compiler_gym::runtime {
+
+/**
+ * A histogram of durations using power-of-two buckets.
+ *
+ * Bucket `i` counts the durations in the range [2^i, 2^(i+1)) microseconds.
+ * Durations of less than one microsecond are counted in the first bucket.
+ */
+class DurationHistogram {
+ public:
+  void add(int64_t micros);
+
+  inline int64_t count() const { return count_; }
+
+  inline int64_t sumMicros() const { return sumMicros_; }
+
+  inline const std::vector<int64_t>& buckets() const { return buckets_; }
+
+  /**
+   * Format the histogram as a JSON object.
+   */
+  std::string toJson() const;
+
+ private:
+  int64_t count_{0};
+  int64_t sumMicros_{0};
+  std::vector<int64_t> buckets_;
+};
+
+/**
+ * Aggregate histograms of the step timings of a session.
+ */
+class StepTimingHistograms {
+ public:
+  /**
+   * Record the timings of a step.
+   *
+   * @param request The step request.
+   * @param observationSpaces The observation spaces that were computed, in
+   *    the order that they were requested.
+   * @param timings The timings of the step.
+   */
+  void add(const StepRequest& request, const std::vector<std::string>& observationSpaces,
+           const StepTimings& timings);
+
+  /**
+   * Format the histograms as a JSON object with keys "total", "end_of_step",
+   * "actions", and "observations". Actions are keyed by the index of the
+   * action, and observations are keyed by the name of the observation space.
+   */
+  std::string toJson() const;
+
+ private:
+  DurationHistogram total_;
+  DurationHistogram endOfStep_;
+  std::map<int, DurationHistogram> actions_;
+  std::map<std::string, DurationHistogram> observations_;
+};
+
+}  // namespace compiler_gym::runtime
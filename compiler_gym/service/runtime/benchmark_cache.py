@@ -7,7 +7,7 @@ from typing import Dict, Optional
 
 import numpy as np
 
-from compiler_gym.service.proto import Benchmark
+from compiler_gym.service.proto import Benchmark, File
 
 MAX_SIZE_IN_BYTES = 512 * 104 * 1024
 
@@ -20,6 +20,11 @@ class BenchmarkCache:
     This object caches Benchmark messages by URI. Once the cache reaches a
     predetermined size, benchmarks are evicted randomly until the capacity is
     reduced to 50%.
+
+    Program contents that are added with a SHA-256 digest are stored once per
+    digest and shared by every benchmark that has the same contents. A
+    benchmark may be added with only the digest of its program contents, in
+    which case the contents must already be in the cache.
     """
 
     def __init__(
@@ -30,7 +35,11 @@ class BenchmarkCache:
         self._max_size_in_bytes = max_size_in_bytes
         self.rng = rng or np.random.default_rng()
 
+        # Benchmarks keyed by URI. The program contents of benchmarks that have
+        # a SHA-256 digest are removed and stored in _contents.
         self._benchmarks: Dict[str, Benchmark] = {}
+        self._contents: Dict[str, bytes] = {}
+        self._contents_ref_counts: Dict[str, int] = {}
         self._size_in_bytes = 0
 
     def __getitem__(self, uri: str) -> Benchmark:
@@ -38,21 +47,56 @@ class BenchmarkCache:
         item = self._benchmarks.get(uri)
         if item is None:
             raise KeyError(uri)
+        if _is_contents_reference(item.program):
+            benchmark = Benchmark()
+            benchmark.CopyFrom(item)
+            benchmark.program.contents = self._contents[item.program.sha256]
+            return benchmark
         return item
 
     def __contains__(self, uri: str):
         """Whether URI is in cache."""
         return uri in self._benchmarks
 
+    def has_contents(self, sha256: str) -> bool:
+        """Whether program contents with the given SHA-256 digest are in the
+        cache.
+        """
+        return sha256 in self._contents
+
     def __setitem__(self, uri: str, benchmark: Benchmark):
-        """Add benchmark to cache."""
+        """Add benchmark to cache. Raises KeyError if the benchmark program
+        refers to contents that are not in the cache.
+        """
+        program = benchmark.program
+        is_hashed = program.sha256 and program.WhichOneof("data") != "uri"
+
+        # Acquire a reference to the program contents before removing any
+        # existing value, which may hold the only other reference.
+        contents_size = 0
+        if is_hashed:
+            if program.sha256 not in self._contents:
+                if _is_contents_reference(program):
+                    raise KeyError(f"Benchmark contents not found: {program.sha256}")
+                self._contents[program.sha256] = program.contents
+                self._contents_ref_counts[program.sha256] = 0
+                contents_size = len(program.contents)
+                self._size_in_bytes += contents_size
+            self._contents_ref_counts[program.sha256] += 1
+
+            # Strip the program contents from hashed benchmarks.
+            stripped = Benchmark(uri=benchmark.uri, program=File(sha256=program.sha256))
+            if benchmark.HasField("dynamic_config"):
+                stripped.dynamic_config.CopyFrom(benchmark.dynamic_config)
+            benchmark = stripped
+
         # Remove any existing value to keep the cache size consistent.
         if uri in self._benchmarks:
-            self._size_in_bytes -= self._benchmarks[uri].ByteSize()
-            del self._benchmarks[uri]
+            self._remove(uri)
 
-        size = benchmark.ByteSize()
-        if self.size_in_bytes + size > self.max_size_in_bytes:
+        entry_size = benchmark.ByteSize()
+        size = entry_size + contents_size
+        if self.size_in_bytes + entry_size > self.max_size_in_bytes:
             if size > self.max_size_in_bytes:
                 logger.warning(
                     "Adding new benchmark with size %d bytes exceeds total "
@@ -71,7 +115,7 @@ class BenchmarkCache:
             self.evict_to_capacity()
 
         self._benchmarks[uri] = benchmark
-        self._size_in_bytes += size
+        self._size_in_bytes += entry_size
 
         logger.debug(
             "Cached benchmark %s. Cache size = %d bytes, %d items",
@@ -92,8 +136,7 @@ class BenchmarkCache:
         while self.size and self.size_in_bytes > target_size_in_bytes:
             evicted += 1
             key = self.rng.choice(list(self._benchmarks.keys()))
-            self._size_in_bytes -= self._benchmarks[key].ByteSize()
-            del self._benchmarks[key]
+            self._remove(key)
 
         if evicted:
             logger.info(
@@ -104,6 +147,17 @@ class BenchmarkCache:
                 self.size,
             )
 
+    def _remove(self, uri: str) -> None:
+        """Remove a benchmark, releasing its program contents."""
+        benchmark = self._benchmarks.pop(uri)
+        self._size_in_bytes -= benchmark.ByteSize()
+        sha256 = benchmark.program.sha256
+        if _is_contents_reference(benchmark.program):
+            self._contents_ref_counts[sha256] -= 1
+            if not self._contents_ref_counts[sha256]:
+                self._size_in_bytes -= len(self._contents.pop(sha256))
+                del self._contents_ref_counts[sha256]
+
     @property
     def size(self) -> int:
         """The number of items in the cache."""
@@ -112,7 +166,8 @@ class BenchmarkCache:
     @property
     def size_in_bytes(self) -> int:
         """The combined size of the elements in the cache, excluding the
-        cache overhead.
+        cache overhead. Program contents that are shared by multiple benchmarks
+        are counted once.
         """
         return self._size_in_bytes
 
@@ -126,3 +181,10 @@ class BenchmarkCache:
         """Set a new maximum cache size."""
         self._max_size_in_bytes = value
         self.evict_to_capacity(target_size_in_bytes=value)
+
+
+def _is_contents_reference(program: File) -> bool:
+    """Whether a program refers to contents by SHA-256 digest, without the
+    contents.
+    """
+    return bool(program.sha256) and program.WhichOneof("data") is None
@@ -2,22 +2,36 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from multiprocessing import cpu_count
 from pathlib import Path
 from threading import Lock
-from typing import Dict, Optional
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, Optional
 
 from grpc import StatusCode
 
 from compiler_gym.service.compilation_session import CompilationSession
-from compiler_gym.service.proto import AddBenchmarkReply, AddBenchmarkRequest
+from compiler_gym.service.proto import (
+    Action,
+    AddBenchmarkChunk,
+    AddBenchmarkReply,
+    AddBenchmarkRequest,
+    Benchmark,
+    Choice,
+)
 from compiler_gym.service.proto import (
     CompilerGymServiceServicer as CompilerGymServiceServicerStub,
 )
 from compiler_gym.service.proto import (
     EndSessionReply,
     EndSessionRequest,
+    ExpandSessionCandidate,
+    ExpandSessionReply,
+    ExpandSessionRequest,
     GetSpacesReply,
     GetSpacesRequest,
     GetVersionReply,
@@ -27,9 +41,13 @@ from compiler_gym.service.proto import (
     StartSessionReply,
     StartSessionRequest,
     StepReply,
+    StepReplyChunk,
     StepRequest,
+    StepTimings,
 )
 from compiler_gym.service.runtime.benchmark_cache import BenchmarkCache
+from compiler_gym.service.runtime.step_timing_histograms import StepTimingHistograms
+from compiler_gym.service.step_stream import step_reply_chunks
 from compiler_gym.util.version import __version__
 
 logger = logging.getLogger(__name__)
@@ -39,6 +57,20 @@ logger = logging.getLogger(__name__)
 # pragma: no cover" annotation for all definitions in this file.
 
 
+def _is_unknown_contents(  # pragma: no cover
+    benchmarks: BenchmarkCache, benchmark: Benchmark
+) -> bool:
+    """Whether a benchmark program refers to contents by SHA-256 digest that
+    are not in the cache.
+    """
+    program = benchmark.program
+    return (
+        bool(program.sha256)
+        and program.WhichOneof("data") is None
+        and not benchmarks.has_contents(program.sha256)
+    )
+
+
 @contextmanager
 def exception_to_grpc_status(context):  # pragma: no cover
     def handle_exception_as(exception, code):
@@ -63,6 +95,21 @@ def exception_to_grpc_status(context):  # pragma: no cover
         handle_exception_as(e, StatusCode.INTERNAL)
 
 
+class _StatusRecordingContext:  # pragma: no cover
+    """Wraps a servicer context to record whether an error code was set."""
+
+    def __init__(self, context):
+        self._context = context
+        self.code: Optional[StatusCode] = None
+
+    def set_code(self, code: StatusCode) -> None:
+        self.code = code
+        self._context.set_code(code)
+
+    def __getattr__(self, name: str):
+        return getattr(self._context, name)
+
+
 class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
     def __init__(self, working_directory: Path, compilation_session_type):
         """Constructor.
@@ -78,8 +125,15 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
 
         self.compilation_session_type = compilation_session_type
         self.sessions: Dict[int, CompilationSession] = {}
+        self.step_timings: Dict[int, StepTimingHistograms] = {}
         self.sessions_lock = Lock()
         self.next_session_id: int = 0
+        # The workers that apply the candidate actions of ExpandSession(). The
+        # pool is shared by all requests so that the number of threads is
+        # bounded.
+        self.expand_session_executor = ThreadPoolExecutor(
+            max_workers=cpu_count(), thread_name_prefix="ExpandSession"
+        )
 
         self.action_spaces = compilation_session_type.action_spaces
         self.observation_spaces = compilation_session_type.observation_spaces
@@ -100,6 +154,7 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
             return GetSpacesReply(
                 action_space_list=self.action_spaces,
                 observation_space_list=self.observation_spaces,
+                supports_packed_action=True,
             )
 
     def StartSession(self, request: StartSessionRequest, context) -> StartSessionReply:
@@ -118,8 +173,13 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
             return reply
 
         with self.sessions_lock, exception_to_grpc_status(context):
-            # If a benchmark definition was provided, add it.
+            # If a benchmark definition was provided, add it. The program may
+            # refer to contents that were previously sent by SHA-256 digest.
             if request.benchmark.HasField("program"):
+                if _is_unknown_contents(self.benchmarks, request.benchmark):
+                    context.set_code(StatusCode.NOT_FOUND)
+                    context.set_details("Benchmark contents not found")
+                    return reply
                 self.benchmarks[request.benchmark.uri] = request.benchmark
 
             # Lookup the requested benchmark.
@@ -159,6 +219,7 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
         with self.sessions_lock:
             if request.session_id in self.sessions:
                 del self.sessions[request.session_id]
+            self.step_timings.pop(request.session_id, None)
             return EndSessionReply(remaining_sessions=len(self.sessions))
 
     def Step(self, request: StepRequest, context) -> StepReply:
@@ -173,31 +234,142 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
         session = self.sessions[request.session_id]
 
         reply.action_had_no_effect = True
+        step_start = perf_counter()
+        timings = StepTimings()
+        observation_spaces = []
+
+        def apply_action(action):
+            action_start = perf_counter()
+            reply.end_of_session, nas, ahne = session.apply_action(action)
+            timings.action_micros.append(int((perf_counter() - action_start) * 1e6))
+            reply.action_had_no_effect &= ahne
+            if nas:
+                reply.new_action_space.CopyFrom(nas)
 
         with exception_to_grpc_status(context):
             for action in request.action:
-                reply.end_of_session, nas, ahne = session.apply_action(action)
-                reply.action_had_no_effect &= ahne
-                if nas:
-                    reply.new_action_space.CopyFrom(nas)
+                apply_action(action)
+
+            # Apply the packed actions. A single Action message is reused for
+            # every action rather than constructing one per action.
+            if request.packed_action and not reply.end_of_session:
+                action = Action(choice=[Choice()])
+                for index in request.packed_action:
+                    action.choice[0].named_discrete_value_index = index
+                    apply_action(action)
+                    if reply.end_of_session:
+                        break
+
+            for obs in request.observation_space:
+                observation_space = self.observation_spaces[obs]
+                observation_start = perf_counter()
+                reply.observation.append(session.get_observation(observation_space))
+                timings.observation_micros.append(
+                    int((perf_counter() - observation_start) * 1e6)
+                )
+                observation_spaces.append(observation_space.name)
+
+            timings.total_micros = int((perf_counter() - step_start) * 1e6)
+            # Hold the sessions lock so that a concurrent EndSession() cannot
+            # pop the histograms between the membership check and the insert,
+            # which would leak the histograms of a dead session.
+            with self.sessions_lock:
+                if request.session_id in self.sessions:
+                    self.step_timings.setdefault(
+                        request.session_id, StepTimingHistograms()
+                    ).add(request, observation_spaces, timings)
+            if request.record_timings:
+                reply.timings.CopyFrom(timings)
 
-            reply.observation.extend(
-                [
-                    session.get_observation(self.observation_spaces[obs])
-                    for obs in request.observation_space
-                ]
+        return reply
+
+    def StepStream(self, request: StepRequest, context) -> Iterator[StepReplyChunk]:
+        logger.debug("StepStream()")
+        context = _StatusRecordingContext(context)
+        reply = self.Step(request, context)
+        # On error the reply is empty or incomplete, so nothing is streamed and
+        # the client receives only the status.
+        if context.code not in {None, StatusCode.OK}:
+            return
+        yield from step_reply_chunks(reply)
+
+    def ExpandSession(
+        self, request: ExpandSessionRequest, context
+    ) -> ExpandSessionReply:
+        logger.debug("ExpandSession(%d candidates)", len(request.packed_action))
+        reply = ExpandSessionReply()
+
+        if request.session_id not in self.sessions:
+            context.set_code(StatusCode.NOT_FOUND)
+            context.set_details(f"Session not found: {request.session_id}")
+            return reply
+
+        session = self.sessions[request.session_id]
+        observation_spaces = [
+            self.observation_spaces[obs] for obs in request.observation_space
+        ]
+
+        def expand_candidate(candidate: CompilationSession, index: int):
+            action = Action(choice=[Choice(named_discrete_value_index=index)])
+            end_of_session, _, action_had_no_effect = candidate.apply_action(action)
+            return ExpandSessionCandidate(
+                end_of_session=end_of_session,
+                action_had_no_effect=action_had_no_effect,
+                observation=[
+                    candidate.get_observation(space) for space in observation_spaces
+                ],
+            )
+
+        with exception_to_grpc_status(context):
+            # Fork a copy of the session for every candidate. This reads the
+            # state of the session, so is done serially.
+            candidates = [session.fork() for _ in request.packed_action]
+            reply.candidate.extend(
+                self.expand_session_executor.map(
+                    expand_candidate, candidates, request.packed_action
+                )
             )
 
         return reply
 
     def AddBenchmark(self, request: AddBenchmarkRequest, context) -> AddBenchmarkReply:
-        del context  # Unused
         reply = AddBenchmarkReply()
         with self.sessions_lock:
             for benchmark in request.benchmark:
+                if _is_unknown_contents(self.benchmarks, benchmark):
+                    context.set_code(StatusCode.NOT_FOUND)
+                    context.set_details(
+                        f"Benchmark contents not found: {benchmark.program.sha256}"
+                    )
+                    return reply
                 self.benchmarks[benchmark.uri] = benchmark
         return reply
 
+    def AddBenchmarkStream(
+        self, request_iterator: Iterable[AddBenchmarkChunk], context
+    ) -> AddBenchmarkReply:
+        reply = AddBenchmarkReply()
+        benchmark = Benchmark()
+        contents = []
+        for i, chunk in enumerate(request_iterator):
+            if not i:
+                benchmark.CopyFrom(chunk.benchmark)
+            contents.append(chunk.contents)
+        if not benchmark.uri:
+            context.set_code(StatusCode.INVALID_ARGUMENT)
+            context.set_details("No benchmark URI set for AddBenchmarkStream()")
+            return reply
+        benchmark.program.contents = b"".join(contents)
+        logger.debug(
+            "AddBenchmarkStream(%s, %d bytes)",
+            benchmark.uri,
+            len(benchmark.program.contents),
+        )
+
+        with self.sessions_lock:
+            self.benchmarks[benchmark.uri] = benchmark
+        return reply
+
     def SendSessionParameter(
         self, request: SendSessionParameterRequest, context
     ) -> SendSessionParameterReply:
@@ -218,7 +390,7 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
                 # Use the builtin parameter handlers if not handled by a session.
                 if message is None:
                     message = self._handle_builtin_session_parameter(
-                        param.key, param.value
+                        request.session_id, param.key, param.value
                     )
 
                 if message is None:
@@ -229,9 +401,13 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
 
         return reply
 
-    def _handle_builtin_session_parameter(self, key: str, value: str) -> Optional[str]:
+    def _handle_builtin_session_parameter(
+        self, session_id: int, key: str, value: str
+    ) -> Optional[str]:
         """Handle a built-in session parameter.
 
+        :param session_id: The ID of the session.
+
         :param key: The parameter key.
 
         :param value: The parameter value.
@@ -246,5 +422,9 @@ class CompilerGymService(CompilerGymServiceServicerStub):  # pragma: no cover
             return str(self.benchmarks.max_size_in_bytes)
         elif key == "service.benchmark_cache.get_size_in_bytes":
             return str(self.benchmarks.size_in_bytes)
+        elif key == "service.get_step_timing_histograms":
+            with self.sessions_lock:
+                histograms = self.step_timings.get(session_id, StepTimingHistograms())
+                return json.dumps(histograms.to_json())
 
         return None
@@ -0,0 +1,94 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Aggregate histograms of the step timings of a compilation session."""
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from compiler_gym.service.proto import StepRequest, StepTimings
+
+
+class DurationHistogram:
+    """A histogram of durations using power-of-two buckets.
+
+    Bucket :code:`i` counts the durations in the range :code:`[2^i, 2^(i+1))`
+    microseconds. Durations of less than one microsecond are counted in the
+    first bucket.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum_micros = 0
+        self.buckets: List[int] = []
+
+    def add(self, micros: int) -> None:
+        bucket = max(micros, 1).bit_length() - 1
+        if len(self.buckets) <= bucket:
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.sum_micros += micros
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum_micros": self.sum_micros,
+            "buckets": self.buckets,
+        }
+
+
+class StepTimingHistograms:
+    """Aggregate histograms of the step timings of a session."""
+
+    def __init__(self):
+        self.total = DurationHistogram()
+        self.end_of_step = DurationHistogram()
+        self.actions: Dict[int, DurationHistogram] = defaultdict(DurationHistogram)
+        self.observations: Dict[str, DurationHistogram] = defaultdict(DurationHistogram)
+
+    def add(
+        self,
+        request: StepRequest,
+        observation_spaces: List[str],
+        timings: StepTimings,
+    ) -> None:
+        """Record the timings of a step.
+
+        :param request: The step request.
+
+        :param observation_spaces: The names of the observation spaces that
+            were computed, in the order that they were requested.
+
+        :param timings: The timings of the step.
+        """
+        self.total.add(timings.total_micros)
+        self.end_of_step.add(timings.end_of_step_micros)
+
+        # Actions are applied in order: first the action messages, then the
+        # packed actions. Fewer actions may have been applied than requested if
+        # the episode ended.
+        indices = [
+            action.choice[0].named_discrete_value_index if action.choice else -1
+            for action in request.action
+        ] + list(request.packed_action)
+        for index, micros in zip(indices, timings.action_micros):
+            self.actions[index].add(micros)
+
+        for name, micros in zip(observation_spaces, timings.observation_micros):
+            self.observations[name].add(micros)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return the histograms as a JSON-serializable dictionary with keys
+        "total", "end_of_step", "actions", and "observations". Actions are
+        keyed by the index of the action, and observations are keyed by the name
+        of the observation space.
+        """
+        return {
+            "total": self.total.to_json(),
+            "end_of_step": self.end_of_step.to_json(),
+            "actions": {str(k): v.to_json() for k, v in sorted(self.actions.items())},
+            "observations": {
+                k: v.to_json() for k, v in sorted(self.observations.items())
+            },
+        }
@@ -0,0 +1,266 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Helpers for sending and receiving the chunks of a StepStream() reply.
+
+A StepStream() reply is a sequence of :code:`StepReplyChunk` messages. The
+first chunk contains the :code:`StepReply`, with the values of string, binary,
+and packed array observations removed, and the sizes of those values. The
+values follow in subsequent chunks, in order of observation index. The service
+splits a reply using :func:`step_reply_chunks`, and the client reads it using
+:class:`StepReplyStream`.
+"""
+import io
+import os
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from compiler_gym.service.connection import ServiceError
+from compiler_gym.service.proto import Observation, StepReply, StepReplyChunk
+
+# The maximum size of the observation data in a single chunk.
+CHUNK_SIZE_IN_BYTES = 4 * 1024 * 1024
+
+# The observation value fields that are streamed.
+_STREAMED_FIELDS = {"string_value", "binary_value", "packed_array"}
+
+
+def step_reply_chunks(
+    reply: StepReply, chunk_size: int = CHUNK_SIZE_IN_BYTES
+) -> Iterator[StepReplyChunk]:
+    """Split a reply into the chunks of a StepStream() reply.
+
+    The streamed observation values are moved out of the reply, which is
+    modified in place.
+
+    :param reply: A Step() reply.
+
+    :param chunk_size: The maximum size of the observation data in a chunk.
+
+    :return: An iterator over chunks.
+    """
+    values: List[bytes] = []
+    for observation in reply.observation:
+        field = observation.WhichOneof("value")
+        if field == "string_value":
+            values.append(observation.string_value.encode("utf-8"))
+            observation.string_value = ""
+        elif field == "binary_value":
+            values.append(observation.binary_value)
+            observation.binary_value = b""
+        elif field == "packed_array":
+            values.append(observation.packed_array.data)
+            observation.packed_array.data = b""
+        else:
+            values.append(b"")
+
+    yield StepReplyChunk(
+        reply=reply, observation_size_in_bytes=[len(value) for value in values]
+    )
+    for i, value in enumerate(values):
+        for start in range(0, len(value), chunk_size):
+            yield StepReplyChunk(
+                observation_index=i, data=value[start : start + chunk_size]
+            )
+
+
+class _PackedArray(NamedTuple):
+    dtype: str
+    shape: List[int]
+    data: bytearray
+
+
+class StreamedObservation:
+    """An observation whose value was received in chunks.
+
+    This provides the subset of the :code:`Observation` message interface that
+    is used to translate observations, so that it can be passed to
+    :meth:`ObservationSpaceSpec.translate()
+    <compiler_gym.views.ObservationSpaceSpec.translate>`. Binary values and
+    packed array data are views of the received buffer, so decoding a packed
+    array does not copy the data.
+    """
+
+    def __init__(self, observation: Observation, data: bytearray):
+        self._observation = observation
+        self._data = data
+
+    def WhichOneof(self, oneof_group: str) -> Optional[str]:
+        return self._observation.WhichOneof(oneof_group)
+
+    @property
+    def string_value(self) -> str:
+        return self._data.decode("utf-8")
+
+    @property
+    def binary_value(self) -> memoryview:
+        return memoryview(self._data)
+
+    @property
+    def packed_array(self) -> _PackedArray:
+        packed = self._observation.packed_array
+        return _PackedArray(
+            dtype=packed.dtype, shape=list(packed.shape), data=self._data
+        )
+
+
+class _ChunkReader(io.RawIOBase):
+    """A raw binary stream over the data of a sequence of chunks."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        super().__init__()
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            data = next(self._chunks, None)
+            if data is None:
+                return 0
+            self._buffer = memoryview(data)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class StepReplyStream:
+    """A reader for the chunks of a StepStream() reply.
+
+    Chunks are received lazily as observation values are read. Observations
+    must be read in order of increasing index, and each observation can be read
+    only once. The data of any observations that are skipped is discarded.
+
+    :ivar reply: The reply, in which the values of streamed observations are
+        empty.
+
+    :vartype reply: StepReply
+
+    :ivar observation_size_in_bytes: The size of the value of each observation
+        in the reply.
+
+    :vartype observation_size_in_bytes: List[int]
+    """
+
+    def __init__(self, chunks: Iterable[StepReplyChunk]):
+        """Constructor.
+
+        :param chunks: The chunks of a StepStream() reply.
+
+        :raises ServiceError: If the stream is empty.
+        """
+        self._chunks = iter(chunks)
+        header = next(self._chunks, None)
+        if header is None:
+            raise ServiceError("StepStream() returned no reply")
+        self.reply: StepReply = header.reply
+        self.observation_size_in_bytes: List[int] = list(
+            header.observation_size_in_bytes
+        )
+        self._next_index = 0
+        # A chunk that was received while reading an earlier observation.
+        self._pending: Optional[StepReplyChunk] = None
+
+    def _observation_chunks(self, index: int) -> Iterator[bytes]:
+        if index < self._next_index:
+            raise ValueError(f"Observation {index} has already been read")
+        self._next_index = index + 1
+        return self._read_chunks(index)
+
+    def _read_chunks(self, index: int) -> Iterator[bytes]:
+        while True:
+            chunk = self._pending or next(self._chunks, None)
+            self._pending = None
+            if chunk is None:
+                return
+            if chunk.observation_index > index:
+                self._pending = chunk
+                return
+            if chunk.observation_index == index:
+                yield chunk.data
+
+    def open(self, index: int) -> io.BufferedReader:
+        """Open the value of an observation as a binary file.
+
+        The file reads the value incrementally as chunks are received. Reading
+        the last observation of the reply to the end of the file receives the
+        end of the stream, raising any error that the service reported. For
+        string observations, wrap the file in an :code:`io.TextIOWrapper` to
+        read text:
+
+            >>> with io.TextIOWrapper(stream.open(0), encoding="utf-8") as f:
+            ...     for line in f:
+            ...         pass
+
+        If the service transferred the value through shared memory, the shared
+        memory file is opened and removed instead.
+
+        :param index: The index of the observation in the reply.
+
+        :return: A file object.
+        """
+        observation = self.reply.observation[index]
+        if observation.WhichOneof("value") == "shared_memory_path":
+            self._observation_chunks(index)  # Mark the observation as read.
+            f = open(observation.shared_memory_path, "rb")
+            os.unlink(observation.shared_memory_path)
+            return f
+        return io.BufferedReader(_ChunkReader(self._observation_chunks(index)))
+
+    def read(self, index: int) -> bytearray:
+        """Read the value of an observation into a single buffer.
+
+        The buffer is allocated once, at its final size, and the chunks are
+        copied into it as they are received.
+
+        :param index: The index of the observation in the reply.
+
+        :return: The observation value.
+
+        :raises ServiceError: If the size of the received value does not match
+            the size in the reply.
+        """
+        size = self.observation_size_in_bytes[index]
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        offset = 0
+        for data in self._observation_chunks(index):
+            if offset + len(data) > size:
+                raise ServiceError(f"Received more than {size} bytes for observation")
+            view[offset : offset + len(data)] = data
+            offset += len(data)
+        if offset != size:
+            raise ServiceError(f"Received {offset} of {size} bytes for observation")
+        return buffer
+
+    def observations(self) -> List[Union[Observation, StreamedObservation]]:
+        """Read the value of every observation.
+
+        The stream is received to the end, so that an error that the service
+        reports after sending the values is raised.
+
+        :return: A list of observations, in the order of the reply.
+        """
+        observations = []
+        for i, observation in enumerate(self.reply.observation):
+            if observation.WhichOneof("value") in _STREAMED_FIELDS:
+                observations.append(StreamedObservation(observation, self.read(i)))
+            else:
+                observations.append(observation)
+        self.drain()
+        return observations
+
+    def drain(self) -> None:
+        """Receive and discard the remaining chunks of the stream.
+
+        The status of the RPC is received with the end of the stream, so
+        draining the stream raises any error that the service reported after
+        sending the first chunk. No observations can be read afterwards.
+        """
+        self._next_index = len(self.reply.observation)
+        self._pending = None
+        for _ in self._chunks:
+            pass
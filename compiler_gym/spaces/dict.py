@@ -2,6 +2,8 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+from collections.abc import Mapping
+from typing import Any
 from typing import Dict as DictType
 from typing import List, Union
 
@@ -24,3 +26,15 @@ class Dict(GymDict):
         """
         super().__init__(spaces)
         self.name = name
+
+    def contains(self, x: Any) -> bool:
+        """Return whether a value is a member of this space.
+
+        In addition to :code:`dict` values, any read-only mapping is accepted,
+        such as the :class:`ArrayDictView
+        <compiler_gym.util.array_dict_view.ArrayDictView>` observations of the
+        LLVM environment.
+        """
+        if isinstance(x, Mapping) and not isinstance(x, dict):
+            x = dict(x)
+        return super().contains(x)
@@ -91,7 +91,12 @@ class Sequence(Space):
         # dtype=bytes, we expect this to be the type of the entire sequence. But
         # for dtype=int, we expect this to be the type of each element. We
         # should distinguish these differences better.
-        if self.dtype in {str, bytes}:
+        if self.dtype is bytes:
+            # Binary observations that are transferred through shared memory
+            # or streamed are views of a buffer rather than bytes objects.
+            if not isinstance(x, (bytes, bytearray, memoryview)):
+                return False
+        elif self.dtype is str:
             if not isinstance(x, self.dtype):
                 return False
         else:
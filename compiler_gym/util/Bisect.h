@@ -0,0 +1,41 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#pragma once
+
+#include <cstddef>
+
+namespace compiler_gym::util {
+
+/**
+ * Find the shortest prefix of a sequence that fails a test, by bisection.
+ *
+ * The sequence as a whole is assumed to fail, so the test is not run on the
+ * full sequence. If prefixes are not monotonic, i.e. a prefix can fail while a
+ * longer prefix passes, then the result is a failing prefix but not necessarily
+ * the shortest one.
+ *
+ * E.g., `findFirstFailingPrefix(5, [](size_t i) { return i >= 2; }) -> 2`.
+ *
+ * @param size The length of the sequence. Must be > 0.
+ * @param prefixFails A callback that takes the index of the last element of a
+ *    prefix and returns whether that prefix fails.
+ * @return The index of the last element of the shortest failing prefix.
+ */
+template <typename PrefixFails>
+size_t findFirstFailingPrefix(size_t size, PrefixFails prefixFails) {
+  size_t lo = 0;
+  size_t hi = size - 1;
+  while (lo < hi) {
+    const size_t mid = (lo + hi) / 2;
+    if (prefixFails(mid)) {
+      hi = mid;
+    } else {
+      lo = mid + 1;
+    }
+  }
+  return lo;
+}
+
+}  // namespace compiler_gym::util
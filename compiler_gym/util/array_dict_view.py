@@ -0,0 +1,61 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""A read-only mapping view of the elements of an array."""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+
+class ArrayDictView(Mapping):
+    """A read-only dictionary view of the elements of a one-dimensional array.
+
+    The view maps names to elements of the array using a name-to-index table
+    that may be shared between many views, so constructing a view is constant
+    time and does not copy the array. Values are looked up when accessed:
+
+        >>> index = {"a": 0, "b": 1}
+        >>> view = ArrayDictView(index, np.array([5, 10]))
+        >>> view["b"]
+        10
+        >>> dict(view)
+        {'a': 5, 'b': 10}
+
+    A view compares equal to any mapping with the same items, including a
+    :code:`dict`.
+    """
+
+    __slots__ = ("_index", "_array")
+
+    def __init__(self, index: Dict[str, int], array: np.ndarray):
+        """Constructor.
+
+        :param index: A table that maps each name to the index of its element
+            in the array. The table is not copied and must not be modified.
+
+        :param array: The array of values.
+        """
+        self._index = index
+        self._array = array
+
+    @property
+    def array(self) -> np.ndarray:
+        """The array of values that this view is backed by."""
+        return self._array
+
+    def __getitem__(self, key: str) -> Any:
+        return self._array[self._index[key]]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
@@ -3,9 +3,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 import hashlib
+import io
 import logging
+from contextlib import contextmanager
+from pathlib import Path
 from time import sleep
-from typing import List, Optional, Union
+from typing import BinaryIO, Iterator, List, Optional, Union
+from urllib.parse import unquote, urlparse
 
 import fasteners
 import requests
@@ -16,6 +20,11 @@ from compiler_gym.util.truncate import truncate
 
 logger = logging.getLogger(__name__)
 
+# The number of seconds to wait for the server to send data when streaming a
+# download, after which the read fails and is retried. This bounds the time
+# that a reader can block on a stalled connection.
+_STREAM_READ_TIMEOUT_SECONDS = 60
+
 
 class DownloadFailed(IOError):
     """Error thrown if a download fails."""
@@ -25,7 +34,25 @@ class TooManyRequests(DownloadFailed):
     """Error thrown by HTTP 429 response."""
 
 
+def _file_url_path(url: str) -> Optional[Path]:
+    """Return the local path of a :code:`file://` URL, or :code:`None` if the
+    URL is not a local file.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "file":
+        return None
+    return Path(unquote(parsed.path))
+
+
 def _get_url_data(url: str) -> bytes:
+    local_path = _file_url_path(url)
+    if local_path:
+        try:
+            with open(local_path, "rb") as f:
+                return f.read()
+        except OSError as e:
+            raise DownloadFailed(str(e)) from e
+
     try:
         req = requests.get(url)
     except IOError as e:
@@ -135,3 +162,285 @@ def download(
     else:
         with fasteners.InterProcessLock(cache_path("downloads/.lock")):
             return _download(urls, None, max_retries)
+
+
+class _DownloadStream(io.RawIOBase):
+    """A readable, non-seekable stream over the contents of a download.
+
+    The bytes are hashed as they are read. If a checksum is provided, the
+    bytes are also appended to a partial download file in the cache directory
+    so that an interrupted download can be resumed. When a partial download
+    exists, its contents are read first and the remainder of the file is
+    requested using an HTTP range request. Errors that occur part way through
+    the stream are retried from the current offset, rotating through the list
+    of URLs.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        sha256: Optional[str],
+        max_retries: int,
+        chunk_size: int,
+    ):
+        super().__init__()
+        self.urls = urls
+        self.sha256 = sha256
+        self.max_retries = max(max_retries, 1)
+        self.chunk_size = chunk_size
+        self.checksum = hashlib.sha256()
+        self.offset = 0
+        self.url = None
+        self._chunks: Optional[Iterator[bytes]] = None
+        self._closeable = None
+        self._reading_partial = False
+        self._partial = None
+        self._partial_path = None
+        self._buffer = b""
+        self._eof = False
+        self._failed_attempts = 0
+        self._url_index = 0
+
+        if sha256:
+            self._partial_path = cache_path(f"downloads/{sha256}.partial")
+            self._partial_path.parent.mkdir(parents=True, exist_ok=True)
+            if self._partial_path.is_file():
+                logger.info(
+                    "Resuming partial download of %s from %d bytes",
+                    sha256,
+                    self._partial_path.stat().st_size,
+                )
+                self._closeable = open(self._partial_path, "rb")
+                self._chunks = self._read_file_chunks(self._closeable)
+                self._reading_partial = True
+            self._partial = open(self._partial_path, "ab")
+
+    def readable(self) -> bool:
+        return True
+
+    def _read_file_chunks(self, f: BinaryIO) -> Iterator[bytes]:
+        return iter(lambda: f.read(self.chunk_size), b"")
+
+    def _close_source(self) -> None:
+        if self._closeable is not None:
+            self._closeable.close()
+            self._closeable = None
+        self._chunks = None
+
+    def _open_url(self) -> None:
+        """Open the next URL for reading from the current offset."""
+        self.url = self.urls[self._url_index % len(self.urls)]
+        self._url_index += 1
+        logger.info("Downloading %s from byte %d ...", self.url, self.offset)
+
+        local_path = _file_url_path(self.url)
+        if local_path:
+            try:
+                self._closeable = open(local_path, "rb")
+            except OSError as e:
+                raise DownloadFailed(str(e)) from e
+            self._closeable.seek(self.offset)
+            self._chunks = self._read_file_chunks(self._closeable)
+            return
+
+        headers = {"Range": f"bytes={self.offset}-"} if self.offset else {}
+        try:
+            response = requests.get(
+                self.url,
+                headers=headers,
+                stream=True,
+                timeout=_STREAM_READ_TIMEOUT_SECONDS,
+            )
+        except IOError as e:
+            # Re-cast an error raised by requests library to DownloadFailed type.
+            raise DownloadFailed(str(e)) from e
+
+        if response.status_code == 429:
+            response.close()
+            raise TooManyRequests("429 Too Many Requests")
+        elif response.status_code not in {200, 206}:
+            response.close()
+            raise DownloadFailed(
+                f"GET returned status code {response.status_code}: {self.url}"
+            )
+
+        self._closeable = response
+        self._chunks = response.iter_content(chunk_size=self.chunk_size)
+        if self.offset and response.status_code == 200:
+            # The server does not support range requests, so discard the
+            # prefix that has already been read.
+            self._chunks = self._skip_prefix(self._chunks, self.offset)
+
+    @staticmethod
+    def _skip_prefix(chunks: Iterator[bytes], n: int) -> Iterator[bytes]:
+        for chunk in chunks:
+            if n >= len(chunk):
+                n -= len(chunk)
+                continue
+            yield chunk[n:]
+            n = 0
+
+    def _read_chunk(self) -> bytes:
+        """Read the next chunk of the download, reconnecting on error."""
+        wait_time = 10
+        while True:
+            # The stream may be closed by another thread to interrupt a read,
+            # in which case the download must not be reopened.
+            if self.closed:
+                raise ValueError("I/O operation on closed download stream")
+            try:
+                if self._chunks is None:
+                    self._open_url()
+                chunk = next(self._chunks, b"")
+            except TooManyRequests:
+                self._close_source()
+                self._failed_attempts += 1
+                if self._failed_attempts >= self.max_retries * len(self.urls):
+                    raise
+                logger.info(
+                    "Download attempt failed with Too Many Requests error. "
+                    "Watiting %.1f seconds",
+                    wait_time,
+                )
+                sleep(wait_time)
+                wait_time *= 1.5
+                continue
+            except IOError as e:
+                # Includes the errors raised by requests while streaming the
+                # response body.
+                self._close_source()
+                self._failed_attempts += 1
+                if self._failed_attempts >= self.max_retries * len(self.urls):
+                    if isinstance(e, DownloadFailed):
+                        raise
+                    raise DownloadFailed(str(e)) from e
+                logger.info("Download attempt failed: %s", truncate(e))
+                continue
+
+            if chunk:
+                self.offset += len(chunk)
+                self.checksum.update(chunk)
+                if self._partial and not self._reading_partial:
+                    self._partial.write(chunk)
+                return chunk
+
+            self._close_source()
+            if self._reading_partial:
+                # Finished reading the partial download, so continue from the
+                # network.
+                self._reading_partial = False
+                continue
+            return b""
+
+    def readinto(self, b) -> int:
+        if not self._buffer and not self._eof:
+            self._buffer = self._read_chunk()
+            self._eof = not self._buffer
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def finish(self) -> None:
+        """Read any remaining bytes, validate the checksum, and move a
+        completed download into the cache.
+
+        :raises DownloadFailed: If the checksum does not match.
+        """
+        while self.read(self.chunk_size):
+            pass
+        self._close_source()
+        if self._partial:
+            self._partial.close()
+        if not self.sha256:
+            return
+
+        actual_sha256 = self.checksum.hexdigest()
+        if self.sha256 != actual_sha256:
+            # The partial download is corrupt, so discard it.
+            self._partial_path.unlink()
+            raise DownloadFailed(
+                f"Checksum of download does not match:\n"
+                f"Url: {self.url}\n"
+                f"Expected: {self.sha256}\n"
+                f"Actual:   {actual_sha256}"
+            )
+        self._partial_path.rename(cache_path(f"downloads/{self.sha256}"))
+
+    def close(self) -> None:
+        # Mark the stream as closed before closing the source so that a read in
+        # another thread that fails as a result does not reopen the download.
+        super().close()
+        self._close_source()
+        if self._partial:
+            self._partial.close()
+
+
+@contextmanager
+def open_download(
+    urls: Union[str, List[str]],
+    sha256: Optional[str] = None,
+    max_retries: int = 5,
+    chunk_size: int = 1024 * 1024,
+) -> Iterator[BinaryIO]:
+    """Open a file download as a readable stream.
+
+    Unlike :func:`download`, this does not read the entire file into memory,
+    so it is suitable for large files. The file is downloaded as it is read.
+
+    If :code:`sha256` is provided, the stream is checksummed as it is read and
+    the file contents are written to the same cache location as
+    :func:`download`. An interrupted download is kept in the cache directory
+    and resumed by the next call, using an HTTP range request. :code:`file://`
+    URLs are supported for reading from a local mirror.
+
+    The checksum is validated once the caller has finished with the stream, so
+    the caller must treat an exception raised on exiting the context manager as
+    a failure to read the file.
+
+    Example usage:
+
+        >>> with open_download(url, sha256) as f:
+        ...     with tarfile.open(fileobj=f, mode="r|bz2") as arc:
+        ...         arc.extractall("/tmp/dataset")
+
+    :param urls: Either a single URL of the file to download, or a list of URLs
+        to download.
+
+    :param sha256: The expected sha256 checksum of the file.
+
+    :param max_retries: The maximum number of attempts for each URL.
+
+    :param chunk_size: The number of bytes to request from the server at a
+        time.
+
+    :return: A context manager that yields a readable, non-seekable file
+        object.
+
+    :raises IOError: If the download fails, or if the downloaded content does
+        match the expected :code:`sha256` checksum.
+    """
+    urls = [urls] if not isinstance(urls, list) else urls
+    if not urls:
+        raise ValueError("No URLs to download")
+
+    # Cache hit.
+    if sha256 and cache_path(f"downloads/{sha256}").is_file():
+        with open(cache_path(f"downloads/{sha256}"), "rb") as f:
+            yield f
+        return
+
+    lockfile = (
+        cache_path(f"downloads/.{sha256}.lock")
+        if sha256
+        else cache_path("downloads/.lock")
+    )
+    with fasteners.InterProcessLock(lockfile):
+        stream = _DownloadStream(urls, sha256, max_retries, chunk_size)
+        try:
+            with io.BufferedReader(stream, buffer_size=chunk_size) as f:
+                yield f
+                stream.finish()
+        finally:
+            stream.close()
+        logger.debug("Downloaded %s", stream.url)
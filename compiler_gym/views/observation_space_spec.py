@@ -3,7 +3,9 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 import json
-from typing import Callable, Optional, Union
+import mmap
+import os
+from typing import Callable, List, Optional, Union
 
 import networkx as nx
 import numpy as np
@@ -16,8 +18,68 @@ from compiler_gym.spaces.sequence import Sequence
 from compiler_gym.util.gym_type_hints import ObservationType
 
 
+def _map_shared_memory_file(path: str) -> memoryview:
+    """Map a file written by the service into memory and remove it.
+
+    The returned view is read-only and remains valid after the file is removed.
+    The file is removed even if it cannot be mapped.
+    """
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # A zero-length file cannot be memory mapped.
+            buf = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+    finally:
+        os.unlink(path)
+    return memoryview(buf)
+
+
+def _string_value(observation: Observation) -> str:
+    """Return the string value of an observation, reading it from shared memory
+    if required.
+    """
+    if observation.WhichOneof("value") == "shared_memory_path":
+        return str(_map_shared_memory_file(observation.shared_memory_path), "utf-8")
+    return observation.string_value
+
+
+def _binary_value(observation: Observation) -> Union[bytes, memoryview]:
+    """Return the binary value of an observation. If the service transferred
+    the observation through shared memory then a read-only :code:`memoryview`
+    of the mapped file is returned, avoiding a copy.
+    """
+    if observation.WhichOneof("value") == "shared_memory_path":
+        return _map_shared_memory_file(observation.shared_memory_path)
+    return observation.binary_value
+
+
+def _packed_array(observation: Observation) -> np.ndarray:
+    """Decode a packed array observation with a single copy-free read of the
+    buffer. The returned array is read-only.
+    """
+    packed = observation.packed_array
+    array = np.frombuffer(packed.data, dtype=np.dtype(packed.dtype))
+    if len(packed.shape) > 1:
+        array = array.reshape(tuple(packed.shape))
+    return array
+
+
+def _int64_array(observation: Observation) -> np.ndarray:
+    """Return the value of an int64 list observation as an array."""
+    if observation.WhichOneof("value") == "packed_array":
+        return _packed_array(observation).astype(np.int64, copy=False)
+    return np.array(observation.int64_list.value, dtype=np.int64)
+
+
+def _double_array(observation: Observation) -> np.ndarray:
+    """Return the value of a double list observation as an array."""
+    if observation.WhichOneof("value") == "packed_array":
+        return _packed_array(observation).astype(np.float64, copy=False)
+    return np.array(observation.double_list.value, dtype=np.float64)
+
+
 def _json2nx(observation):
-    json_data = json.loads(observation.string_value)
+    json_data = json.loads(_string_value(observation))
     return nx.readwrite.json_graph.node_link_graph(
         json_data, multigraph=True, directed=True
     )
@@ -153,7 +215,9 @@ class ObservationSpaceSpec:
 
             def translate(observation):
                 return nx.readwrite.json_graph.node_link_graph(
-                    json.loads(observation.string_value), multigraph=True, directed=True
+                    json.loads(_string_value(observation)),
+                    multigraph=True,
+                    directed=True,
                 )
 
             def to_string(observation):
@@ -165,7 +229,7 @@ class ObservationSpaceSpec:
             space = make_seq(proto.string_size_range, str, (0, None))
 
             def translate(observation):
-                return json.loads(observation.string_value)
+                return json.loads(_string_value(observation))
 
             def to_string(observation):
                 return json.dumps(observation, indent=2)
@@ -177,8 +241,7 @@ class ObservationSpaceSpec:
                 (np.iinfo(np.int64).min, np.iinfo(np.int64).max),
             )
 
-            def translate(observation):
-                return np.array(observation.int64_list.value, dtype=np.int64)
+            translate = _int64_array
 
             to_string = str
         elif shape_type == "double_range_list":
@@ -186,22 +249,21 @@ class ObservationSpaceSpec:
                 proto.double_range_list.range, np.float64, (-np.inf, np.inf)
             )
 
-            def translate(observation):
-                return np.array(observation.double_list.value, dtype=np.float64)
+            translate = _double_array
 
             to_string = str
         elif shape_type == "string_size_range":
             space = make_seq(proto.string_size_range, str, (0, None))
 
             def translate(observation):
-                return observation.string_value
+                return _string_value(observation)
 
             to_string = str
         elif shape_type == "binary_size_range":
             space = make_seq(proto.binary_size_range, bytes, (0, None))
 
             def translate(observation):
-                return observation.binary_value
+                return _binary_value(observation)
 
             to_string = str
         elif shape_type == "scalar_int64_range":
@@ -232,8 +294,7 @@ class ObservationSpaceSpec:
                 ),
             )
 
-            def translate(observation):
-                return np.array(observation.double_list.value, dtype=np.float64)
+            translate = _double_array
 
             to_string = str
         else:
@@ -252,6 +313,47 @@ class ObservationSpaceSpec:
             default_value=translate(proto.default_value),
         )
 
+    def translate_batch(
+        self, observations: List[Observation]
+    ) -> Union[np.ndarray, List[ObservationType]]:
+        """Translate a batch of observations of this space, such as the
+        observations of multiple sessions.
+
+        If this is a numeric array space and every observation is a packed
+        array of the same type and size, the batch is decoded with a single
+        read into an array with one row per observation. Otherwise, a list of
+        individually translated observations is returned.
+
+        :param observations: A list of :code:`Observation` messages.
+
+        :return: An array, or a list of observations.
+        """
+        dtypes = {_int64_array: np.int64, _double_array: np.float64}
+        if (
+            self.translate in dtypes
+            and observations
+            and all(o.WhichOneof("value") == "packed_array" for o in observations)
+        ):
+            first = observations[0].packed_array
+            if all(
+                o.packed_array.dtype == first.dtype
+                and o.packed_array.shape == first.shape
+                and len(o.packed_array.data) == len(first.data)
+                for o in observations
+            ):
+                dtype = np.dtype(first.dtype)
+                shape = (
+                    tuple(first.shape)
+                    if len(first.shape) > 1
+                    else (len(first.data) // dtype.itemsize,)
+                )
+                batch = np.frombuffer(
+                    b"".join(o.packed_array.data for o in observations),
+                    dtype=dtype,
+                ).reshape((len(observations), *shape))
+                return batch.astype(dtypes[self.translate], copy=False)
+        return [self.translate(o) for o in observations]
+
     def make_derived_space(
         self,
         id: str,
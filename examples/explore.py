@@ -155,16 +155,19 @@ def env_to_fingerprint(env):
 
 
 def compute_edges(env, sequence):
-    edges = []
-    for action in range(env.action_space.n):
-        env.reset()
-        reward_sum = 0.0
-        for action in sequence + [action]:
-            _, reward, _, _ = env.step(action)
-            reward_sum += reward
-
-        edges.append((env_to_fingerprint(env), reward_sum))
-    return edges
+    env.reset()
+    reward_sum = 0.0
+    for action in sequence:
+        _, reward, _, _ = env.step(action)
+        reward_sum += reward
+
+    # Compute the successors of every action in a single call, using the same
+    # fingerprint as env_to_fingerprint().
+    successors = env.expand(range(env.action_space.n), observations=["Ir"])
+    return [
+        (hashlib.sha256(ir.encode()).digest(), reward_sum + reward)
+        for (ir,), reward, _, _ in successors
+    ]
 
 
 class NodeTypeStats:
@@ -0,0 +1,354 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""A preprocessed, sharded format for the graphs of a state transition database.
+
+Loading an instance from the state transition database requires an sqlite
+query, decompressing and unpickling a networkx graph, and converting the graph
+to DGL. This module converts a database once into shards of flat arrays that
+can be memory-mapped and sliced:
+
+    <shard_dir>/
+        index.json                  # The shard sizes and the format version.
+        shard-00000/
+            node_features.npy       # int64 [num_nodes, 2]: text_idx, type
+            edge_index.npy          # int64 [num_edges, 2]: src, dst
+            edge_features.npy       # int64 [num_edges, 2]: flow, position
+            node_offsets.npy        # int64 [num_graphs + 1]
+            edge_offsets.npy        # int64 [num_graphs + 1]
+            rewards.npy             # float64 [num_graphs]
+        shard-00001/
+        ...
+
+Node indices in :code:`edge_index.npy` are relative to the start of the graph.
+Graph :code:`i` of a shard has nodes :code:`node_offsets[i]` to
+:code:`node_offsets[i + 1]` and edges :code:`edge_offsets[i]` to
+:code:`edge_offsets[i + 1]`.
+
+Example usage:
+
+    >>> write_graph_shards("database.db", "shards", vocab)
+    >>> dataset = GraphShardDataset("shards")
+    >>> loader = make_graph_shard_loader(dataset, batch_size=32, num_workers=4)
+    >>> for graph, rewards in loader:
+    ...     ...
+"""
+import json
+import pickle
+import shutil
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import dgl
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from .compiler_gym_dataset import (
+    get_all_states,
+    get_observation_from_table,
+    update_graph_with_vocab,
+)
+
+# The version of the shard format. Bump this when the format changes.
+GRAPH_SHARDS_VERSION = 1
+
+NODE_FEATURES = ["text_idx", "type"]
+EDGE_FEATURES = ["flow", "position"]
+
+_ARRAYS = [
+    "node_features",
+    "edge_index",
+    "edge_features",
+    "node_offsets",
+    "edge_offsets",
+    "rewards",
+]
+
+
+def networkx_to_arrays(graph, vocab) -> Dict[str, np.ndarray]:
+    """Convert a ProGraML networkx graph to node feature, edge index, and edge
+    feature arrays.
+
+    :param graph: A networkx graph.
+
+    :param vocab: The vocabulary, a mapping from feature name to a mapping
+        from text to index.
+
+    :return: A dictionary of arrays.
+    """
+    update_graph_with_vocab(graph.nodes, ["text", "type"], vocab)
+    update_graph_with_vocab(graph.edges, EDGE_FEATURES, vocab)
+    node_features = np.array(
+        [[data[feat] for feat in NODE_FEATURES] for _, data in graph.nodes(data=True)],
+        dtype=np.int64,
+    ).reshape(-1, len(NODE_FEATURES))
+    edges = list(graph.edges(data=True))
+    edge_index = np.array([[src, dst] for src, dst, _ in edges], dtype=np.int64)
+    edge_features = np.array(
+        [[data[feat] for feat in EDGE_FEATURES] for _, _, data in edges],
+        dtype=np.int64,
+    )
+    return {
+        "node_features": node_features,
+        "edge_index": edge_index.reshape(-1, 2),
+        "edge_features": edge_features.reshape(-1, len(EDGE_FEATURES)),
+    }
+
+
+def _write_shard(path: Path, graphs: List[Dict[str, np.ndarray]], rewards):
+    path.mkdir(parents=True)
+    node_counts = [len(g["node_features"]) for g in graphs]
+    edge_counts = [len(g["edge_index"]) for g in graphs]
+    arrays = {
+        "node_features": np.concatenate([g["node_features"] for g in graphs]),
+        "edge_index": np.concatenate([g["edge_index"] for g in graphs]),
+        "edge_features": np.concatenate([g["edge_features"] for g in graphs]),
+        "node_offsets": np.concatenate([[0], np.cumsum(node_counts)]).astype(np.int64),
+        "edge_offsets": np.concatenate([[0], np.cumsum(edge_counts)]).astype(np.int64),
+        "rewards": np.array(rewards, dtype=np.float64),
+    }
+    for name, array in arrays.items():
+        np.save(path / f"{name}.npy", array)
+
+
+def write_graph_shards(
+    db_path: Union[str, Path],
+    shard_dir: Union[str, Path],
+    vocab,
+    shard_size: int = 10000,
+    dataset_size: int = -1,
+) -> int:
+    """Convert the graphs of a state transition database to shards.
+
+    The conversion is a one-time cost. The index is written last, so an
+    interrupted conversion is not mistaken for a complete one and is restarted
+    from scratch.
+
+    :param db_path: The path of the state transition database.
+
+    :param shard_dir: The directory to write the shards to.
+
+    :param vocab: The vocabulary, a mapping from feature name to a mapping
+        from text to index.
+
+    :param shard_size: The number of graphs per shard.
+
+    :param dataset_size: The number of states to convert, or -1 for all.
+
+    :return: The number of graphs written.
+    """
+    shard_dir = Path(shard_dir)
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    shard_dir.mkdir(parents=True)
+
+    connection = sqlite3.connect(str(db_path))
+    cursor = connection.cursor()
+    shard_sizes = []
+    graphs, rewards = [], []
+
+    def flush():
+        _write_shard(shard_dir / f"shard-{len(shard_sizes):05d}", graphs, rewards)
+        shard_sizes.append(len(graphs))
+        graphs.clear()
+        rewards.clear()
+
+    try:
+        for state in get_all_states(cursor, dataset_size):
+            observation = get_observation_from_table(cursor, state[3])
+            # The reward is the number of instruction counts in the graph, as
+            # in CompilerGymDataset.
+            rewards.append(observation[0][1])
+            graph = pickle.loads(zlib.decompress(observation[0][3]))
+            graphs.append(networkx_to_arrays(graph, vocab))
+            if len(graphs) == shard_size:
+                flush()
+        if graphs:
+            flush()
+    finally:
+        connection.close()
+
+    with open(shard_dir / "index.json", "w") as f:
+        json.dump({"version": GRAPH_SHARDS_VERSION, "shard_sizes": shard_sizes}, f)
+    return sum(shard_sizes)
+
+
+def graph_shards_exist(shard_dir: Union[str, Path]) -> bool:
+    """Return whether a complete set of shards of the current version exists."""
+    try:
+        with open(Path(shard_dir) / "index.json") as f:
+            return json.load(f)["version"] == GRAPH_SHARDS_VERSION
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return False
+
+
+class GraphShardDataset(Dataset):
+    """A dataset of graphs that are memory-mapped from shards.
+
+    The dataset is indexed using a list of graph indices and returns a single
+    batched DGL graph and a list of rewards, so that a batch is built directly
+    from contiguous array slices rather than by batching individual graphs.
+    Shards are opened lazily in each process so that the dataset can be used by
+    :code:`DataLoader` worker processes.
+
+    The interface for train and dev splits matches :class:`CompilerGymDataset
+    <examples.gnn_cost_model.compiler_gym_dataset.CompilerGymDataset>`.
+    """
+
+    def __init__(self, shard_dir: Union[str, Path], train_prop: float = 0.8):
+        """Constructor.
+
+        :param shard_dir: The directory containing the shards.
+
+        :param train_prop: The proportion of training instances.
+        """
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / "index.json") as f:
+            index = json.load(f)
+        if index["version"] != GRAPH_SHARDS_VERSION:
+            raise ValueError(
+                f"Graph shards version {index['version']} is not supported, "
+                f"expected {GRAPH_SHARDS_VERSION}"
+            )
+        shard_sizes = index["shard_sizes"]
+        # The global index of the first graph of each shard.
+        self.shard_offsets = np.concatenate([[0], np.cumsum(shard_sizes)]).astype(
+            np.int64
+        )
+        self.size = int(self.shard_offsets[-1])
+        self._shards: Dict[int, Dict[str, np.ndarray]] = {}
+
+        self.train_size = int(train_prop * self.size)
+        self.train_indices = np.random.choice(
+            self.size, size=self.train_size, replace=False
+        )
+        self.dev_indices = np.setdiff1d(np.arange(self.size), self.train_indices)
+        self.distribution_type = "train"
+
+    def set_distribution_type(self, dist_type: str) -> None:
+        assert dist_type in ["train", "dev"]
+        self.distribution_type = dist_type
+
+    @property
+    def indices(self) -> np.ndarray:
+        """The global indices of the graphs of the current distribution."""
+        if self.distribution_type == "train":
+            return self.train_indices
+        return self.dev_indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def _shard(self, shard: int) -> Dict[str, np.ndarray]:
+        if shard not in self._shards:
+            path = self.shard_dir / f"shard-{shard:05d}"
+            self._shards[shard] = {
+                name: np.load(path / f"{name}.npy", mmap_mode="r") for name in _ARRAYS
+            }
+        return self._shards[shard]
+
+    def _graph_arrays(self, index: int):
+        shard = int(np.searchsorted(self.shard_offsets, index, side="right")) - 1
+        arrays = self._shard(shard)
+        i = index - self.shard_offsets[shard]
+        node_start, node_end = arrays["node_offsets"][i : i + 2]
+        edge_start, edge_end = arrays["edge_offsets"][i : i + 2]
+        return (
+            arrays["node_features"][node_start:node_end],
+            arrays["edge_index"][edge_start:edge_end],
+            arrays["edge_features"][edge_start:edge_end],
+            arrays["rewards"][i],
+        )
+
+    def __getitem__(self, indices: Union[int, List[int]]):
+        """Return a batched graph and the list of rewards for the given global
+        graph indices.
+        """
+        if isinstance(indices, (int, np.integer)):
+            indices = [indices]
+        graphs = [self._graph_arrays(i) for i in indices]
+        num_nodes = [len(g[0]) for g in graphs]
+        num_edges = [len(g[1]) for g in graphs]
+
+        # Offset the edge indices of each graph by the start of its nodes.
+        node_starts = np.concatenate([[0], np.cumsum(num_nodes)[:-1]])
+        edge_index = np.concatenate(
+            [g[1] + start for g, start in zip(graphs, node_starts)]
+        )
+        node_features = torch.from_numpy(np.concatenate([g[0] for g in graphs]))
+        edge_features = torch.from_numpy(np.concatenate([g[2] for g in graphs]))
+
+        graph = dgl.graph(
+            (torch.from_numpy(edge_index[:, 0]), torch.from_numpy(edge_index[:, 1])),
+            num_nodes=sum(num_nodes),
+        )
+        for i, feat in enumerate(NODE_FEATURES):
+            graph.ndata[feat] = node_features[:, i].contiguous()
+        for i, feat in enumerate(EDGE_FEATURES):
+            graph.edata[feat] = edge_features[:, i].contiguous()
+        graph.set_batch_num_nodes(torch.tensor(num_nodes, dtype=torch.int64))
+        graph.set_batch_num_edges(torch.tensor(num_edges, dtype=torch.int64))
+
+        return graph, [float(g[3]) for g in graphs]
+
+
+class _BatchSampler(Sampler):
+    """Yield batches of global graph indices from the current distribution of
+    a dataset. The distribution is read when iteration starts, so the sampler
+    follows calls to :code:`set_distribution_type()` in the main process.
+    """
+
+    def __init__(self, dataset: GraphShardDataset, batch_size: int, shuffle: bool):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __iter__(self) -> Iterator[List[int]]:
+        indices = self.dataset.indices
+        if self.shuffle:
+            indices = np.random.permutation(indices)
+        for i in range(0, len(indices), self.batch_size):
+            yield indices[i : i + self.batch_size].tolist()
+
+    def __len__(self) -> int:
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+
+def make_graph_shard_loader(
+    dataset: GraphShardDataset,
+    batch_size: int,
+    shuffle: bool = True,
+    num_workers: int = 0,
+    prefetch_batches: Optional[int] = 4,
+) -> DataLoader:
+    """Create a loader that builds batches in background worker processes.
+
+    Workers are persistent, so shards remain memory-mapped across epochs.
+
+    :param dataset: The dataset to load.
+
+    :param batch_size: The number of graphs per batch.
+
+    :param shuffle: Whether to shuffle the graphs on every epoch.
+
+    :param num_workers: The number of worker processes. If zero, batches are
+        built in the main process without prefetching.
+
+    :param prefetch_batches: The number of batches to prefetch per worker.
+
+    :return: A :code:`DataLoader` that yields :code:`(graph, rewards)` tuples.
+    """
+    kwargs = {}
+    if num_workers:
+        kwargs = {"persistent_workers": True, "prefetch_factor": prefetch_batches}
+    return DataLoader(
+        dataset,
+        sampler=_BatchSampler(dataset, batch_size, shuffle),
+        batch_size=None,
+        num_workers=num_workers,
+        **kwargs,
+    )
@@ -0,0 +1,86 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for examples/gnn_cost_model/graph_shards.py"""
+import pickle
+import sqlite3
+import zlib
+
+import dgl
+import networkx as nx
+import torch
+
+from .compiler_gym_dataset import process_networkx_graph
+from .graph_shards import (
+    GraphShardDataset,
+    graph_shards_exist,
+    make_graph_shard_loader,
+    write_graph_shards,
+)
+
+VOCAB = {"text": {"a": 0, "b": 1}}
+
+
+def make_graph(num_nodes: int) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph()
+    for i in range(num_nodes):
+        graph.add_node(i, text="ab"[i % 2], type=i % 3)
+    for i in range(num_nodes - 1):
+        graph.add_edge(i, i + 1, flow=0, position=i)
+        graph.add_edge(i + 1, i, flow=1, position=0)
+    return graph
+
+
+def make_database(path, sizes):
+    connection = sqlite3.connect(str(path))
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE States (benchmark_uri, done, reward, state_id)")
+    cursor.execute("CREATE TABLE Observations (state_id, reward, ir, programl)")
+    for i, size in enumerate(sizes):
+        cursor.execute("INSERT INTO States VALUES (?, 0, 0, ?)", ("b", str(i)))
+        cursor.execute(
+            "INSERT INTO Observations VALUES (?, ?, '', ?)",
+            (str(i), size * 10, zlib.compress(pickle.dumps(make_graph(size)))),
+        )
+    connection.commit()
+    connection.close()
+
+
+def test_write_and_read_graph_shards(tmp_path):
+    sizes = [3, 5, 2]
+    make_database(tmp_path / "db", sizes)
+    assert not graph_shards_exist(tmp_path / "shards")
+    assert write_graph_shards(tmp_path / "db", tmp_path / "shards", VOCAB, 2) == 3
+    assert graph_shards_exist(tmp_path / "shards")
+    assert (tmp_path / "shards" / "shard-00001").is_dir()
+
+    dataset = GraphShardDataset(tmp_path / "shards", train_prop=1)
+    graph, rewards = dataset[[2, 0, 1]]
+    assert rewards == [20, 30, 50]
+    assert graph.batch_size == 3
+    assert graph.batch_num_nodes().tolist() == [2, 3, 5]
+
+    # The batched graph matches the graphs of the original dataset.
+    for i, g in enumerate(dgl.unbatch(graph)):
+        expected = process_networkx_graph(make_graph([2, 3, 5][i]), VOCAB)
+        for feat in ["text_idx", "type"]:
+            assert torch.equal(g.ndata[feat], expected.ndata[feat])
+        for feat in ["flow", "position"]:
+            assert torch.equal(g.edata[feat], expected.edata[feat])
+        assert [e.tolist() for e in g.edges()] == [e.tolist() for e in expected.edges()]
+
+
+def test_graph_shard_loader(tmp_path):
+    make_database(tmp_path / "db", [2, 3, 4, 5, 6])
+    write_graph_shards(tmp_path / "db", tmp_path / "shards", VOCAB, 2)
+    dataset = GraphShardDataset(tmp_path / "shards", train_prop=0.6)
+    loader = make_graph_shard_loader(dataset, batch_size=2)
+
+    dataset.set_distribution_type("train")
+    batches = list(loader)
+    assert [len(rewards) for _, rewards in batches] == [2, 1]
+
+    dataset.set_distribution_type("dev")
+    batches = list(loader)
+    assert [len(rewards) for _, rewards in batches] == [2]
@@ -32,6 +32,12 @@ from compiler_gym.util.runfiles_path import cache_path, transient_cache_path
 from compiler_gym.util.timer import Timer, humanize_duration
 
 from .compiler_gym_dataset import CompilerGymDataset
+from .graph_shards import (
+    GraphShardDataset,
+    graph_shards_exist,
+    make_graph_shard_loader,
+    write_graph_shards,
+)
 from .model import GNNEncoder
 
 flags.DEFINE_integer(
@@ -59,6 +65,13 @@ flags.DEFINE_string(
     "af7781f57e6ef430c561afb045fc03693783e668b21826b32234e9c45bd1882c",
     "SHA256 checksum of the vocabulary database.",
 )
+flags.DEFINE_boolean(
+    "graph_shards",
+    False,
+    "Convert the database to memory-mapped graph shards on first use and train "
+    "from the shards, building batches in --nproc background workers.",
+)
+flags.DEFINE_integer("graph_shard_size", 10000, "The number of graphs per shard.")
 flags.DEFINE_string(
     "device", "cuda:0" if torch.cuda.is_available() else "cpu", "The device to run on."
 )
@@ -184,14 +197,36 @@ def main(argv):
     model.to(FLAGS.device)
     print(model)
 
-    dataset = CompilerGymDataset(root_pth, vocab=vocab, dataset_size=FLAGS.dataset_size)
-    dataset_loader = DataLoader(
-        dataset,
-        batch_size=FLAGS.batch_size,
-        shuffle=True,
-        num_workers=FLAGS.nproc,
-        collate_fn=dataset.collate_fn,
-    )
+    if FLAGS.graph_shards:
+        shard_dir = cache_path(
+            f"state_transition_dataset/shards-{FLAGS.db_sha256[:16]}-"
+            f"{FLAGS.vocab_db_sha256[:16]}-{FLAGS.dataset_size}"
+        )
+        with InterProcessLock(transient_cache_path(".graph_shards.LOCK")):
+            if not graph_shards_exist(shard_dir):
+                with Timer("Converted database to graph shards"):
+                    write_graph_shards(
+                        root_pth,
+                        shard_dir,
+                        vocab,
+                        shard_size=FLAGS.graph_shard_size,
+                        dataset_size=FLAGS.dataset_size,
+                    )
+        dataset = GraphShardDataset(shard_dir)
+        dataset_loader = make_graph_shard_loader(
+            dataset, batch_size=FLAGS.batch_size, num_workers=FLAGS.nproc
+        )
+    else:
+        dataset = CompilerGymDataset(
+            root_pth, vocab=vocab, dataset_size=FLAGS.dataset_size
+        )
+        dataset_loader = DataLoader(
+            dataset,
+            batch_size=FLAGS.batch_size,
+            shuffle=True,
+            num_workers=FLAGS.nproc,
+            collate_fn=dataset.collate_fn,
+        )
 
     train(dataset, dataset_loader, model, FLAGS.num_epoch, FLAGS.device)
 
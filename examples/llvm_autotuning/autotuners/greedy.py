@@ -14,13 +14,11 @@ def greedy(env, search_time_seconds: int, **kwargs) -> None:
 
     :param env: The environment to optimize.
     """
-
-    def eval_action(env, action: int):
-        with env.fork() as fkd:
-            return (fkd.step(action)[1], action)
-
+    actions = range(env.action_space.n)
     end_time = time() + search_time_seconds
     while time() < end_time:
-        best = max(eval_action(env, action) for action in range(env.action_space.n))
+        # Evaluate every action from the current state in a single call.
+        rewards = [reward for _, reward, _, _ in env.expand(actions)]
+        best = max(zip(rewards, actions))
         if best[0] <= 0 or env.step(best[1])[2]:
             return
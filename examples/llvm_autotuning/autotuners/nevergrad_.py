@@ -2,14 +2,13 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
-from functools import lru_cache
 from time import time
-from typing import Tuple
 
 import nevergrad as ng
 from llvm_autotuning.optimization_target import OptimizationTarget
 
 from compiler_gym.envs import CompilerEnv
+from compiler_gym.population_evaluator import PopulationEvaluator
 
 
 def nevergrad(
@@ -19,6 +18,7 @@ def nevergrad(
     seed: int,
     episode_length: int = 100,
     optimizer: str = "DiscreteLenglerOnePlusOne",
+    population_size: int = 1,
     **kwargs
 ) -> None:
     """Optimize an environment using nevergrad.
@@ -27,21 +27,18 @@ def nevergrad(
     implementations of various black box optimizations techniques:
 
         https://facebookresearch.github.io/nevergrad/
-    """
-    if optimization_target == OptimizationTarget.RUNTIME:
-
-        def calculate_negative_reward(actions: Tuple[int]) -> float:
-            env.reset()
-            env.step(actions)
-            return -env.episode_reward
 
-    else:
-        # Only cache the deterministic non-runtime rewards.
-        @lru_cache(maxsize=int(1e4))
-        def calculate_negative_reward(actions: Tuple[int]) -> float:
-            env.reset()
-            env.step(actions)
-            return -env.episode_reward
+    Candidates are requested from the optimizer in batches of
+    :code:`population_size` and evaluated using a :class:`PopulationEvaluator
+    <compiler_gym.population_evaluator.PopulationEvaluator>`, so that the
+    actions of prefixes that are shared by candidates are run only once.
+    """
+    env.reset()
+    # Only cache the deterministic non-runtime rewards.
+    memo = None if optimization_target == OptimizationTarget.RUNTIME else {}
+    evaluator = PopulationEvaluator(
+        env, state_hash=None if memo is None else "IrSha1", memo=memo
+    )
 
     params = ng.p.Choice(
         choices=range(env.action_space.n),
@@ -51,12 +48,19 @@ def nevergrad(
     params.random_state.seed(seed)
 
     optimizer_class = getattr(ng.optimizers, optimizer)
-    optimizer = optimizer_class(parametrization=params, budget=1, num_workers=1)
+    optimizer = optimizer_class(
+        parametrization=params, budget=1, num_workers=population_size
+    )
 
     end_time = time() + search_time_seconds
     while time() < end_time:
-        x = optimizer.ask()
-        optimizer.tell(x, calculate_negative_reward(x.value))
+        population = [optimizer.ask() for _ in range(population_size)]
+        rewards = evaluator.evaluate([x.value for x in population])
+        for x, reward in zip(population, rewards):
+            optimizer.tell(x, -reward)
+        # Bound the size of the cache.
+        if memo is not None and len(memo) > int(1e4):
+            memo.clear()
 
     # Get best solution and replay it.
     recommendation = optimizer.provide_recommendation()
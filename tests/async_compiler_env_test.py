@@ -0,0 +1,127 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/envs:async_compiler_env."""
+import asyncio
+import threading
+
+import pytest
+
+from compiler_gym.envs import AsyncCompilerEnv
+from compiler_gym.envs.llvm import LlvmEnv
+from compiler_gym.service import AsyncConnection, SessionNotFound
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.llvm"]
+
+
+def run(env: LlvmEnv, coroutine):
+    """Run a coroutine that accepts an async environment and connection."""
+
+    async def _run():
+        connection = AsyncConnection(env.service.connection.url)
+        try:
+            return await coroutine(connection)
+        finally:
+            await connection.close()
+
+    return asyncio.run(_run())
+
+
+def test_step_matches_sync_env(env: LlvmEnv):
+    env.observation_space = "IrInstructionCount"
+    env.reward_space = "IrInstructionCount"
+    env.reset(benchmark="cbench-v1/crc32")
+    expected = env.step([0, 1, 2])
+
+    async def coroutine(connection):
+        async_env = AsyncCompilerEnv(env, connection)
+        try:
+            await async_env.reset()
+            return await async_env.step([0, 1, 2])
+        finally:
+            await async_env.close()
+
+    observation, reward, done, _ = run(env, coroutine)
+    assert observation == expected[0]
+    assert reward == expected[1]
+    assert done == expected[2]
+
+
+def test_concurrent_episodes(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/crc32")
+
+    async def episode(connection):
+        async_env = AsyncCompilerEnv(env, connection)
+        try:
+            await async_env.reset()
+            await async_env.step(0)
+            return await async_env.observation("IrInstructionCount")
+        finally:
+            await async_env.close()
+
+    async def coroutine(connection):
+        return await asyncio.gather(*[episode(connection) for _ in range(8)])
+
+    observations = run(env, coroutine)
+    assert len(set(observations)) == 1
+
+
+def test_reward_baseline_does_not_block_event_loop(env: LlvmEnv, mocker):
+    env.reward_space = "IrInstructionCountOz"
+    env.reset(benchmark="cbench-v1/crc32")
+    main_thread = threading.get_ident()
+    reset_threads = []
+
+    async def coroutine(connection):
+        async_env = AsyncCompilerEnv(env, connection)
+        reward_space = async_env.reward_space
+        reset = reward_space.reset
+
+        def spy(*args, **kwargs):
+            reset_threads.append(threading.get_ident())
+            return reset(*args, **kwargs)
+
+        mocker.patch.object(reward_space, "reset", side_effect=spy)
+        try:
+            await async_env.reset()
+            _, reward, _, _ = await async_env.step(0)
+            return reward
+        finally:
+            await async_env.close()
+
+    reward = run(env, coroutine)
+    assert isinstance(reward, float)
+    assert reset_threads and main_thread not in reset_threads
+
+
+def test_fork(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/crc32")
+
+    async def coroutine(connection):
+        async_env = AsyncCompilerEnv(env, connection)
+        await async_env.reset()
+        await async_env.step(0)
+        fkd = await async_env.fork()
+        try:
+            assert fkd.actions == [0]
+            assert await fkd.observation("Ir") == await async_env.observation("Ir")
+        finally:
+            await fkd.close()
+            await async_env.close()
+
+    run(env, coroutine)
+
+
+def test_step_before_reset(env: LlvmEnv):
+    async def coroutine(connection):
+        async_env = AsyncCompilerEnv(env, connection)
+        with pytest.raises(SessionNotFound, match=r"Must call reset\(\) before"):
+            await async_env.step(0)
+
+    run(env, coroutine)
+
+
+if __name__ == "__main__":
+    main()
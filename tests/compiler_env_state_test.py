@@ -11,7 +11,15 @@ import pytest
 from pydantic import ValidationError as PydanticValidationError
 
 from compiler_gym import CompilerEnvState, CompilerEnvStateWriter
-from compiler_gym.compiler_env_state import CompilerEnvStateReader
+from compiler_gym.compiler_env_state import (
+    CompilerEnvStateColumnarReader,
+    CompilerEnvStateColumnarWriter,
+    CompilerEnvStateReader,
+    columnar_state_index_path,
+    convert_columnar_to_csv,
+    convert_csv_to_columnar,
+    is_columnar_state_file,
+)
 from tests.test_main import main
 
 pytest_plugins = ["tests.pytest_plugins.common"]
@@ -335,5 +343,88 @@ def test_state_serialize_deserialize_equality_no_reward():
     assert state_from_csv.commandline == "-a -b -c"
 
 
+def _make_states(n: int):
+    return [
+        CompilerEnvState(
+            benchmark=f"benchmark://cbench-v0/{i % 3}",
+            walltime=i,
+            commandline="-a -b -c" if i % 2 else "",
+            reward=None if i % 4 == 0 else i / 2,
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_columnar_state_writer_reader_roundtrip(tmpwd: Path, chunk_size: int):
+    states = _make_states(10)
+    with CompilerEnvStateColumnarWriter("results.bin", chunk_size=chunk_size) as w:
+        w.write_states(states)
+
+    assert is_columnar_state_file("results.bin")
+    assert columnar_state_index_path("results.bin").is_file()
+
+    with CompilerEnvStateColumnarReader("results.bin") as reader:
+        assert len(reader) == 10
+        read_states = list(reader)
+
+    assert read_states == states
+    assert [s.walltime for s in read_states] == [s.walltime for s in states]
+    assert [s.reward for s in read_states] == [s.reward for s in states]
+
+
+def test_columnar_state_reader_chunks(tmpwd: Path):
+    with CompilerEnvStateColumnarWriter("results.bin", chunk_size=4) as writer:
+        writer.write_states(_make_states(10))
+
+    with CompilerEnvStateColumnarReader("results.bin") as reader:
+        chunks = list(reader.iter_chunks())
+
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert chunks[0].benchmarks[:2] == [
+        "benchmark://cbench-v0/0",
+        "benchmark://cbench-v0/1",
+    ]
+    assert chunks[0].commandline(1) == "-a -b -c"
+    assert list(chunks[0].actions[1]) == [0, 1, 2]
+
+
+def test_columnar_state_reader_read_benchmark(tmpwd: Path):
+    states = _make_states(10)
+    with CompilerEnvStateColumnarWriter("results.bin", chunk_size=2) as writer:
+        writer.write_states(states)
+
+    with CompilerEnvStateColumnarReader("results.bin") as reader:
+        assert reader.benchmarks == [
+            "benchmark://cbench-v0/0",
+            "benchmark://cbench-v0/1",
+            "benchmark://cbench-v0/2",
+        ]
+        assert list(reader.read_benchmark("benchmark://cbench-v0/1")) == [
+            s for s in states if s.benchmark == "benchmark://cbench-v0/1"
+        ]
+        assert list(reader.read_benchmark("benchmark://cbench-v0/4")) == []
+
+
+def test_columnar_state_reader_not_columnar(tmpwd: Path):
+    Path("results.csv").write_text("benchmark,reward,walltime,commandline\n")
+    assert not is_columnar_state_file("results.csv")
+    with pytest.raises(ValueError, match="Not a columnar state file"):
+        CompilerEnvStateColumnarReader("results.csv")
+
+
+def test_columnar_state_csv_conversion_roundtrip(tmpwd: Path):
+    states = _make_states(5)
+    with CompilerEnvStateWriter(open("a.csv", "w")) as writer:
+        for state in states:
+            writer.write_state(state)
+
+    assert convert_csv_to_columnar("a.csv", "a.bin") == 5
+    assert convert_columnar_to_csv("a.bin", "b.csv") == 5
+
+    assert Path("a.csv").read_text() == Path("b.csv").read_text()
+    assert list(CompilerEnvStateReader.read_paths(["a.bin"])) == states
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/datasets:benchmark_prefetcher."""
+import pickle
+from threading import Lock
+
+import numpy as np
+import pytest
+
+from compiler_gym.datasets import Benchmark, BenchmarkInitError
+from compiler_gym.datasets.benchmark_prefetcher import (
+    BenchmarkPrefetcher,
+    PrefetchingDatasetMixin,
+)
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+MAX_SEED = (2 ** 32) - 1
+
+
+class MockGenerator:
+    """A benchmark generator that records the seeds that it is called with."""
+
+    def __init__(self, fail_seeds=()):
+        self.seeds = []
+        self.fail_seeds = set(fail_seeds)
+        self.lock = Lock()
+
+    def __call__(self, seed: int) -> Benchmark:
+        with self.lock:
+            self.seeds.append(seed)
+        if seed in self.fail_seeds:
+            raise BenchmarkInitError(f"Failed to generate {seed}")
+        return Benchmark.from_file_contents(f"generator://mock-v0/{seed}", b"")
+
+
+def expected_uris(n: int, rng_seed: int = 0):
+    rng = np.random.default_rng(rng_seed)
+    return [f"generator://mock-v0/{rng.integers(MAX_SEED)}" for _ in range(n)]
+
+
+def test_invalid_queue_size():
+    with pytest.raises(ValueError, match="queue_size must be positive"):
+        BenchmarkPrefetcher(MockGenerator(), max_seed=MAX_SEED, queue_size=0)
+
+
+def test_invalid_num_workers():
+    with pytest.raises(ValueError, match="num_workers must be positive"):
+        BenchmarkPrefetcher(MockGenerator(), max_seed=MAX_SEED, num_workers=0)
+
+
+def make_prefetcher(generate: MockGenerator, **kwargs) -> BenchmarkPrefetcher:
+    return BenchmarkPrefetcher(
+        generate, max_seed=MAX_SEED, random_state=np.random.default_rng(0), **kwargs
+    )
+
+
+def test_random_benchmark_order_matches_random_state():
+    prefetcher = make_prefetcher(MockGenerator(), queue_size=4)
+    try:
+        uris = [prefetcher.random_benchmark().uri for _ in range(10)]
+    finally:
+        prefetcher.close()
+    assert uris == expected_uris(10)
+
+
+def test_random_benchmark_keeps_queue_full():
+    generate = MockGenerator()
+    prefetcher = make_prefetcher(generate, queue_size=4)
+    try:
+        prefetcher.random_benchmark()
+        assert len(prefetcher) == 4
+    finally:
+        prefetcher.close()
+    assert len(prefetcher) == 0
+
+
+def test_prefetched_benchmark():
+    generate = MockGenerator()
+    prefetcher = make_prefetcher(generate, queue_size=4)
+    try:
+        prefetcher.random_benchmark()
+        # The second seed drawn from the random state is queued.
+        uri = expected_uris(2)[1]
+        seed = int(uri.split("/")[-1])
+        assert prefetcher.prefetched_benchmark(seed).uri == uri
+        assert len(prefetcher) == 3
+        assert generate.seeds.count(seed) == 1
+        assert prefetcher.prefetched_benchmark(MAX_SEED + 1) is None
+    finally:
+        prefetcher.close()
+
+
+def test_random_benchmark_error():
+    uri = expected_uris(1)[0]
+    seed = int(uri.split("/")[-1])
+    prefetcher = make_prefetcher(MockGenerator(fail_seeds=[seed]), queue_size=2)
+    try:
+        with pytest.raises(BenchmarkInitError, match=f"Failed to generate {seed}"):
+            prefetcher.random_benchmark()
+        # The failed benchmark is not retried.
+        assert prefetcher.random_benchmark().uri == expected_uris(2)[1]
+    finally:
+        prefetcher.close()
+
+
+class MockDataset(PrefetchingDatasetMixin):
+    """A seeded dataset that uses the prefetching mixin."""
+
+    max_seed = MAX_SEED
+
+    def __init__(self):
+        self.seeds = []
+        self.installed = False
+
+    def install(self) -> None:
+        self.installed = True
+
+    def _benchmark_from_seed(self, seed: int) -> Benchmark:
+        self.seeds.append(seed)
+        return Benchmark.from_file_contents(f"generator://mock-v0/{seed}", b"")
+
+
+def test_prefetching_dataset_disabled_by_default():
+    dataset = MockDataset()
+    assert dataset._random_prefetched_benchmark(np.random.default_rng(0)) is None
+    assert dataset._prefetched_benchmark(0) is None
+    assert not dataset.seeds
+
+
+def test_prefetching_dataset_prefetch():
+    dataset = MockDataset()
+    dataset.prefetch(queue_size=2, num_workers=1)
+    assert dataset.installed
+    try:
+        benchmark = dataset._random_prefetched_benchmark(np.random.default_rng(0))
+        assert benchmark.uri.startswith("generator://mock-v0/")
+        assert len(dataset._prefetcher) == 2
+    finally:
+        dataset.prefetch(queue_size=0)
+    assert dataset._prefetcher is None
+    assert dataset._random_prefetched_benchmark(np.random.default_rng(0)) is None
+
+
+def test_prefetching_dataset_pickle():
+    dataset = MockDataset()
+    dataset.prefetch(queue_size=2, num_workers=1)
+    try:
+        dataset._random_prefetched_benchmark(np.random.default_rng(0))
+        restored = pickle.loads(pickle.dumps(dataset))
+    finally:
+        dataset.prefetch(queue_size=0)
+    assert restored._prefetcher is None
+    assert restored._prefetch_options == {"queue_size": 2, "num_workers": 1}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/datasets:benchmark_uri_index."""
+import pickle
+from pathlib import Path
+
+import pytest
+
+from compiler_gym.datasets.benchmark_uri_index import BenchmarkUriIndex
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+
+def test_empty_index(tmpwd: Path):
+    assert BenchmarkUriIndex.write(Path("index"), []) == 0
+    index = BenchmarkUriIndex(Path("index"))
+    assert len(index) == 0
+    assert list(index) == []
+    with pytest.raises(IndexError):
+        index[0]
+
+
+def test_index_random_access(tmpwd: Path):
+    uris = [f"benchmark://test-v0/{i}" for i in range(100)]
+    assert BenchmarkUriIndex.write(Path("index"), uris) == 100
+    index = BenchmarkUriIndex(Path("index"))
+
+    assert len(index) == 100
+    assert list(index) == uris
+    assert index[0] == "benchmark://test-v0/0"
+    assert index[50] == "benchmark://test-v0/50"
+    assert index[-1] == "benchmark://test-v0/99"
+    with pytest.raises(IndexError):
+        index[100]
+
+
+def test_index_preserves_order(tmpwd: Path):
+    uris = ["benchmark://test-v0/b", "benchmark://test-v0/a/é"]
+    BenchmarkUriIndex.write(Path("index"), uris)
+    assert list(BenchmarkUriIndex(Path("index"))) == uris
+
+
+def test_index_concurrent_iterators(tmpwd: Path):
+    uris = [f"benchmark://test-v0/{i}" for i in range(10)]
+    BenchmarkUriIndex.write(Path("index"), uris)
+    index = BenchmarkUriIndex(Path("index"))
+    assert list(zip(index, index)) == list(zip(uris, uris))
+
+
+def test_index_pickle(tmpwd: Path):
+    uris = [f"benchmark://test-v0/{i}" for i in range(10)]
+    BenchmarkUriIndex.write(Path("index"), uris)
+    index = pickle.loads(pickle.dumps(BenchmarkUriIndex(Path("index"))))
+    assert list(index) == uris
+
+
+def test_invalid_index(tmpwd: Path):
+    Path("index").write_text("not an index file")
+    with pytest.raises(ValueError, match="Invalid benchmark URI index"):
+        BenchmarkUriIndex(Path("index"))
+
+
+if __name__ == "__main__":
+    main()
@@ -123,5 +123,39 @@ def test_populated_dataset_random_benchmark(populated_dataset: FilesDataset):
     assert len(random_benchmarks) == num_benchmarks
 
 
+def test_populated_dataset_benchmark_uri_index(populated_dataset: FilesDataset):
+    uris = list(populated_dataset.benchmark_uris())
+    populated_dataset.benchmark_uri_index = True
+
+    assert list(populated_dataset.benchmark_uris()) == uris
+    assert (populated_dataset.site_data_path / "benchmark_uris.idx").is_file()
+    assert populated_dataset.size == 9
+
+    rng = np.random.default_rng(0)
+    assert populated_dataset.random_benchmark(rng).uri in uris
+
+
+def test_populated_dataset_benchmark_uri_index_is_persistent(
+    populated_dataset: FilesDataset,
+):
+    populated_dataset.benchmark_uri_index = True
+    uris = list(populated_dataset.benchmark_uris())
+
+    # A new dataset instance reads the existing index rather than the files.
+    dataset = FilesDataset(
+        name="benchmark://test-v0",
+        description="",
+        license="MIT",
+        dataset_root=populated_dataset.dataset_root,
+        site_data_base=populated_dataset.site_data_path.parent.parent,
+        benchmark_uri_index=True,
+    )
+    assert dataset.site_data_path == populated_dataset.site_data_path
+    (populated_dataset.dataset_root / "h.txt").touch()
+
+    assert list(dataset.benchmark_uris()) == uris
+    assert dataset.size == 9
+
+
 if __name__ == "__main__":
     main()
@@ -360,6 +360,28 @@ def test_timeout(gcc_bin: str):
         assert env.timeout == 20
 
 
+@with_gcc_support
+def test_single_invocation(gcc_bin: str):
+    """Test that a single invocation of gcc produces the same observations as
+    separate invocations."""
+    with gym.make("gcc-v0", gcc_bin=gcc_bin) as env:
+        env.reset()
+        env.step(env.action_space.names.index("-O3"))
+        expected = env.observation["obj_hash"], env.asm_hash, env.rtl
+
+        env.single_invocation = True
+        assert env.single_invocation
+        env.reset()
+        env.step(env.action_space.names.index("-O3"))
+        assert env.observation["obj_hash"] == expected[0]
+        assert env.asm_hash == expected[1]
+        assert env.rtl == expected[2]
+        # Subsequent steps produce all of the artifacts at once.
+        env.step(env.action_space.names.index("-O2"))
+        assert env.obj_size > 0
+        assert env.asm_size > 0
+
+
 @with_docker
 def test_compile():
     with gym.make("gcc-v0") as env:
@@ -0,0 +1,156 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for //compiler_gym/envs/gcc:worker_pool."""
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pytest
+
+from compiler_gym.envs.gcc.worker_pool import Volumes, Worker, WorkerError, WorkerPool
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+
+class LocalWorker(Worker):
+    """A fake worker that runs commands as local subprocesses."""
+
+    def __init__(self, volumes: Volumes):
+        self.volumes = volumes
+        self.is_healthy = True
+        self.fail_next_exec = False
+        self.closed = False
+        self.exec_count = 0
+
+    def exec(
+        self, cmd: List[str], workdir: str, timeout: Optional[float] = None
+    ) -> Tuple[int, str]:
+        if self.fail_next_exec or not self.is_healthy:
+            self.fail_next_exec = False
+            raise WorkerError("Worker failed")
+        self.exec_count += 1
+        try:
+            process = subprocess.run(
+                cmd,
+                cwd=workdir,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise TimeoutError(f"Timed out waiting for command: {cmd}") from e
+        return process.returncode, process.stdout
+
+    def healthy(self) -> bool:
+        return self.is_healthy
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def workers() -> List[LocalWorker]:
+    return []
+
+
+@pytest.fixture
+def pool(workers: List[LocalWorker]) -> WorkerPool:
+    def make_worker(volumes: Volumes) -> LocalWorker:
+        workers.append(LocalWorker(volumes))
+        return workers[-1]
+
+    pool = WorkerPool(make_worker, max_workers=2)
+    yield pool
+    pool.close()
+
+
+def _volumes(path: str) -> Volumes:
+    return {path: {"bind": path, "mode": "rw"}}
+
+
+def test_run_command(pool: WorkerPool, tmpwd: Path):
+    assert pool.run(["echo", "hello"], str(tmpwd), _volumes("/a")) == (0, "hello\n")
+
+
+def test_run_command_returncode(pool: WorkerPool, tmpwd: Path):
+    returncode, _ = pool.run(["false"], str(tmpwd), _volumes("/a"))
+    assert returncode == 1
+
+
+def test_worker_is_reused(pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path):
+    for _ in range(5):
+        pool.run(["true"], str(tmpwd), _volumes("/a"))
+    assert len(workers) == 1
+    assert workers[0].exec_count == 5
+
+
+def test_worker_per_volumes(pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path):
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    pool.run(["true"], str(tmpwd), _volumes("/b"))
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    assert len(workers) == 2
+    assert [w.exec_count for w in workers] == [2, 1]
+
+
+def test_least_recently_used_worker_is_evicted(
+    pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path
+):
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    pool.run(["true"], str(tmpwd), _volumes("/b"))
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    pool.run(["true"], str(tmpwd), _volumes("/c"))
+
+    assert len(pool) == 2
+    assert [w.closed for w in workers] == [False, True, False]
+
+
+def test_worker_error_is_retried_on_new_worker(
+    pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path
+):
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    workers[0].fail_next_exec = True
+
+    assert pool.run(["echo", "hello"], str(tmpwd), _volumes("/a")) == (0, "hello\n")
+    assert len(workers) == 2
+    assert workers[0].closed
+    assert workers[1].exec_count == 1
+
+
+def test_unhealthy_worker_is_restarted(
+    pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path
+):
+    pool.health_check_interval = 0
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    workers[0].is_healthy = False
+
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    assert len(workers) == 2
+    assert workers[0].closed
+    assert workers[1].exec_count == 1
+
+
+def test_timed_out_worker_is_stopped(
+    pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path
+):
+    with pytest.raises(TimeoutError):
+        pool.run(["sleep", "10"], str(tmpwd), _volumes("/a"), timeout=0.1)
+    assert len(pool) == 0
+    assert workers[0].closed
+
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    assert len(workers) == 2
+
+
+def test_close_stops_workers(pool: WorkerPool, workers: List[LocalWorker], tmpwd: Path):
+    pool.run(["true"], str(tmpwd), _volumes("/a"))
+    pool.run(["true"], str(tmpwd), _volumes("/b"))
+    pool.close()
+    assert len(pool) == 0
+    assert all(w.closed for w in workers)
+
+
+if __name__ == "__main__":
+    main()
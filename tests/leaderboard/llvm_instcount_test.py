@@ -22,6 +22,11 @@ def null_policy(env) -> None:
     pass
 
 
+def failing_policy(env) -> None:
+    """A policy that raises an error."""
+    raise ValueError("policy error")
+
+
 def test_eval_llvm_instcount_policy():
     set_command_line_flags(["argv0", "--n=1", "--max_benchmarks=1", "--novalidate"])
     with pytest.raises(SystemExit):
@@ -94,6 +99,112 @@ def test_eval_llvm_instcount_policy_resume(tmpwd):
     assert len(log.rstrip().split("\n")) == 5
 
 
+def test_eval_llvm_instcount_policy_workers(tmpwd):
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=2",
+            "--max_benchmarks=2",
+            "--novalidate",
+            "--workers=2",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit):
+        eval_llvm_instcount_policy(null_policy)
+
+    # Check that the log has an entry for every evaluation (and a header row.)
+    with open("test.csv") as f:
+        log = f.read()
+    assert len(log.rstrip().split("\n")) == 5
+
+
+def test_eval_llvm_instcount_policy_resume_repeated_benchmark(tmpwd):
+    # Run eval once on a single benchmark.
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=1",
+            "--max_benchmarks=1",
+            "--novalidate",
+            "--resume",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit):
+        eval_llvm_instcount_policy(null_policy)
+
+    # Resume with three runs of the benchmark. Only the two outstanding runs
+    # are evaluated.
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=3",
+            "--max_benchmarks=1",
+            "--novalidate",
+            "--resume",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit):
+        eval_llvm_instcount_policy(null_policy)
+
+    with open("test.csv") as f:
+        log = f.read()
+    assert len(log.rstrip().split("\n")) == 4
+
+
+def test_eval_llvm_instcount_policy_validate_during_evaluation(tmpwd):
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=1",
+            "--max_benchmarks=1",
+            "--validate_during_evaluation",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit):
+        eval_llvm_instcount_policy(null_policy)
+
+
+def test_eval_llvm_instcount_policy_validate_during_evaluation_workers(tmpwd):
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=2",
+            "--max_benchmarks=2",
+            "--workers=2",
+            "--validate_during_evaluation",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit) as ctx:
+        eval_llvm_instcount_policy(null_policy)
+    assert not ctx.value.code
+
+    with open("test.csv") as f:
+        log = f.read()
+    assert len(log.rstrip().split("\n")) == 5
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_eval_llvm_instcount_policy_worker_error(tmpwd, capsys, workers: int):
+    set_command_line_flags(
+        [
+            "argv0",
+            "--n=1",
+            "--max_benchmarks=2",
+            f"--workers={workers}",
+            "--leaderboard_results=test.csv",
+        ]
+    )
+    with pytest.raises(SystemExit) as ctx:
+        eval_llvm_instcount_policy(failing_policy)
+    assert ctx.value.code == 1
+    assert "ValueError: policy error" in capsys.readouterr().err
+
+
 def test_eval_llvm_instcount_policy_invalid_flag():
     set_command_line_flags(["argv0", "--n=-1"])
     with pytest.raises(AssertionError):
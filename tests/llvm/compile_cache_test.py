@@ -0,0 +1,127 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for //compiler_gym/envs/llvm:compile_cache."""
+import os
+from pathlib import Path
+
+from compiler_gym.envs.llvm import BitcodeCache, make_benchmark
+from compiler_gym.envs.llvm.compile_cache import read_dependency_file
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+
+def test_read_dependency_file(tmpwd: Path):
+    with open("a.d", "w") as f:
+        f.write("a.bc: /src/a.c /src/my\\ dir/b.h \\\n  /usr/include/stdio.h\n")
+    assert read_dependency_file(Path("a.d")) == [
+        Path("/src/a.c"),
+        Path("/src/my dir/b.h"),
+        Path("/usr/include/stdio.h"),
+    ]
+
+
+def test_cache_miss_then_hit(tmpwd: Path):
+    cache = BitcodeCache(Path("cache"))
+    Path("a.c").write_text("int A() { return 0; }")
+    key = BitcodeCache.make_key("clang", ["-O1"], [Path("a.c")])
+
+    assert cache.get(key) is None
+    cache.put(key, b"bitcode")
+    assert cache.get(key) == b"bitcode"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_key_depends_on_input_contents(tmpwd: Path):
+    Path("a.c").write_text("int A() { return 0; }")
+    key_a = BitcodeCache.make_key("clang", ["-O1"], [Path("a.c")])
+    Path("a.c").write_text("int A() { return 1; }")
+    key_b = BitcodeCache.make_key("clang", ["-O1"], [Path("a.c")])
+    assert key_a != key_b
+    assert key_b != BitcodeCache.make_key("clang", ["-O2"], [Path("a.c")])
+
+
+def test_cache_key_resolves_relative_paths(tmpwd: Path):
+    Path("a").mkdir()
+    Path("a/include").mkdir()
+    Path("a/a.c").write_text("int A() { return 0; }")
+    Path("b").mkdir()
+    Path("b/include").mkdir()
+    Path("b/a.c").write_text("int A() { return 0; }")
+
+    def key(*args: str) -> str:
+        return BitcodeCache.make_key("clang", args, [Path(args[0])])
+
+    absolute_key = key(
+        str(Path("a/a.c").absolute()), f"-I{Path('a/include').absolute()}"
+    )
+    os.chdir("a")
+    assert key("a.c", "-Iinclude") == absolute_key
+    # A file with the same relative path and contents in another directory is
+    # a different compilation.
+    os.chdir("../b")
+    assert key("a.c", "-Iinclude") != absolute_key
+
+
+def test_cache_key_does_not_depend_on_working_directory(tmpwd: Path):
+    Path("a.c").write_text("int A() { return 0; }")
+    path = Path("a.c").absolute()
+    key = BitcodeCache.make_key("clang", ["-O1", str(path)], [path])
+    Path("subdir").mkdir()
+    os.chdir("subdir")
+    assert BitcodeCache.make_key("clang", ["-O1", str(path)], [path]) == key
+
+
+def test_cache_invalidated_by_include_change(tmpwd: Path):
+    cache = BitcodeCache(Path("cache"))
+    Path("a.h").write_text("#define A 0")
+    cache.put("key", b"bitcode-a", includes=[Path("a.h")])
+    assert cache.get("key") == b"bitcode-a"
+
+    Path("a.h").write_text("#define A 1")
+    assert cache.get("key") is None
+
+    # Both include sets are recorded in the manifest.
+    cache.put("key", b"bitcode-b", includes=[Path("a.h")])
+    assert cache.get("key") == b"bitcode-b"
+    Path("a.h").write_text("#define A 0")
+    assert cache.get("key") == b"bitcode-a"
+
+
+def test_cache_eviction(tmpwd: Path):
+    cache = BitcodeCache(Path("cache"), max_size_in_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    # Make "a" the most recently used entry.
+    for path in Path("cache/objects").iterdir():
+        os.utime(path, (0, 0))
+    assert cache.get("a") == b"a" * 100
+
+    cache.put("c", b"c" * 100)
+    assert cache.size_in_bytes <= 250
+    assert cache.get("a") == b"a" * 100
+    assert cache.get("b") is None
+    assert cache.get("c") == b"c" * 100
+
+
+def test_make_benchmark_with_cache(tmpwd: Path):
+    cache = BitcodeCache(Path("cache"))
+    Path("a.h").write_text("#define A 0")
+    Path("a.c").write_text('#include "a.h"\nint A() { return A; }')
+
+    a = make_benchmark(Path("a.c").absolute(), cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    b = make_benchmark(Path("a.c").absolute(), cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert a.proto.program.contents == b.proto.program.contents
+
+    # Changing the header invalidates the cached result.
+    Path("a.h").write_text("#define A 1")
+    make_benchmark(Path("a.c").absolute(), cache=cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+if __name__ == "__main__":
+    main()
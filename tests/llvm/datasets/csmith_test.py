@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 """Tests for the Csmith dataset."""
+import pickle
 import sys
 from itertools import islice
 from pathlib import Path
@@ -15,6 +16,7 @@ from flaky import flaky
 import compiler_gym.envs.llvm  # noqa register environments
 from compiler_gym.envs.llvm import LlvmEnv
 from compiler_gym.envs.llvm.datasets import CsmithBenchmark, CsmithDataset
+from compiler_gym.envs.llvm.datasets.csmith import UINT_MAX
 from compiler_gym.service import ServiceError
 from tests.pytest_plugins.common import is_ci
 from tests.test_main import main
@@ -63,6 +65,57 @@ def test_csmith_from_seed_retry_count_exceeded(csmith_dataset: CsmithDataset):
         csmith_dataset.benchmark_from_seed(seed=1, max_retries=3, retry_count=5)
 
 
+def test_random_benchmark_prefetch(csmith_dataset: CsmithDataset):
+    num_benchmarks = 5
+
+    def prefetched_uris():
+        csmith_dataset.prefetch(queue_size=3, num_workers=2)
+        try:
+            rng = np.random.default_rng(0)
+            uris = [
+                csmith_dataset.random_benchmark(rng).uri for _ in range(num_benchmarks)
+            ]
+        finally:
+            csmith_dataset.prefetch(queue_size=0)
+        # Prefetching takes a single draw from the random state.
+        expected_rng = np.random.default_rng(0)
+        expected_rng.integers(UINT_MAX)
+        assert rng.integers(UINT_MAX) == expected_rng.integers(UINT_MAX)
+        return uris
+
+    assert prefetched_uris() == prefetched_uris()
+
+
+def test_pickle_while_prefetching(csmith_dataset: CsmithDataset):
+    csmith_dataset.prefetch(queue_size=3, num_workers=2)
+    try:
+        csmith_dataset.random_benchmark(np.random.default_rng(0))
+        restored = pickle.loads(pickle.dumps(csmith_dataset))
+        assert restored._prefetcher is None
+        assert restored.random_benchmark(np.random.default_rng(0)).uri.startswith(
+            "generator://csmith-v0/"
+        )
+        restored.prefetch(queue_size=0)
+    finally:
+        csmith_dataset.prefetch(queue_size=0)
+
+
+def test_csmith_cache_dir(csmith_dataset: CsmithDataset, tmpdir: Path):
+    tmpdir = Path(tmpdir)
+    csmith_dataset.cache_dir = tmpdir
+    try:
+        benchmark = csmith_dataset.benchmark_from_seed(seed=10)
+        assert (tmpdir / "10.bc").is_file()
+        assert (tmpdir / "10.c").is_file()
+
+        cached = csmith_dataset.benchmark_from_seed(seed=10)
+    finally:
+        csmith_dataset.cache_dir = None
+    assert cached.uri == benchmark.uri
+    assert cached.proto.program.contents == benchmark.proto.program.contents
+    assert cached.source == benchmark.source
+
+
 @pytest.mark.xfail(
     sys.platform == "darwin",
     strict=True,
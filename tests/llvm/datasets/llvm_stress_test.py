@@ -5,6 +5,7 @@
 """Tests for the AnghaBench dataset."""
 import sys
 from itertools import islice
+from pathlib import Path
 
 import gym
 import numpy as np
@@ -69,5 +70,19 @@ def test_random_benchmark(llvm_stress_dataset: LlvmStressDataset):
     assert len(random_benchmarks) == num_benchmarks
 
 
+def test_llvm_stress_cache_dir(llvm_stress_dataset: LlvmStressDataset, tmpdir: Path):
+    tmpdir = Path(tmpdir)
+    llvm_stress_dataset.cache_dir = tmpdir
+    try:
+        benchmark = llvm_stress_dataset.benchmark_from_seed(10)
+        assert (tmpdir / "10.bc").is_file()
+
+        cached = llvm_stress_dataset.benchmark_from_seed(10)
+    finally:
+        llvm_stress_dataset.cache_dir = None
+    assert cached.uri == benchmark.uri
+    assert cached.proto.program.contents == benchmark.proto.program.contents
+
+
 if __name__ == "__main__":
     main()
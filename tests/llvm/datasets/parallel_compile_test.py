@@ -0,0 +1,77 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for //compiler_gym/envs/llvm/datasets:parallel_compile."""
+from pathlib import Path
+
+from compiler_gym.datasets import Benchmark, BenchmarkInitError, Dataset
+from compiler_gym.envs.llvm.datasets.parallel_compile import (
+    FAILURES_FILE_NAME,
+    compile_all,
+)
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.common"]
+
+
+class MockLazyDataset(Dataset):
+    """A dataset that "compiles" a benchmark by writing a file."""
+
+    def __init__(self, site_data_base: Path, size: int, failing: int):
+        super().__init__(
+            name="benchmark://lazy-v0",
+            description="A lazily compiled dataset",
+            license="MIT",
+            site_data_base=site_data_base,
+        )
+        self._size = size
+        self.failing = failing
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def benchmark_uris(self):
+        return (f"{self.name}/{i}" for i in range(self.size))
+
+    def benchmark(self, uri: str) -> Benchmark:
+        i = int(uri.split("/")[-1])
+        if i == self.failing:
+            raise BenchmarkInitError(f"Failed to compile {uri}")
+        output = self.site_data_path / f"{i}.bc"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "a") as f:
+            f.write("x")
+        return Benchmark.from_file_contents(uri, b"")
+
+
+def test_compile_all(tmpdir: Path):
+    dataset = MockLazyDataset(Path(tmpdir), size=10, failing=3)
+
+    assert compile_all(dataset, num_workers=2, chunksize=3) == 1
+
+    for i in range(10):
+        assert (dataset.site_data_path / f"{i}.bc").is_file() == (i != 3)
+    assert (
+        dataset.site_data_path / FAILURES_FILE_NAME
+    ).read_text() == "benchmark://lazy-v0/3\n"
+
+
+def test_compile_all_skips_previous_failures(tmpdir: Path):
+    dataset = MockLazyDataset(Path(tmpdir), size=5, failing=3)
+    assert compile_all(dataset, num_workers=2) == 1
+
+    # The failed benchmark is skipped, and the others are compiled again.
+    dataset.failing = -1
+    assert compile_all(dataset, num_workers=2) == 1
+    assert not (dataset.site_data_path / "3.bc").is_file()
+    assert (dataset.site_data_path / "0.bc").read_text() == "xx"
+
+    assert compile_all(dataset, num_workers=2, retry_failures=True) == 0
+    assert (dataset.site_data_path / "3.bc").is_file()
+    assert not (dataset.site_data_path / FAILURES_FILE_NAME).read_text()
+
+
+if __name__ == "__main__":
+    main()
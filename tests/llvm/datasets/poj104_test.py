@@ -33,6 +33,25 @@ def test_poj104_size(poj104_dataset: POJ104Dataset):
         assert poj104_dataset.size == 49816
 
 
+def test_preprocess_poj104_source_without_prelude():
+    src = POJ104Dataset.preprocess_poj104_source("main() { return 0; }", prelude=False)
+    assert src == "int main() { return 0; }"
+
+
+def test_preprocess_poj104_source_with_prelude():
+    src = POJ104Dataset.preprocess_poj104_source("main() { return 0; }")
+    assert src.endswith("\nint main() { return 0; }")
+    assert "#define MAX 1024" in src
+
+
+def test_poj104_prelude_pch(poj104_dataset: POJ104Dataset):
+    pch = poj104_dataset.prelude_pch()
+    assert pch is not None
+    assert pch.is_file()
+    # The precompiled header is reused.
+    assert poj104_dataset.prelude_pch() == pch
+
+
 @skip_on_ci
 @pytest.mark.parametrize("index", range(250))
 def test_poj104_random_select(
@@ -0,0 +1,67 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Tests for LlvmEnv.expand()."""
+import pytest
+
+from compiler_gym.envs import LlvmEnv
+from compiler_gym.service import SessionNotFound
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.llvm"]
+
+
+def test_expand_before_reset(env: LlvmEnv):
+    with pytest.raises(SessionNotFound, match=r"Must call reset\(\) before expand\(\)"):
+        env.expand([0])
+
+
+def test_expand_equals_fork_and_step(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    env.step(env.action_space["-mem2reg"])
+    actions = [
+        env.action_space["-instcombine"],
+        env.action_space["-simplifycfg"],
+        env.action_space["-gvn"],
+    ]
+
+    successors = env.expand(actions, observations=["IrSha1", "IrInstructionCount"])
+    assert len(successors) == len(actions)
+
+    for action, (observation, reward, done, info) in zip(actions, successors):
+        with env.fork() as fkd:
+            expected = fkd.step(action, observations=["IrSha1", "IrInstructionCount"])
+        assert observation == expected[0]
+        assert reward == expected[1]
+        assert done == expected[2]
+        assert info["action_had_no_effect"] == expected[3]["action_had_no_effect"]
+
+
+def test_expand_does_not_modify_state(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    action = env.action_space["-mem2reg"]
+    ir = env.observation["Ir"]
+    with env.fork() as fkd:
+        expected_reward = fkd.step(action)[1]
+
+    env.expand(range(10))
+
+    assert env.observation["Ir"] == ir
+    assert env.actions == []
+    assert env.step(action)[1] == expected_reward
+
+
+def test_expand_default_observation_and_reward(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.observation_space = "IrInstructionCount"
+    env.reward_space = "IrInstructionCount"
+    ((observation, reward, _, _),) = env.expand([env.action_space["-mem2reg"]])
+    assert isinstance(observation, int)
+    assert isinstance(reward, float)
+
+
+if __name__ == "__main__":
+    main()
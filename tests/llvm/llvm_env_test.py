@@ -4,7 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 """Integrations tests for the LLVM CompilerGym environments."""
 from enum import Enum
-from io import StringIO
+from io import StringIO, TextIOWrapper
 from pathlib import Path
 from typing import List
 
@@ -197,6 +197,33 @@ def test_write_ir(env: LlvmEnv, tmpwd: Path):
     assert Path("file.ll").is_file()
 
 
+def test_write_ir_streams_observation(env: LlvmEnv, tmpwd: Path):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.write_ir("file.ll")
+    assert Path("file.ll").read_text() == env.ir
+
+
+def test_open_observation(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/crc32")
+    with TextIOWrapper(env.open_observation("Ir"), encoding="utf-8") as f:
+        assert f.read() == env.ir
+
+
+def test_stream_observations(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/crc32")
+    observations = ["Ir", "Bitcode", "Autophase", "IrInstructionCount"]
+    expected, _, _, _ = env.step(0, observations=observations)
+
+    env.reset(benchmark="cbench-v1/crc32")
+    env.stream_observations = True
+    actual, _, _, _ = env.step(0, observations=observations)
+
+    assert actual[0] == expected[0]
+    assert bytes(actual[1]) == bytes(expected[1])
+    assert actual[2].tolist() == expected[2].tolist()
+    assert actual[3] == expected[3]
+
+
 def test_ir_sha1(env: LlvmEnv, tmpwd: Path):
     env.reset(benchmark="cbench-v1/crc32")
     before = env.ir_sha1
@@ -241,5 +268,61 @@ def test_step_multiple_actions_generator(env: LlvmEnv):
     ]
 
 
+def test_step_multiple_actions_equals_single_steps(env: LlvmEnv):
+    """Test that a sequence of actions in a single step produces the same state
+    as stepping through the actions one at a time."""
+    env.reset(benchmark="cbench-v1/crc32")
+    actions = [
+        env.action_space.flags.index("-mem2reg"),
+        env.action_space.flags.index("-instcombine"),
+        env.action_space.flags.index("-simplifycfg"),
+    ]
+    env.step(actions)
+    ir = env.observation["Ir"]
+
+    env.reset()
+    for action in actions:
+        env.step(action)
+    assert env.observation["Ir"] == ir
+
+
+def test_step_timings(env: LlvmEnv):
+    """Test that the service reports step timings when requested."""
+    env.reset(benchmark="cbench-v1/crc32")
+    _, _, _, info = env.step(0)
+    assert "step_timings" not in info
+
+    env.record_step_timings = True
+    _, _, _, info = env.step([0, 1], observations=["IrInstructionCount"])
+    timings = info["step_timings"]
+    assert len(timings["actions"]) == 2
+    assert list(timings["observations"]) == ["IrInstructionCount"]
+    assert timings["total"] >= sum(timings["actions"])
+    assert timings["rpc_overhead"] >= 0
+
+    histograms = env.step_timing_histograms()
+    assert histograms["total"]["count"] == 2
+    assert histograms["actions"]["0"]["count"] == 2
+    assert histograms["actions"]["1"]["count"] == 1
+    assert histograms["observations"]["IrInstructionCount"]["count"] == 1
+
+
+def test_step_without_packed_actions_support(env: LlvmEnv):
+    """Test that actions are sent as Action messages to a service that does not
+    support packed actions."""
+    env.reset(benchmark="cbench-v1/crc32")
+    actions = [
+        env.action_space.flags.index("-mem2reg"),
+        env.action_space.flags.index("-instcombine"),
+    ]
+    env.step(actions)
+    ir = env.observation["Ir"]
+
+    env.reset()
+    env.service.supports_packed_action = False
+    env.step(actions)
+    assert env.observation["Ir"] == ir
+
+
 if __name__ == "__main__":
     main()
@@ -5,6 +5,7 @@
 """Tests for LLVM session parameter handlers."""
 import sys
 
+import numpy as np
 import pytest
 from flaky import flaky
 
@@ -88,5 +89,264 @@ def test_runtime_observation_parameters(env: LlvmEnv, n: int):
     assert env.observation_space.contains(runtimes)
 
 
+def test_shared_memory_observation_threshold_parameters(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    assert env.send_param("llvm.get_shared_memory_observation_threshold", "") == "0"
+    assert (
+        env.send_param("llvm.set_shared_memory_observation_threshold", "1024") == "1024"
+    )
+    assert env.send_param("llvm.get_shared_memory_observation_threshold", "") == "1024"
+
+
+def test_shared_memory_observation_threshold_invalid_value(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    with pytest.raises(
+        ValueError, match="shared_memory_observation_threshold must be >= 0"
+    ):
+        env.send_param("llvm.set_shared_memory_observation_threshold", "-1")
+
+
+def test_shared_memory_observations_equal_inline_observations(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    ir = env.observation["Ir"]
+    bitcode = env.observation["Bitcode"]
+
+    env.shared_memory_observation_threshold = 1
+    shared_ir = env.observation["Ir"]
+    shared_bitcode = env.observation["Bitcode"]
+
+    assert isinstance(shared_ir, str)
+    assert shared_ir == ir
+    assert isinstance(shared_bitcode, memoryview)
+    assert shared_bitcode.readonly
+    assert shared_bitcode.tobytes() == bitcode
+
+
+def test_shared_memory_observation_threshold_is_preserved_on_reset(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    env.shared_memory_observation_threshold = 1
+    env.reset()
+    assert env.send_param("llvm.get_shared_memory_observation_threshold", "") == "1"
+    assert isinstance(env.observation["Bitcode"], memoryview)
+
+
+def test_packed_observation_spaces_parameters(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    assert env.send_param("llvm.get_packed_observation_spaces", "") == ""
+    env.send_param("llvm.set_packed_observation_spaces", "InstCount,Autophase")
+    assert (
+        env.send_param("llvm.get_packed_observation_spaces", "")
+        == "Autophase,InstCount"
+    )
+
+
+def test_packed_observation_spaces_invalid_value(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    with pytest.raises(
+        ValueError, match="Could not interpret observation space name: NotASpace"
+    ):
+        env.send_param("llvm.set_packed_observation_spaces", "NotASpace")
+
+
+def test_packed_observations_equal_inline_observations(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    autophase = env.observation["Autophase"]
+    inst_count = env.observation["InstCount"]
+
+    env.packed_observation_spaces = {"Autophase", "InstCount"}
+    packed_autophase = env.observation["Autophase"]
+    packed_inst_count = env.observation["InstCount"]
+
+    assert packed_autophase.dtype == np.int64
+    np.testing.assert_array_equal(packed_autophase, autophase)
+    np.testing.assert_array_equal(packed_inst_count, inst_count)
+
+
+def test_packed_observation_spaces_are_preserved_on_reset(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    env.packed_observation_spaces = {"Autophase"}
+    env.reset()
+    assert env.send_param("llvm.get_packed_observation_spaces", "") == "Autophase"
+    assert not env.observation["Autophase"].flags.writeable
+
+
+def test_state_transition_cache_parameters(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    assert env.send_param("llvm.get_state_transition_cache", "") == "0"
+    env.send_param("llvm.set_state_transition_cache", "1")
+    assert env.send_param("llvm.get_state_transition_cache", "") == "1"
+
+
+def test_state_transition_cache_invalid_value(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    with pytest.raises(
+        ValueError, match="Invalid value for llvm.set_state_transition_cache: 2"
+    ):
+        env.send_param("llvm.set_state_transition_cache", "2")
+
+
+@pytest.mark.parametrize("value", ["", "-1", "1e6", "abc", "99999999999999999999999"])
+def test_state_transition_cache_max_size_invalid_value(env: LlvmEnv, value: str):
+    env.reset(benchmark="cbench-v1/qsort")
+    with pytest.raises(
+        ValueError,
+        match="Invalid value for llvm.set_state_transition_cache_max_size_in_bytes",
+    ):
+        env.send_param("llvm.set_state_transition_cache_max_size_in_bytes", value)
+
+
+def test_state_transition_cache_max_size_is_service_wide(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    env.send_param("llvm.set_state_transition_cache_max_size_in_bytes", "1024")
+    with env.fork() as fkd:
+        assert fkd.state_transition_cache_stats["max_size_in_bytes"] == 1024
+
+
+def test_state_transition_cache_hits_equal_uncached_steps(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.step([0, 1, 2, 3])
+    expected = env.ir_sha1, env.observation["IrInstructionCount"]
+
+    env.state_transition_cache = True
+    for _ in range(2):
+        env.reset()
+        env.step([0, 1, 2, 3])
+        assert (env.ir_sha1, env.observation["IrInstructionCount"]) == expected
+
+    stats = env.state_transition_cache_stats
+    assert stats["hits"] >= 4
+    assert stats["size"] >= 4
+
+
+def test_state_transition_cache_is_preserved_on_reset_and_fork(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    env.state_transition_cache = True
+    env.reset()
+    assert env.send_param("llvm.get_state_transition_cache", "") == "1"
+    with env.fork() as fkd:
+        assert fkd.send_param("llvm.get_state_transition_cache", "") == "1"
+
+
+def test_module_verification_policy_parameters(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    assert env.send_param("llvm.get_module_verification_policy", "") == "EveryStep"
+    env.send_param("llvm.set_module_verification_policy", "EveryNSteps")
+    assert env.send_param("llvm.get_module_verification_policy", "") == "EveryNSteps"
+    env.send_param("llvm.set_module_verification_interval", "5")
+    assert env.send_param("llvm.get_module_verification_interval", "") == "5"
+
+
+def test_module_verification_policy_invalid_value(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    with pytest.raises(ValueError):
+        env.send_param("llvm.set_module_verification_policy", "Sometimes")
+    with pytest.raises(
+        ValueError, match="module_verification_interval must be >= 1. Received: 0"
+    ):
+        env.send_param("llvm.set_module_verification_interval", "0")
+
+
+@pytest.mark.parametrize(
+    "policy", ["EveryStep", "EveryNSteps", "BeforeExecution", "OnDemand"]
+)
+def test_module_verification_policy_steps_match_default(env: LlvmEnv, policy: str):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.step([0, 1, 2, 3])
+    expected = env.ir_sha1
+
+    env.module_verification_policy = policy
+    env.module_verification_interval = 2
+    env.reset()
+    env.step([0, 1, 2, 3])
+    env.verify_module()
+    assert env.ir_sha1 == expected
+
+
+def test_module_verification_policy_is_preserved_on_reset_and_fork(env: LlvmEnv):
+    env.reset(benchmark="cbench-v1/qsort")
+    env.module_verification_policy = "OnDemand"
+    env.reset()
+    assert env.send_param("llvm.get_module_verification_policy", "") == "OnDemand"
+    env.step(0)
+    with env.fork() as fkd:
+        assert fkd.module_verification_policy == "OnDemand"
+        assert fkd.send_param("llvm.get_module_verification_policy", "") == "OnDemand"
+        fkd.verify_module()
+
+
+def test_module_verification_policy_on_demand_verifies_at_end_of_episode(
+    env: LlvmEnv, mocker
+):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.module_verification_policy = "OnDemand"
+    env.step(0)
+    mocker.spy(env, "verify_module")
+
+    env.reset()
+
+    assert env.verify_module.call_count == 1
+
+
+def test_module_verification_policy_end_of_episode_failure_fails_reset(
+    env: LlvmEnv, mocker
+):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.module_verification_policy = "OnDemand"
+    env.step(0)
+    mocker.patch.object(env, "verify_module", side_effect=ServiceError("invalid"))
+
+    with pytest.raises(
+        ValueError, match="Module verification failed at end of episode: invalid"
+    ):
+        env.reset()
+
+    # The failed episode is ended, so the next reset starts a new one.
+    assert not env.in_episode
+    env.reset()
+    assert env.in_episode
+
+
+def test_module_verification_policy_end_of_episode_failure_fails_close(
+    env: LlvmEnv, mocker
+):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.module_verification_policy = "OnDemand"
+    env.step(0)
+    mocker.patch.object(env, "verify_module", side_effect=ServiceError("invalid"))
+
+    with pytest.raises(
+        ValueError, match="Module verification failed at end of episode: invalid"
+    ):
+        env.close()
+
+    assert env.service is None
+
+
+def test_module_verification_policy_on_demand_verifies_on_validate(
+    env: LlvmEnv, mocker
+):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.module_verification_policy = "OnDemand"
+    env.step(0)
+    mocker.spy(env, "verify_module")
+
+    result = env.validate()
+
+    assert result.okay()
+    assert env.verify_module.call_count >= 1
+
+
+def test_module_verification_policy_apply_failure(env: LlvmEnv, mocker):
+    env.reset(benchmark="cbench-v1/crc32")
+    env.module_verification_policy = "OnDemand"
+    env.step(0)
+    state = env.state
+    env.reset()
+    mocker.patch.object(env, "verify_module", side_effect=ServiceError("invalid"))
+
+    with pytest.raises(ValueError, match="Module verification failed: invalid"):
+        env.apply(state)
+
+
 if __name__ == "__main__":
     main()
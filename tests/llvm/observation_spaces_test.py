@@ -17,6 +17,7 @@ from compiler_gym.envs.llvm.llvm_env import LlvmEnv
 from compiler_gym.spaces import Box
 from compiler_gym.spaces import Dict as DictSpace
 from compiler_gym.spaces import Scalar, Sequence
+from compiler_gym.third_party.autophase import AUTOPHASE_FEATURE_NAMES
 from tests.test_main import main
 
 pytest_plugins = ["tests.pytest_plugins.llvm"]
@@ -399,6 +400,7 @@ def test_autophase_dict_observation_space(env: LlvmEnv):
     value: Dict[str, int] = env.observation[key]
     print(value)  # For debugging in case of error.
     assert len(value) == 56
+    assert value == dict(zip(AUTOPHASE_FEATURE_NAMES, env.observation["Autophase"]))
 
     assert space.deterministic
     assert not space.platform_dependent
@@ -161,5 +161,27 @@ for a in 1024 : L0 {'cpu_parallel ' if backend=='cpu' else ''}[thread]
         assert out == expected.strip(), f"{out} \n vs \n {expected.strip()}"
 
 
+@flaky
+@pytest.mark.parametrize("backend", lt.backends())
+def test_repeated_flops(backend):
+    """Test that the flops of a previously compiled schedule can be observed
+    again, including after returning to it from another schedule."""
+    with compiler_gym.make("loop_tool-v0") as env:
+        env.observation_space = "flops"
+        env.reset(
+            benchmark=env.datasets.benchmark(
+                uri=f"benchmark://loop_tool-{backend}-v0/1024"
+            ),
+            action_space="simple",
+        )
+        assert env.observation["flops"] > 0
+        assert env.observation["flops"] > 0
+        # toggle_thread twice to return to the original schedule.
+        o, _, _, _ = env.step(3)
+        assert o > 0
+        o, _, _, _ = env.step(3)
+        assert o > 0
+
+
 if __name__ == "__main__":
     main()
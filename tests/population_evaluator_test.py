@@ -0,0 +1,97 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym:population_evaluator."""
+import pytest
+
+from compiler_gym.envs import LlvmEnv
+from compiler_gym.population_evaluator import PopulationEvaluator
+from tests.test_main import main
+
+pytest_plugins = ["tests.pytest_plugins.llvm"]
+
+POPULATION = [[0, 1, 2], [0, 1, 3], [0, 4], [0, 1, 2], [5], []]
+
+
+def replay_rewards(env: LlvmEnv, population):
+    rewards = []
+    for actions in population:
+        env.reset()
+        if actions:
+            env.step(actions)
+        rewards.append(env.episode_reward)
+    return rewards
+
+
+def test_evaluate_rewards_match_replay(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    evaluator = PopulationEvaluator(env)
+
+    rewards = evaluator.evaluate(POPULATION)
+
+    assert rewards == pytest.approx(replay_rewards(env, POPULATION))
+
+
+def test_evaluate_shares_prefixes(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    evaluator = PopulationEvaluator(env)
+
+    evaluator.evaluate(POPULATION)
+
+    # The trie contains the actions: 0 -> 1 -> {2, 3}, 0 -> 4, and 5.
+    assert evaluator.steps == 6
+
+
+def test_evaluate_does_not_modify_env(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    env.step(0)
+    ir_sha1 = env.ir_sha1
+    evaluator = PopulationEvaluator(env)
+
+    evaluator.evaluate(POPULATION)
+
+    assert env.actions == [0]
+    assert env.ir_sha1 == ir_sha1
+
+
+def test_evaluate_memo(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = "IrInstructionCount"
+    memo = {}
+    evaluator = PopulationEvaluator(env, state_hash="IrSha1", memo=memo)
+
+    rewards = evaluator.evaluate(POPULATION)
+    assert memo
+    steps = evaluator.steps
+
+    # Re-evaluating the population is resolved entirely from the memo.
+    assert evaluator.evaluate(POPULATION) == pytest.approx(rewards)
+    assert evaluator.steps == steps
+    assert evaluator.cache_hits == len([x for x in POPULATION if x])
+
+    # The memo can be shared with a second evaluator.
+    other = PopulationEvaluator(env, state_hash="IrSha1", memo=memo)
+    assert other.evaluate(POPULATION) == pytest.approx(rewards)
+    assert other.steps == 0
+
+
+def test_evaluate_without_reward_space(env: LlvmEnv):
+    env.reset("cbench-v1/crc32")
+    env.reward_space = None
+    evaluator = PopulationEvaluator(env)
+
+    with pytest.raises(ValueError, match="without a reward space"):
+        evaluator.evaluate(POPULATION)
+
+
+def test_memo_requires_state_hash(env: LlvmEnv):
+    with pytest.raises(ValueError, match="state_hash"):
+        PopulationEvaluator(env, memo={})
+
+
+if __name__ == "__main__":
+    main()
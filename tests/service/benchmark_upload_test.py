@@ -0,0 +1,96 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/service:benchmark_upload."""
+import hashlib
+
+from compiler_gym.service import benchmark_upload
+from compiler_gym.service.benchmark_upload import (
+    AddBenchmarkChunks,
+    add_benchmark_request,
+    benchmark_reference,
+    content_sha256,
+)
+from compiler_gym.service.proto import (
+    AddBenchmarkRequest,
+    Benchmark,
+    BenchmarkDynamicConfig,
+    Command,
+    File,
+)
+from tests.test_main import main
+
+CONTENTS = b"Hello, world"
+SHA256 = hashlib.sha256(CONTENTS).hexdigest()
+
+
+class MockStub:
+    AddBenchmark = "AddBenchmark"
+    AddBenchmarkStream = "AddBenchmarkStream"
+
+
+def test_content_sha256():
+    benchmark = Benchmark(uri="a", program=File(contents=CONTENTS))
+    assert content_sha256(benchmark) == SHA256
+
+
+def test_content_sha256_without_contents():
+    benchmark = Benchmark(uri="a", program=File(uri="file:///a"))
+    assert content_sha256(benchmark) is None
+
+
+def test_benchmark_reference():
+    dynamic_config = BenchmarkDynamicConfig(run_cmd=Command(argument=["a.out"]))
+    benchmark = Benchmark(
+        uri="a", program=File(contents=CONTENTS), dynamic_config=dynamic_config
+    )
+
+    reference = benchmark_reference(benchmark)
+
+    assert reference == Benchmark(
+        uri="a", program=File(sha256=SHA256), dynamic_config=dynamic_config
+    )
+    assert benchmark.program.contents == CONTENTS
+
+
+def test_add_benchmark_request():
+    benchmark = Benchmark(uri="a", program=File(contents=CONTENTS))
+
+    method, request = add_benchmark_request(MockStub, benchmark)
+
+    assert method == "AddBenchmark"
+    assert request == AddBenchmarkRequest(
+        benchmark=[Benchmark(uri="a", program=File(contents=CONTENTS, sha256=SHA256))]
+    )
+
+
+def test_add_benchmark_request_streams_large_benchmarks(mocker):
+    mocker.patch.object(benchmark_upload, "STREAM_THRESHOLD_IN_BYTES", 5)
+    benchmark = Benchmark(uri="a", program=File(contents=CONTENTS))
+
+    method, request = add_benchmark_request(MockStub, benchmark)
+
+    assert method == "AddBenchmarkStream"
+    assert isinstance(request, AddBenchmarkChunks)
+
+
+def test_add_benchmark_chunks():
+    benchmark = Benchmark(uri="a", program=File(contents=CONTENTS))
+
+    chunks = list(AddBenchmarkChunks(benchmark, chunk_size=5))
+
+    assert [chunk.contents for chunk in chunks] == [b"Hello", b", wor", b"ld"]
+    assert chunks[0].benchmark == Benchmark(uri="a", program=File(sha256=SHA256))
+    assert not any(chunk.HasField("benchmark") for chunk in chunks[1:])
+
+
+def test_add_benchmark_chunks_can_be_iterated_multiple_times():
+    benchmark = Benchmark(uri="a", program=File(contents=CONTENTS))
+    chunks = AddBenchmarkChunks(benchmark, chunk_size=5)
+
+    assert list(chunks) == list(chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@
 // LICENSE file in the root directory of this source tree.
 #include <gtest/gtest.h>
 
-#include <optional>
+#include <memory>
 
 #include "compiler_gym/service/proto/compiler_gym_service.pb.h"
 #include "compiler_gym/service/runtime/BenchmarkCache.h"
@@ -82,6 +82,13 @@ TEST(BenchmarkCache, getter) {
   ASSERT_EQ(cache.get("b")->DebugString(), b.DebugString());
 }
 
+TEST(BenchmarkCache, getterDoesNotCopy) {
+  BenchmarkCache cache;
+  cache.add(makeBenchmarkOfSize("a", 30));
+
+  ASSERT_EQ(cache.get("a"), cache.get("a"));
+}
+
 TEST(BenchmarkCache, evictToCapacityOnMaximumSizeUpdate) {
   BenchmarkCache cache;
 
@@ -96,5 +103,88 @@ TEST(BenchmarkCache, evictToCapacityOnMaximumSizeUpdate) {
   ASSERT_EQ(cache.sizeInBytes(), 30);
 }
 
+TEST(BenchmarkCache, getterMissingBenchmark) {
+  BenchmarkCache cache;
+
+  ASSERT_EQ(cache.get("a"), nullptr);
+}
+
+TEST(BenchmarkCache, deduplicateHashedContents) {
+  BenchmarkCache cache;
+
+  auto a = makeBenchmarkOfSize("a", 100);
+  a.mutable_program()->set_sha256("abc");
+  auto b = a;
+  b.set_uri("b");
+  cache.add(std::move(a));
+  const size_t sizeInBytes = cache.sizeInBytes();
+  cache.add(std::move(b));
+
+  ASSERT_EQ(cache.size(), 2);
+  ASSERT_TRUE(cache.hasContents("abc"));
+  ASSERT_LT(cache.sizeInBytes(), 2 * sizeInBytes);
+  ASSERT_EQ(cache.get("a")->program().contents(), cache.get("b")->program().contents());
+  ASSERT_EQ(cache.get("b")->uri(), "b");
+  ASSERT_EQ(&cache.get("a")->program().contents(), &cache.get("b")->program().contents());
+}
+
+TEST(BenchmarkCache, getterOutlivesEviction) {
+  BenchmarkCache cache;
+
+  auto a = makeBenchmarkOfSize("a", 100);
+  a.mutable_program()->set_sha256("abc");
+  const std::string contents = a.program().contents();
+  cache.add(std::move(a));
+
+  const auto benchmark = cache.get("a");
+  cache.evictToCapacity(0);
+  ASSERT_EQ(cache.size(), 0);
+  ASSERT_FALSE(cache.hasContents("abc"));
+  ASSERT_EQ(benchmark->uri(), "a");
+  ASSERT_EQ(benchmark->program().contents(), contents);
+}
+
+TEST(BenchmarkCache, addContentsReference) {
+  BenchmarkCache cache;
+
+  auto a = makeBenchmarkOfSize("a", 100);
+  a.mutable_program()->set_sha256("abc");
+  const std::string contents = a.program().contents();
+  cache.add(std::move(a));
+
+  Benchmark b;
+  b.set_uri("b");
+  b.mutable_program()->set_sha256("abc");
+  cache.add(std::move(b));
+
+  ASSERT_EQ(cache.size(), 2);
+  ASSERT_EQ(cache.get("b")->program().contents(), contents);
+}
+
+TEST(BenchmarkCache, addUnknownContentsReference) {
+  BenchmarkCache cache;
+
+  Benchmark a;
+  a.set_uri("a");
+  a.mutable_program()->set_sha256("abc");
+  cache.add(std::move(a));
+
+  ASSERT_EQ(cache.size(), 0);
+  ASSERT_EQ(cache.get("a"), nullptr);
+}
+
+TEST(BenchmarkCache, releaseContentsWhenLastReferenceIsRemoved) {
+  BenchmarkCache cache;
+
+  auto a = makeBenchmarkOfSize("a", 100);
+  a.mutable_program()->set_sha256("abc");
+  cache.add(std::move(a));
+  ASSERT_TRUE(cache.hasContents("abc"));
+
+  cache.add(makeBenchmarkOfSize("a", 30));
+  ASSERT_FALSE(cache.hasContents("abc"));
+  ASSERT_EQ(cache.sizeInBytes(), 30);
+}
+
 }  // anonymous namespace
 }  // namespace compiler_gym::runtime
@@ -0,0 +1,139 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#include <gtest/gtest.h>
+
+#include <limits>
+
+#include "compiler_gym/service/proto/compiler_gym_service.pb.h"
+#include "compiler_gym/service/runtime/StepTimingHistograms.h"
+
+using namespace ::testing;
+
+namespace compiler_gym::runtime {
+namespace {
+
+// Test helper. Create a histogram containing a single duration.
+DurationHistogram makeHistogram(int64_t micros) {
+  DurationHistogram histogram;
+  histogram.add(micros);
+  return histogram;
+}
+
+TEST(DurationHistogram, emptyHistogram) {
+  DurationHistogram histogram;
+  EXPECT_EQ(histogram.count(), 0);
+  EXPECT_EQ(histogram.sumMicros(), 0);
+  EXPECT_TRUE(histogram.buckets().empty());
+  EXPECT_EQ(histogram.toJson(), "{\"count\": 0, \"sum_micros\": 0, \"buckets\": []}");
+}
+
+TEST(DurationHistogram, zeroDurationIsCountedInFirstBucket) {
+  EXPECT_EQ(makeHistogram(0).buckets(), std::vector<int64_t>({1}));
+}
+
+TEST(DurationHistogram, bucketBoundaries) {
+  EXPECT_EQ(makeHistogram(1).buckets(), std::vector<int64_t>({1}));
+  EXPECT_EQ(makeHistogram(2).buckets(), std::vector<int64_t>({0, 1}));
+  EXPECT_EQ(makeHistogram(3).buckets(), std::vector<int64_t>({0, 1}));
+  EXPECT_EQ(makeHistogram(4).buckets(), std::vector<int64_t>({0, 0, 1}));
+  EXPECT_EQ(makeHistogram(1023).buckets().size(), 10);
+  EXPECT_EQ(makeHistogram(1024).buckets().size(), 11);
+}
+
+TEST(DurationHistogram, largestDuration) {
+  const auto histogram = makeHistogram(std::numeric_limits<int64_t>::max());
+  ASSERT_EQ(histogram.buckets().size(), 63);
+  EXPECT_EQ(histogram.buckets()[62], 1);
+  EXPECT_EQ(histogram.sumMicros(), std::numeric_limits<int64_t>::max());
+}
+
+TEST(DurationHistogram, aggregateDurations) {
+  DurationHistogram histogram;
+  for (int64_t micros : {0, 1, 5, 6, 100}) {
+    histogram.add(micros);
+  }
+  EXPECT_EQ(histogram.count(), 5);
+  EXPECT_EQ(histogram.sumMicros(), 112);
+  EXPECT_EQ(histogram.buckets(), std::vector<int64_t>({2, 0, 2, 0, 0, 0, 1}));
+  EXPECT_EQ(histogram.toJson(),
+            "{\"count\": 5, \"sum_micros\": 112, \"buckets\": [2, 0, 2, 0, 0, 0, 1]}");
+}
+
+TEST(StepTimingHistograms, emptyHistograms) {
+  StepTimingHistograms histograms;
+  EXPECT_EQ(histograms.toJson(),
+            "{\"total\": {\"count\": 0, \"sum_micros\": 0, \"buckets\": []}, "
+            "\"end_of_step\": {\"count\": 0, \"sum_micros\": 0, \"buckets\": []}, "
+            "\"actions\": {}, \"observations\": {}}");
+}
+
+TEST(StepTimingHistograms, actionsAndObservations) {
+  StepTimingHistograms histograms;
+
+  StepRequest request;
+  request.add_action()->add_choice()->set_named_discrete_value_index(3);
+  request.add_packed_action(5);
+  request.add_packed_action(3);
+  StepTimings timings;
+  timings.set_total_micros(100);
+  timings.add_action_micros(1);
+  timings.add_action_micros(2);
+  timings.add_action_micros(4);
+  timings.add_observation_micros(8);
+  timings.add_observation_micros(16);
+  histograms.add(request, {"Ir", "Autophase"}, timings);
+
+  request.Clear();
+  request.add_packed_action(5);
+  timings.Clear();
+  timings.set_total_micros(50);
+  timings.set_end_of_step_micros(2);
+  timings.add_action_micros(2);
+  timings.add_observation_micros(8);
+  histograms.add(request, {"Ir"}, timings);
+
+  EXPECT_EQ(histograms.toJson(),
+            "{\"total\": {\"count\": 2, \"sum_micros\": 150, \"buckets\": [0, 0, 0, 0, 0, 1, 1]}, "
+            "\"end_of_step\": {\"count\": 2, \"sum_micros\": 2, \"buckets\": [1, 1]}, "
+            "\"actions\": {"
+            "\"3\": {\"count\": 2, \"sum_micros\": 5, \"buckets\": [1, 0, 1]}, "
+            "\"5\": {\"count\": 2, \"sum_micros\": 4, \"buckets\": [0, 2]}}, "
+            "\"observations\": {"
+            "\"Autophase\": {\"count\": 1, \"sum_micros\": 16, \"buckets\": [0, 0, 0, 0, 1]}, "
+            "\"Ir\": {\"count\": 2, \"sum_micros\": 16, \"buckets\": [0, 0, 0, 2]}}}");
+}
+
+TEST(StepTimingHistograms, fewerActionsAppliedThanRequested) {
+  StepTimingHistograms histograms;
+
+  StepRequest request;
+  request.add_packed_action(1);
+  request.add_packed_action(2);
+  request.add_packed_action(3);
+  StepTimings timings;
+  timings.add_action_micros(4);
+  histograms.add(request, {}, timings);
+
+  EXPECT_EQ(histograms.toJson(),
+            "{\"total\": {\"count\": 1, \"sum_micros\": 0, \"buckets\": [1]}, "
+            "\"end_of_step\": {\"count\": 1, \"sum_micros\": 0, \"buckets\": [1]}, "
+            "\"actions\": {\"1\": {\"count\": 1, \"sum_micros\": 4, \"buckets\": [0, 0, 1]}}, "
+            "\"observations\": {}}");
+}
+
+TEST(StepTimingHistograms, actionWithoutChoice) {
+  StepTimingHistograms histograms;
+
+  StepRequest request;
+  request.add_action();
+  StepTimings timings;
+  timings.add_action_micros(1);
+  histograms.add(request, {}, timings);
+
+  EXPECT_NE(histograms.toJson().find("\"actions\": {\"-1\": "), std::string::npos);
+}
+
+}  // anonymous namespace
+}  // namespace compiler_gym::runtime
@@ -140,5 +140,52 @@ def test_evict_to_capacity_on_maximum_size_update(mocker):
     assert cache.size_in_bytes == 30
 
 
+def test_deduplicate_hashed_contents():
+    cache = BenchmarkCache()
+
+    a = Benchmark(uri="a", program=File(contents=b"." * 100, sha256="abc"))
+    b = Benchmark(uri="b", program=File(contents=b"." * 100, sha256="abc"))
+    cache["a"] = a
+    size_in_bytes = cache.size_in_bytes
+    cache["b"] = b
+
+    assert cache.size == 2
+    assert cache.has_contents("abc")
+    assert cache.size_in_bytes < 2 * size_in_bytes
+    assert cache["a"] == a
+    assert cache["b"] == b
+
+
+def test_add_contents_reference():
+    cache = BenchmarkCache()
+
+    cache["a"] = Benchmark(uri="a", program=File(contents=b"123", sha256="abc"))
+    cache["b"] = Benchmark(uri="b", program=File(sha256="abc"))
+
+    assert cache["b"].program.contents == b"123"
+
+
+def test_add_unknown_contents_reference():
+    cache = BenchmarkCache()
+
+    with pytest.raises(KeyError, match="abc"):
+        cache["a"] = Benchmark(uri="a", program=File(sha256="abc"))
+    assert cache.size == 0
+    assert cache.size_in_bytes == 0
+
+
+def test_release_contents_when_last_reference_is_removed():
+    cache = BenchmarkCache()
+
+    cache["a"] = Benchmark(uri="a", program=File(contents=b"123", sha256="abc"))
+    cache["b"] = Benchmark(uri="b", program=File(sha256="abc"))
+    cache["a"] = make_benchmark_of_size(30)
+    assert cache.has_contents("abc")
+
+    cache["b"] = make_benchmark_of_size(30)
+    assert not cache.has_contents("abc")
+    assert cache.size_in_bytes == 60
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,133 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/service/runtime:step_timing_histograms."""
+import json
+
+import pytest
+
+from compiler_gym.service.proto import Action, Choice, StepRequest, StepTimings
+from compiler_gym.service.runtime.step_timing_histograms import (
+    DurationHistogram,
+    StepTimingHistograms,
+)
+from tests.test_main import main
+
+
+def make_action(index: int) -> Action:
+    return Action(choice=[Choice(named_discrete_value_index=index)])
+
+
+def test_empty_duration_histogram():
+    histogram = DurationHistogram()
+    assert histogram.to_json() == {"count": 0, "sum_micros": 0, "buckets": []}
+
+
+@pytest.mark.parametrize(
+    "micros,bucket",
+    [
+        (0, 0),
+        (1, 0),
+        (2, 1),
+        (3, 1),
+        (4, 2),
+        (1023, 9),
+        (1024, 10),
+    ],
+)
+def test_duration_histogram_bucket_boundaries(micros: int, bucket: int):
+    histogram = DurationHistogram()
+    histogram.add(micros)
+    assert histogram.buckets == [0] * bucket + [1]
+    assert histogram.count == 1
+    assert histogram.sum_micros == micros
+
+
+def test_duration_histogram_large_duration():
+    histogram = DurationHistogram()
+    histogram.add(2 ** 62)
+    assert len(histogram.buckets) == 63
+    assert histogram.buckets[62] == 1
+    assert histogram.sum_micros == 2 ** 62
+
+
+def test_duration_histogram_aggregates_durations():
+    histogram = DurationHistogram()
+    for micros in [0, 1, 5, 6, 100]:
+        histogram.add(micros)
+    assert histogram.to_json() == {
+        "count": 5,
+        "sum_micros": 112,
+        "buckets": [2, 0, 2, 0, 0, 0, 1],
+    }
+
+
+def test_step_timing_histograms_actions_and_observations():
+    histograms = StepTimingHistograms()
+    histograms.add(
+        StepRequest(action=[make_action(3)], packed_action=[5, 3]),
+        ["Ir", "Autophase"],
+        StepTimings(
+            total_micros=100,
+            end_of_step_micros=0,
+            action_micros=[1, 2, 4],
+            observation_micros=[8, 16],
+        ),
+    )
+    histograms.add(
+        StepRequest(packed_action=[5]),
+        ["Ir"],
+        StepTimings(
+            total_micros=50,
+            end_of_step_micros=2,
+            action_micros=[2],
+            observation_micros=[8],
+        ),
+    )
+
+    data = histograms.to_json()
+    assert data["total"] == {"count": 2, "sum_micros": 150, "buckets": [0] * 5 + [1, 1]}
+    assert data["end_of_step"] == {"count": 2, "sum_micros": 2, "buckets": [1, 1]}
+    assert data["actions"] == {
+        "3": {"count": 2, "sum_micros": 5, "buckets": [1, 0, 1]},
+        "5": {"count": 2, "sum_micros": 4, "buckets": [0, 2]},
+    }
+    assert data["observations"] == {
+        "Autophase": {"count": 1, "sum_micros": 16, "buckets": [0, 0, 0, 0, 1]},
+        "Ir": {"count": 2, "sum_micros": 16, "buckets": [0, 0, 0, 2]},
+    }
+
+
+def test_step_timing_histograms_fewer_actions_applied_than_requested():
+    """If the episode ended early, only the applied actions are recorded."""
+    histograms = StepTimingHistograms()
+    histograms.add(
+        StepRequest(packed_action=[1, 2, 3]),
+        [],
+        StepTimings(action_micros=[4]),
+    )
+    assert histograms.to_json()["actions"] == {
+        "1": {"count": 1, "sum_micros": 4, "buckets": [0, 0, 1]},
+    }
+
+
+def test_step_timing_histograms_action_without_choice():
+    histograms = StepTimingHistograms()
+    histograms.add(StepRequest(action=[Action()]), [], StepTimings(action_micros=[1]))
+    assert list(histograms.to_json()["actions"]) == ["-1"]
+
+
+def test_step_timing_histograms_json_serializable():
+    histograms = StepTimingHistograms()
+    histograms.add(
+        StepRequest(action=[make_action(0)]),
+        ["Ir"],
+        StepTimings(action_micros=[1], observation_micros=[2]),
+    )
+    data = histograms.to_json()
+    assert json.loads(json.dumps(data)) == data
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/service:step_stream."""
+import io
+
+import numpy as np
+import pytest
+
+from compiler_gym.service.connection import ServiceError
+from compiler_gym.service.proto import (
+    Observation,
+    ObservationSpace,
+    PackedArray,
+    ScalarRange,
+    ScalarRangeList,
+    StepReply,
+    StepReplyChunk,
+)
+from compiler_gym.service.step_stream import (
+    StepReplyStream,
+    StreamedObservation,
+    step_reply_chunks,
+)
+from compiler_gym.views import ObservationSpaceSpec
+from tests.test_main import main
+
+ARRAY = np.arange(10, dtype=np.int64)
+
+
+def make_reply() -> StepReply:
+    return StepReply(
+        end_of_session=True,
+        observation=[
+            Observation(string_value="Hello, world"),
+            Observation(scalar_int64=5),
+            Observation(binary_value=b"\x00\x01\x02"),
+            Observation(
+                packed_array=PackedArray(
+                    dtype=ARRAY.dtype.str, shape=[10], data=ARRAY.tobytes()
+                )
+            ),
+        ],
+    )
+
+
+def test_step_reply_chunks():
+    chunks = list(step_reply_chunks(make_reply(), chunk_size=5))
+
+    header = chunks[0]
+    assert header.reply.end_of_session
+    assert list(header.observation_size_in_bytes) == [12, 0, 3, 80]
+    assert header.reply.observation[0].WhichOneof("value") == "string_value"
+    assert header.reply.observation[0].string_value == ""
+    assert header.reply.observation[1].scalar_int64 == 5
+    assert header.reply.observation[3].packed_array.dtype == ARRAY.dtype.str
+    assert not header.reply.observation[3].packed_array.data
+
+    assert [chunk.observation_index for chunk in chunks[1:5]] == [0, 0, 0, 2]
+    assert [chunk.data for chunk in chunks[1:4]] == [b"Hello", b", wor", b"ld"]
+    assert all(len(chunk.data) <= 5 for chunk in chunks[1:])
+
+
+def test_step_reply_stream_observations():
+    stream = StepReplyStream(step_reply_chunks(make_reply(), chunk_size=5))
+    observations = stream.observations()
+
+    assert stream.reply.end_of_session
+    assert isinstance(observations[0], StreamedObservation)
+    assert observations[0].string_value == "Hello, world"
+    assert observations[1].scalar_int64 == 5
+    assert bytes(observations[2].binary_value) == b"\x00\x01\x02"
+
+
+def test_streamed_packed_array_translation():
+    space = ObservationSpaceSpec.from_proto(
+        0,
+        ObservationSpace(
+            name="features",
+            int64_range_list=ScalarRangeList(range=[ScalarRange()] * 10),
+        ),
+    )
+    stream = StepReplyStream(step_reply_chunks(make_reply(), chunk_size=16))
+
+    array = space.translate(stream.observations()[3])
+
+    assert array.dtype == np.int64
+    assert array.tolist() == ARRAY.tolist()
+
+
+def test_step_reply_stream_open():
+    stream = StepReplyStream(step_reply_chunks(make_reply(), chunk_size=5))
+
+    with io.TextIOWrapper(stream.open(0), encoding="utf-8") as f:
+        assert f.read() == "Hello, world"
+    # Observations that are skipped are discarded.
+    with stream.open(3) as f:
+        assert f.read() == ARRAY.tobytes()
+
+
+def test_step_reply_stream_read_out_of_order():
+    stream = StepReplyStream(step_reply_chunks(make_reply()))
+    stream.read(2)
+
+    with pytest.raises(ValueError, match="Observation 0 has already been read"):
+        stream.read(0)
+
+
+def test_step_reply_stream_truncated():
+    chunks = list(step_reply_chunks(make_reply(), chunk_size=5))
+    stream = StepReplyStream(chunks[:2])
+
+    with pytest.raises(ServiceError, match="Received 5 of 12 bytes for observation"):
+        stream.read(0)
+
+
+def test_step_reply_stream_observations_drains_stream():
+    def chunks():
+        yield from step_reply_chunks(make_reply(), chunk_size=5)
+        raise ServiceError("Step failed")
+
+    stream = StepReplyStream(chunks())
+
+    with pytest.raises(ServiceError, match="Step failed"):
+        stream.observations()
+
+
+def test_step_reply_stream_drain():
+    chunks = iter(step_reply_chunks(make_reply(), chunk_size=5))
+    stream = StepReplyStream(chunks)
+    stream.read(0)
+
+    stream.drain()
+
+    assert next(chunks, None) is None
+    with pytest.raises(ValueError, match="Observation 3 has already been read"):
+        stream.read(3)
+
+
+def test_step_reply_stream_empty():
+    with pytest.raises(ServiceError, match="StepStream"):
+        StepReplyStream(iter([]))
+
+
+def test_step_reply_stream_reply_without_observations():
+    stream = StepReplyStream([StepReplyChunk(reply=StepReply(end_of_session=True))])
+    assert stream.reply.end_of_session
+    assert stream.observations() == []
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/spaces:dict."""
+import numpy as np
+
+from compiler_gym.spaces import Dict, Scalar
+from compiler_gym.util.array_dict_view import ArrayDictView
+from tests.test_main import main
+
+
+def test_contains_dict():
+    space = Dict({"a": Scalar(name="a", min=0, max=10, dtype=int)}, name="test")
+    assert space.contains({"a": 5})
+    assert not space.contains({"a": 11})
+
+
+def test_contains_mapping():
+    space = Dict({"a": Scalar(name="a", min=0, max=10, dtype=float)}, name="test")
+    assert space.contains(ArrayDictView({"a": 0}, np.array([5.0])))
+    assert not space.contains(ArrayDictView({"a": 0}, np.array([11.0])))
+
+
+if __name__ == "__main__":
+    main()
@@ -64,5 +64,12 @@ def test_bytes_contains():
     assert not space.contains("Hello, world!")
 
 
+def test_bytes_contains_buffer():
+    space = Sequence(name="test", size_range=(0, 5), dtype=bytes)
+    assert space.contains(memoryview(b"Hello"))
+    assert space.contains(bytearray(b"Hello"))
+    assert not space.contains(memoryview(b"Hello, world!"))
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,48 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+//
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#include <gtest/gtest.h>
+
+#include <vector>
+
+#include "compiler_gym/util/Bisect.h"
+
+namespace compiler_gym::util {
+namespace {
+
+TEST(Bisect, singleElement) {
+  int calls = 0;
+  EXPECT_EQ(findFirstFailingPrefix(1,
+                                   [&](size_t) {
+                                     ++calls;
+                                     return true;
+                                   }),
+            0);
+  EXPECT_EQ(calls, 0);
+}
+
+TEST(Bisect, lastElementFails) {
+  EXPECT_EQ(findFirstFailingPrefix(10, [](size_t) { return false; }), 9);
+}
+
+TEST(Bisect, everyFailingElement) {
+  for (size_t size = 1; size < 20; ++size) {
+    for (size_t failing = 0; failing < size; ++failing) {
+      EXPECT_EQ(findFirstFailingPrefix(size, [&](size_t i) { return i >= failing; }), failing)
+          << "size=" << size << " failing=" << failing;
+    }
+  }
+}
+
+TEST(Bisect, logarithmicNumberOfTests) {
+  std::vector<size_t> tested;
+  findFirstFailingPrefix(1024, [&](size_t i) {
+    tested.push_back(i);
+    return i >= 700;
+  });
+  EXPECT_EQ(tested.size(), 10);
+}
+
+}  // anonymous namespace
+}  // namespace compiler_gym::util
@@ -0,0 +1,58 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Unit tests for //compiler_gym/util:array_dict_view."""
+import numpy as np
+import pytest
+
+from compiler_gym.util.array_dict_view import ArrayDictView
+from tests.test_main import main
+
+INDEX = {"a": 0, "b": 1, "c": 2}
+
+
+def test_array_dict_view_getitem():
+    view = ArrayDictView(INDEX, np.array([1, 2, 3]))
+    assert view["a"] == 1
+    assert view["c"] == 3
+    with pytest.raises(KeyError):
+        view["d"]
+
+
+def test_array_dict_view_iteration_order():
+    view = ArrayDictView(INDEX, np.array([1, 2, 3]))
+    assert list(view) == ["a", "b", "c"]
+    assert list(view.values()) == [1, 2, 3]
+    assert len(view) == 3
+
+
+def test_array_dict_view_contains():
+    view = ArrayDictView(INDEX, np.array([1, 2, 3]))
+    assert "b" in view
+    assert "d" not in view
+
+
+def test_array_dict_view_equals_dict():
+    view = ArrayDictView(INDEX, np.array([1, 2, 3]))
+    assert view == {"a": 1, "b": 2, "c": 3}
+    assert view != {"a": 1, "b": 2, "c": 4}
+    assert dict(view) == {"a": 1, "b": 2, "c": 3}
+
+
+def test_array_dict_view_does_not_copy_array():
+    array = np.array([1, 2, 3])
+    view = ArrayDictView(INDEX, array)
+    assert view.array is array
+    array[1] = 5
+    assert view["b"] == 5
+
+
+def test_array_dict_view_is_read_only():
+    view = ArrayDictView(INDEX, np.array([1, 2, 3]))
+    with pytest.raises(TypeError):
+        view["a"] = 5
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 """Unit tests for //compiler_gym/util:download."""
+import hashlib
+import os
+from pathlib import Path
+
 import pytest
 
 from compiler_gym.util import download
@@ -104,5 +108,82 @@ def test_download_no_urls():
         download.download(urls=[])
 
 
+def _make_mirror(tmp_path: Path, size: int = 100000):
+    data = os.urandom(size)
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = tmp_path / "mirror.bin"
+    path.write_bytes(data)
+    return data, sha256, f"file://{path}"
+
+
+def test_download_file_url(tmp_path: Path):
+    data, sha256, url = _make_mirror(tmp_path)
+    assert download.download(url, sha256=sha256) == data
+    assert cache_path(f"downloads/{sha256}").is_file()
+
+
+def test_open_download_file_url(tmp_path: Path):
+    data, sha256, url = _make_mirror(tmp_path)
+    with download.open_download(url, sha256=sha256, chunk_size=1000) as f:
+        assert f.read() == data
+    assert cache_path(f"downloads/{sha256}").read_bytes() == data
+    assert not cache_path(f"downloads/{sha256}.partial").is_file()
+
+
+def test_open_download_resume_partial(tmp_path: Path):
+    data, sha256, url = _make_mirror(tmp_path)
+    partial_path = cache_path(f"downloads/{sha256}.partial")
+    partial_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Start a download and stop part way through.
+    with pytest.raises(KeyboardInterrupt):
+        with download.open_download(url, sha256=sha256, chunk_size=1000) as f:
+            f.read(5000)
+            raise KeyboardInterrupt
+    assert partial_path.stat().st_size == 5000
+
+    with download.open_download(url, sha256=sha256, chunk_size=1000) as f:
+        assert f.read() == data
+    assert cache_path(f"downloads/{sha256}").read_bytes() == data
+    assert not partial_path.is_file()
+
+
+def test_open_download_unread_remainder_is_checksummed(tmp_path: Path):
+    data, sha256, url = _make_mirror(tmp_path)
+    with download.open_download(url, sha256=sha256, chunk_size=1000) as f:
+        f.read(10)
+    assert cache_path(f"downloads/{sha256}").read_bytes() == data
+
+
+def test_open_download_mismatched_checksum(tmp_path: Path):
+    _, _, url = _make_mirror(tmp_path)
+    sha256 = "0" * 64
+    with pytest.raises(
+        download.DownloadFailed, match="Checksum of download does not match"
+    ):
+        with download.open_download(url, sha256=sha256) as f:
+            f.read()
+    assert not cache_path(f"downloads/{sha256}.partial").is_file()
+    assert not cache_path(f"downloads/{sha256}").is_file()
+
+
+def test_open_download_closed_stream_is_not_reopened(tmp_path: Path):
+    """Closing the raw stream from another thread must fail the read in progress
+    rather than reopening the download."""
+    _, sha256, url = _make_mirror(tmp_path)
+    with pytest.raises(ValueError, match="closed download stream"):
+        with download.open_download(url, sha256=sha256, chunk_size=1000) as f:
+            f.read(1000)
+            f.raw.close()
+            f.raw.readinto(bytearray(1000))
+    assert not cache_path(f"downloads/{sha256}").is_file()
+
+
+def test_open_download_file_not_found(tmp_path: Path):
+    with pytest.raises(download.DownloadFailed):
+        with download.open_download(f"file://{tmp_path}/not_found", max_retries=1) as f:
+            f.read()
+
+
 if __name__ == "__main__":
     main()
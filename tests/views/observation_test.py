@@ -8,12 +8,15 @@ import pytest
 
 from compiler_gym.service.connection import ServiceError
 from compiler_gym.service.proto import (
+    Int64List,
+    Observation,
     ObservationSpace,
+    PackedArray,
     ScalarLimit,
     ScalarRange,
     ScalarRangeList,
 )
-from compiler_gym.views import ObservationView
+from compiler_gym.views import ObservationSpaceSpec, ObservationView
 from tests.test_main import main
 
 
@@ -187,5 +190,52 @@ def test_observation_when_raw_step_returns_done():
         observation["ir"]  # pylint: disable=pointless-statement
 
 
+def test_packed_array_translation():
+    space = ObservationSpaceSpec.from_proto(
+        0,
+        ObservationSpace(
+            name="features",
+            int64_range_list=ScalarRangeList(range=[ScalarRange(), ScalarRange()]),
+        ),
+    )
+    packed = Observation(
+        packed_array=PackedArray(
+            dtype="<i8", data=np.array([1, 2], dtype="<i8").tobytes()
+        )
+    )
+    inline = Observation(int64_list=Int64List(value=[1, 2]))
+
+    assert space.translate(packed).tolist() == [1, 2]
+    assert space.translate(packed).dtype == np.int64
+    assert space.translate(inline).tolist() == [1, 2]
+
+
+def test_packed_array_translate_batch():
+    space = ObservationSpaceSpec.from_proto(
+        0,
+        ObservationSpace(
+            name="features",
+            int64_range_list=ScalarRangeList(range=[ScalarRange(), ScalarRange()]),
+        ),
+    )
+    observations = [
+        Observation(
+            packed_array=PackedArray(
+                dtype="<i8", data=np.array([i, i + 1], dtype="<i8").tobytes()
+            )
+        )
+        for i in range(3)
+    ]
+
+    batch = space.translate_batch(observations)
+    assert isinstance(batch, np.ndarray)
+    assert batch.tolist() == [[0, 1], [1, 2], [2, 3]]
+
+    # Mixed representations are translated individually.
+    observations.append(Observation(int64_list=Int64List(value=[3, 4])))
+    batch = space.translate_batch(observations)
+    assert [b.tolist() for b in batch] == [[0, 1], [1, 2], [2, 3], [3, 4]]
+
+
 if __name__ == "__main__":
     main()